@@ -1,8 +1,10 @@
 import asyncio
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple, Union
 import aiohttp
 from config.config import config
+from mock_llm_provider import shared_mock_provider
+from prompt_assembly import AssembledPrompt, prompt_assembler
 
 class SimpleGenAIClient:
     """Memory-optimized single GenAI client"""
@@ -18,69 +20,109 @@ class SimpleGenAIClient:
             )
         return self.session
     
-    async def generate_response(self, prompt: str, schema: Dict = None) -> Dict[str, Any]:
-        """Generate response with active provider"""
+    async def generate_response(self, prompt: Union[str, AssembledPrompt], schema: Dict = None) -> Dict[str, Any]:
+        """Generate response with active provider.
+        An AssembledPrompt sends its static prefix as the system part (cacheable) and its suffix as the user turn"""
         session = await self.get_session()
         
         if self.provider == "openai" and config.OPENAI_API_KEY:
-            return await self._call_openai(session, prompt, schema)
+            result = await self._call_openai(session, prompt, schema)
         elif self.provider == "claude" and config.CLAUDE_API_KEY:
-            return await self._call_claude(session, prompt, schema)
+            result = await self._call_claude(session, prompt, schema)
+        elif self.provider == "mock":
+            result = await self._call_mock(prompt, schema)
         else:
             raise ValueError(f"Provider {self.provider} not configured")
+        
+        if isinstance(prompt, AssembledPrompt):
+            result["prefix_tokens_saved"] = prompt_assembler.record(prompt, result["provider"], result["cached_tokens"])
+        return result
     
-    async def _call_openai(self, session, prompt: str, schema: Dict = None):
+    @staticmethod
+    def _split_prompt(prompt: Union[str, AssembledPrompt], schema: Dict = None) -> Tuple[Optional[str], str]:
+        """(static system part, dynamic user part); plain strings keep the schema appended as before"""
+        if isinstance(prompt, AssembledPrompt):
+            return prompt.prefix, prompt.suffix
+        if schema:
+            prompt += f"\n\nPlease respond in valid JSON format matching this schema: {json.dumps(schema)}"
+        return None, prompt
+    
+    async def _call_openai(self, session, prompt: Union[str, AssembledPrompt], schema: Dict = None):
         headers = {
             "Authorization": f"Bearer {config.OPENAI_API_KEY}",
             "Content-Type": "application/json"
         }
         
+        system, user = self._split_prompt(prompt, schema)
+        # OpenAI caches identical prompt prefixes automatically, so the static part goes first
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": user})
+        
         payload = {
             "model": "gpt-4",
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": messages,
             "max_tokens": 1500,
             "temperature": 0.7
         }
         
         if schema:
             payload["response_format"] = {"type": "json_object"}
-            prompt += f"\n\nPlease respond in valid JSON format matching this schema: {json.dumps(schema)}"
-            payload["messages"][0]["content"] = prompt
         
-        async with session.post("https://api.openai.com/v1/chat/completions", 
+        async with session.post(f"{config.OPENAI_BASE_URL}/chat/completions",
                                headers=headers, json=payload) as response:
             data = await response.json()
+            usage = data.get("usage", {})
             return {
                 "content": data["choices"][0]["message"]["content"],
                 "provider": "openai",
-                "tokens_used": data.get("usage", {}).get("total_tokens", 0)
+                "tokens_used": usage.get("total_tokens", 0),
+                "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
             }
     
-    async def _call_claude(self, session, prompt: str, schema: Dict = None):
+    async def _call_claude(self, session, prompt: Union[str, AssembledPrompt], schema: Dict = None):
         headers = {
             "x-api-key": config.CLAUDE_API_KEY,
             "content-type": "application/json",
             "anthropic-version": "2023-06-01"
         }
         
-        if schema:
-            prompt += f"\n\nPlease respond in valid JSON format matching this schema: {json.dumps(schema)}"
+        system, user = self._split_prompt(prompt, schema)
         
         payload = {
             "model": "claude-3-sonnet-20240229",
             "max_tokens": 1500,
-            "messages": [{"role": "user", "content": prompt}]
+            "messages": [{"role": "user", "content": user}]
         }
+        if system and prompt_assembler.claude_cacheable(prompt.template):
+            # Mark the static prefix as a cache breakpoint; later calls read it from the prompt cache
+            payload["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        elif system:
+            # Below Claude's minimum cacheable size a breakpoint is ignored, so send a plain system prompt
+            payload["system"] = system
         
-        async with session.post("https://api.anthropic.com/v1/messages",
+        async with session.post(f"{config.CLAUDE_BASE_URL}/messages",
                                headers=headers, json=payload) as response:
             data = await response.json()
+            usage = data.get("usage", {})
             return {
                 "content": data["content"][0]["text"],
                 "provider": "claude",
-                "tokens_used": data.get("usage", {}).get("input_tokens", 0) + data.get("usage", {}).get("output_tokens", 0)
+                "tokens_used": usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+                + usage.get("cache_creation_input_tokens", 0) + usage.get("cache_read_input_tokens", 0),
+                "cached_tokens": usage.get("cache_read_input_tokens", 0)
             }
     
+    async def _call_mock(self, prompt: Union[str, AssembledPrompt], schema: Dict = None):
+        """Local stand-in (mock_llm_provider): same latency/error injection as its HTTP server, no network"""
+        system, user = self._split_prompt(prompt, schema)
+        content, usage = await shared_mock_provider.agenerate(user, system or "")
+        return {
+            "content": content,
+            "provider": "mock",
+            "tokens_used": usage["input_tokens"] + usage["output_tokens"],
+            "cached_tokens": usage["cached_tokens"]
+        }
+    
     async def close(self):
         if self.session:
             await self.session.close()
@@ -5,6 +5,7 @@ import uvicorn
 import asyncio
 from api.modules.m1.analyzer import analyze_symptoms
 from api.core.genai_client import genai_client
+from prompt_assembly import prompt_assembler
 
 app = FastAPI(title="XAI Flex Message API", version="1.0.0")
 
@@ -48,6 +49,11 @@ async def health_check():
     """健康檢查"""
     return {"status": "healthy", "service": "XAI Flex Message API"}
 
+@app.get("/api/prompt/stats")
+async def prompt_stats():
+    """各提示詞範本的前綴 tokens 與節省統計"""
+    return prompt_assembler.get_stats()
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """清理資源"""
@@ -1,30 +1,7 @@
 import json
 from typing import Dict, Any
 from api.core.genai_client import genai_client
-
-M1_PROMPT_TEMPLATE = """
-你是專業的失智症評估助手。請分析以下症狀描述，對照台灣失智症協會十大警訊：
-
-用戶描述："{user_input}"
-
-請以JSON格式回應，包含：
-1. 分析過程說明
-2. 符合的警訊項目
-3. 信心指數 (0-10)
-4. 建議行動
-
-十大警訊：
-1. 記憶力減退影響日常生活
-2. 計劃事情或解決問題有困難
-3. 無法勝任原本熟悉的事務
-4. 對時間地點感到混淆
-5. 理解視覺影像和空間關係有困難
-6. 言語表達或書寫出現困難
-7. 東西擺放錯亂且失去回溯能力
-8. 判斷力變差或減退
-9. 從工作或社交活動中退出
-10. 情緒和個性的改變
-"""
+from prompt_assembly import PromptTemplate
 
 M1_SCHEMA = {
     "type": "object",
@@ -61,10 +38,39 @@ M1_SCHEMA = {
     "required": ["analysis_process", "matched_warnings", "overall_confidence", "risk_level"]
 }
 
+# Static prefix (instructions, warning signs, schema) is identical on every call and goes first so
+# provider-side prefix caching applies; only the user description is sent as the dynamic suffix
+M1_PROMPT = PromptTemplate(
+    "m1",
+    prefix="""
+你是專業的失智症評估助手。請分析用戶描述的症狀，對照台灣失智症協會十大警訊：
+
+請以JSON格式回應，包含：
+1. 分析過程說明
+2. 符合的警訊項目
+3. 信心指數 (0-10)
+4. 建議行動
+
+十大警訊：
+1. 記憶力減退影響日常生活
+2. 計劃事情或解決問題有困難
+3. 無法勝任原本熟悉的事務
+4. 對時間地點感到混淆
+5. 理解視覺影像和空間關係有困難
+6. 言語表達或書寫出現困難
+7. 東西擺放錯亂且失去回溯能力
+8. 判斷力變差或減退
+9. 從工作或社交活動中退出
+10. 情緒和個性的改變
+""",
+    suffix='用戶描述："{user_input}"',
+    schema=M1_SCHEMA,
+)
+
 async def analyze_symptoms(user_input: str) -> Dict[str, Any]:
     """Analyze user-described symptoms against dementia warning signs"""
     
-    prompt = M1_PROMPT_TEMPLATE.format(user_input=user_input)
+    prompt = M1_PROMPT.render(user_input=user_input)
     
     try:
         result = await genai_client.generate_response(prompt, M1_SCHEMA)
@@ -74,7 +80,8 @@ async def analyze_symptoms(user_input: str) -> Dict[str, Any]:
         response_data["metadata"] = {
             "module_id": "M1",
             "provider": result["provider"],
-            "tokens_used": result["tokens_used"]
+            "tokens_used": result["tokens_used"],
+            "prefix_tokens_saved": result.get("prefix_tokens_saved", 0)
         }
         
         return response_data
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+共用非同步 HTTP 客戶端
+各服務原本在 async handler 內以 requests.post（30 秒逾時）呼叫上游，或每個請求新建 httpx.AsyncClient：
+前者阻塞整個事件迴圈，後者每則訊息都重新建立 TCP/TLS 連線。
+改為每個程序一個 httpx.AsyncClient（由應用程式 lifespan 啟動與關閉）：
+keep-alive 連線池、有安裝 h2 時啟用 HTTP/2、各上游有自己的逾時與並行上限，另有全域並行上限。
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 連線池設定
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_MAX_CONCURRENCY = int(os.getenv("HTTP_MAX_CONCURRENCY", "64"))
+
+
+class Upstream:
+    """一個上游服務的設定與統計"""
+
+    def __init__(self, name: str, base_url: str = "", timeout: float = 10.0, connect_timeout: float = 3.0,
+                 max_concurrency: int = 16, headers: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.base_url = base_url  # 保留設定值原樣（含結尾斜線）
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_concurrency = max_concurrency
+        self.headers = headers or {}
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.stats = {"requests": 0, "errors": 0, "timeouts": 0, "in_flight": 0, "total_latency": 0.0}
+
+    def url(self, path: str) -> str:
+        if not self.base_url or path.startswith(("http://", "https://")):
+            return path
+        if not path:
+            return self.base_url
+        return f"{self.base_url.rstrip('/')}/{path.lstrip('/')}"
+
+    def httpx_timeout(self) -> Any:
+        if not HTTPX_AVAILABLE:
+            return self.timeout
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+
+class AsyncHTTPClient:
+    """程序內共用的 httpx.AsyncClient：連線池、HTTP/2、各上游逾時與並行上限"""
+
+    def __init__(self, max_connections: int = HTTP_MAX_CONNECTIONS, max_keepalive: int = HTTP_MAX_KEEPALIVE,
+                 keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY, max_concurrency: int = HTTP_MAX_CONCURRENCY,
+                 http2: Optional[bool] = None):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.max_concurrency = max_concurrency
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2 and HTTP2_AVAILABLE
+        self.upstreams: Dict[str, Upstream] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._loop = None
+        self._client = None
+
+    def register(self, name: str, base_url: str = "", **options) -> Upstream:
+        """登記上游服務（timeout、connect_timeout、max_concurrency、headers）"""
+        upstream = Upstream(name, base_url, **options)
+        self.upstreams[name] = upstream
+        return upstream
+
+    async def start(self):
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("httpx 未安裝，無法建立共用 HTTP 客戶端")
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_keepalive,
+                                    keepalive_expiry=self.keepalive_expiry),
+            )
+            logger.info(f"✅ 共用 HTTP 客戶端啟動（HTTP/2: {self.http2}，上游: {', '.join(self.upstreams) or '無'}）")
+
+    async def close(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    async def request(self, upstream: str, method: str, path: str = "", **kwargs) -> Any:
+        """以上游的逾時與並行上限送出請求；錯誤（含逾時）照常拋出由呼叫端處理"""
+        if self._client is None:
+            await self.start()
+        target = self.upstreams.get(upstream) or self.register(upstream)
+        headers = {**target.headers, **(kwargs.pop("headers", None) or {})}
+        kwargs.setdefault("timeout", target.httpx_timeout())
+
+        self._bind_loop()
+        async with self._semaphore, target.semaphore:
+            target.stats["requests"] += 1
+            target.stats["in_flight"] += 1
+            start = time.perf_counter()
+            try:
+                return await self._client.request(method, target.url(path), headers=headers, **kwargs)
+            except Exception as e:
+                target.stats["errors"] += 1
+                if HTTPX_AVAILABLE and isinstance(e, httpx.TimeoutException):
+                    target.stats["timeouts"] += 1
+                raise
+            finally:
+                target.stats["in_flight"] -= 1
+                target.stats["total_latency"] += time.perf_counter() - start
+
+    async def stream_lines(self, upstream: str, method: str, path: str = "", **kwargs) -> AsyncIterator[str]:
+        """以串流讀取回應並逐行產出（例如 NDJSON），不等整個回應完成；非 2xx 回應以 raise_for_status 拋出"""
+        if self._client is None:
+            await self.start()
+        target = self.upstreams.get(upstream) or self.register(upstream)
+        headers = {**target.headers, **(kwargs.pop("headers", None) or {})}
+        kwargs.setdefault("timeout", target.httpx_timeout())
+
+        self._bind_loop()
+        async with self._semaphore, target.semaphore:
+            target.stats["requests"] += 1
+            target.stats["in_flight"] += 1
+            start = time.perf_counter()
+            try:
+                async with self._client.stream(method, target.url(path), headers=headers, **kwargs) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line:
+                            yield line
+            except Exception as e:
+                target.stats["errors"] += 1
+                if HTTPX_AVAILABLE and isinstance(e, httpx.TimeoutException):
+                    target.stats["timeouts"] += 1
+                raise
+            finally:
+                target.stats["in_flight"] -= 1
+                target.stats["total_latency"] += time.perf_counter() - start
+
+    def _bind_loop(self):
+        """並行上限的 Semaphore 綁定事件迴圈；換了迴圈（例如重新啟動應用程式）時重新建立"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            for upstream in self.upstreams.values():
+                upstream.semaphore = asyncio.Semaphore(upstream.max_concurrency)
+
+    async def get(self, upstream: str, path: str = "", **kwargs) -> Any:
+        return await self.request(upstream, "GET", path, **kwargs)
+
+    async def post(self, upstream: str, path: str = "", **kwargs) -> Any:
+        return await self.request(upstream, "POST", path, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "started": self._client is not None,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_concurrency": self.max_concurrency,
+            "upstreams": {
+                name: {
+                    **{key: value for key, value in upstream.stats.items() if key != "total_latency"},
+                    "avg_latency_ms": round(upstream.stats["total_latency"] / upstream.stats["requests"] * 1000, 3)
+                    if upstream.stats["requests"] else 0.0,
+                    "timeout": upstream.timeout,
+                    "max_concurrency": upstream.max_concurrency,
+                }
+                for name, upstream in self.upstreams.items()
+            },
+        }
+
+
+# 程序內共用實例
+shared_http_client = AsyncHTTPClient()
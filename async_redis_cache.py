@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+非同步 Redis 快取後端
+async 端點原本在事件迴圈內呼叫同步的 redis.Redis，每次快取讀寫都阻塞整個迴圈。
+改用 redis.asyncio：連線池（由應用程式 lifespan 建立與關閉）、每個指令有逾時、
+多鍵讀寫以 MGET / pipeline 一次往返完成；連線錯誤計入斷路器，Redis 異常時快取路徑快速失敗。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+    ASYNC_REDIS_AVAILABLE = True
+except ImportError:
+    ASYNC_REDIS_AVAILABLE = False
+
+from circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# 連線失敗類錯誤（含逾時）才會計入斷路器
+TIMEOUT_ERRORS: Tuple[type, ...] = (asyncio.TimeoutError,)
+CONNECTION_ERRORS: Tuple[type, ...] = (OSError, asyncio.TimeoutError)
+if ASYNC_REDIS_AVAILABLE:
+    TIMEOUT_ERRORS += (RedisTimeoutError,)
+    CONNECTION_ERRORS += (RedisConnectionError, RedisTimeoutError)
+
+
+class AsyncRedisCache:
+    """redis.asyncio 快取後端：連線池、逾時、pipeline 與斷路器"""
+
+    def __init__(self, redis_url: str = None, max_connections: int = None,
+                 socket_timeout: float = None, operation_timeout: float = None):
+        self.redis_url = redis_url or os.getenv('REDIS_URL', 'redis://localhost:6379')
+        self.max_connections = max_connections or int(os.getenv('REDIS_MAX_CONNECTIONS', '20'))
+        self.socket_timeout = socket_timeout or float(os.getenv('REDIS_SOCKET_TIMEOUT', '1.0'))
+        # 單一指令（含等待連線池）的總逾時
+        self.operation_timeout = operation_timeout or self.socket_timeout * 2
+        self.breaker = CircuitBreaker(
+            "AsyncRedis",
+            failure_threshold=int(os.getenv('REDIS_FAILURE_THRESHOLD', '3')),
+            reset_timeout=float(os.getenv('REDIS_RESET_TIMEOUT', '5')),
+        )
+        self.client = None
+        self.stats = {"commands": 0, "errors": 0, "timeouts": 0, "total_latency": 0.0}
+
+    async def connect(self) -> bool:
+        """建立連線池並以一次 PING 確認初始狀態（於應用程式啟動時呼叫）"""
+        if not ASYNC_REDIS_AVAILABLE:
+            logger.warning("⚠️  redis.asyncio 不可用，非同步快取停用")
+            return False
+
+        pool = aioredis.ConnectionPool.from_url(
+            self.redis_url,
+            decode_responses=False,
+            max_connections=self.max_connections,
+            socket_timeout=self.socket_timeout,
+            socket_connect_timeout=self.socket_timeout,
+            health_check_interval=30,
+        )
+        self.client = aioredis.Redis(connection_pool=pool)
+        if await self.execute("PING", lambda: self.client.ping(), False):
+            logger.info("✅ 非同步 Redis 連接成功")
+            return True
+        logger.warning("⚠️  非同步 Redis 連接失敗，斷路器開啟後由快取路徑快速略過")
+        self.breaker.trip()
+        return False
+
+    async def close(self):
+        """關閉連線池（於應用程式關閉時呼叫）"""
+        self.breaker.shutdown()
+        if self.client is not None:
+            client, self.client = self.client, None
+            await client.connection_pool.disconnect()
+
+    def is_available(self) -> bool:
+        return self.client is not None and self.breaker.allow()
+
+    async def execute(self, operation: str, command: Callable[[], Awaitable[Any]], default: Any = None) -> Any:
+        """執行一個指令（含逾時）並回報結果給斷路器；斷路器開啟時直接回傳預設值"""
+        if not self.is_available():
+            return default
+
+        start = time.perf_counter()
+        self.stats["commands"] += 1
+        try:
+            result = await asyncio.wait_for(command(), self.operation_timeout)
+        except CONNECTION_ERRORS as e:
+            if isinstance(e, TIMEOUT_ERRORS):
+                self.stats["timeouts"] += 1
+            self.stats["errors"] += 1
+            self.breaker.record_failure()
+            logger.warning(f"⚠️  非同步 Redis {operation}失敗: {e}")
+            return default
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"❌ 非同步 Redis {operation}錯誤: {e}")
+            return default
+        finally:
+            self.stats["total_latency"] += time.perf_counter() - start
+
+        self.breaker.record_success()
+        return result
+
+    # 基本指令
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.execute("讀取", lambda: self.client.get(key))
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """以一次 MGET 讀取多個鍵"""
+        if not keys:
+            return []
+        values = await self.execute("批次讀取", lambda: self.client.mget(keys))
+        return values if values is not None else [None] * len(keys)
+
+    async def set(self, key: str, value: Any, ttl: int,
+                  publish: Optional[Tuple[str, str]] = None) -> bool:
+        """寫入並可同時發佈一則訊息（同一個 pipeline，一次往返）"""
+        return await self.set_many([(key, value)], ttl, publish)
+
+    async def set_many(self, items: Iterable[Tuple[str, Any]], ttl: int,
+                       publish: Optional[Tuple[str, str]] = None) -> bool:
+        """以 pipeline 一次寫入多個鍵"""
+        async def write():
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, value in items:
+                    pipe.setex(key, ttl, value)
+                if publish is not None:
+                    pipe.publish(*publish)
+                await pipe.execute()
+            return True
+
+        return await self.execute("寫入", write, False)
+
+    async def delete(self, *keys: str, publish: Optional[Tuple[str, str]] = None) -> int:
+        async def remove():
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.delete(*keys)
+                if publish is not None:
+                    pipe.publish(*publish)
+                return (await pipe.execute())[0]
+
+        return await self.execute("刪除", remove, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        commands = self.stats["commands"]
+        return {
+            "available": self.client is not None,
+            "commands": commands,
+            "errors": self.stats["errors"],
+            "timeouts": self.stats["timeouts"],
+            "avg_latency_ms": round(self.stats["total_latency"] / commands * 1000, 3) if commands else 0.0,
+            "max_connections": self.max_connections,
+            "circuit_breaker": self.breaker.get_stats(),
+        }
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Gemini 串流提早回覆壓測
+以固定的首段延遲與輸出速率模擬 Gemini 回傳 M1 分析 JSON，比較兩種回覆時機：
+    完整回應  等整段回應收到、safe_json_parse 後才組 Flex 回覆（原本 generate_response 的流程）
+    串流      generate_json_stream 增量解析，matched_warning_code / symptom_title 一出現就回覆
+兩者都經過 OptimizedGeminiClient（不使用快取），輸出「送出回覆」的時間 p50 / p95。
+
+用法：
+    python benchmark_gemini_streaming.py
+    python benchmark_gemini_streaming.py --requests 40 --ttft 0.8 --chars-per-second 300
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from optimized_gemini_client import OptimizedGeminiClient
+
+ANALYSIS = {
+    "matched_warning_code": "M1-01",
+    "symptom_title": "記憶力減退影響日常生活",
+    "user_behavior_summary": "媽媽最近常忘記關瓦斯爐，提醒後仍反覆發生，也會重複詢問同樣的事情",
+    "normal_behavior": "偶爾忘記約會或名字，但事後能夠想起來，不影響日常生活",
+    "dementia_indicator": "經常忘記剛發生的事情，需要依賴記事本或家人提醒，且頻率逐漸增加",
+    "action_suggestion": "記錄忘記的情境與頻率，安裝瓦斯自動關閉裝置，並安排神經內科或記憶門診評估",
+    "confidence_level": "high",
+    "source": "TADA 十大警訊",
+}
+
+
+class ModeledStreamingModel:
+    """首段延遲 ttft 後依 chars_per_second 逐段輸出 JSON"""
+
+    def __init__(self, ttft: float, chars_per_second: float, chunk_chars: int = 24):
+        self.ttft = ttft
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_chars / chars_per_second
+        self.text = "```json\n" + json.dumps(ANALYSIS, ensure_ascii=False, indent=2) + "\n```"
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        return self._stream()
+
+    def _stream(self):
+        time.sleep(self.ttft)
+        for i in range(0, len(self.text), self.chunk_chars):
+            time.sleep(self.chunk_delay)
+            yield type("Chunk", (), {"text": self.text[i:i + self.chunk_chars]})()
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def build_client(args) -> OptimizedGeminiClient:
+    client = OptimizedGeminiClient(api_key="benchmark")
+    client.model = ModeledStreamingModel(args.ttft, args.chars_per_second)
+    client._generation_config = lambda model, max_tokens: None
+    return client
+
+
+def measure(args, client: OptimizedGeminiClient, early: bool) -> Dict[str, float]:
+    def one(i: int) -> float:
+        start = time.perf_counter()
+        sent = []
+        result = client.generate_json_stream(
+            f"分析第 {i} 則訊息", use_cache=False,
+            on_early=(lambda fields: sent.append(time.perf_counter())) if early else None)
+        if not early:
+            # 完整回應後才解析並組 Flex
+            assert result["parsed"] == ANALYSIS
+            sent.append(time.perf_counter())
+        return sent[0] - start + args.reply_latency
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(one, range(args.requests)))
+    return {"p50_ms": statistics.median(latencies) * 1000, "p95_ms": percentile(latencies, 0.95) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 Gemini 完整回應與串流提早回覆的回覆時間")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--ttft", type=float, default=0.6, help="首段回應延遲（秒）")
+    parser.add_argument("--chars-per-second", type=float, default=250, help="輸出速率（字元/秒）")
+    parser.add_argument("--reply-latency", type=float, default=0.15, help="LINE 回覆 API 延遲（秒）")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    client = build_client(args)
+    blocking = measure(args, client, early=False)
+    streaming = measure(args, client, early=True)
+
+    print(f"📊 {args.requests} 則請求，首段 {args.ttft * 1000:.0f}ms，輸出 {args.chars_per_second:.0f} 字元/秒")
+    print(f"{'回覆時機':<10}{'p50':>12}{'p95':>12}")
+    print(f"{'完整回應':<10}{blocking['p50_ms']:>10.0f}ms{blocking['p95_ms']:>10.0f}ms")
+    print(f"{'串流':<10}{streaming['p50_ms']:>10.0f}ms{streaming['p95_ms']:>10.0f}ms")
+    print(f"⚡ 回覆提早 {blocking['p50_ms'] - streaming['p50_ms']:.0f}ms（p50）")
+
+
+if __name__ == "__main__":
+    main()
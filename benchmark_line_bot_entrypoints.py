@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+LINE Bot 入口負載比較（services/line-bot/app/main.py 改版前後）
+實際載入兩版應用程式，以簽名正確的 webhook 請求驅動，上游以模擬延遲取代：
+    舊版  Flask：從 git 取出改版前的 main.py，以 test client 在 --workers 個執行緒中送出請求
+          （相當於 WSGI worker 數）；XAI 經 httpx.MockTransport、LINE 回覆以阻塞的替身 reply_message
+    新版  ASGI：以 httpx.ASGITransport 送出請求；XAI 與 LINE 回覆經同一個 httpx.MockTransport
+兩版的 XAI 與回覆延遲相同。MockTransport 不含建立連線成本，舊版每則訊息新建 AsyncClient 的成本不計入，
+差異只來自兩版的執行模型（回覆送出後才回應 webhook vs. 排入 task 後立即回應）。
+舊版的並行度是 --workers、新版是 --max-concurrent；兩者設為相同值可比較同並行度下的差異。
+輸出：webhook 回應時間、訊息送達回覆的 p50 / p95 與吞吐量。需要 flask、fastapi、line-bot-sdk 與 httpx。
+
+用法：
+    python benchmark_line_bot_entrypoints.py
+    python benchmark_line_bot_entrypoints.py --messages 400 --concurrency 100 --workers 4
+    python benchmark_line_bot_entrypoints.py --workers 100 --max-concurrent 100
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = "services/line-bot/app/main.py"
+CHANNEL_SECRET = "benchmark-secret"
+XAI_RESULT = {"module": "M1", "confidence": 0.9, "bot_response": {"text": "可能是記憶力減退"},
+              "visualization": {"flex_message": {"confidence_bar": {"label": "高"}}}}
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(name: str, ack: List[float], done: List[float], elapsed: float) -> Dict[str, float]:
+    if len(done) != len(ack):
+        raise RuntimeError(f"{name}：{len(ack)} 則 webhook 只有 {len(done)} 則送出回覆")
+    return {
+        "entry": name,
+        "webhook_p50_ms": statistics.median(ack) * 1000,
+        "reply_p50_ms": statistics.median(done) * 1000,
+        "reply_p95_ms": percentile(done, 0.95) * 1000,
+        "throughput": len(done) / elapsed,
+    }
+
+
+def webhook_request(i: int):
+    """一則文字訊息的 webhook 請求（body 與 X-Line-Signature）"""
+    body = json.dumps({"destination": "Ubenchmark", "events": [{
+        "type": "message", "mode": "active", "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": f"U{i}"}, "replyToken": f"token-{i}",
+        "message": {"id": str(i), "type": "text", "text": "媽媽最近常忘記關瓦斯"},
+    }]}, ensure_ascii=False)
+    digest = hmac.new(CHANNEL_SECRET.encode(), body.encode(), hashlib.sha256).digest()
+    return body, {"X-Line-Signature": base64.b64encode(digest).decode(), "Content-Type": "application/json"}
+
+
+def arrivals(args):
+    """每批同時到達 --concurrency 則，批次間隔 --interval 秒"""
+    for batch in range(0, args.messages, args.concurrency):
+        yield range(batch, min(batch + args.concurrency, args.messages))
+
+
+def load_flask_app(ref: str):
+    """從 git 取出改版前的 Flask 入口並載入"""
+    source = subprocess.run(["git", "show", f"{ref}:{APP_PATH}"], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    module = types.ModuleType("line_bot_flask_baseline")
+    exec(compile(source, f"{ref}:{APP_PATH}", "exec"), module.__dict__)
+    return module
+
+
+def load_asgi_app():
+    spec = importlib.util.spec_from_file_location("line_bot_asgi", os.path.join(ROOT, APP_PATH))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_flask_entry(args) -> Dict[str, float]:
+    """舊版：WSGI worker 執行緒處理整個請求（新事件迴圈 + 新 AsyncClient + 阻塞回覆）"""
+    import httpx
+
+    bot = load_flask_app(args.baseline_ref)
+    arrived, ack, done = {}, [], []
+    lock = threading.Lock()
+
+    async def xai(request):
+        await asyncio.sleep(args.xai_latency)
+        return httpx.Response(200, json=XAI_RESULT)
+
+    class BlockingLineBotApi:
+        def reply_message(self, reply_token, messages, **kwargs):
+            time.sleep(args.reply_latency)
+            with lock:
+                done.append(time.perf_counter() - arrived[reply_token])
+
+    bot.httpx = types.SimpleNamespace(AsyncClient=lambda: httpx.AsyncClient(transport=httpx.MockTransport(xai)))
+    bot.line_bot_api = BlockingLineBotApi()
+
+    def post(i: int):
+        body, headers = webhook_request(i)
+        bot.app.test_client().post("/webhook", data=body, headers=headers)
+        with lock:
+            ack.append(time.perf_counter() - arrived[f"token-{i}"])
+
+    start = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for batch in arrivals(args):
+            now = time.perf_counter()
+            for i in batch:
+                arrived[f"token-{i}"] = now
+                futures.append(pool.submit(post, i))
+            time.sleep(args.interval)
+    for future in futures:
+        future.result()
+    return summarize("flask", ack, done, time.perf_counter() - start)
+
+
+def run_asgi_entry(args) -> Dict[str, float]:
+    """新版：單一事件迴圈，webhook 排入 task 後立即回應，XAI 與回覆共用連線池"""
+    import httpx
+
+    bot = load_asgi_app()
+    arrived, ack, done = {}, [], []
+
+    async def upstream(request):
+        if request.url.path == "/api/v1/analyze":
+            await asyncio.sleep(args.xai_latency)
+            return httpx.Response(200, json=XAI_RESULT)
+        await asyncio.sleep(args.reply_latency)
+        done.append(time.perf_counter() - arrived[json.loads(request.content)["replyToken"]])
+        return httpx.Response(200, json={})
+
+    async def scenario():
+        bot.http_client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+        bot.message_slots = asyncio.Semaphore(args.max_concurrent)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=bot.app), base_url="http://line-bot")
+
+        async def post(i: int):
+            body, headers = webhook_request(i)
+            await client.post("/webhook", content=body.encode(), headers=headers)
+            ack.append(time.perf_counter() - arrived[f"token-{i}"])
+
+        for batch in arrivals(args):
+            now = time.perf_counter()
+            for i in batch:
+                arrived[f"token-{i}"] = now
+            await asyncio.gather(*(post(i) for i in batch))
+            await asyncio.sleep(args.interval)
+        while bot.pending:
+            await asyncio.gather(*list(bot.pending))
+        await client.aclose()
+        await bot.http_client.aclose()
+
+    start = time.perf_counter()
+    asyncio.run(scenario())
+    return summarize("asgi", ack, done, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 LINE Bot 舊版 Flask 與新版 ASGI 入口的負載表現")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="每批同時到達的訊息數")
+    parser.add_argument("--interval", type=float, default=0.1, help="批次間隔（秒）")
+    parser.add_argument("--workers", type=int, default=4, help="舊版 WSGI worker 執行緒數")
+    parser.add_argument("--max-concurrent", type=int, default=100, help="新版同時處理的訊息上限")
+    parser.add_argument("--xai-latency", type=float, default=0.2)
+    parser.add_argument("--reply-latency", type=float, default=0.05)
+    parser.add_argument("--baseline-ref", default="bcadf75^", help="改版前（Flask 入口）的 git revision")
+    args = parser.parse_args()
+
+    os.environ["LINE_CHANNEL_SECRET"] = CHANNEL_SECRET
+    os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark-token")
+
+    print(f"📊 {args.messages} 則訊息，每批 {args.concurrency} 則，舊版 {args.workers} 個 worker，"
+          f"XAI {args.xai_latency * 1000:.0f}ms / 回覆 {args.reply_latency * 1000:.0f}ms（模擬上游，不含連線成本）")
+    print(f"{'入口':<8}{'webhook p50':>14}{'回覆 p50':>12}{'回覆 p95':>12}{'吞吐量':>12}")
+    for run in (run_flask_entry, run_asgi_entry):
+        try:
+            result = run(args)
+        except ImportError as e:
+            print(f"⚠️  略過 {run.__name__}：缺少套件 {e.name}")
+            continue
+        print(f"{result['entry']:<8}{result['webhook_p50_ms']:>12.1f}ms{result['reply_p50_ms']:>10.1f}ms"
+              f"{result['reply_p95_ms']:>10.1f}ms{result['throughput']:>9.1f}/s")
+
+
+if __name__ == "__main__":
+    main()
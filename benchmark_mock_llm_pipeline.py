@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+端到端離線壓測（本地 LLM 替身）
+LightweightRAGEngine 實際檢索 + mock_llm_provider 依設定的延遲分布串流回應，
+量測每則訊息「提早回覆」（警訊代碼與標題解析出來）與完整分析的時間、吞吐量，
+以及注入 429 / 500 / 逾時時退回本地分析的比例。不需要 API 金鑰，也不耗配額。
+
+用法：
+    python benchmark_mock_llm_pipeline.py
+    python benchmark_mock_llm_pipeline.py --requests 200 --concurrency 32 --latency lognormal:0.8,0.5 \\
+        --rate-limit-rate 0.05 --server-error-rate 0.02
+"""
+
+import argparse
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from enhanced.lightweight_rag_for_replit import ANALYSIS_PROMPT, LightweightRAGEngine
+from mock_llm_provider import MockGenerativeModel, MockLLMProvider
+
+MESSAGES = [
+    "媽媽最近常忘記關瓦斯爐，提醒後還是一直發生",
+    "爸爸出門常迷路，不知道今天幾月幾號",
+    "阿嬤東西常找不到，一直說被偷了",
+    "爺爺最近脾氣變得很差，很容易生氣",
+    "媽媽以前很會做菜，現在連洗衣機都不會用",
+    "爸爸講話常常說不出想要的詞",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(args, engine: LightweightRAGEngine) -> Dict[str, float]:
+    def one(i: int) -> Dict[str, float]:
+        start = time.perf_counter()
+        early = []
+        result = engine.analyze_with_lightweight_rag(
+            MESSAGES[i % len(MESSAGES)], on_early=lambda fields: early.append(time.perf_counter()))
+        done = time.perf_counter()
+        return {"early": (early[0] if early else done) - start, "complete": done - start,
+                "fallback": result.get("analysis_method") != "gemini_ai"}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    early = [s["early"] for s in samples]
+    complete = [s["complete"] for s in samples]
+    return {
+        "throughput": len(samples) / elapsed,
+        "early_p50_ms": statistics.median(early) * 1000, "early_p95_ms": percentile(early, 0.95) * 1000,
+        "complete_p50_ms": statistics.median(complete) * 1000,
+        "complete_p95_ms": percentile(complete, 0.95) * 1000,
+        "fallback_rate": sum(s["fallback"] for s in samples) / len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以本地 LLM 替身壓測 RAG → LLM 串流 → 提早回覆")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--latency", default="lognormal:0.6,0.3", help="首段延遲分布")
+    parser.add_argument("--chars-per-second", type=float, default=400)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    provider = MockLLMProvider(args.latency, args.chars_per_second, rate_limit_rate=args.rate_limit_rate,
+                               server_error_rate=args.server_error_rate, timeout_rate=args.timeout_rate,
+                               hang_seconds=args.hang_seconds, seed=args.seed)
+    engine = LightweightRAGEngine(index_dir=None)
+    engine.model = MockGenerativeModel(system_instruction=ANALYSIS_PROMPT.prefix, provider=provider)
+    engine.gemini_available = True
+
+    report = run(args, engine)
+    stats = provider.get_stats()
+    print(f"📊 {args.requests} 則訊息，並行 {args.concurrency}，延遲 {args.latency}，"
+          f"輸出 {args.chars_per_second:.0f} 字元/秒")
+    print(f"🚀 吞吐量 {report['throughput']:.1f} 則/秒")
+    print(f"{'':<10}{'p50':>12}{'p95':>12}")
+    print(f"{'提早回覆':<10}{report['early_p50_ms']:>10.0f}ms{report['early_p95_ms']:>10.0f}ms")
+    print(f"{'完整分析':<10}{report['complete_p50_ms']:>10.0f}ms{report['complete_p95_ms']:>10.0f}ms")
+    print(f"⚠️  退回本地分析 {report['fallback_rate']:.1%}（429: {stats['rate_limited']}、"
+          f"500: {stats['server_errors']}、逾時: {stats['timeouts']}）")
+
+
+if __name__ == "__main__":
+    main()
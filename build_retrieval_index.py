@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+建立檢索索引
+預先將知識片段分詞並寫成磁碟索引，API 服務啟動時以 mmap 開啟，
+多個 worker 共用同一份索引，不需各自重新建立。
+
+用法：
+    python build_retrieval_index.py                 # 建立全部索引
+    python build_retrieval_index.py --only m1_m2_m3 # 只建立指定索引
+    python build_retrieval_index.py --keep 3        # 保留最近 3 個世代
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from retrieval_index_store import prune_generations
+
+
+def build_m1_m2_m3(index_dir):
+    from m1_m2_m3_integrated_rag import M1M2M3IntegratedEngine
+    engine = M1M2M3IntegratedEngine(index_dir=None)
+    return engine.save_index(index_dir)
+
+
+def build_lightweight(index_dir):
+    from enhanced.lightweight_rag_for_replit import LightweightRAGEngine
+    engine = LightweightRAGEngine(index_dir=None)
+    return engine.save_index(index_dir)
+
+
+BUILDERS = {
+    "m1_m2_m3": ("M1M2M3_INDEX_DIR", "data/vector_index/m1_m2_m3", build_m1_m2_m3),
+    "lightweight_tfidf": ("LIGHTWEIGHT_RAG_INDEX_DIR", "data/vector_index/lightweight_tfidf", build_lightweight),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="建立檢索索引")
+    parser.add_argument("--only", choices=sorted(BUILDERS), action="append", help="只建立指定索引")
+    parser.add_argument("--keep", type=int, default=2, help="保留的索引世代數")
+    args = parser.parse_args()
+
+    for name in args.only or sorted(BUILDERS):
+        env_var, default_dir, builder = BUILDERS[name]
+        index_dir = os.getenv(env_var, default_dir)
+        print(f"🔧 建立 {name} 索引 -> {index_dir}")
+        manifest = builder(index_dir)
+        removed = prune_generations(index_dir, keep=args.keep)
+        print(f"✅ {name}: {manifest['generation']}（{manifest['num_chunks']} 個片段，"
+              f"{manifest['num_terms']} 個詞彙，清除 {removed} 個舊世代）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+快取值編碼器
+依型別編碼快取值，讀回時還原成原本的物件，不再把物件降級成 {"value": str(value)}：
+    AnalysisResult   依欄位順序存成陣列（不重複存欄位名稱），讀回為 AnalysisResult
+    片段列表          每個片段依欄位順序存成陣列，讀回為 dict 列表
+    其他值            （Flex payload、字串、dict、list）原樣編碼
+有安裝 msgpack 時以 msgpack 序列化，否則用緊湊 JSON；超過門檻的內容以 zstd（未安裝時用 zlib）壓縮。
+格式：MAGIC(0xC1) + 版本 + 旗標 + 內容。0xC1 不會出現在 JSON 或 UTF-8 開頭，
+因此舊版 JSON 快取值仍可直接讀取。
+"""
+
+import importlib
+import json
+import logging
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 0xC1
+CODEC_VERSION = 1
+
+# 旗標：低 2 位元為序列化格式，其次 2 位元為壓縮方式
+SERIALIZER_JSON = 0
+SERIALIZER_MSGPACK = 1
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+# 型別標籤
+TAG_RAW = 0
+TAG_ANALYSIS = 1
+TAG_CHUNKS = 2
+
+ANALYSIS_RESULT_CLASS = "m1_m2_m3_integrated_rag:AnalysisResult"
+ANALYSIS_FIELDS = (
+    "matched_codes", "symptom_titles", "confidence_levels", "bpsd_analysis", "stage_detection",
+    "comprehensive_summary", "action_suggestions", "retrieved_chunks", "modules_used",
+)
+CHUNK_FIELDS = (
+    "chunk_id", "module_id", "chunk_type", "title", "content", "keywords",
+    "confidence_score", "source", "similarity_score",
+)
+
+
+def _is_chunk_list(value: Any) -> bool:
+    return (isinstance(value, list) and bool(value)
+            and all(isinstance(item, dict) and "chunk_id" in item and "content" in item for item in value))
+
+
+def _pack_record(record: Dict[str, Any], fields: Tuple[str, ...]) -> List[Any]:
+    """依欄位順序存成 [存在欄位位元遮罩, 各欄位值..., 欄位以外的項目]"""
+    mask = 0
+    for i, field in enumerate(fields):
+        if field in record:
+            mask |= 1 << i
+    extras = {key: value for key, value in record.items() if key not in fields}
+    return [mask] + [record.get(field) for field in fields] + [extras or None]
+
+
+def _unpack_record(row: List[Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    mask, values = row[0], row[1:]
+    record = {field: values[i] for i, field in enumerate(fields) if mask >> i & 1}
+    if len(values) > len(fields) and values[len(fields)]:
+        record.update(values[len(fields)])
+    return record
+
+
+class CacheCodec:
+    """快取值的型別感知編碼器"""
+
+    def __init__(self, compress_threshold: int = 512, zstd_level: int = 3, use_msgpack: bool = MSGPACK_AVAILABLE):
+        self.compress_threshold = compress_threshold
+        self.serializer = SERIALIZER_MSGPACK if use_msgpack and MSGPACK_AVAILABLE else SERIALIZER_JSON
+        self._zstd_compressor = zstandard.ZstdCompressor(level=zstd_level) if ZSTD_AVAILABLE else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if ZSTD_AVAILABLE else None
+        self._analysis_class = None
+
+    # 型別轉換
+
+    def _analysis_result_class(self):
+        if self._analysis_class is None:
+            module_name, class_name = ANALYSIS_RESULT_CLASS.split(":")
+            self._analysis_class = getattr(importlib.import_module(module_name), class_name)
+        return self._analysis_class
+
+    def _to_tagged(self, value: Any) -> List[Any]:
+        if type(value).__name__ == "AnalysisResult" and hasattr(value, "__dict__"):
+            record = dict(value.__dict__)
+            if _is_chunk_list(record.get("retrieved_chunks")):
+                record["retrieved_chunks"] = [_pack_record(chunk, CHUNK_FIELDS) for chunk in record["retrieved_chunks"]]
+            return [TAG_ANALYSIS, _pack_record(record, ANALYSIS_FIELDS)]
+        if _is_chunk_list(value):
+            return [TAG_CHUNKS, [_pack_record(chunk, CHUNK_FIELDS) for chunk in value]]
+        if hasattr(value, "__dict__") and not isinstance(value, type):
+            return [TAG_RAW, value.__dict__]
+        return [TAG_RAW, value]
+
+    def _from_tagged(self, tagged: List[Any]) -> Any:
+        tag, body = tagged
+        if tag == TAG_ANALYSIS:
+            record = _unpack_record(body, ANALYSIS_FIELDS)
+            chunks = record.get("retrieved_chunks")
+            if chunks and isinstance(chunks[0], list) and isinstance(chunks[0][0], int):
+                record["retrieved_chunks"] = [_unpack_record(row, CHUNK_FIELDS) for row in chunks]
+            result = self._analysis_result_class()()
+            result.__dict__.update(record)
+            return result
+        if tag == TAG_CHUNKS:
+            return [_unpack_record(row, CHUNK_FIELDS) for row in body]
+        return body
+
+    # 編碼與解碼
+
+    def encode(self, value: Any) -> bytes:
+        tagged = self._to_tagged(value)
+        if self.serializer == SERIALIZER_MSGPACK:
+            payload = msgpack.packb(tagged, use_bin_type=True, default=str)
+        else:
+            payload = json.dumps(tagged, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+        compression = COMPRESSION_NONE
+        if len(payload) > self.compress_threshold:
+            if self._zstd_compressor is not None:
+                compressed, method = self._zstd_compressor.compress(payload), COMPRESSION_ZSTD
+            else:
+                compressed, method = zlib.compress(payload, 6), COMPRESSION_ZLIB
+            if len(compressed) < len(payload):
+                payload, compression = compressed, method
+
+        flags = self.serializer | (compression << 2)
+        return bytes((MAGIC, CODEC_VERSION, flags)) + payload
+
+    def decode(self, data: Any) -> Optional[Any]:
+        """還原快取值；無法解析（版本不符、缺少解壓套件）時回傳 None 視為未命中"""
+        if data is None:
+            return None
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if not data or data[0] != MAGIC:
+            # 舊版 JSON 快取值；字串曾被包成 {"value": ..., "type": "str"}
+            value = json.loads(data)
+            if isinstance(value, dict) and value.keys() == {"value", "type"} and value["type"] == "str":
+                return value["value"]
+            return value
+
+        version, flags = data[1], data[2]
+        if version != CODEC_VERSION:
+            logger.warning(f"⚠️  快取值版本 {version} 不相容，視為未命中")
+            return None
+
+        payload = data[3:]
+        compression = flags >> 2 & 0b11
+        if compression == COMPRESSION_ZSTD:
+            if self._zstd_decompressor is None:
+                logger.warning("⚠️  zstandard 未安裝，無法解壓快取值")
+                return None
+            payload = self._zstd_decompressor.decompress(payload)
+        elif compression == COMPRESSION_ZLIB:
+            payload = zlib.decompress(payload)
+
+        serializer = flags & 0b11
+        if serializer == SERIALIZER_MSGPACK:
+            if not MSGPACK_AVAILABLE:
+                logger.warning("⚠️  msgpack 未安裝，無法解析快取值")
+                return None
+            tagged = msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        else:
+            tagged = json.loads(payload)
+        return self._from_tagged(tagged)
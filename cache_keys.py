@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+快取鍵正規化與近似重複查詢
+快取鍵原本對輸入的原始字串取雜湊，「媽媽常常忘記」與「媽媽常常忘記。」或多一個空白就互相錯過。
+正規化步驟：Unicode NFKC（同時統一全半形）、轉小寫、去除標點符號與空白、繁簡字折疊，
+可選擇附加命中的關鍵字代碼集合。
+
+近似重複以 MinHash（字元二元組）估計 Jaccard 相似度：簽章切成多段做 LSH 分桶，
+只比對至少一段完全相同的候選。短句的 SimHash 漢明距離對改寫過於敏感，因此採用 MinHash。
+候選還必須命中相同的關鍵字代碼，確保改寫後的問題對應到相同的分析結果。
+"""
+
+import hashlib
+import random
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+try:
+    from opencc import OpenCC
+    _T2S = OpenCC("t2s")
+    OPENCC_AVAILABLE = True
+except Exception:
+    _T2S = None
+    OPENCC_AVAILABLE = False
+
+# 未安裝 OpenCC 時使用的常用字繁→簡對照（照護對話常見字）
+_TRADITIONAL = (
+    "媽爺憶記憂鬱護醫療顧驗錯議藥壓腦時間問題說話會們麼這個來對還沒嗎進覺點東書車門開關見現發無"
+    "動機態狀認識轉經歷長專業處應該幫讓電視聽錢買賬帳單氣樣從後裡頭臉飯飲體與為邊過異變斷憤懷竊"
+    "遊蕩亂緒減隨嚴輕協評診資補請務級階煩擔慮緊張聲響夢醒鐘錶較則標誌類別種詢號碼頁與歲孫兒媳婦"
+    "歡喜樂難總麗錄鑰匙鎖窗戶廁淨洗澡衛濕據將當實際導統計劃療癒區縣鄉鎮員輔齡顯"
+)
+_SIMPLIFIED = (
+    "妈爷忆记忧郁护医疗顾验错议药压脑时间问题说话会们么这个来对还没吗进觉点东书车门开关见现发无"
+    "动机态状认识转经历长专业处应该帮让电视听钱买账帐单气样从后里头脸饭饮体与为边过异变断愤怀窃"
+    "游荡乱绪减随严轻协评诊资补请务级阶烦担虑紧张声响梦醒钟表较则标志类别种询号码页与岁孙儿媳妇"
+    "欢喜乐难总丽录钥匙锁窗户厕净洗澡卫湿据将当实际导统计划疗愈区县乡镇员辅龄显"
+)
+_T2S_TABLE = str.maketrans(_TRADITIONAL, _SIMPLIFIED)
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+_ROWS = MINHASH_PERMUTATIONS // MINHASH_BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240807)  # 固定種子，各 worker 的簽章一致
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+
+def fold_chinese(text: str) -> str:
+    """繁簡字折疊（統一為簡體）"""
+    if _T2S is not None:
+        return _T2S.convert(text)
+    return text.translate(_T2S_TABLE)
+
+
+def canonicalize(text: str) -> str:
+    """正規化快取鍵文字：NFKC、小寫、去除標點與空白、繁簡折疊"""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    kept = [ch for ch in text if not ch.isspace() and unicodedata.category(ch)[0] not in ("P", "S")]
+    return fold_chinese("".join(kept))
+
+
+def keyword_codes(text: str) -> FrozenSet[str]:
+    """訊息命中的關鍵字代碼集合（模組:類別）"""
+    from keyword_matcher import shared_matcher
+
+    matches = shared_matcher.match(text)
+    return frozenset(f"{hit.module}:{hit.category}" for hit in matches.hits)
+
+
+def canonical_key(text: str, with_keyword_codes: bool = False) -> str:
+    """快取鍵使用的正規化字串，可選擇附加關鍵字代碼"""
+    key = canonicalize(text)
+    if with_keyword_codes:
+        key += "|" + ",".join(sorted(keyword_codes(text)))
+    return key
+
+
+def shingles(text: str) -> set:
+    """字元二元組集合"""
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """字元二元組的 MinHash 簽章"""
+    values = [int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+              for gram in shingles(text)]
+    return tuple(min((a * value + b) % _PRIME for value in values) for a, b in _PERMUTATIONS)
+
+
+def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(band, signature[band * _ROWS:(band + 1) * _ROWS]) for band in range(MINHASH_BANDS)]
+
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """由簽章估計 Jaccard 相似度"""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class NearDuplicateIndex:
+    """MinHash LSH 索引：查詢與已快取輸入近似重複的快取鍵"""
+
+    def __init__(self, threshold: float = 0.75, min_length: int = 6, max_entries: int = 5000):
+        self.threshold = threshold
+        self.min_length = min_length
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, ...], FrozenSet[str]]]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], set] = {}
+        self._lock = threading.Lock()
+
+    def add(self, cache_key: str, canonical: str, codes: FrozenSet[str]):
+        if len(canonical) < self.min_length:
+            return
+        signature = minhash(canonical)
+        with self._lock:
+            self._discard(cache_key)
+            self._entries[cache_key] = (signature, codes)
+            for band in _bands(signature):
+                self._buckets.setdefault(band, set()).add(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def find(self, canonical: str, codes: FrozenSet[str]) -> Optional[str]:
+        """回傳最相似（達門檻）且關鍵字代碼相同的快取鍵"""
+        if len(canonical) < self.min_length:
+            return None
+        signature = minhash(canonical)
+        best, best_score = None, self.threshold
+        with self._lock:
+            candidates = set()
+            for band in _bands(signature):
+                candidates |= self._buckets.get(band, set())
+            for cache_key in candidates:
+                other, other_codes = self._entries[cache_key]
+                if other_codes != codes:
+                    continue
+                score = similarity(signature, other)
+                if score >= best_score:
+                    best, best_score = cache_key, score
+        return best
+
+    def discard(self, cache_key: str):
+        with self._lock:
+            self._discard(cache_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def _discard(self, cache_key: str):
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return
+        for band in _bands(entry[0]):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(cache_key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+知識片段欄位式儲存
+將 JSON/JSONL 知識片段編譯成單一二進位檔：所有字串去重後放在同一個
+UTF-8 blob，以位移表存取；字串欄位只存字串編號，分數存成 float 陣列，
+關鍵字等字串列表以位移陣列 + 字串編號陣列表示。載入時以 mmap 開啟，
+不需解析 JSON，多個程序共用同一份 page cache，片段在存取時才組回 dict。
+缺少的欄位記錄在 .present、值為 None 者記錄在 .null，兩者還原時有所區別。
+
+用法：
+    python chunk_corpus_store.py                       # 編譯 M1+M2+M3 整合引擎語料
+    python chunk_corpus_store.py -o out.bin a.jsonl b.json
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Optional
+
+CORPUS_MAGIC = b"DMCHUNK1"
+CORPUS_FORMAT_VERSION = 2
+MISSING = 0xFFFFFFFF
+_HEADER_LEN = struct.Struct("<I")
+
+
+def read_chunk_file(path: str) -> List[Dict[str, Any]]:
+    """讀取 .json（片段列表）或 .jsonl 片段檔"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+
+def _column_kind(values: List[Any]) -> str:
+    present = [v for v in values if v is not None]
+    if not present:
+        return "json"
+    if all(isinstance(v, str) for v in present):
+        return "str"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        if all(isinstance(v, int) for v in present):
+            return "int"
+        if all(isinstance(v, float) for v in present):
+            return "float"
+        return "json"  # int 與 float 混用，以 JSON 保留原型別
+    if all(isinstance(v, list) and all(isinstance(x, str) for x in v) for v in present):
+        return "str_list"
+    return "json"
+
+
+class _StringTable:
+    """字串去重表"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.blob = bytearray()
+        self.offsets = array("I", [0])
+
+    def intern(self, value: str) -> int:
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.ids)
+            self.ids[value] = string_id
+            self.blob += value.encode("utf-8")
+            if len(self.blob) > MISSING:
+                raise ValueError("字串 blob 超過 4GB")
+            self.offsets.append(len(self.blob))
+        return string_id
+
+
+def compile_corpus(chunks: Iterable[Dict[str, Any]], output_path: str,
+                   fingerprint: Optional[str] = None) -> Dict[str, Any]:
+    """將片段編譯成欄位式二進位檔，回傳檔頭資訊"""
+    chunks = list(chunks)
+    field_names: List[str] = []
+    for chunk in chunks:
+        for name in chunk:
+            if name not in field_names:
+                field_names.append(name)
+
+    strings = _StringTable()
+    sections: Dict[str, array] = {}
+    columns = []
+
+    for name in field_names:
+        values = [chunk.get(name) for chunk in chunks]
+        kind = _column_kind(values)
+        column = {"name": name, "kind": kind}
+
+        if any(name not in chunk for chunk in chunks):
+            sections[f"{name}.present"] = array("B", (name in chunk for chunk in chunks))
+            column["has_presence"] = True
+
+        if kind in ("int", "float", "str_list") and any(v is None for v in values):
+            sections[f"{name}.null"] = array("B", (v is None for v in values))
+            column["has_nulls"] = True
+
+        if kind == "str":
+            sections[name] = array("I", (MISSING if v is None else strings.intern(v) for v in values))
+        elif kind == "int":
+            sections[name] = array("q", (0 if v is None else v for v in values))
+        elif kind == "float":
+            sections[name] = array("d", (math.nan if v is None else float(v) for v in values))
+        elif kind == "str_list":
+            offsets, ids = array("I", [0]), array("I")
+            for v in values:
+                ids.extend(strings.intern(x) for x in (v or []))
+                offsets.append(len(ids))
+            sections[f"{name}.offsets"] = offsets
+            sections[name] = ids
+        else:
+            sections[name] = array("I", (
+                MISSING if name not in chunk else strings.intern(json.dumps(chunk[name], ensure_ascii=False))
+                for chunk in chunks
+            ))
+        columns.append(column)
+
+    sections["strings.offsets"] = strings.offsets
+    sections["strings.blob"] = array("B", bytes(strings.blob))
+
+    # 先計算各區段位移（8 位元組對齊），再寫出檔頭與資料
+    layout = {}
+    position = 0
+    for name, data in sections.items():
+        position = (position + 7) & ~7
+        size = len(data) * data.itemsize
+        layout[name] = [position, len(data), data.typecode]
+        position += size
+
+    header = {
+        "format_version": CORPUS_FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "num_chunks": len(chunks),
+        "num_strings": len(strings.ids),
+        "fingerprint": fingerprint,
+        "columns": columns,
+        "sections": layout,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = (len(CORPUS_MAGIC) + _HEADER_LEN.size + len(header_bytes) + 7) & ~7
+
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(tmp_path, "wb") as f:
+        f.write(CORPUS_MAGIC)
+        f.write(_HEADER_LEN.pack(len(header_bytes)))
+        f.write(header_bytes)
+        for name, data in sections.items():
+            f.seek(data_start + layout[name][0])
+            data.tofile(f)
+    os.replace(tmp_path, output_path)
+
+    header["size_bytes"] = os.path.getsize(output_path)
+    return header
+
+
+class ColumnarChunkCorpus(Sequence):
+    """以 mmap 開啟的欄位式片段語料，行為如同唯讀的片段列表"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = self._view = memoryview(self._mmap)
+
+        if bytes(view[:len(CORPUS_MAGIC)]) != CORPUS_MAGIC:
+            raise ValueError(f"不是知識片段語料檔: {path}")
+        (header_len,) = _HEADER_LEN.unpack_from(view, len(CORPUS_MAGIC))
+        header_start = len(CORPUS_MAGIC) + _HEADER_LEN.size
+        self.header = json.loads(bytes(view[header_start:header_start + header_len]).decode("utf-8"))
+        if self.header["format_version"] != CORPUS_FORMAT_VERSION or self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"語料檔版本或位元組順序不符: {path}")
+
+        data_start = (header_start + header_len + 7) & ~7
+        self._sections = {}
+        for name, (offset, length, typecode) in self.header["sections"].items():
+            start = data_start + offset
+            size = length * array(typecode).itemsize
+            self._sections[name] = view[start:start + size].cast(typecode)
+
+        self._blob = self._sections["strings.blob"]
+        self._string_offsets = self._sections["strings.offsets"]
+        self.columns = self.header["columns"]
+        self.fingerprint = self.header.get("fingerprint")
+
+    def __len__(self):
+        return self.header["num_chunks"]
+
+    def close(self):
+        """釋放所有 view 後關閉 mmap 與檔案；scores() 取出的 view 需先釋放"""
+        if self._file.closed:
+            return
+        for data in self._sections.values():
+            data.release()
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string(self, string_id: int) -> Optional[str]:
+        if string_id == MISSING:
+            return None
+        start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def _value(self, column: Dict[str, Any], idx: int):
+        name, kind = column["name"], column["kind"]
+        if column.get("has_nulls") and self._sections[f"{name}.null"][idx]:
+            return None
+        data = self._sections[name]
+        if kind == "str":
+            return self.string(data[idx])
+        if kind in ("int", "float"):
+            return data[idx]
+        if kind == "str_list":
+            offsets = self._sections[f"{name}.offsets"]
+            return [self.string(data[i]) for i in range(offsets[idx], offsets[idx + 1])]
+        return json.loads(self.string(data[idx]))
+
+    def _present(self, column: Dict[str, Any], idx: int) -> bool:
+        return not column.get("has_presence") or bool(self._sections[f"{column['name']}.present"][idx])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("chunk index out of range")
+        return {
+            column["name"]: self._value(column, idx)
+            for column in self.columns if self._present(column, idx)
+        }
+
+    def column(self, name: str) -> List[Any]:
+        """取出單一欄位的所有值（缺少者為 None），不需組回整個片段"""
+        for column in self.columns:
+            if column["name"] == name:
+                return [
+                    self._value(column, idx) if self._present(column, idx) else None
+                    for idx in range(len(self))
+                ]
+        return [None] * len(self)
+
+    def scores(self, name: str) -> memoryview:
+        """數值欄位的零複製 view"""
+        return self._sections[name]
+
+
+def load_corpus(path: Optional[str], fingerprint: Optional[str] = None) -> Optional[ColumnarChunkCorpus]:
+    """開啟語料檔；不存在、格式或指紋不符時回傳 None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        corpus = ColumnarChunkCorpus(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️  語料檔無法開啟 {path}: {e}")
+        return None
+    if fingerprint is not None and corpus.fingerprint != fingerprint:
+        print(f"⚠️  語料檔已過期，改為讀取原始資料: {path}")
+        return None
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="編譯知識片段欄位式語料")
+    parser.add_argument("inputs", nargs="*", help=".json / .jsonl 片段檔；省略時編譯 M1+M2+M3 整合引擎語料")
+    parser.add_argument("-o", "--output", help="輸出檔案")
+    args = parser.parse_args()
+
+    if args.inputs:
+        if not args.output:
+            parser.error("指定輸入檔時需提供 --output")
+        chunks = [chunk for path in args.inputs for chunk in read_chunk_file(path)]
+        header = compile_corpus(chunks, args.output)
+        output = args.output
+    else:
+        from m1_m2_m3_integrated_rag import M1M2M3IntegratedEngine, CORPUS_FILE
+        output = args.output or CORPUS_FILE
+        header = M1M2M3IntegratedEngine.compile_corpus(output)
+
+    with ColumnarChunkCorpus(output) as corpus:
+        source_bytes = sum(len(json.dumps(c, ensure_ascii=False).encode("utf-8")) for c in corpus)
+    print(f"✅ 已編譯 {header['num_chunks']} 個片段 -> {output}")
+    print(f"📊 {header['num_strings']} 個去重字串，{header['size_bytes']} bytes（JSON 約 {source_bytes} bytes）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+斷路器
+依實際呼叫結果追蹤外部服務（Redis 等）健康狀態，不在每次操作前額外 PING：
+    closed     正常呼叫；連續失敗達門檻 -> open
+    open       直接快速失敗；計時器到期後進入 half_open 執行一次探測
+    half_open  探測成功 -> closed；失敗 -> open，等待時間加倍（有上限）
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """以計時器半開探測的斷路器"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 5.0,
+                 max_reset_timeout: float = 60.0, probe: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.probe = probe
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._current_timeout = reset_timeout
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+        self.stats = {"successes": 0, "failures": 0, "short_circuited": 0, "opened": 0, "probes": 0}
+
+    def allow(self) -> bool:
+        """是否允許呼叫；open/half_open 時快速失敗"""
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            # 未設定探測函式時，計時到期後放行一個請求作為探測
+            if (self.probe is None and self.state == self.OPEN
+                    and time.monotonic() - self.opened_at >= self._current_timeout):
+                self.state = self.HALF_OPEN
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        if self.state == self.CLOSED and not self.consecutive_failures:
+            return
+        with self._lock:
+            self._close()
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN:
+                self._open(backoff=True)
+            elif self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open(backoff=False)
+
+    def _close(self):
+        if self.state != self.CLOSED:
+            logger.info(f"✅ {self.name} 已恢復，斷路器關閉")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._current_timeout = self.reset_timeout
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _open(self, backoff: bool):
+        if backoff:
+            self._current_timeout = min(self._current_timeout * 2, self.max_reset_timeout)
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        logger.warning(f"⚠️  {self.name} 無法使用，斷路器開啟 {self._current_timeout:.0f}s")
+        if self.probe is not None:
+            self._timer = threading.Timer(self._current_timeout, self._run_probe)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def trip(self):
+        """立即開啟斷路器（例如初始連線失敗）"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                self.consecutive_failures = self.failure_threshold
+                self._open(backoff=False)
+
+    def _run_probe(self):
+        with self._lock:
+            if self.state != self.OPEN:
+                return
+            self.state = self.HALF_OPEN
+            self.stats["probes"] += 1
+        try:
+            self.probe()
+        except Exception as e:
+            logger.debug(f"{self.name} 探測失敗: {e}")
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def shutdown(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "reset_timeout": self._current_timeout,
+            **self.stats,
+        }
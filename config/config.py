@@ -6,9 +6,12 @@ from typing import Optional
 class AppConfig:
     """Lightweight app configuration"""
     # GenAI Settings (choose ONE provider to save memory)
-    GENAI_PROVIDER = os.getenv("GENAI_PROVIDER", "openai")  # or "claude"
+    GENAI_PROVIDER = os.getenv("GENAI_PROVIDER", "openai")  # or "claude", "mock" (in-process stand-in)
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
+    # Point these at mock_llm_provider.py for offline load tests
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    CLAUDE_BASE_URL = os.getenv("CLAUDE_BASE_URL", "https://api.anthropic.com/v1")
     
     # LINE Settings
     LINE_CHANNEL_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
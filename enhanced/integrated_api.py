@@ -5,8 +5,10 @@
 """
 
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional
+import asyncio
 import uvicorn
 import os
 from datetime import datetime
@@ -93,6 +95,55 @@ async def m1_flex_enhanced(request: UserInput):
         print(f"分析錯誤: {e}")
         return generate_error_flex_message(str(e))
 
+@app.post("/m1-flex/stream")
+async def m1_flex_stream(request: UserInput):
+    """
+    串流版 M1 Flex API（NDJSON）
+    第一行在警訊代碼與標題確定時送出精簡 Flex（stage=early），webhook 讀到即可回覆；
+    第二行為完整分析（stage=complete），格式同 /m1-flex
+    updated_line_bot_webhook.py（USE_M1_STREAM=true）以第一行回覆，完整分析再以 push 送出
+    """
+    if not rag_engine:
+        raise HTTPException(status_code=503, detail="RAG 引擎未初始化")
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    started = loop.time()
+
+    def on_early(fields):
+        loop.call_soon_threadsafe(queue.put_nowait, {
+            "stage": "early",
+            "flex_message": generate_early_flex_message(fields),
+            "analysis_data": {key: fields.get(key) for key in ("matched_warning_code", "symptom_title")},
+            "elapsed": round(loop.time() - started, 3)
+        })
+
+    async def analyze():
+        try:
+            result = await asyncio.to_thread(rag_engine.analyze_with_lightweight_rag, request.user_input, on_early)
+            await queue.put({
+                "stage": "complete",
+                "flex_message": generate_enhanced_flex_message(result),
+                "analysis_data": result,
+                "enhanced": True,
+                "timestamp": datetime.now().isoformat(),
+                "elapsed": round(loop.time() - started, 3)
+            })
+        except Exception as e:
+            print(f"分析錯誤: {e}")
+            await queue.put({"stage": "complete", **generate_error_flex_message(str(e))})
+
+    async def lines():
+        task = asyncio.create_task(analyze())
+        while True:
+            item = await queue.get()
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+            if item["stage"] == "complete":
+                break
+        await task
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 # ===== 新增的增強功能端點 =====
 
 @app.post("/api/v1/analyze")
@@ -415,6 +466,55 @@ def generate_enhanced_flex_message(analysis_data: Dict) -> Dict:
 
     return flex_message
 
+def generate_early_flex_message(fields: Dict) -> Dict:
+    """串流初期只有警訊代碼與標題時的精簡 Flex Message"""
+    symptom_title = fields.get("symptom_title") or "需要關注的症狀"
+    return {
+        "type": "flex",
+        "altText": f"失智症警訊分析：{symptom_title}",
+        "contents": {
+            "type": "bubble",
+            "size": "kilo",
+            "body": {
+                "type": "box",
+                "layout": "vertical",
+                "contents": [
+                    {
+                        "type": "text",
+                        "text": "🧠 失智症警訊分析",
+                        "weight": "bold",
+                        "size": "md",
+                        "color": "#005073"
+                    },
+                    {
+                        "type": "text",
+                        "text": symptom_title,
+                        "weight": "bold",
+                        "size": "lg",
+                        "wrap": True,
+                        "margin": "md"
+                    },
+                    {
+                        "type": "text",
+                        "text": f"警訊代碼：{fields.get('matched_warning_code') or 'M1-GENERAL'}",
+                        "size": "sm",
+                        "color": "#666666",
+                        "margin": "sm"
+                    },
+                    {
+                        "type": "text",
+                        "text": "建議諮詢專業醫療人員進行評估",
+                        "size": "xs",
+                        "color": "#999999",
+                        "wrap": True,
+                        "margin": "md"
+                    }
+                ],
+                "paddingAll": "15dp"
+            }
+        }
+    }
+
 def generate_error_flex_message(error_message: str) -> Dict:
     """生成錯誤回應的 Flex Message"""
     return {
@@ -474,6 +574,7 @@ async def health_check():
         },
         "endpoints": {
             "classic_compatible": "/m1-flex",
+            "streaming_flex": "/m1-flex/stream",
             "enhanced_analysis": "/api/v1/analyze",
             "search_only": "/api/v1/search"
         },
@@ -7,7 +7,9 @@
 import json
 import os
 import re
+import sys
 import math
+import heapq
 from typing import Dict, List, Optional
 from collections import Counter
 from datetime import datetime
@@ -20,31 +22,321 @@ except ImportError:
     print("⚠️  google.generativeai 未安裝，將使用模擬模式")
     GEMINI_AVAILABLE = False
 
+# 檢查 NumPy / SciPy（稀疏矩陣檢索）
+try:
+    import numpy as np
+    from scipy import sparse
+    SPARSE_AVAILABLE = True
+except ImportError:
+    print("⚠️  numpy/scipy 未安裝，將使用純 Python 倒排索引")
+    SPARSE_AVAILABLE = False
+
+# 檢索索引磁碟儲存（位於專案根目錄）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from retrieval_index_store import corpus_fingerprint, open_index, write_index
+from prompt_assembly import PromptTemplate, gemini_cached_tokens, gemini_prefix_cache, prompt_assembler
+from streaming_json import IncrementalJSONParser
+from token_budget import TokenBudgetManager
+
+INDEX_KIND = "lightweight_tfidf"
+DEFAULT_INDEX_DIR = os.getenv("LIGHTWEIGHT_RAG_INDEX_DIR", "data/vector_index/lightweight_tfidf")
+
+# Gemini 提示詞中檢索片段可用的 token 預算
+CONTEXT_TOKEN_BUDGET = int(os.getenv("LIGHTWEIGHT_RAG_CONTEXT_TOKENS", "1500"))
+
+# 串流分析時，這兩個欄位一出現就先通知呼叫端（提示詞中須排在最前面）
+EARLY_REPLY_FIELDS = ("matched_warning_code", "symptom_title")
+
+# Gemini 分析提示詞：固定的指示與 JSON 格式為前綴（system instruction），檢索片段與使用者描述為後綴
+ANALYSIS_PROMPT = PromptTemplate(
+    "lightweight_rag",
+    prefix="""你是失智症早期警訊分析助理。根據使用者訊息中的參考資料與使用者描述分析。
+
+請以JSON格式回應：
+{
+    "matched_warning_code": "M1-XX",
+    "symptom_title": "相符的警訊標題",
+    "user_behavior_summary": "使用者行為摘要",
+    "normal_behavior": "正常老化表現",
+    "dementia_indicator": "失智症警訊指標",
+    "action_suggestion": "建議行動",
+    "confidence_level": "high/medium/low",
+    "source": "TADA 十大警訊"
+}""",
+    suffix="""參考資料：
+{context}
+使用者描述："{user_input}"
+""",
+)
+
+
+class SparseTFIDFIndex:
+    """稀疏 TF-IDF 索引
+
+    文件以 CSR 矩陣儲存詞頻 (tf)，IDF 以向量形式套用在查詢端，
+    文件向量長度預先計算。查詢只需一次稀疏矩陣乘向量，
+    再以 argpartition 取前 k 名。未安裝 numpy/scipy 時改用
+    倒排列表 (postings) 計分，計算結果相同。
+
+    支援增量更新：add_document / remove_document 只就地更新
+    文件頻率與 postings，成本為 O(該文件詞數)；IDF 與文件向量長度
+    標記為過期，於下一次查詢時才重新計算。移除的文件保留為空位，
+    文件編號不會變動。
+    """
+
+    def __init__(self):
+        self.term_index: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self.doc_freq: List[int] = []
+        # 尚未寫入 CSR 的文件詞頻；純 Python 模式下保存全部有效文件
+        self.doc_terms: Dict[int, Dict[int, float]] = {}
+        self.vocabulary = set()
+        self.total_docs = 0        # 文件編號數（含已移除）
+        self.num_docs = 0          # 有效文件數
+        self.tf_matrix = None      # CSR (文件 x 詞彙)，或 postings 字典
+        self.idf = None
+        self.doc_norms = None
+        self._matrix_rows = 0      # 已寫入 CSR 的文件數
+        self._removed = set()
+        self._stale = True
+        if not SPARSE_AVAILABLE:
+            self.tf_matrix = {}
+
+    def build(self, doc_tokens: List[List[str]]):
+        """由分詞後的文件建立索引，成本為 O(總詞數)"""
+        self.__init__()
+        for tokens in doc_tokens:
+            self.add_document(tokens)
+        self._refresh()
+
+    def add_document(self, tokens: List[str]) -> int:
+        """新增一份文件，回傳文件編號"""
+        doc_idx = self.total_docs
+        terms: Dict[int, float] = {}
+
+        if tokens:
+            doc_length = len(tokens)
+            for token, count in Counter(tokens).items():
+                term_id = self.term_index.get(token)
+                if term_id is None:
+                    term_id = len(self.terms)
+                    self.term_index[token] = term_id
+                    self.terms.append(token)
+                    self.doc_freq.append(0)
+                if self.doc_freq[term_id] == 0:
+                    self.vocabulary.add(token)
+                self.doc_freq[term_id] += 1
+
+                tf = count / doc_length
+                terms[term_id] = tf
+                if not SPARSE_AVAILABLE:
+                    self.tf_matrix.setdefault(term_id, {})[doc_idx] = tf
+
+        self.doc_terms[doc_idx] = terms
+        self.total_docs += 1
+        self.num_docs += 1
+        self._stale = True
+        return doc_idx
+
+    def _document_term_ids(self, doc_idx: int):
+        if doc_idx in self.doc_terms:
+            return list(self.doc_terms[doc_idx])
+        start, end = self.tf_matrix.indptr[doc_idx], self.tf_matrix.indptr[doc_idx + 1]
+        return [int(t) for t in self.tf_matrix.indices[start:end]]
+
+    def remove_document(self, doc_idx: int) -> bool:
+        """移除一份文件，回傳是否有移除"""
+        if doc_idx < 0 or doc_idx >= self.total_docs or doc_idx in self._removed:
+            return False
+
+        for term_id in self._document_term_ids(doc_idx):
+            self.doc_freq[term_id] -= 1
+            if self.doc_freq[term_id] == 0:
+                self.vocabulary.discard(self.terms[term_id])
+            if not SPARSE_AVAILABLE:
+                self.tf_matrix[term_id].pop(doc_idx, None)
+
+        self.doc_terms.pop(doc_idx, None)
+        self._removed.add(doc_idx)
+        self.num_docs -= 1
+        self._stale = True
+        return True
+
+    def _refresh(self):
+        """延遲重算：寫入新文件列、重算 IDF 與文件向量長度"""
+        if not self._stale:
+            return
+
+        idf = [math.log(self.num_docs / df) if df > 0 else 0.0 for df in self.doc_freq]
+
+        if SPARSE_AVAILABLE:
+            vocab_size = len(self.terms)
+            rows, cols, values = [], [], []
+            for doc_idx in range(self._matrix_rows, self.total_docs):
+                for term_id, tf in self.doc_terms.pop(doc_idx, {}).items():
+                    rows.append(doc_idx - self._matrix_rows)
+                    cols.append(term_id)
+                    values.append(tf)
+            new_rows = sparse.csr_matrix(
+                (np.asarray(values, dtype=np.float64), (rows, cols)),
+                shape=(self.total_docs - self._matrix_rows, vocab_size)
+            )
+            if self.tf_matrix is None:
+                self.tf_matrix = new_rows
+            else:
+                if self.tf_matrix.shape[1] < vocab_size:
+                    matrix = self.tf_matrix
+                    self.tf_matrix = sparse.csr_matrix(
+                        (matrix.data, matrix.indices, matrix.indptr),
+                        shape=(matrix.shape[0], vocab_size)
+                    )
+                if new_rows.shape[0]:
+                    self.tf_matrix = sparse.vstack([self.tf_matrix, new_rows], format="csr")
+            self._matrix_rows = self.total_docs
+
+            self.idf = np.asarray(idf, dtype=np.float64)
+            weighted_sq = self.tf_matrix.multiply(self.tf_matrix) @ (self.idf ** 2)
+            self.doc_norms = np.sqrt(np.asarray(weighted_sq).ravel())
+            if self._removed:
+                self.doc_norms[list(self._removed)] = 0.0
+        else:
+            self.idf = idf
+            self.doc_norms = [0.0] * self.total_docs
+            for doc_idx, terms in self.doc_terms.items():
+                self.doc_norms[doc_idx] = math.sqrt(sum((tf * idf[t]) ** 2 for t, tf in terms.items()))
+
+        self._stale = False
+
+    def to_arrays(self) -> Dict[str, "np.ndarray"]:
+        """輸出可寫入磁碟的陣列（需 numpy/scipy）"""
+        self._refresh()
+        return {
+            "doc_freq": np.asarray(self.doc_freq, dtype=np.int64),
+            "tf_indptr": self.tf_matrix.indptr,
+            "tf_indices": self.tf_matrix.indices,
+            "tf_data": self.tf_matrix.data,
+            "idf": self.idf,
+            "doc_norms": self.doc_norms,
+            "removed": np.asarray(sorted(self._removed), dtype=np.int64),
+        }
+
+    @classmethod
+    def from_arrays(cls, terms: List[str], term_index: Dict[str, int], arrays) -> "SparseTFIDFIndex":
+        """由（mmap 的）陣列還原索引，不需重新分詞"""
+        index = cls()
+        index.terms = list(terms)
+        index.term_index = term_index
+        index.doc_freq = arrays["doc_freq"].tolist()
+        index.vocabulary = {t for t, df in zip(index.terms, index.doc_freq) if df > 0}
+
+        indptr = arrays["tf_indptr"]
+        index.tf_matrix = sparse.csr_matrix(
+            (arrays["tf_data"], arrays["tf_indices"], indptr),
+            shape=(len(indptr) - 1, len(index.terms)), copy=False
+        )
+        index.idf = arrays["idf"]
+        index.doc_norms = arrays["doc_norms"]
+        index._removed = set(arrays["removed"].tolist())
+        index.total_docs = index._matrix_rows = len(indptr) - 1
+        index.num_docs = index.total_docs - len(index._removed)
+        index._stale = False
+        return index
+
+    def search(self, query_tokens: List[str], k: int = 3):
+        """回傳 [(doc_idx, similarity)]，依相似度由高到低、僅保留大於 0 者"""
+        query_length = len(query_tokens)
+        if query_length == 0 or self.num_docs == 0 or k <= 0:
+            return []
+
+        query_weights = {}
+        for token, count in Counter(query_tokens).items():
+            term_id = self.term_index.get(token)
+            if term_id is not None and self.doc_freq[term_id] > 0:
+                query_weights[term_id] = count / query_length
+        if not query_weights:
+            return []
+        query_norm = math.sqrt(sum(w * w for w in query_weights.values()))
+
+        self._refresh()
+        if SPARSE_AVAILABLE:
+            return self._search_sparse(query_weights, query_norm, k)
+        return self._search_postings(query_weights, query_norm, k)
+
+    def _search_sparse(self, query_weights, query_norm, k):
+        query_vector = np.zeros(len(self.terms), dtype=np.float64)
+        term_ids = np.fromiter(query_weights.keys(), dtype=np.int64)
+        query_vector[term_ids] = np.fromiter(query_weights.values(), dtype=np.float64)
+
+        dots = self.tf_matrix @ (query_vector * self.idf)
+        denom = self.doc_norms * query_norm
+        scores = np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+
+        total_docs = scores.shape[0]
+        if k < total_docs:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(total_docs)
+        # 同分時依文件順序排列
+        order = np.lexsort((candidates, -scores[candidates]))
+        return [(int(candidates[i]), float(scores[candidates[i]]))
+                for i in order if scores[candidates[i]] > 0]
+
+    def _search_postings(self, query_weights, query_norm, k):
+        dots: Dict[int, float] = {}
+        for term_id, q_tf in query_weights.items():
+            q_weight = q_tf * self.idf[term_id]
+            if q_weight == 0:
+                continue
+            for doc_idx, tf in self.tf_matrix.get(term_id, {}).items():
+                dots[doc_idx] = dots.get(doc_idx, 0.0) + tf * q_weight
+
+        scored = []
+        for doc_idx, dot in dots.items():
+            denom = self.doc_norms[doc_idx] * query_norm
+            if denom > 0 and dot > 0:
+                scored.append((dot / denom, -doc_idx))
+        return [(-neg_idx, score) for score, neg_idx in heapq.nlargest(k, scored)]
+
+
 class LightweightRAGEngine:
     """輕量級 RAG 引擎"""
 
-    def __init__(self, gemini_api_key=None):
+    def __init__(self, gemini_api_key=None, index_dir=DEFAULT_INDEX_DIR):
         print("🚀 初始化輕量級 RAG 引擎...")
 
-        # Gemini 配置
+        # Gemini 配置；self.model 只在注入替身時設定，否則每次呼叫向 gemini_prefix_cache 取得（context cache 到期前會重建）
         self.gemini_available = GEMINI_AVAILABLE and gemini_api_key
-        if self.gemini_available:
+        self.model = None
+        if os.getenv('GEMINI_PROVIDER') == 'mock':
+            # 本地替身：相同的固定前綴作為 system_instruction
+            from mock_llm_provider import MockGenerativeModel
+            self.model = MockGenerativeModel('gemini-1.5-flash', system_instruction=ANALYSIS_PROMPT.prefix)
+            self.gemini_available = True
+            print("🧪 使用本地 Mock LLM（GEMINI_PROVIDER=mock）")
+        elif self.gemini_available:
             try:
                 genai.configure(api_key=gemini_api_key)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
+                # 固定前綴只建立一次模型，夠長時使用 context caching
+                gemini_prefix_cache.model_for(ANALYSIS_PROMPT, 'gemini-1.5-flash')
                 print("✅ Gemini AI 連接成功")
             except Exception as e:
                 print(f"⚠️  Gemini AI 連接失敗: {e}")
                 self.gemini_available = False
 
+        # 提示詞 token 預算
+        self.token_budget = TokenBudgetManager()
+
         # 檢索組件
         self.chunks = []
-        self.tfidf_matrix = {}
+        self.tfidf_index = SparseTFIDFIndex()
         self.vocabulary = set()
+        self.indexed_chunks = []   # 與索引文件編號對齊，已移除者為 None
+        self.chunk_doc_ids = {}    # chunk_id -> 索引文件編號
 
-        # 載入資料
+        # 載入資料；有預先建好的索引時直接 mmap 開啟，不重新分詞
         self.load_m1_chunks()
-        self.build_tfidf_index()
+        if not self.load_index(index_dir):
+            self.build_tfidf_index()
 
         print("✅ 引擎初始化完成")
 
@@ -115,51 +407,105 @@ class LightweightRAGEngine:
         return tokens
 
     def compute_tf_idf(self, documents):
-        """計算 TF-IDF"""
+        """計算 TF-IDF（稀疏索引）"""
         print("🔍 建立 TF-IDF 索引...")
 
-        all_tokens = []
-        doc_tokens = []
-
-        for doc in documents:
-            tokens = self.tokenize_chinese(doc)
-            doc_tokens.append(tokens)
-            all_tokens.extend(tokens)
-
-        self.vocabulary = set(all_tokens)
-        vocab_list = list(self.vocabulary)
-
-        tfidf_matrix = {}
-        N = len(documents)
-
-        for doc_idx, tokens in enumerate(doc_tokens):
-            doc_vector = {}
-            token_count = Counter(tokens)
-            doc_length = len(tokens)
+        doc_tokens = [self.tokenize_chinese(doc) for doc in documents]
 
-            for token in vocab_list:
-                if doc_length > 0:
-                    tf = token_count[token] / doc_length
-                    docs_with_token = sum(1 for dt in doc_tokens if token in dt)
-                    idf = math.log(N / docs_with_token) if docs_with_token > 0 else 0
-                    tfidf_score = tf * idf
-                    if tfidf_score > 0:
-                        doc_vector[token] = tfidf_score
+        index = SparseTFIDFIndex()
+        index.build(doc_tokens)
+        self.vocabulary = index.vocabulary
 
-            tfidf_matrix[doc_idx] = doc_vector
+        return index
 
-        return tfidf_matrix
+    def chunk_document(self, chunk):
+        """組合片段的檢索文字"""
+        return f"{chunk['title']} {chunk['content']} {' '.join(chunk['keywords'])}"
 
     def build_tfidf_index(self):
         """建立檢索索引"""
-        documents = []
-        for chunk in self.chunks:
-            doc_text = f"{chunk['title']} {chunk['content']} {' '.join(chunk['keywords'])}"
-            documents.append(doc_text)
+        documents = [self.chunk_document(chunk) for chunk in self.chunks]
 
-        self.tfidf_matrix = self.compute_tf_idf(documents)
+        self.tfidf_index = self.compute_tf_idf(documents)
+        self.indexed_chunks = list(self.chunks)
+        self.chunk_doc_ids = {
+            chunk.get("chunk_id"): doc_idx for doc_idx, chunk in enumerate(self.chunks)
+        }
         print("✅ 檢索索引建立完成")
 
+    def index_fingerprint(self):
+        """目前已索引片段的指紋"""
+        return corpus_fingerprint(
+            INDEX_KIND,
+            [chunk.get("chunk_id") if chunk else None for chunk in self.indexed_chunks],
+            [self.chunk_document(chunk) if chunk else None for chunk in self.indexed_chunks]
+        )
+
+    def save_index(self, index_dir=DEFAULT_INDEX_DIR):
+        """將目前的檢索索引寫入磁碟（需 numpy/scipy）"""
+        if not SPARSE_AVAILABLE:
+            raise RuntimeError("numpy/scipy 未安裝，無法儲存索引")
+        return write_index(
+            index_dir,
+            kind=INDEX_KIND,
+            fingerprint=self.index_fingerprint(),
+            terms=self.tfidf_index.terms,
+            arrays=self.tfidf_index.to_arrays(),
+            chunks=[chunk or {} for chunk in self.indexed_chunks]
+        )
+
+    def load_index(self, index_dir=DEFAULT_INDEX_DIR):
+        """開啟磁碟索引；索引不存在或與目前片段不符時回傳 False"""
+        if not SPARSE_AVAILABLE or not index_dir:
+            return False
+
+        self.indexed_chunks = list(self.chunks)
+        stored = open_index(index_dir, INDEX_KIND, fingerprint=self.index_fingerprint())
+        if stored is None:
+            return False
+
+        self.tfidf_index = SparseTFIDFIndex.from_arrays(stored.terms, stored.term_index, stored.arrays)
+        self.vocabulary = self.tfidf_index.vocabulary
+        self.chunk_doc_ids = {
+            chunk.get("chunk_id"): doc_idx for doc_idx, chunk in enumerate(self.indexed_chunks)
+        }
+        print(f"✅ 已開啟磁碟索引 {stored.path}")
+        return True
+
+    def add_chunks(self, chunks):
+        """增量加入知識片段（同 chunk_id 者視為更新）
+
+        只處理新片段的詞彙，不重建整個索引；IDF 於下次查詢時重算。
+        """
+        removed = self.remove_chunks(
+            [chunk.get("chunk_id") for chunk in chunks if chunk.get("chunk_id") in self.chunk_doc_ids]
+        )
+
+        for chunk in chunks:
+            tokens = self.tokenize_chinese(self.chunk_document(chunk))
+            doc_idx = self.tfidf_index.add_document(tokens)
+            self.indexed_chunks.append(chunk)
+            self.chunk_doc_ids[chunk.get("chunk_id")] = doc_idx
+            self.chunks.append(chunk)
+
+        self.vocabulary = self.tfidf_index.vocabulary
+        print(f"➕ 新增 {len(chunks) - removed} 個、更新 {removed} 個知識片段，目前共 {len(self.chunks)} 個")
+        return len(chunks)
+
+    def remove_chunks(self, chunk_ids):
+        """增量移除知識片段，回傳實際移除數量"""
+        removed_ids = set()
+        for chunk_id in chunk_ids:
+            doc_idx = self.chunk_doc_ids.pop(chunk_id, None)
+            if doc_idx is not None and self.tfidf_index.remove_document(doc_idx):
+                self.indexed_chunks[doc_idx] = None
+                removed_ids.add(chunk_id)
+
+        if removed_ids:
+            self.chunks = [c for c in self.chunks if c.get("chunk_id") not in removed_ids]
+            self.vocabulary = self.tfidf_index.vocabulary
+        return len(removed_ids)
+
     def cosine_similarity(self, vec1, vec2):
         """計算餘弦相似度"""
         common_keys = set(vec1.keys()) & set(vec2.keys())
@@ -181,91 +527,98 @@ class LightweightRAGEngine:
         print(f"🔍 檢索查詢: {query}")
 
         query_tokens = self.tokenize_chinese(query)
-        query_token_count = Counter(query_tokens)
-        query_length = len(query_tokens)
-
-        if query_length == 0:
+        if not query_tokens:
             return []
 
-        query_vector = {}
-        for token in self.vocabulary:
-            tf = query_token_count[token] / query_length
-            if tf > 0:
-                query_vector[token] = tf
-
-        similarities = []
-        for doc_idx, doc_vector in self.tfidf_matrix.items():
-            similarity = self.cosine_similarity(query_vector, doc_vector)
-            similarities.append((doc_idx, similarity))
-
-        similarities.sort(key=lambda x: x[1], reverse=True)
-
         results = []
-        for doc_idx, similarity in similarities[:k]:
-            if similarity > 0:
-                chunk = self.chunks[doc_idx].copy()
-                chunk['similarity_score'] = round(similarity, 4)
-                results.append(chunk)
+        for doc_idx, similarity in self.tfidf_index.search(query_tokens, k=k):
+            chunk = self.indexed_chunks[doc_idx].copy()
+            chunk['similarity_score'] = round(similarity, 4)
+            results.append(chunk)
 
         print(f"📊 找到 {len(results)} 個相關片段")
         return results
 
-    def analyze_with_lightweight_rag(self, user_input):
-        """RAG 分析"""
+    def analyze_with_lightweight_rag(self, user_input, on_early=None):
+        """RAG 分析；有 on_early 時，警訊代碼與標題一確定就呼叫一次 on_early(欄位)，
+        Gemini 以串流分析，呼叫端可在其餘欄位產生期間先送出回覆"""
         print(f"🧠 分析: {user_input}")
 
+        notified = []
+
+        def notify(fields):
+            if on_early and not notified:
+                notified.append(True)
+                on_early(fields)
+
         relevant_chunks = self.retrieve_relevant_chunks(user_input, k=3)
 
         if not relevant_chunks:
-            return self.get_fallback_response(user_input, [])
-
-        if self.gemini_available:
-            return self.analyze_with_gemini(user_input, relevant_chunks)
+            result = self.get_fallback_response(user_input, [])
+        elif self.gemini_available:
+            result = self.analyze_with_gemini(user_input, relevant_chunks, on_early=notify if on_early else None)
         else:
-            return self.analyze_with_rules(user_input, relevant_chunks)
+            result = self.analyze_with_rules(user_input, relevant_chunks)
 
-    def analyze_with_gemini(self, user_input, chunks):
-        """使用 Gemini 分析"""
-        print("🤖 使用 Gemini AI 分析...")
+        # 規則分析、備用回應或串流未解析出欄位時，以完整結果通知
+        notify(result)
+        return result
 
-        context_info = ""
-        for i, chunk in enumerate(chunks, 1):
-            context_info += f"【片段{i}】{chunk['title']}: {chunk['content']}\n"
+    def build_gemini_prompt(self, user_input, chunks):
+        """Gemini 分析提示詞（固定前綴 + 動態後綴）；片段依相關度放入 context，超出預算時捨棄排名最後的片段"""
+        _, context_info = self.token_budget.fit_chunks(
+            chunks, CONTEXT_TOKEN_BUDGET, lambda i, chunk: f"【片段{i}】{chunk['title']}: {chunk['content']}\n")
+        return ANALYSIS_PROMPT.render(context=context_info, user_input=user_input)
 
-        prompt = f"""你是失智症早期警訊分析助理。
-
-參考資料：
-{context_info}
+    def analyze_with_gemini(self, user_input, chunks, on_early=None):
+        """使用 Gemini 分析；前綴已在模型的 system instruction 中，只送出後綴。
+        有 on_early 時改以串流生成並增量解析"""
+        print("🤖 使用 Gemini AI 分析...")
 
-使用者描述："{user_input}"
+        prompt = self.build_gemini_prompt(user_input, chunks)
+        early_fields = {}
 
-請以JSON格式回應：
-{{
-    "matched_warning_code": "M1-XX",
-    "symptom_title": "相符的警訊標題",
-    "user_behavior_summary": "使用者行為摘要",
-    "normal_behavior": "正常老化表現",
-    "dementia_indicator": "失智症警訊指標",
-    "action_suggestion": "建議行動",
-    "confidence_level": "high/medium/low",
-    "source": "TADA 十大警訊"
-}}"""
+        def notify_early(fields):
+            early_fields.update(fields)
+            on_early(fields)
 
         try:
-            response = self.model.generate_content(prompt)
-            result_text = response.text
-            analysis_result = self.safe_json_parse(result_text)
+            model = self.model or gemini_prefix_cache.model_for(ANALYSIS_PROMPT, 'gemini-1.5-flash')
+            if on_early is None:
+                response = model.generate_content(prompt.suffix)
+                analysis_result = self.safe_json_parse(response.text)
+            else:
+                response = model.generate_content(prompt.suffix, stream=True)
+                analysis_result = self.stream_gemini_json(response, notify_early)
 
             analysis_result["retrieved_chunks"] = chunks
             analysis_result["total_chunks_used"] = len(chunks)
             analysis_result["lightweight_rag"] = True
             analysis_result["analysis_method"] = "gemini_ai"
+            analysis_result["prefix_tokens_saved"] = prompt_assembler.record(
+                prompt, "gemini", gemini_cached_tokens(response))
 
             return analysis_result
 
         except Exception as e:
             print(f"⚠️  Gemini 分析失敗: {e}")
-            return self.analyze_with_rules(user_input, chunks)
+            fallback = self.analyze_with_rules(user_input, chunks)
+            if early_fields:
+                # 提早回覆已送出：保留串流解析出的欄位，避免完整結果與已送出的回覆不一致
+                fallback.update(early_fields)
+                fallback["early_reply_kept"] = True
+            return fallback
+
+    def stream_gemini_json(self, response, on_early):
+        """逐段增量解析串流回應，警訊代碼與標題完成時立即呼叫 on_early"""
+        parser = IncrementalJSONParser()
+        notified = False
+        for chunk in response:
+            parser.feed(chunk.text)
+            if not notified and parser.has(EARLY_REPLY_FIELDS):
+                notified = True
+                on_early(dict(parser.fields))
+        return parser.result() or self.safe_json_parse(parser.buffer)
 
     def analyze_with_rules(self, user_input, chunks):
         """規則基礎分析"""
@@ -15,9 +15,8 @@ class EnhancedRAGWithM2(LightweightRAGEngine):
     def __init__(self, gemini_api_key=None):
         super().__init__(gemini_api_key)
 
-        # 載入 M2 模組
+        # 載入 M2 模組（增量加入索引）
         self.load_m2_chunks()
-        self.rebuild_index_with_m2()
 
         print("✅ M2 病程階段模組已整合")
 
@@ -36,14 +35,14 @@ class EnhancedRAGWithM2(LightweightRAGEngine):
                 # 如果沒有檔案，直接建立 M2 chunks
                 m2_chunks = self.create_m2_chunks_inline()
 
-            # 合併到現有 chunks
-            self.chunks.extend(m2_chunks)
+            # 增量加入現有索引
+            self.add_chunks(m2_chunks)
             print(f"📊 載入了 {len(m2_chunks)} 個 M2 知識片段")
 
         except Exception as e:
             print(f"⚠️  M2 模組載入失敗: {e}")
             print("將使用內建的 M2 知識片段")
-            self.chunks.extend(self.create_m2_chunks_inline())
+            self.add_chunks(self.create_m2_chunks_inline())
 
     def create_m2_chunks_inline(self):
         """內建的 M2 chunks（如果檔案不存在）"""
@@ -81,7 +80,7 @@ class EnhancedRAGWithM2(LightweightRAGEngine):
         ]
 
     def rebuild_index_with_m2(self):
-        """重新建立包含 M2 的檢索索引"""
+        """完整重建包含 M2 的檢索索引（一般情況請用 add_chunks 增量更新）"""
         print("🔄 重新建立檢索索引（包含 M2 模組）...")
         self.build_tfidf_index()
         print(f"✅ 索引重建完成，現在包含 {len(self.chunks)} 個知識片段")
@@ -12,6 +12,8 @@ import os
 from datetime import datetime
 import re
 
+from keyword_matcher import shared_matcher
+
 app = FastAPI(
     title="增強版失智小助手 Chatbot API",
     description="支援 M1-M4 模組的失智症分析服務 + XAI 視覺化",
@@ -1238,54 +1240,56 @@ def analyze_comprehensive(text: str) -> Dict[str, Any]:
         "M4": m4_analysis
     }
 
-def should_use_visualization(message: str, user_context: dict = None) -> dict:
-    """
-    智能判斷是否使用視覺化模組
-    
-    Args:
-        message: 用戶輸入訊息
-        user_context: 用戶上下文（可選）
-    
-    Returns:
-        dict: {
-            "use_visualization": bool,
-            "reason": str,
-            "confidence": float
-        }
-    """
+# 視覺化判斷關鍵詞
+VISUALIZATION_MODULE = "visualization"
+VISUALIZATION_KEYWORDS = {
     # 視覺化偏好關鍵詞
-    visualization_keywords = [
+    "visualization": [
         "圖表", "視覺", "圖像", "視覺化", "圖表", "分析", "數據", "統計",
         "比較", "對比", "趨勢", "進度", "階段", "程度", "嚴重性",
         "詳細", "完整", "全面", "深入", "專業", "醫療", "診斷"
-    ]
-    
+    ],
     # 純文字偏好關鍵詞
-    text_only_keywords = [
+    "text_only": [
         "簡單", "快速", "簡短", "直接", "立即", "馬上", "緊急",
         "基本", "初步", "大概", "大概", "約略", "粗略",
         "聊天", "閒聊", "隨便", "隨便問問", "好奇", "想了解"
-    ]
-    
+    ],
     # 緊急情況關鍵詞
-    emergency_keywords = [
+    "emergency": [
         "緊急", "危險", "立即", "馬上", "現在", "立刻", "急",
         "救命", "幫助", "求助", "支援", "協助"
-    ]
-    
+    ],
     # 複雜分析關鍵詞
-    complex_analysis_keywords = [
+    "complex_analysis": [
         "詳細分析", "完整評估", "全面檢查", "深入診斷",
         "專業意見", "醫療建議", "專家諮詢", "正式評估"
     ]
+}
+shared_matcher.register(VISUALIZATION_MODULE, VISUALIZATION_KEYWORDS)
+
+def should_use_visualization(message: str, user_context: dict = None) -> dict:
+    """
+    智能判斷是否使用視覺化模組
     
-    message_lower = message.lower()
+    Args:
+        message: 用戶輸入訊息
+        user_context: 用戶上下文（可選）
+    
+    Returns:
+        dict: {
+            "use_visualization": bool,
+            "reason": str,
+            "confidence": float
+        }
+    """
+    matches = shared_matcher.match(message)
     
     # 計算各類關鍵詞匹配分數
-    viz_score = sum(1 for keyword in visualization_keywords if keyword in message_lower)
-    text_score = sum(1 for keyword in text_only_keywords if keyword in message_lower)
-    emergency_score = sum(1 for keyword in emergency_keywords if keyword in message_lower)
-    complex_score = sum(1 for keyword in complex_analysis_keywords if keyword in message_lower)
+    viz_score = matches.count(VISUALIZATION_MODULE, "visualization")
+    text_score = matches.count(VISUALIZATION_MODULE, "text_only")
+    emergency_score = matches.count(VISUALIZATION_MODULE, "emergency")
+    complex_score = matches.count(VISUALIZATION_MODULE, "complex_analysis")
     
     # 判斷邏輯
     use_visualization = False
@@ -93,7 +93,16 @@ except ImportError:
     print("⚠️  整合引擎模組未找到")
     M1M2M3IntegratedEngine = None
 
+# 非同步 Redis 後端：async 端點的快取讀寫不阻塞事件迴圈
+from async_redis_cache import AsyncRedisCache
+
+# LINE 回覆派送器：webhook 立即回應，分析與回覆由有界佇列 + async worker 處理
+from line_reply_dispatcher import LineReplyClient, LineReplyDispatcher
+
 # 導入所有模組
+from fused_analysis_pipeline import FusedAnalysis, FusedAnalysisPipeline
+from keyword_matcher import KeywordMatches, shared_matcher
+from single_flight import SingleFlight, flight_key
 from modules.m1_warning_signs import M1WarningSignsModule
 from modules.m2_progression_matrix import M2ProgressionMatrixModule
 from modules.m3_bpsd_classification import M3BPSDClassificationModule
@@ -111,7 +120,19 @@ app = FastAPI()
 # 全域引擎和優化組件
 integrated_engine = None
 cache_manager = None
+async_cache = AsyncRedisCache()
 optimized_gemini = None
+analysis_pipeline = FusedAnalysisPipeline(None, m1_module, m2_module, m3_module, m4_module)
+# 快取未命中時合併同一輸入的並行分析與 Flex 生成（啟動後改用 Redis 鎖跨程序合併）
+single_flight = SingleFlight()
+line_reply_client = LineReplyClient(os.getenv("LINE_CHANNEL_ACCESS_TOKEN", ""))
+
+
+@app.middleware("http")
+async def analysis_scope(request: Request, call_next):
+    """每個請求一個融合分析範圍：請求內多次分析同一輸入只算一次，跨請求的重用交給 Redis 快取"""
+    with analysis_pipeline.scope():
+        return await call_next(request)
 
 
 # 檢查環境變數
@@ -140,21 +161,16 @@ def check_env_variables():
     return True
 
 
-def create_smart_flex_message(user_input: str, analysis_result: Any) -> Dict:
+def create_smart_flex_message(user_input: str, analysis_result: Any, fused: FusedAnalysis = None) -> Dict:
     """智能創建適合的 Flex Message，根據用戶問題選配視覺模組"""
     
-    # 使用 M1 模組進行警訊分析
-    m1_analysis = m1_module.analyze_warning_signs(user_input)
+    # M1–M4 模組評分取自融合分析（同一則訊息只分析一次）
+    fused = fused or analysis_pipeline.analyze(user_input)
+    m1_analysis = fused.module("M1")
     matched_signs = m1_analysis.get('matched_signs', [])
-    
-    # 使用 M2 模組進行病程階段分析
-    m2_analysis = m2_module.analyze_progression(user_input)
-    
-    # 使用 M3 模組進行 BPSD 症狀分析
-    m3_analysis = m3_module.analyze_bpsd_symptoms(user_input)
-    
-    # 使用 M4 模組進行照護需求分析
-    m4_analysis = m4_module.analyze_care_needs(user_input)
+    m2_analysis = fused.module("M2")
+    m3_analysis = fused.module("M3")
+    m4_analysis = fused.module("M4")
     
     # 智能模組選擇邏輯
     user_input_lower = user_input.lower()
@@ -287,220 +303,65 @@ def create_smart_flex_message(user_input: str, analysis_result: Any) -> Dict:
         return flex_message
 
 
-@handler.add(MessageEvent, message=TextMessageContent)
-def handle_message(event):
-    logger.info("[DEBUG] handle_message 被呼叫")
-    try:
-        user_input = event.message.text
-        user_id = event.source.user_id
-        logger.info(f"[DEBUG] event.message.text: {user_input}")
-        logger.info(f"[DEBUG] event.source.user_id: {user_id}")
-        logger.info(f"📨 收到來自 {user_id} 的訊息: {user_input}")
-        
-        # 檢查 reply token 是否有效
-        if not event.reply_token or event.reply_token == "00000000000000000000000000000000":
-            logger.error("[DEBUG] Reply token 無效或過期")
-            return
-        
-        if integrated_engine:
-            logger.info("[DEBUG] integrated_engine 可用，開始分析...")
-            
-            # 檢查快取
-            cached_result = None
-            if cache_manager:
-                cached_result = cache_manager.get_cached_analysis(user_input)
-                if cached_result:
-                    logger.info("[DEBUG] 快取命中，使用快取結果")
-                    result = cached_result
-                else:
-                    logger.info("[DEBUG] 快取未命中，進行新分析")
-                    result = integrated_engine.analyze_comprehensive(user_input)
-                    # 快取新結果
-                    try:
-                        cache_manager.cache_analysis_result(user_input, result)
-                        logger.info("[DEBUG] 新分析結果已快取")
-                    except Exception as cache_error:
-                        logger.warning(f"[DEBUG] 快取失敗: {cache_error}")
-            else:
-                logger.info("[DEBUG] 無快取管理器，直接分析")
-                result = integrated_engine.analyze_comprehensive(user_input)
-            
-            logger.info(f"[DEBUG] 分析結果類型: {type(result)}")
-            
-            # 生成回應（先嘗試文字訊息，確保能回應）
+def analyze_and_cache(user_input: str) -> Any:
+    """分析並寫入快取；同一輸入的並行請求只分析一次，其他程序持鎖時等待其快取結果"""
+    def compute():
+        result = analysis_pipeline.analyze(user_input).result
+        if cache_manager:
             try:
-                # 創建簡單的文字回應
-                if result and hasattr(result, 'comprehensive_summary'):
-                    summary = result.comprehensive_summary
-                elif result and isinstance(result, dict):
-                    summary = result.get('comprehensive_summary', '分析完成')
-                else:
-                    summary = "分析完成"
-                
-                text_response = f"""🧠 失智症分析結果
+                cache_manager.cache_analysis_result(user_input, result)
+                logger.info("💾 分析結果已快取")
+            except Exception as cache_error:
+                logger.warning(f"⚠️  快取失敗: {cache_error}")
+        return result
 
-📋 分析摘要：{summary}
+    result, _ = single_flight.do(
+        flight_key("analysis", user_input), compute,
+        check=(lambda: cache_manager.get_cached_analysis(user_input)) if cache_manager else None,
+    )
+    return result
 
-💡 建議：請諮詢專業醫療人員進行詳細評估
-"""
-                
-                # 發送文字訊息（確保能回應）
-                success = send_line_message_sync(event.reply_token, text_response)
-                
-                if success:
-                    logger.info("✅ 文字訊息發送成功")
-                else:
-                    logger.error("❌ 文字訊息發送失敗")
-                
-            except Exception as text_error:
-                logger.warning(f"[DEBUG] 文字訊息創建失敗: {text_error}")
-                # 最終備用方案
-                send_fallback_message_sync(event.reply_token)
-                
-        else:
-            response_text = "❌ 系統尚未初始化，請稍後再試。"
-            send_line_message_sync(event.reply_token, response_text)
-            
-    except Exception as e:
-        logger.error(f"❌ 訊息處理錯誤: {e}")
-        import traceback
-        logger.error(f"❌ 詳細錯誤: {traceback.format_exc()}")
-        send_fallback_message_sync(event.reply_token)
-
-async def send_line_message_with_retry(reply_token: str, text: str, max_retries: int = 3) -> bool:
-    """發送 LINE 訊息，帶重試機制"""
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"[DEBUG] 嘗試發送訊息 (第 {attempt + 1} 次)")
-            
-            # 創建文字訊息
-            text_message = TextMessage(text=text)
-            
-            # 設置超時
-            import asyncio
-            await asyncio.wait_for(
-                asyncio.to_thread(
-                    line_bot_api.reply_message,
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[text_message]
-                    )
-                ),
-                timeout=LINE_TIMEOUT
-            )
-            
-            logger.info("✅ 文字訊息發送成功")
-            return True
-            
-        except asyncio.TimeoutError:
-            logger.error(f"❌ 發送超時 (第 {attempt + 1} 次)")
-        except Exception as e:
-            logger.error(f"❌ 發送失敗 (第 {attempt + 1} 次): {e}")
-        
-        if attempt < max_retries - 1:
-            await asyncio.sleep(1)  # 等待 1 秒後重試
-    
-    logger.error("❌ 所有重試都失敗")
-    return False
 
-def send_line_message_sync(reply_token: str, text: str, max_retries: int = 3) -> bool:
-    """發送 LINE 訊息，同步版本"""
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"[DEBUG] 嘗試發送訊息 (第 {attempt + 1} 次)")
-            
-            # 創建文字訊息
-            text_message = TextMessage(text=text)
-            
-            # 直接發送（同步）
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[text_message]
-                )
-            )
-            
-            logger.info("✅ 訊息發送成功")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ 訊息發送失敗 (第 {attempt + 1} 次): {e}")
-            if attempt < max_retries - 1:
-                import time
-                time.sleep(1)  # 等待1秒後重試
-            else:
-                logger.error("❌ 所有重試都失敗了")
-                return False
+def handle_message(events) -> List[Dict[str, Any]]:
+    """分析同一使用者合併後的文字訊息並產生回覆內容（由回覆派送器在專用執行緒呼叫，回覆另以非同步送出）"""
+    logger.info(f"[DEBUG] handle_message 被呼叫（{len(events)} 則訊息）")
+    user_input = "\n".join(event.message.text for event in events)
+    user_id = events[0].source.user_id
+    logger.info(f"📨 收到來自 {user_id} 的訊息: {user_input}")
     
-    return False
+    if not integrated_engine:
+        return [{"type": "text", "text": "❌ 系統尚未初始化，請稍後再試。"}]
+    
+    # 檢查快取
+    result = None
+    if cache_manager:
+        result = cache_manager.get_cached_analysis(user_input)
+        if result:
+            logger.info("[DEBUG] 快取命中，使用快取結果")
+    if not result:
+        with analysis_pipeline.scope():
+            result = analyze_and_cache(user_input)
+    
+    if result and hasattr(result, 'comprehensive_summary'):
+        summary = result.comprehensive_summary
+    elif result and isinstance(result, dict):
+        summary = result.get('comprehensive_summary', '分析完成')
+    else:
+        summary = "分析完成"
+    
+    text_response = f"""🧠 失智症分析結果
 
-def send_flex_message_sync(reply_token: str, flex_content: Dict, alt_text: str = "失智症分析結果"):
-    """發送 Flex 訊息，同步版本"""
-    try:
-        logger.info(f"[DEBUG] 嘗試發送 Flex 訊息")
-        
-        # 創建 Flex 訊息
-        flex_message = FlexMessage(
-            alt_text=alt_text,
-            contents=flex_content
-        )
-        
-        # 直接發送（同步）
-        line_bot_api.reply_message(
-            ReplyMessageRequest(
-                reply_token=reply_token,
-                messages=[flex_message]
-            )
-        )
-        
-        logger.info("✅ Flex 訊息發送成功")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Flex 訊息發送失敗: {e}")
-        return False
+📋 分析摘要：{summary}
 
-def send_fallback_message_sync(reply_token: str):
-    """發送備用訊息，同步版本"""
-    try:
-        fallback_text = "🧠 失智症分析完成\n\n分析結果已準備好，請稍後查看。"
-        text_message = TextMessage(text=fallback_text)
-        
-        line_bot_api.reply_message(
-            ReplyMessageRequest(
-                reply_token=reply_token,
-                messages=[text_message]
-            )
-        )
-        logger.info("✅ 備用訊息發送成功")
-        return True
-    except Exception as e:
-        logger.error(f"❌ 備用訊息發送失敗: {e}")
-        return False
+💡 建議：請諮詢專業醫療人員進行詳細評估
+"""
+    messages = [{"type": "text", "text": text_response}]
+    if len(events) > 1:
+        messages.insert(0, {"type": "text", "text": f"📝 已將您的 {len(events)} 則訊息合併分析"})
+    return messages
 
-async def send_fallback_message(reply_token: str):
-    """發送備用訊息"""
-    try:
-        fallback_text = "🧠 失智症分析完成\n\n分析結果已準備好，請稍後查看。"
-        text_message = TextMessage(text=fallback_text)
-        
-        await asyncio.wait_for(
-            asyncio.to_thread(
-                line_bot_api.reply_message,
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[text_message]
-                )
-            ),
-            timeout=10  # 較短的超時時間
-        )
-        
-        logger.info("✅ 備用訊息發送成功")
-        
-    except Exception as e:
-        logger.error(f"❌ 備用訊息發送失敗: {e}")
-        # 最後的錯誤處理 - 記錄但不拋出異常
-        logger.info("✅ 已回覆用戶純文字訊息（最終備用方案）")
+
+reply_dispatcher = LineReplyDispatcher(handle_message, line_reply_client.reply)
 
 @app.get("/webhook")
 async def webhook_get():
@@ -527,24 +388,20 @@ async def webhook(request: Request):
             logger.error("[DEBUG] 缺少 X-Line-Signature")
             return {"error": "缺少 X-Line-Signature"}
         
+        # 只在此驗證簽名與解析事件，分析與回覆交給派送器，立即回應 LINE
         try:
-            # 設置超時處理
-            await asyncio.wait_for(
-                asyncio.to_thread(handler.handle, body.decode(), signature),
-                timeout=30  # 30 秒超時
-            )
-            logger.info("[DEBUG] handler.handle 已執行")
-            return {"message": "ok"}
-            
-        except asyncio.TimeoutError:
-            logger.error("❌ Webhook 處理超時")
-            return {"error": "處理超時"}
+            events = handler.parser.parse(body.decode(), signature)
         except InvalidSignatureError:
             logger.error("❌ 無效的 LINE 簽名")
             return {"error": "無效簽名"}
-        except Exception as handler_error:
-            logger.error(f"❌ Handler 處理錯誤: {handler_error}")
-            return {"error": str(handler_error)}
+        
+        for event in events:
+            if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+                if not event.reply_token or event.reply_token == "00000000000000000000000000000000":
+                    logger.error("[DEBUG] Reply token 無效或過期")
+                    continue
+                reply_dispatcher.submit(event)
+        return {"message": "ok"}
             
     except Exception as e:
         logger.error(f"❌ Webhook 處理錯誤: {e}")
@@ -553,7 +410,7 @@ async def webhook(request: Request):
 
 @app.on_event("startup")
 async def startup():
-    global integrated_engine, cache_manager, optimized_gemini, line_bot_api, handler
+    global integrated_engine, cache_manager, optimized_gemini, line_bot_api, handler, analysis_pipeline, single_flight
     print("🚀 啟動增強版 M1+M2+M3 整合引擎...")
 
     # 檢查環境變數
@@ -571,6 +428,8 @@ async def startup():
     if RedisCacheManager:
         try:
             cache_manager = RedisCacheManager()
+            await async_cache.connect()
+            cache_manager.attach_async(async_cache)
             print("✅ Redis 快取管理器初始化成功")
         except Exception as e:
             print(f"❌ Redis 快取管理器初始化失敗: {e}")
@@ -603,9 +462,31 @@ async def startup():
         print("⚠️  M1+M2+M3 整合引擎未載入")
         integrated_engine = None
 
+    # 融合分析管線：每則訊息只檢索一次，結果分送 M1–M4 並依訊息記憶
+    analysis_pipeline = FusedAnalysisPipeline(integrated_engine, m1_module, m2_module, m3_module, m4_module)
+    single_flight = SingleFlight(lock_manager=cache_manager)
+
+    # 啟動 LINE 回覆派送器
+    await reply_dispatcher.start()
+
     print("✅ 增強版 M1+M2+M3 整合 API 啟動成功")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await reply_dispatcher.stop()
+    await line_reply_client.close()
+    await async_cache.close()
+    if cache_manager:
+        cache_manager.close()
+
+
+@app.get("/dispatcher/stats")
+def get_dispatcher_stats():
+    """LINE 回覆派送器背壓指標"""
+    return reply_dispatcher.get_stats()
+
+
 class UserInput(BaseModel):
     user_input: str
 
@@ -676,7 +557,7 @@ def analyze_m1(request: UserInput):
         return {"error": "引擎未初始化"}
     
     try:
-        result = integrated_engine.analyze_comprehensive(request.user_input)
+        result = analysis_pipeline.analyze(request.user_input).result
         # 只返回 M1 相關結果
         m1_chunks = [c for c in result.retrieved_chunks if c.get("chunk_id", "").startswith("M1")]
         return {
@@ -697,7 +578,7 @@ def analyze_m2(request: UserInput):
         return {"error": "引擎未初始化"}
     
     try:
-        result = integrated_engine.analyze_comprehensive(request.user_input)
+        result = analysis_pipeline.analyze(request.user_input).result
         # 只返回 M2 相關結果
         m2_chunks = [c for c in result.retrieved_chunks if c.get("module_id") == "M2"]
         return {
@@ -716,7 +597,7 @@ def analyze_m3(request: UserInput):
         return {"error": "引擎未初始化"}
     
     try:
-        result = integrated_engine.analyze_comprehensive(request.user_input)
+        result = analysis_pipeline.analyze(request.user_input).result
         # 只返回 M3 相關結果
         m3_chunks = [c for c in result.retrieved_chunks if c.get("module_id") == "M3"]
         return {
@@ -735,9 +616,11 @@ def analyze_m4(request: UserInput):
         return {"error": "引擎未初始化"}
     
     try:
-        result = integrated_engine.analyze_comprehensive(request.user_input)
+        fused = analysis_pipeline.analyze(request.user_input)
+        result = fused.result
         return {
             "module": "M4",
+            "care_needs": [need.value for need in fused.module("M4").get("detected_needs", [])],
             "action_suggestions": result.action_suggestions,
             "comprehensive_summary": result.comprehensive_summary
         }
@@ -746,7 +629,7 @@ def analyze_m4(request: UserInput):
 
 
 @app.post("/comprehensive-analysis")
-def comprehensive_analysis(request: UserInput):
+async def comprehensive_analysis(request: UserInput):
     """綜合分析端點（優化版本）"""
 
     if not integrated_engine:
@@ -758,9 +641,11 @@ def comprehensive_analysis(request: UserInput):
         # 檢查快取
         cached_result = None
         if cache_manager:
-            cached_result = cache_manager.get_cached_analysis(user_input)
+            cached_result = await cache_manager.aget_cached_analysis(user_input)
             if cached_result:
                 logger.info("✅ 分析結果快取命中")
+                if hasattr(cached_result, '__dict__'):
+                    cached_result = cached_result.__dict__
                 return {
                     **cached_result,
                     "cached": True,
@@ -768,10 +653,11 @@ def comprehensive_analysis(request: UserInput):
                     "cache_available": cache_manager.is_available()
                 }
 
-        # 使用整合引擎進行分析
-        result = integrated_engine.analyze_comprehensive(user_input)
+        # 使用融合分析管線（與各模組端點共用同一次分析），並行的相同請求只分析一次；
+        # 分析為 CPU 工作，放到執行緒中執行
+        result = await asyncio.to_thread(analyze_and_cache, user_input)
 
-        # 將結果轉換為字典格式以便快取
+        # 將結果轉換為字典格式以便回應
         try:
             if hasattr(result, '__dict__'):
                 result_dict = result.__dict__
@@ -786,14 +672,6 @@ def comprehensive_analysis(request: UserInput):
             # 如果無法序列化，轉換為字符串
             result_dict = {"result": str(result), "type": type(result).__name__}
 
-        # 快取結果
-        if cache_manager:
-            try:
-                cache_manager.cache_analysis_result(user_input, result_dict)
-                logger.info("💾 分析結果已快取")
-            except Exception as cache_error:
-                logger.warning(f"⚠️  快取失敗: {cache_error}")
-
         return {
             **result_dict,
             "cached": False,
@@ -815,19 +693,14 @@ async def professional_analysis(request: UserInput):
     try:
         logger.info(f"🎯 專業分析: {request.user_input}")
         
-        # 執行基礎分析
-        result = integrated_engine.analyze_comprehensive(request.user_input)
-        
-        # 轉換為字典格式
-        if hasattr(result, '__dict__'):
-            result_dict = result.__dict__
-        else:
-            result_dict = result
+        # 執行基礎分析（融合管線，結果與其他端點共用）
+        fused = analysis_pipeline.analyze(request.user_input)
         
         # 執行專業模組化分析
         context = {
             "user_input": request.user_input,
-            "analysis_result": result_dict
+            "analysis_result": fused.result_dict,
+            "keyword_matches": fused.matches
         }
         
         professional_result = await professional_analyzer.analyze_professional(request.user_input, context)
@@ -861,22 +734,21 @@ def analyze_with_flex(request: UserInput):
                 logger.info("✅ Flex Message 快取命中")
                 return {"flex_message": cached_flex, "cached": True, "optimized": True}
 
-        # 使用整合引擎進行分析
-        result = integrated_engine.analyze_comprehensive(user_input)
-
-        # 將 AnalysisResult 對象轉換為字典格式
-        if hasattr(result, '__dict__'):
-            result_dict = result.__dict__
-        else:
-            result_dict = result
-
-        # 生成 Flex Message
-        flex_message = create_smart_flex_message(user_input, result_dict)
-
-        # 快取 Flex Message
-        if cache_manager:
-            cache_manager.cache_flex_message(user_input, flex_message)
-            logger.info("💾 Flex Message 已快取")
+        def generate_flex():
+            # 使用融合分析管線生成 Flex Message 並快取
+            fused = analysis_pipeline.analyze(user_input)
+            flex_message = create_smart_flex_message(user_input, fused.result_dict, fused)
+            if cache_manager:
+                cache_manager.cache_flex_message(user_input, flex_message)
+                logger.info("💾 Flex Message 已快取")
+            return flex_message
+
+        # 並行的相同請求只生成一次
+        flex_message, _ = single_flight.do(
+            flight_key("flex", user_input), generate_flex,
+            check=(lambda: cache_manager.get_cached_flex_message(user_input)) if cache_manager else None,
+        )
+        result = analysis_pipeline.analyze(user_input).result
 
         return {
             "flex_message": flex_message,
@@ -1168,8 +1040,10 @@ def clear_cache():
     """清除快取"""
     if cache_manager:
         try:
-            cache_manager.clear_all_cache()
-            return {"message": "快取已清除", "status": "success"}
+            # 遞增各命名空間的世代號，舊鍵由背景 SCAN + UNLINK 回收，不阻塞共用的 Redis
+            if not cache_manager.clear_all_cache():
+                return {"message": "Redis 無法使用，僅清除本地快取", "status": "partial"}
+            return {"message": "快取已清除", "status": "success", "generations": cache_manager.get_cache_stats()["generations"]}
         except Exception as e:
             return {"message": f"清除快取失敗: {str(e)}", "status": "error"}
     return {"message": "快取管理器不可用", "status": "unavailable"}
@@ -1182,7 +1056,9 @@ def modules_status():
         "integrated_engine": "active" if integrated_engine else "inactive",
         "cache_manager": "active" if cache_manager else "inactive",
         "optimized_gemini": "active" if optimized_gemini else "inactive",
-        "line_bot_api": "active" if line_bot_api else "inactive"
+        "line_bot_api": "active" if line_bot_api else "inactive",
+        "analysis_pipeline": analysis_pipeline.get_stats(),
+        "single_flight": single_flight.get_stats()
     }
 
 
@@ -2596,15 +2472,28 @@ class XAIVisualization:
 class ProfessionalModularAnalysis:
     """專業 M1-M4 模組化分析"""
     
+    KEYWORD_MODULE = "professional"
+    MODULE_KEYWORDS = {
+        # M1 快速篩檢 - 十大警訊智能比對
+        "M1": ["記憶", "忘記", "重複", "迷路", "時間", "混淆", "警訊"],
+        # M2 病程理解 - 階段預測與個人化建議
+        "M2": ["階段", "進展", "惡化", "早期", "中期", "晚期", "病程"],
+        # M3 症狀處理 - BPSD 分類與應對策略
+        "M3": ["情緒", "行為", "暴躁", "妄想", "幻覺", "遊走", "睡眠", "攻擊"],
+        # M4 資源導航 - 智能匹配與申請指引
+        "M4": ["申請", "補助", "資源", "照護", "服務", "支援", "協助"]
+    }
+    
     def __init__(self):
         self.bon_mav = BoNMAV()
         self.xai_visualization = XAIVisualization()
         self.aspect_verifier = AspectVerifier()
+        shared_matcher.register(self.KEYWORD_MODULE, self.MODULE_KEYWORDS)
     
     async def analyze_professional(self, user_input: str, context: Dict) -> Dict[str, Any]:
         """專業模組化分析"""
-        # 1. 模組選擇
-        selected_modules = self._select_modules(user_input)
+        # 1. 模組選擇（沿用融合分析的關鍵字比對結果）
+        selected_modules = self._select_modules(user_input, context.get("keyword_matches"))
         
         # 2. 專業分析
         analysis_results = {}
@@ -2634,29 +2523,11 @@ class ProfessionalModularAnalysis:
             "selection_reason": bon_mav_result["selection_reason"]
         }
     
-    def _select_modules(self, user_input: str) -> List[str]:
+    def _select_modules(self, user_input: str, matches: KeywordMatches = None) -> List[str]:
         """智能選擇分析模組"""
-        modules = []
-        
-        # M1 快速篩檢 - 十大警訊智能比對
-        m1_keywords = ["記憶", "忘記", "重複", "迷路", "時間", "混淆", "警訊"]
-        if any(keyword in user_input for keyword in m1_keywords):
-            modules.append("M1")
-        
-        # M2 病程理解 - 階段預測與個人化建議
-        m2_keywords = ["階段", "進展", "惡化", "早期", "中期", "晚期", "病程"]
-        if any(keyword in user_input for keyword in m2_keywords):
-            modules.append("M2")
-        
-        # M3 症狀處理 - BPSD 分類與應對策略
-        m3_keywords = ["情緒", "行為", "暴躁", "妄想", "幻覺", "遊走", "睡眠", "攻擊"]
-        if any(keyword in user_input for keyword in m3_keywords):
-            modules.append("M3")
-        
-        # M4 資源導航 - 智能匹配與申請指引
-        m4_keywords = ["申請", "補助", "資源", "照護", "服務", "支援", "協助"]
-        if any(keyword in user_input for keyword in m4_keywords):
-            modules.append("M4")
+        # M1 快速篩檢、M2 病程理解、M3 症狀處理、M4 資源導航（依序）
+        matches = matches or shared_matcher.match(user_input)
+        modules = matches.categories(self.KEYWORD_MODULE)
         
         # 如果沒有明確匹配，使用 M1 作為預設
         if not modules:
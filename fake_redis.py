@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+快取測試共用的假 Redis
+FakeRedis 以記憶體字典模擬同步 Redis 客戶端（記錄指令與發佈的訊息），
+build_manager 建立不連線、不啟動背景執行緒的 RedisCacheManager 並接上指定的客戶端。
+各測試模組由此匯入，不互相匯入測試模組。
+"""
+
+from fnmatch import fnmatch
+
+from redis_cache_manager import RedisCacheManager
+
+
+class FakeRedis:
+    """共用資料的假 Redis 客戶端，記錄指令與發佈的訊息"""
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+        self.published = []
+
+    def ping(self):
+        return True
+
+    def get(self, key):
+        self.commands.append("get")
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.commands.append("setex")
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        self.commands.append("delete")
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def mget(self, keys):
+        self.commands.append("mget")
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        self.commands.append("incr")
+        self.data[key] = str(int(self.data.get(key) or 0) + 1).encode()
+        return int(self.data[key])
+
+    def scan(self, cursor, match="*", count=10):
+        # 游標為上一頁最後一個鍵的序號，掃描期間刪除鍵不會跳過其他鍵
+        self.commands.append("scan")
+        if cursor == 0:
+            self.scan_order = sorted(self.data)
+        keys = self.scan_order[cursor:cursor + count]
+        next_cursor = cursor + count if cursor + count < len(self.scan_order) else 0
+        return next_cursor, [key.encode() for key in keys if key in self.data and fnmatch(key, match)]
+
+    def unlink(self, *keys):
+        self.commands.append("unlink")
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def publish(self, channel, message):
+        self.commands.append("publish")
+        self.published.append((channel, message))
+        return 1
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        self.client.commands.append("pipeline")
+        return [getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+def build_manager(client):
+    """斷路器設為關閉、停止探測，並以 client 取代連線後讀取世代號"""
+    manager = RedisCacheManager(redis_url="redis://127.0.0.1:1")
+    manager.close()
+    manager.breaker.state = manager.breaker.CLOSED
+    manager.redis_client = client
+    manager._refresh_generations()
+    return manager
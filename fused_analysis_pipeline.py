@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+M1–M4 融合分析管線
+每則訊息只做一次分詞與檢索（整合引擎）和一次關鍵字掃描（共用比對器），
+再把同一份中間結果分送給 M1–M4 四個模組評分。結果只在一則訊息（一個請求）的處理範圍內記憶：
+同一請求中產生 Flex、取得綜合結果等多次呼叫共用同一次分析，請求結束即丟棄；
+跨請求的重用交給 Redis 快取（清除快取後不會再回傳舊結果）。
+未記憶時以 single-flight 合併同一輸入的並行分析；兩者都以正規化輸入
+（NFKC、合併空白）為鍵，只差空白或全半形的訊息共用同一次分析。
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from keyword_matcher import KeywordMatches, shared_matcher
+from single_flight import SingleFlight, flight_key, normalize_input
+
+ModuleScorer = Callable[[str, KeywordMatches], Dict[str, Any]]
+
+# 目前請求的記憶結果（正規化輸入 -> 融合分析）；不在範圍內時為 None
+_request_memo: ContextVar[Optional[Dict[str, "FusedAnalysis"]]] = ContextVar("fused_analysis_memo", default=None)
+
+
+class FusedAnalysis:
+    """單一訊息的融合分析結果"""
+
+    def __init__(self, user_input: str, result: Any, matches: KeywordMatches,
+                 module_results: Dict[str, Dict[str, Any]]):
+        self.user_input = user_input
+        self.result = result                    # 整合引擎的 AnalysisResult（可能為 None）
+        self.matches = matches                  # 共用關鍵字比對結果
+        self.module_results = module_results    # M1–M4 模組評分
+
+    @property
+    def result_dict(self) -> Dict[str, Any]:
+        """整合引擎結果的字典形式"""
+        if self.result is None:
+            return {}
+        return dict(self.result.__dict__) if hasattr(self.result, "__dict__") else dict(self.result)
+
+    def module(self, module_id: str) -> Dict[str, Any]:
+        return self.module_results.get(module_id, {})
+
+
+class FusedAnalysisPipeline:
+    """融合分析管線：分詞/檢索一次、分送四個模組評分，並在請求範圍內記憶結果"""
+
+    def __init__(self, engine: Any = None, m1_module: Any = None, m2_module: Any = None,
+                 m3_module: Any = None, m4_module: Any = None):
+        self.engine = engine
+        self.scorers: Dict[str, ModuleScorer] = {}
+        if m1_module is not None:
+            self.scorers["M1"] = m1_module.analyze_warning_signs
+        if m2_module is not None:
+            self.scorers["M2"] = m2_module.analyze_progression
+        if m3_module is not None:
+            self.scorers["M3"] = m3_module.analyze_bpsd_symptoms
+        if m4_module is not None:
+            self.scorers["M4"] = m4_module.analyze_care_tasks
+
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def scope(self) -> Iterator[None]:
+        """一則訊息（一個請求）的處理範圍：範圍內同一輸入只分析一次，離開範圍即丟棄；巢狀時沿用外層範圍"""
+        if _request_memo.get() is not None:
+            yield
+            return
+        token = _request_memo.set({})
+        try:
+            yield
+        finally:
+            _request_memo.reset(token)
+
+    def analyze(self, user_input: str) -> FusedAnalysis:
+        """取得訊息的融合分析（同一請求內已分析過的訊息直接回傳記憶結果）"""
+        key = normalize_input(user_input)
+        memo = _request_memo.get()
+        if memo is not None and key in memo:
+            with self._lock:
+                self.hits += 1
+            return memo[key]
+        with self._lock:
+            self.misses += 1
+
+        fused, _ = self._flights.do(flight_key("analysis", key), lambda: self._run(key))
+        if memo is not None:
+            memo[key] = fused
+        return fused
+
+    def _run(self, user_input: str) -> FusedAnalysis:
+        matches = shared_matcher.match(user_input)
+        result = self.engine.analyze_comprehensive(user_input) if self.engine is not None else None
+        module_results = {
+            module_id: scorer(user_input, matches) for module_id, scorer in self.scorers.items()
+        }
+        return FusedAnalysis(user_input, result, matches, module_results)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "shared_flights": self._flights.stats["shared"],
+        }
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+多關鍵字比對（Aho–Corasick）
+各模組把關鍵字表註冊到同一個比對器，所有表的關鍵字編譯成單一自動機，
+訊息只需掃描一次即可取得全部 (keyword, module, category) 命中，
+各模組從比對結果取用，不再逐一 `keyword in text`。
+自動機只在關鍵字表內容變更時重新編譯。
+
+用法：
+    from keyword_matcher import shared_matcher
+    shared_matcher.register("M3", {"激動": ["暴躁", "易怒"], "憂鬱": ["低落"]})
+    matches = shared_matcher.match("爸爸最近很暴躁")
+    matches.categories("M3")        # ["激動"]
+"""
+
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Hashable, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+KeywordTable = Mapping[Hashable, Iterable[str]]
+
+
+class KeywordHit(NamedTuple):
+    keyword: str
+    module: str
+    category: Hashable
+    start: int
+
+
+class AhoCorasickAutomaton:
+    """以 dict 轉移表實作的 Aho–Corasick 自動機"""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = list(dict.fromkeys(k for k in keywords if k))
+        self._goto: List[Dict[str, int]] = [{}]
+        self._output: List[Tuple[int, ...]] = [()]
+
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._output.append(())
+                state = nxt
+            self._output[state] += (keyword_id,)
+
+        # 以 BFS 建立失敗轉移，並把失敗鏈上的輸出合併到各狀態
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._output[nxt] += self._output[self._fail[nxt]]
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """單次掃描，依結束位置產生 (起始位置, 關鍵字編號)，包含重疊命中"""
+        goto, fail, output, keywords = self._goto, self._fail, self._output, self.keywords
+        state = 0
+        for end, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword_id in output[state]:
+                yield end - len(keywords[keyword_id]) + 1, keyword_id
+
+
+class KeywordMatches:
+    """單一訊息的比對結果，各模組由此取用自己的命中"""
+
+    def __init__(self, hits: List[KeywordHit], tables: Dict[str, Dict[Hashable, Tuple[str, ...]]]):
+        self.hits = hits
+        self._tables = tables
+        self._found: Dict[str, Dict[Hashable, Set[str]]] = {}
+        for hit in hits:
+            self._found.setdefault(hit.module, {}).setdefault(hit.category, set()).add(hit.keyword)
+
+    def modules(self) -> List[str]:
+        """有命中的模組（依註冊順序）"""
+        return [module for module in self._tables if module in self._found]
+
+    def categories(self, module: str) -> List[Hashable]:
+        """模組中有命中的類別，依關鍵字表中的順序"""
+        found = self._found.get(module, {})
+        return [category for category in self._tables.get(module, {}) if category in found]
+
+    def keywords(self, module: str, category: Optional[Hashable] = None) -> Set[str]:
+        """命中的關鍵字（不指定類別時為整個模組）"""
+        found = self._found.get(module, {})
+        if category is not None:
+            return set(found.get(category, ()))
+        return set().union(*found.values()) if found else set()
+
+    def count(self, module: str, category: Hashable) -> int:
+        """關鍵字表中出現在訊息裡的項目數，等同 sum(kw in text for kw in table[category])"""
+        found = self._found.get(module, {}).get(category)
+        if not found:
+            return 0
+        return sum(1 for keyword in self._tables[module][category] if keyword in found)
+
+
+class KeywordMatcher:
+    """共用關鍵字比對器：註冊關鍵字表、延遲編譯自動機、快取最近的比對結果"""
+
+    def __init__(self, cache_size: int = 256):
+        self._tables: Dict[str, Dict[Hashable, Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+        self._automaton: Optional[AhoCorasickAutomaton] = None
+        self._keyword_targets: List[Tuple[Tuple[str, Hashable], ...]] = []
+        self._snapshot: Dict[str, Dict[Hashable, Tuple[str, ...]]] = {}
+        self._compiled_version = -1
+        self._cache: "OrderedDict[str, KeywordMatches]" = OrderedDict()
+        self._cache_size = cache_size
+        self.version = 0
+        self.compile_count = 0
+
+    def register(self, module: str, table: KeywordTable) -> bool:
+        """註冊或更新模組的關鍵字表（類別 -> 關鍵字列表），內容有變更時回傳 True"""
+        normalized = {category: tuple(k.lower() for k in keywords) for category, keywords in table.items()}
+        with self._lock:
+            current = self._tables.get(module)
+            if current is not None and list(current.items()) == list(normalized.items()):
+                return False
+            self._tables[module] = normalized
+            self.version += 1
+            self._cache.clear()
+            return True
+
+    def unregister(self, module: str) -> bool:
+        with self._lock:
+            if self._tables.pop(module, None) is None:
+                return False
+            self.version += 1
+            self._cache.clear()
+            return True
+
+    def table(self, module: str) -> Dict[Hashable, Tuple[str, ...]]:
+        return dict(self._tables.get(module, {}))
+
+    def _compile(self):
+        """關鍵字表有變更時才重新編譯（呼叫端需持有鎖）"""
+        if self._compiled_version == self.version:
+            return
+        targets: Dict[str, List[Tuple[str, Hashable]]] = {}
+        for module, table in self._tables.items():
+            for category, keywords in table.items():
+                for keyword in keywords:
+                    if keyword and (module, category) not in targets.setdefault(keyword, []):
+                        targets[keyword].append((module, category))
+        self._automaton = AhoCorasickAutomaton(targets)
+        self._keyword_targets = [tuple(targets[k]) for k in self._automaton.keywords]
+        self._snapshot = dict(self._tables)
+        self._compiled_version = self.version
+        self.compile_count += 1
+
+    def match(self, text: str) -> KeywordMatches:
+        """單次掃描訊息（不分大小寫），回傳所有模組的命中"""
+        text = (text or "").lower()
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+            self._compile()
+            automaton, targets, tables = self._automaton, self._keyword_targets, self._snapshot
+
+        hits = [
+            KeywordHit(automaton.keywords[keyword_id], module, category, start)
+            for start, keyword_id in automaton.iter_matches(text)
+            for module, category in targets[keyword_id]
+        ]
+        result = KeywordMatches(hits, tables)
+
+        with self._lock:
+            if self._compiled_version == self.version:
+                self._cache[text] = result
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+
+# 所有模組共用的比對器
+shared_matcher = KeywordMatcher()
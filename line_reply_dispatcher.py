@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+LINE 回覆派送器
+Webhook 驗證簽名後立即回應 200，事件放入有界佇列，由 N 個 async worker 取出：
+分析在專用執行緒池執行（不占用預設 executor），回覆以 httpx.AsyncClient
+連線池非同步送出，重試以 asyncio.sleep 退避，不阻塞執行緒。
+超過回覆期限（reply token 失效）的事件直接丟棄並計數；佇列滿時拒收並計數，
+突發流量只會反映在背壓指標上，不會耗盡執行緒池。
+同一使用者在短時間內連續送出的訊息會在合併視窗內併成一批，只分析一次，
+並以一個 ReplyMessageRequest（最多 5 則訊息）回覆。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+LINE_REPLY_URL = "https://api.line.me/v2/bot/message/reply"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# 派送器設定
+REPLY_WORKERS = int(os.getenv("LINE_REPLY_WORKERS", "4"))
+REPLY_QUEUE_SIZE = int(os.getenv("LINE_REPLY_QUEUE_SIZE", "100"))
+REPLY_DEADLINE = float(os.getenv("LINE_REPLY_DEADLINE", "50"))  # reply token 約 1 分鐘內有效
+REPLY_TIMEOUT = float(os.getenv("LINE_REPLY_TIMEOUT", "10"))
+COALESCE_WINDOW = float(os.getenv("LINE_COALESCE_WINDOW", "0.8"))  # 同一使用者連續訊息的合併視窗
+MAX_BATCH_EVENTS = int(os.getenv("LINE_COALESCE_MAX_EVENTS", "5"))
+MAX_REPLY_MESSAGES = 5  # 單一 ReplyMessageRequest 上限
+
+# 回覆函式：async (reply_token, messages, deadline=...) -> 是否成功
+ReplySender = Callable[..., Any]
+
+
+class LineReplyClient:
+    """以連線池呼叫 LINE Reply API 的非同步客戶端"""
+
+    def __init__(self, access_token: str, timeout: float = REPLY_TIMEOUT, max_retries: int = 3,
+                 max_connections: int = 20, max_keepalive: int = 10):
+        self.access_token = access_token
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self._client = None
+
+    async def start(self):
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("httpx 未安裝，無法建立 LINE 回覆客戶端")
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_keepalive),
+                headers={"Authorization": f"Bearer {self.access_token}"},
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def reply(self, reply_token: str, messages: List[Dict[str, Any]],
+                    deadline: Optional[float] = None) -> bool:
+        """送出回覆；429/5xx 與連線錯誤以指數退避重試，不超過期限（monotonic 秒）"""
+        await self.start()
+        payload = {"replyToken": reply_token, "messages": messages[:MAX_REPLY_MESSAGES]}
+        for attempt in range(self.max_retries):
+            try:
+                response = await self._client.post(LINE_REPLY_URL, json=payload)
+                if response.status_code == 200:
+                    return True
+                if response.status_code not in RETRYABLE_STATUS:
+                    logger.error(f"❌ LINE 回覆失敗 {response.status_code}: {response.text[:200]}")
+                    return False
+                logger.warning(f"⚠️  LINE 回覆 {response.status_code}，準備重試 (第 {attempt + 1} 次)")
+            except httpx.HTTPError as e:
+                logger.warning(f"⚠️  LINE 回覆連線錯誤 (第 {attempt + 1} 次): {e}")
+
+            backoff = 0.5 * (2 ** attempt)
+            if attempt == self.max_retries - 1 or (deadline is not None and time.monotonic() + backoff > deadline):
+                break
+            await asyncio.sleep(backoff)
+        logger.error("❌ LINE 回覆重試失敗")
+        return False
+
+    __call__ = reply
+
+
+class _Job:
+    """一批待回覆事件（同一使用者在合併視窗內的訊息）"""
+    __slots__ = ("events", "enqueued_at", "deadline", "timer")
+
+    def __init__(self, event: Any, enqueued_at: float, deadline: float):
+        self.events = [event]
+        self.enqueued_at = enqueued_at
+        self.deadline = deadline
+        self.timer = None
+
+
+class LineReplyDispatcher:
+    """有界佇列 + async worker 的 LINE 事件派送器"""
+
+    def __init__(self, process_events: Callable[[List[Any]], List[Dict[str, Any]]], send_reply: ReplySender,
+                 workers: int = REPLY_WORKERS, queue_size: int = REPLY_QUEUE_SIZE,
+                 reply_deadline: float = REPLY_DEADLINE, coalesce_window: float = COALESCE_WINDOW,
+                 max_batch_events: int = MAX_BATCH_EVENTS,
+                 fallback_messages: Optional[List[Dict[str, Any]]] = None):
+        self.process_events = process_events
+        self.send_reply = send_reply
+        self.workers = workers
+        self.queue_size = queue_size
+        self.reply_deadline = reply_deadline
+        self.coalesce_window = coalesce_window
+        self.max_batch_events = max_batch_events
+        self.fallback_messages = fallback_messages or [
+            {"type": "text", "text": "🧠 失智症分析完成\n\n分析結果已準備好，請稍後查看。"}
+        ]
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Dict[str, _Job] = {}
+        self._loop = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.stats = {
+            "accepted": 0,
+            "rejected": 0,        # 佇列滿拒收
+            "coalesced": 0,       # 併入同一使用者既有批次的事件
+            "batches": 0,
+            "expired": 0,         # 等待過久，reply token 已失效
+            "replied": 0,
+            "failed": 0,
+            "fallbacks": 0,
+            "in_flight": 0,
+            "queue_high_watermark": 0,
+            "max_queue_wait": 0.0,
+            "total_queue_wait": 0.0,
+            "total_processing_time": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="line-reply")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"✅ LINE 回覆派送器啟動：{self.workers} 個 worker，佇列上限 {self.queue_size}，"
+                    f"合併視窗 {self.coalesce_window}s")
+
+    async def stop(self, drain: bool = True):
+        """停止派送器；drain=True 時先送出合併中的批次並處理完佇列"""
+        if not self.running:
+            return
+        for key in list(self._pending):
+            self._flush(key)
+        if drain:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=False)
+
+    def _deadline(self, event: Any, now: float) -> float:
+        deadline = now + self.reply_deadline
+        # LINE 事件帶有毫秒時間戳，以事件發生時間計算 reply token 期限
+        timestamp = getattr(event, "timestamp", None)
+        if isinstance(timestamp, (int, float)) and timestamp > 0:
+            deadline -= max(0.0, time.time() - timestamp / 1000)
+        return deadline
+
+    def submit(self, event: Any) -> bool:
+        """事件放入佇列（不等待）；同一使用者在合併視窗內的事件併成一批，佇列滿時回傳 False"""
+        now = time.monotonic()
+        deadline = self._deadline(event, now)
+        user_id = getattr(getattr(event, "source", None), "user_id", None)
+
+        job = self._pending.get(user_id) if user_id else None
+        if job is not None:
+            job.events.append(event)
+            job.deadline = min(job.deadline, deadline)
+            self.stats["accepted"] += 1
+            self.stats["coalesced"] += 1
+            if len(job.events) >= self.max_batch_events:
+                self._flush(user_id)
+            return True
+
+        # 合併中的批次也占用佇列名額，送出時才不會因佇列已滿而失敗
+        if self._queue.qsize() + len(self._pending) >= self.queue_size:
+            self.stats["rejected"] += 1
+            logger.warning(f"⚠️  回覆佇列已滿（{self.queue_size}），拒收事件")
+            return False
+
+        job = _Job(event, now, deadline)
+        self.stats["accepted"] += 1
+        if user_id and self.coalesce_window > 0 and self.max_batch_events > 1:
+            self._pending[user_id] = job
+            job.timer = self._loop.call_later(self.coalesce_window, self._flush, user_id)
+        else:
+            self._enqueue(job)
+        return True
+
+    def _flush(self, user_id: str):
+        job = self._pending.pop(user_id, None)
+        if job is None:
+            return
+        if job.timer is not None:
+            job.timer.cancel()
+        self._enqueue(job)
+
+    def _enqueue(self, job: _Job):
+        self._queue.put_nowait(job)
+        self.stats["batches"] += 1
+        self.stats["queue_high_watermark"] = max(self.stats["queue_high_watermark"], self._queue.qsize())
+
+    async def _worker(self, worker_id: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._handle(loop, job)
+            except Exception as e:
+                logger.error(f"❌ 派送器 worker {worker_id} 錯誤: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _handle(self, loop, job: _Job):
+        started = time.monotonic()
+        waited = started - job.enqueued_at
+        self.stats["total_queue_wait"] += waited
+        self.stats["max_queue_wait"] = max(self.stats["max_queue_wait"], waited)
+
+        if started >= job.deadline:
+            self.stats["expired"] += 1
+            logger.warning(f"⚠️  事件等待 {waited:.1f}s，reply token 已過期，略過")
+            return
+
+        # 以批次中最早的 reply token 一次回覆（最多 5 則訊息）
+        reply_token = getattr(job.events[0], "reply_token", None)
+        self.stats["in_flight"] += 1
+        try:
+            try:
+                messages = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, self.process_events, job.events),
+                    timeout=max(0.0, job.deadline - started),
+                )
+            except Exception as e:
+                logger.error(f"❌ 事件分析失敗，改送備用訊息: {e}")
+                messages = self.fallback_messages
+                self.stats["fallbacks"] += 1
+
+            if not messages or not reply_token:
+                return
+            if await self.send_reply(reply_token, messages[:MAX_REPLY_MESSAGES], deadline=job.deadline):
+                self.stats["replied"] += 1
+            else:
+                self.stats["failed"] += 1
+        finally:
+            self.stats["in_flight"] -= 1
+            self.stats["total_processing_time"] += time.monotonic() - started
+
+    def get_stats(self) -> Dict[str, Any]:
+        """背壓指標"""
+        stats = dict(self.stats)
+        handled = stats["replied"] + stats["failed"] + stats["expired"]
+        stats.update({
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "pending_batches": len(self._pending),
+            "avg_queue_wait": stats["total_queue_wait"] / handled if handled else 0.0,
+            "avg_processing_time": stats["total_processing_time"] / handled if handled else 0.0,
+        })
+        return stats
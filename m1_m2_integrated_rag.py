@@ -15,12 +15,9 @@ class M1M2RAGEngine(LightweightRAGEngine):
         # 初始化基礎引擎（包含 M1）
         super().__init__(gemini_api_key)
         
-        # 載入 M2 模組
+        # 載入 M2 模組（增量加入索引）
         self.load_m2_module()
         
-        # 重建索引
-        self.rebuild_combined_index()
-        
         print(f"✅ 整合完成：總共 {len(self.chunks)} 個知識片段")
     
     def load_m2_module(self):
@@ -28,22 +25,21 @@ class M1M2RAGEngine(LightweightRAGEngine):
         m2_file = '../data/chunks/m2_stage_chunks.jsonl'
         
         if os.path.exists(m2_file):
-            m2_count = 0
+            m2_chunks = []
             try:
                 with open(m2_file, 'r', encoding='utf-8') as f:
                     for line in f:
                         if line.strip():
-                            chunk = json.loads(line.strip())
-                            self.chunks.append(chunk)
-                            m2_count += 1
-                print(f"📊 載入 M2 模組：{m2_count} 個知識片段")
+                            m2_chunks.append(json.loads(line.strip()))
+                self.add_chunks(m2_chunks)
+                print(f"📊 載入 M2 模組：{len(m2_chunks)} 個知識片段")
             except Exception as e:
                 print(f"⚠️  M2 檔案讀取錯誤：{e}")
         else:
             print(f"❌ M2 檔案不存在：{m2_file}")
     
     def rebuild_combined_index(self):
-        """重建包含 M1+M2 的檢索索引"""
+        """完整重建包含 M1+M2 的檢索索引（一般情況請用 add_chunks 增量更新）"""
         print("🔄 重建檢索索引（M1+M2）...")
         self.build_tfidf_index()
         print(f"✅ 檢索索引重建完成")
@@ -1,9 +1,22 @@
 # 簡化版 M1+M2+M3 整合引擎
+import heapq
 import json
+import os
 import re
+from collections import defaultdict
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 
+from chunk_corpus_store import compile_corpus, load_corpus
+from retrieval_index_store import corpus_fingerprint, file_fingerprint, open_index, write_index
+
+INDEX_KIND = "m1_m2_m3_terms"
+CORPUS_KIND = "m1_m2_m3_corpus"
+DEFAULT_INDEX_DIR = os.getenv("M1M2M3_INDEX_DIR", "data/vector_index/m1_m2_m3")
+CORPUS_FILE = os.getenv("M1M2M3_CORPUS_FILE", "data/chunks/m1_m2_m3_corpus.bin")
+M2_DATA_FILE = 'm2_stage_data.json'
+M3_DATA_FILE = 'm3_bpsd_data.json'
+
 class AnalysisResult:
     """分析結果資料結構"""
     def __init__(self):
@@ -20,56 +33,95 @@ class AnalysisResult:
 class M1M2M3IntegratedEngine:
     """M1+M2+M3 整合分析引擎"""
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, index_dir=DEFAULT_INDEX_DIR, corpus_file=CORPUS_FILE):
         self.api_key = api_key
+        self.corpus_file = corpus_file
         self.chunks = []
         self.vocabulary = set()
+        # 倒排索引（CSR 形式）：詞彙編號 -> postings[indptr[t]:indptr[t+1]] 片段索引
+        self.term_index: Dict[str, int] = {}
+        self.postings_indptr = [0]
+        self.postings_chunks = []
+        self.postings_is_keyword = []
+        self.chunk_term_counts = []
+        self.chunk_id_to_index: Dict[str, int] = {}
         
         print("🚀 初始化 M1+M2+M3 整合引擎...")
-        self._load_all_modules()
-        self._build_search_index()
+        if not self.load_index(index_dir):
+            self._load_all_modules()
+            self._build_search_index()
         print("✅ M1+M2+M3 整合引擎初始化完成")
     
     def _load_all_modules(self):
-        """載入所有模組資料"""
+        """載入所有模組資料（優先使用已編譯的欄位式語料）"""
+        
+        corpus = load_corpus(self.corpus_file, fingerprint=self.source_fingerprint(CORPUS_KIND))
+        if corpus is not None:
+            print(f"📦 載入已編譯語料：{self.corpus_file}")
+            self.chunks = corpus
+            chunk_ids = corpus.column("chunk_id")
+            module_ids = corpus.column("module_id")
+        else:
+            m1_data, m2_data, m3_data = self._read_module_data()
+            self.chunks.extend(m1_data + m2_data + m3_data)
+            chunk_ids = [c.get("chunk_id") for c in self.chunks]
+            module_ids = [c.get("module_id") for c in self.chunks]
+        
+        total_chunks = len(self.chunks)
+        print(f"🎯 總計載入：{total_chunks} 個知識片段")
+        
+        # 統計各模組
+        m1_count = len([c for c in chunk_ids if (c or "").startswith("M1")])
+        m2_count = module_ids.count("M2")
+        m3_count = module_ids.count("M3")
+        
+        print(f"📋 模組分布：M1({m1_count}) + M2({m2_count}) + M3({m3_count}) = {total_chunks}")
+    
+    @classmethod
+    def _read_module_data(cls):
+        """讀取 M1 內建資料與 M2/M3 JSON 資料檔"""
         
         # 載入 M1 資料
         print("📊 載入 M1 資料...")
-        m1_data = self._create_m1_data()
-        self.chunks.extend(m1_data)
+        m1_data = cls._create_m1_data()
         print(f"✅ M1 載入：{len(m1_data)} 個知識片段")
         
         # 載入 M2 資料
         print("📊 載入 M2 資料...")
+        m2_data = []
         try:
-            with open('m2_stage_data.json', 'r', encoding='utf-8') as f:
+            with open(M2_DATA_FILE, 'r', encoding='utf-8') as f:
                 m2_data = json.load(f)
-                self.chunks.extend(m2_data)
                 print(f"✅ M2 載入：{len(m2_data)} 個知識片段")
         except FileNotFoundError:
             print("⚠️  M2 資料檔案未找到，跳過 M2 模組")
         
         # 載入 M3 資料  
         print("📊 載入 M3 BPSD 資料...")
+        m3_data = []
         try:
-            with open('m3_bpsd_data.json', 'r', encoding='utf-8') as f:
+            with open(M3_DATA_FILE, 'r', encoding='utf-8') as f:
                 m3_data = json.load(f)
-                self.chunks.extend(m3_data)
                 print(f"✅ M3 載入：{len(m3_data)} 個知識片段")
         except FileNotFoundError:
             print("⚠️  M3 資料檔案未找到")
         
-        total_chunks = len(self.chunks)
-        print(f"🎯 總計載入：{total_chunks} 個知識片段")
-        
-        # 統計各模組
-        m1_count = len([c for c in self.chunks if c.get("chunk_id", "").startswith("M1")])
-        m2_count = len([c for c in self.chunks if c.get("module_id") == "M2"])
-        m3_count = len([c for c in self.chunks if c.get("module_id") == "M3"])
-        
-        print(f"📋 模組分布：M1({m1_count}) + M2({m2_count}) + M3({m3_count}) = {total_chunks}")
+        return m1_data, m2_data, m3_data
+    
+    @classmethod
+    def source_fingerprint(cls, kind):
+        """資料來源指紋：M1 內建資料與 M2/M3 資料檔"""
+        return corpus_fingerprint(kind, cls._create_m1_data(), file_fingerprint(M2_DATA_FILE, M3_DATA_FILE))
+    
+    @classmethod
+    def compile_corpus(cls, output_path=CORPUS_FILE):
+        """將 M1+M2+M3 資料編譯成欄位式語料檔"""
+        m1_data, m2_data, m3_data = cls._read_module_data()
+        return compile_corpus(m1_data + m2_data + m3_data, output_path,
+                              fingerprint=cls.source_fingerprint(CORPUS_KIND))
     
-    def _create_m1_data(self):
+    @staticmethod
+    def _create_m1_data():
         """創建 M1 十大警訊資料"""
         return [
             {
@@ -99,15 +151,81 @@ class M1M2M3IntegratedEngine:
         ]
     
     def _build_search_index(self):
-        """建立檢索索引"""
+        """建立檢索索引（倒排索引 + 片段詞彙數快取）"""
         print("🔍 建立檢索索引...")
-        for chunk in self.chunks:
-            content = chunk.get("content", "")
-            keywords = chunk.get("keywords", [])
-            title = chunk.get("title", "")
-            words = re.findall(r'[\u4e00-\u9fff]+', content + title + " ".join(keywords))
-            self.vocabulary.update(words)
-        print(f"✅ 詞彙庫建立完成：{len(self.vocabulary)} 個詞彙")
+        postings = defaultdict(list)
+        self.chunk_term_counts = []
+        self.chunk_id_to_index = {}
+        
+        for idx, chunk in enumerate(self.chunks):
+            chunk_keywords = set(chunk.get("keywords", []))
+            content_words = re.findall(r'[\u4e00-\u9fff]+', chunk.get("content", ""))
+            title_words = re.findall(r'[\u4e00-\u9fff]+', chunk.get("title", ""))
+            terms = chunk_keywords | set(content_words) | set(title_words)
+            
+            self.chunk_term_counts.append(len(terms))
+            if chunk.get("chunk_id"):
+                self.chunk_id_to_index[chunk["chunk_id"]] = idx
+            for term in terms:
+                postings[term].append((idx, term in chunk_keywords))
+        
+        self.term_index = {}
+        self.postings_indptr = [0]
+        self.postings_chunks = []
+        self.postings_is_keyword = []
+        for term, entries in postings.items():
+            self.term_index[term] = len(self.term_index)
+            for idx, is_keyword in entries:
+                self.postings_chunks.append(idx)
+                self.postings_is_keyword.append(is_keyword)
+            self.postings_indptr.append(len(self.postings_chunks))
+        
+        self.vocabulary = set(self.term_index)
+        print(f"✅ 詞彙庫建立完成：{len(self.vocabulary)} 個詞彙，{len(self.chunks)} 個片段已索引")
+    
+    def index_fingerprint(self):
+        """索引來源指紋"""
+        return self.source_fingerprint(INDEX_KIND)
+    
+    def save_index(self, index_dir=DEFAULT_INDEX_DIR):
+        """將檢索索引與片段資料寫入磁碟"""
+        import numpy as np
+        terms = [None] * len(self.term_index)
+        for term, term_id in self.term_index.items():
+            terms[term_id] = term
+        return write_index(
+            index_dir,
+            kind=INDEX_KIND,
+            fingerprint=self.index_fingerprint(),
+            terms=terms,
+            arrays={
+                "postings_indptr": np.asarray(self.postings_indptr, dtype=np.int64),
+                "postings_chunks": np.asarray(self.postings_chunks, dtype=np.int32),
+                "postings_is_keyword": np.asarray(self.postings_is_keyword, dtype=np.bool_),
+                "chunk_term_counts": np.asarray(self.chunk_term_counts, dtype=np.int32),
+            },
+            chunks=list(self.chunks),
+            meta={"chunk_ids": [chunk.get("chunk_id") for chunk in self.chunks]}
+        )
+    
+    def load_index(self, index_dir=DEFAULT_INDEX_DIR):
+        """以 mmap 開啟磁碟索引；不存在或資料檔已變更時回傳 False"""
+        stored = open_index(index_dir, INDEX_KIND, fingerprint=self.index_fingerprint())
+        if stored is None:
+            return False
+        
+        self.chunks = stored.chunks
+        self.term_index = stored.term_index
+        self.vocabulary = set(stored.terms)
+        self.postings_indptr = stored.arrays["postings_indptr"]
+        self.postings_chunks = stored.arrays["postings_chunks"]
+        self.postings_is_keyword = stored.arrays["postings_is_keyword"]
+        self.chunk_term_counts = stored.arrays["chunk_term_counts"]
+        self.chunk_id_to_index = {
+            chunk_id: idx for idx, chunk_id in enumerate(stored.meta.get("chunk_ids", [])) if chunk_id
+        }
+        print(f"✅ 已開啟磁碟索引 {stored.path}：{len(self.chunks)} 個知識片段")
+        return True
     
     def analyze_comprehensive(self, user_input: str):
         """綜合分析：M1+M2+M3"""
@@ -193,34 +311,56 @@ class M1M2M3IntegratedEngine:
             # 默認策略
             priority_chunk_ids = []
         
-        scored_chunks = []
-        for chunk in self.chunks:
-            chunk_keywords = set(chunk.get("keywords", []))
-            content_words = set(re.findall(r'[\u4e00-\u9fff]+', chunk.get("content", "")))
-            title_words = set(re.findall(r'[\u4e00-\u9fff]+', chunk.get("title", "")))
-            
-            all_chunk_words = chunk_keywords | content_words | title_words
-            
+        # 走訪 postings 累計重疊詞數，只對與查詢有共同詞彙的候選片段計分
+        overlaps = defaultdict(int)
+        keyword_hits = defaultdict(int)
+        for word in query_words:
+            term_id = self.term_index.get(word)
+            if term_id is None:
+                continue
+            start, end = self.postings_indptr[term_id], self.postings_indptr[term_id + 1]
+            for idx, is_keyword in zip(self.postings_chunks[start:end], self.postings_is_keyword[start:end]):
+                overlaps[int(idx)] += 1
+                if is_keyword:
+                    keyword_hits[int(idx)] += 1
+        
+        priority_indices = {
+            self.chunk_id_to_index[chunk_id] for chunk_id in priority_chunk_ids if chunk_id in self.chunk_id_to_index
+        }
+        candidates = set(overlaps) | priority_indices
+        
+        scored = []
+        for idx in candidates:
             # 計算相似度
-            overlap = len(query_words & all_chunk_words)
-            total_words = len(query_words | all_chunk_words)
+            overlap = overlaps.get(idx, 0)
+            total_words = len(query_words) + int(self.chunk_term_counts[idx]) - overlap
             
             if total_words > 0:
                 similarity = overlap / total_words
                 # 關鍵字匹配加權
-                keyword_bonus = len(query_words & chunk_keywords) * 0.3
+                keyword_bonus = keyword_hits.get(idx, 0) * 0.3
                 similarity += keyword_bonus
                 
                 # 優先級加權
-                if chunk.get("chunk_id") in priority_chunk_ids:
+                if idx in priority_indices:
                     similarity += 0.5  # 大幅提升優先級
                 
-                chunk_copy = chunk.copy()
-                chunk_copy["similarity_score"] = round(similarity, 4)
-                scored_chunks.append(chunk_copy)
-        
-        scored_chunks.sort(key=lambda x: x["similarity_score"], reverse=True)
-        top_chunks = scored_chunks[:top_k]
+                scored.append((round(similarity, 4), -idx))
+        
+        # 候選不足 top_k 時，依原載入順序以 0 分片段補足（與逐片段計分相同）
+        if len(scored) < top_k:
+            for idx in range(len(self.chunks)):
+                if len(scored) >= top_k:
+                    break
+                if idx not in candidates and len(query_words) + int(self.chunk_term_counts[idx]) > 0:
+                    scored.append((0.0, -idx))
+        
+        # 使用堆積取前 top_k，避免整體排序；同分時保留原載入順序
+        top_chunks = []
+        for similarity, neg_idx in heapq.nlargest(top_k, scored):
+            chunk_copy = self.chunks[-neg_idx].copy()
+            chunk_copy["similarity_score"] = similarity
+            top_chunks.append(chunk_copy)
         
         print(f"📊 找到 {len(top_chunks)} 個相關片段")
         return top_chunks
@@ -1,34 +1,129 @@
 # memory_cache.py - 内存缓存替代 Redis
+# OrderedDict 维护 LRU 顺序，过期时间放在最小堆中；插入与读取均为 O(1)/O(log n)，
+# 过期项在每次写入时从堆顶主动清除，不依赖有人读取
+import heapq
+import sys
+import threading
 import time
-from typing import Any, Optional, Dict
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _default_size_of(value: Any) -> int:
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    return sys.getsizeof(value)
+
 
 class MemoryCache:
-    def __init__(self, default_ttl: int = 3600, max_size: int = 1000):
-        self.cache: Dict[str, Dict] = {}
+    def __init__(self, default_ttl: int = 3600, max_size: int = 1000, max_bytes: Optional[int] = None,
+                 size_of: Callable[[Any], int] = _default_size_of):
+        # key -> (value, expires_at, size)
+        self.cache: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
         self.default_ttl = default_ttl
         self.max_size = max_size
-    
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.current_bytes = 0
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
-        if len(self.cache) >= self.max_size:
-            oldest_key = min(self.cache.keys(), 
-                           key=lambda k: self.cache[k]['created_at'])
-            del self.cache[oldest_key]
-        
-        expires_at = time.time() + (ttl or self.default_ttl)
-        self.cache[key] = {
-            'value': value,
-            'expires_at': expires_at,
-            'created_at': time.time()
-        }
-    
+        now = time.time()
+        expires_at = now + (ttl or self.default_ttl)
+        size = self.size_of(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self._remove(key)
+            self._purge_expired(now)
+            self.cache[key] = (value, expires_at, size)
+            self.current_bytes += size
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+
+            # 超出条数或字节预算时淘汰最久未使用的项（保留刚写入的项）
+            while len(self.cache) > 1 and (
+                    len(self.cache) > self.max_size
+                    or (self.max_bytes is not None and self.current_bytes > self.max_bytes)):
+                oldest_key = next(iter(self.cache))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+            # 堆中失效的记录过多时重建
+            if len(self._expiry_heap) > 2 * len(self.cache) + 64:
+                self._expiry_heap = [(item[1], k) for k, item in self.cache.items()]
+                heapq.heapify(self._expiry_heap)
+
     def get(self, key: str) -> Any:
-        if key in self.cache:
-            item = self.cache[key]
-            if time.time() < item['expires_at']:
-                return item['value']
-            else:
-                del self.cache[key]
-        return None
+        with self._lock:
+            item = self.cache.get(key)
+            if item is not None:
+                if time.time() < item[1]:
+                    self.cache.move_to_end(key)
+                    self.hits += 1
+                    return item[0]
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self.cache.keys())
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self._expiry_heap.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def _remove(self, key: str) -> bool:
+        item = self.cache.pop(key, None)
+        if item is None:
+            return False
+        self.current_bytes -= item[2]
+        return True
+
+    def _purge_expired(self, now: float):
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            item = self.cache.get(key)
+            # 同一个 key 重写后旧的堆记录会失效，只删除过期时间相符的项
+            if item is not None and item[1] == expires_at:
+                self._remove(key)
+                self.expirations += 1
+
+    def purge_expired(self) -> int:
+        """主动清除所有过期项，返回清除数量"""
+        with self._lock:
+            before = self.expirations
+            self._purge_expired(time.time())
+            return self.expirations - before
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.cache),
+            "max_size": self.max_size,
+            "bytes": self.current_bytes if self.max_bytes is not None else None,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
 
 # 全局缓存实例
 cache = MemoryCache()
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+本地 LLM 替身（離線壓測與延遲測試）
+不經網路、不耗配額，讓 webhook → RAG → LLM → Flex 整條路徑可以在筆電上壓測：
+    - 延遲分布可設定（fixed / uniform / normal / lognormal 的首段延遲 + 依輸出速率逐段串流）
+    - 錯誤注入：429（附 Retry-After）、500、逾時（卡住 hang 秒後才失敗）
+    - 輸出為確定性的 JSON：依使用者描述比對十大警訊，符合 M1_SCHEMA，或 RAG 分析的 matched_warning_code 格式
+與現有客戶端介面相同：
+    Gemini   MockGenerativeModel（generate_content / generate_content_async，支援 stream=True），
+             GEMINI_PROVIDER=mock 時 OptimizedGeminiClient 與 LightweightRAGEngine 自動使用
+    OpenAI / Claude  HTTP 伺服器（/v1/chat/completions、/v1/messages），SimpleGenAIClient 以
+             OPENAI_BASE_URL / CLAUDE_BASE_URL 指向；或 GENAI_PROVIDER=mock 在程序內直接呼叫
+前綴快取也會模擬：同一個 system 前綴第二次出現起回報 cached tokens。
+
+用法：
+    python mock_llm_provider.py --port 8900 --latency lognormal:0.8,0.4 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://localhost:8900/v1 OPENAI_API_KEY=mock python -m api.main
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from keyword_matcher import KeywordMatcher
+from token_budget import HeuristicTokenizer
+
+logger = logging.getLogger(__name__)
+
+# 台灣失智症協會十大警訊與比對關鍵字
+WARNING_SIGNS = {
+    1: ("記憶力減退影響日常生活", ["忘記", "忘了", "記不住", "重複問", "健忘", "想不起"]),
+    2: ("計劃事情或解決問題有困難", ["計劃", "算錯", "帳單", "付錢", "找錢", "規劃"]),
+    3: ("無法勝任原本熟悉的事務", ["做菜", "不會用", "熟悉", "洗衣", "遙控器", "開車"]),
+    4: ("對時間地點感到混淆", ["迷路", "日期", "幾月", "幾點", "在哪", "時間"]),
+    5: ("理解視覺影像和空間關係有困難", ["距離", "看不懂", "撞到", "樓梯", "倒水"]),
+    6: ("言語表達或書寫出現困難", ["說不出", "叫不出", "寫字", "講話", "詞不達意"]),
+    7: ("東西擺放錯亂且失去回溯能力", ["東西", "放錯", "找不到", "被偷", "亂放"]),
+    8: ("判斷力變差或減退", ["被騙", "亂買", "判斷", "穿錯", "衣服"]),
+    9: ("從工作或社交活動中退出", ["不出門", "社交", "退出", "不想出", "朋友"]),
+    10: ("情緒和個性的改變", ["脾氣", "生氣", "易怒", "憂鬱", "多疑", "個性"]),
+}
+
+_USER_INPUT = re.compile(r'(?:用戶描述|使用者描述)[：:]\s*"(.*?)"', re.DOTALL)
+
+
+class MockLLMError(Exception):
+    """注入的供應商錯誤（code 為 HTTP 狀態碼）"""
+
+    def __init__(self, code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """延遲分布：fixed:秒、uniform:下限,上限、normal:平均,標準差、lognormal:中位數,sigma"""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v] if args else []
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        import math
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"不支援的延遲分布: {spec}")
+
+
+class MockLLMProvider:
+    """延遲、錯誤注入與確定性輸出"""
+
+    def __init__(self, latency: str = 'lognormal:0.6,0.3', chars_per_second: float = 400.0,
+                 chunk_chars: int = 24, rate_limit_rate: float = 0.0, server_error_rate: float = 0.0,
+                 timeout_rate: float = 0.0, hang_seconds: float = 30.0, retry_after: float = 1.0,
+                 seed: Optional[int] = None):
+        self.latency_spec = latency
+        self.first_token_latency = parse_latency(latency)
+        self.chars_per_second = chars_per_second
+        self.chunk_chars = chunk_chars
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.retry_after = retry_after
+        self.tokenizer = HeuristicTokenizer()
+        self.matcher = KeywordMatcher()
+        self.matcher.register("M1", {sign_id: keywords for sign_id, (_, keywords) in WARNING_SIGNS.items()})
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prefixes = set()
+        self.stats = {'requests': 0, 'streamed': 0, 'rate_limited': 0, 'server_errors': 0, 'timeouts': 0,
+                      'input_tokens': 0, 'output_tokens': 0, 'cached_tokens': 0}
+
+    @classmethod
+    def from_env(cls) -> 'MockLLMProvider':
+        seed = os.getenv('MOCK_LLM_SEED')
+        return cls(
+            latency=os.getenv('MOCK_LLM_LATENCY', 'lognormal:0.6,0.3'),
+            chars_per_second=float(os.getenv('MOCK_LLM_CHARS_PER_SECOND', '400')),
+            rate_limit_rate=float(os.getenv('MOCK_LLM_RATE_LIMIT_RATE', '0')),
+            server_error_rate=float(os.getenv('MOCK_LLM_SERVER_ERROR_RATE', '0')),
+            timeout_rate=float(os.getenv('MOCK_LLM_TIMEOUT_RATE', '0')),
+            hang_seconds=float(os.getenv('MOCK_LLM_HANG_SECONDS', '30')),
+            seed=int(seed) if seed else None,
+        )
+
+    # ===== 確定性輸出 =====
+
+    def _match(self, user_input: str) -> List[Tuple[int, int]]:
+        """（警訊編號, 命中關鍵字數），依命中數排序"""
+        matches = self.matcher.match(user_input)
+        ranked = [(sign_id, matches.count("M1", sign_id)) for sign_id in matches.categories("M1")]
+        return sorted(ranked, key=lambda item: (-item[1], item[0]))
+
+    def respond(self, prompt: str, system: str = '') -> str:
+        """依提示詞要求的格式產生確定性的回應（同一輸入永遠相同）"""
+        found = _USER_INPUT.search(prompt) or _USER_INPUT.search(system)
+        user_input = found.group(1) if found else prompt[-200:]
+        ranked = self._match(user_input)
+        instructions = f"{system}\n{prompt}"
+
+        if 'matched_warning_code' in instructions:
+            return json.dumps(self._rag_analysis(user_input, ranked), ensure_ascii=False, indent=2)
+        if 'matched_warnings' in instructions or 'overall_confidence' in instructions:
+            return json.dumps(self._m1_analysis(ranked), ensure_ascii=False, indent=2)
+        title = WARNING_SIGNS[ranked[0][0]][0] if ranked else '一般認知變化'
+        return f"根據描述，可能與「{title}」有關，建議持續觀察並諮詢專業醫療人員。"
+
+    @staticmethod
+    def _rag_analysis(user_input: str, ranked: List[Tuple[int, int]]) -> Dict[str, Any]:
+        sign_id, hits = ranked[0] if ranked else (0, 0)
+        return {
+            "matched_warning_code": f"M1-{sign_id:02d}" if sign_id else "M1-GENERAL",
+            "symptom_title": WARNING_SIGNS[sign_id][0] if sign_id else "需要進一步關注的症狀",
+            "user_behavior_summary": user_input[:100],
+            "normal_behavior": "偶爾發生、事後能夠想起或自行修正",
+            "dementia_indicator": "頻率增加且影響日常生活",
+            "action_suggestion": "記錄發生情境與頻率，並諮詢神經內科或記憶門診",
+            "confidence_level": "high" if hits >= 2 else "medium" if hits else "low",
+            "source": "TADA 十大警訊",
+        }
+
+    @staticmethod
+    def _m1_analysis(ranked: List[Tuple[int, int]]) -> Dict[str, Any]:
+        matched = [
+            {"warning_id": sign_id, "warning_name": WARNING_SIGNS[sign_id][0],
+             "match_confidence": round(min(0.5 + 0.2 * hits, 0.95), 2)}
+            for sign_id, hits in ranked[:3]
+        ]
+        confidence = min(3 + 2 * sum(hits for _, hits in ranked[:3]), 9) if ranked else 2
+        risk = "low" if not ranked else "moderate" if len(ranked) == 1 else "high" if len(ranked) < 4 else "urgent"
+        names = "、".join(item["warning_name"] for item in matched) or "無明確對應的警訊"
+        return {
+            "analysis_process": f"比對描述中的行為與十大警訊，對應到：{names}",
+            "matched_warnings": matched,
+            "overall_confidence": confidence,
+            "risk_level": risk,
+            "recommendations": ["記錄症狀出現的時間與頻率", "安排神經內科或記憶門診評估"]
+            if ranked else ["持續觀察，如有變化再諮詢專業醫療人員"],
+        }
+
+    # ===== 延遲與錯誤 =====
+
+    def _plan(self, text: str) -> Tuple[Optional[str], float, float]:
+        """抽樣（注入的錯誤, 首段延遲, 每段間隔）"""
+        with self._lock:
+            self.stats['requests'] += 1
+            roll = self._rng.random()
+            ttft = self.first_token_latency(self._rng)
+        fault = None
+        if roll < self.rate_limit_rate:
+            fault = 'rate_limited'
+        elif roll < self.rate_limit_rate + self.server_error_rate:
+            fault = 'server_errors'
+        elif roll < self.rate_limit_rate + self.server_error_rate + self.timeout_rate:
+            fault = 'timeouts'
+        if fault:
+            with self._lock:
+                self.stats[fault] += 1
+        return fault, ttft, self.chunk_chars / self.chars_per_second
+
+    def _raise(self, fault: str):
+        if fault == 'rate_limited':
+            raise MockLLMError(429, "Resource has been exhausted (mock quota)", retry_after=self.retry_after)
+        if fault == 'server_errors':
+            raise MockLLMError(500, "Internal error (mock)")
+        raise MockLLMError(504, "Deadline exceeded (mock)")
+
+    def _fault_delay(self, fault: str) -> float:
+        return self.hang_seconds if fault == 'timeouts' else 0.0
+
+    def usage(self, prompt: str, system: str, text: str) -> Dict[str, int]:
+        """token 用量；同一 system 前綴第二次起視為前綴快取命中"""
+        system_tokens = self.tokenizer.count(system)
+        key = hashlib.md5(system.encode()).hexdigest() if system else None
+        with self._lock:
+            cached = system_tokens if key in self._prefixes else 0
+            if key:
+                self._prefixes.add(key)
+            usage = {'input_tokens': system_tokens + self.tokenizer.count(prompt),
+                     'output_tokens': self.tokenizer.count(text), 'cached_tokens': cached}
+            for name, value in usage.items():
+                self.stats[name] += value
+        return usage
+
+    def chunks(self, text: str) -> List[str]:
+        return [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+
+    # ===== 同步 / 非同步介面 =====
+
+    def generate(self, prompt: str, system: str = '') -> Tuple[str, Dict[str, int]]:
+        fault, ttft, interval = self._plan(prompt)
+        if fault:
+            time.sleep(self._fault_delay(fault))
+            self._raise(fault)
+        text = self.respond(prompt, system)
+        time.sleep(ttft + interval * len(self.chunks(text)))
+        return text, self.usage(prompt, system, text)
+
+    def stream(self, prompt: str, system: str = '') -> Iterator[str]:
+        fault, ttft, interval = self._plan(prompt)
+        with self._lock:
+            self.stats['streamed'] += 1
+        if fault:
+            time.sleep(self._fault_delay(fault))
+            self._raise(fault)
+        time.sleep(ttft)
+        for chunk in self.chunks(self.respond(prompt, system)):
+            time.sleep(interval)
+            yield chunk
+
+    async def agenerate(self, prompt: str, system: str = '') -> Tuple[str, Dict[str, int]]:
+        fault, ttft, interval = self._plan(prompt)
+        if fault:
+            await asyncio.sleep(self._fault_delay(fault))
+            self._raise(fault)
+        text = self.respond(prompt, system)
+        await asyncio.sleep(ttft + interval * len(self.chunks(text)))
+        return text, self.usage(prompt, system, text)
+
+    async def astream(self, prompt: str, system: str = '') -> AsyncIterator[str]:
+        fault, ttft, interval = self._plan(prompt)
+        with self._lock:
+            self.stats['streamed'] += 1
+        if fault:
+            await asyncio.sleep(self._fault_delay(fault))
+            self._raise(fault)
+        await asyncio.sleep(ttft)
+        for chunk in self.chunks(self.respond(prompt, system)):
+            await asyncio.sleep(interval)
+            yield chunk
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'latency': self.latency_spec, 'chars_per_second': self.chars_per_second}
+
+
+# ===== Gemini 相容介面 =====
+
+class MockUsageMetadata:
+    def __init__(self, usage: Optional[Dict[str, int]] = None):
+        usage = usage or {}
+        self.prompt_token_count = usage.get('input_tokens', 0)
+        self.candidates_token_count = usage.get('output_tokens', 0)
+        self.cached_content_token_count = usage.get('cached_tokens', 0)
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class MockChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class MockResponse:
+    """generate_content 的回應；串流時可迭代，結束後 text 與 usage_metadata 才完整"""
+
+    def __init__(self, text: str = '', usage: Optional[Dict[str, int]] = None, chunks: Any = None,
+                 finish: Optional[Callable[[str], Dict[str, int]]] = None):
+        self.text = text
+        self.usage_metadata = MockUsageMetadata(usage)
+        self._chunks = chunks
+        self._finish = finish
+
+    def __iter__(self):
+        parts = []
+        for chunk in self._chunks:
+            parts.append(chunk)
+            yield MockChunk(chunk)
+        self._complete(''.join(parts))
+
+    async def __aiter__(self):
+        parts = []
+        async for chunk in self._chunks:
+            parts.append(chunk)
+            yield MockChunk(chunk)
+        self._complete(''.join(parts))
+
+    def _complete(self, text: str):
+        self.text = text
+        self.usage_metadata = MockUsageMetadata(self._finish(text))
+
+
+class MockGenerativeModel:
+    """與 google.generativeai.GenerativeModel 相同介面的替身"""
+
+    def __init__(self, model_name: str = 'gemini-1.5-flash', system_instruction: Optional[str] = None,
+                 provider: Optional[MockLLMProvider] = None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ''
+        self.provider = provider or shared_mock_provider
+
+    def _finish(self, prompt: str):
+        return lambda text: self.provider.usage(prompt, self.system_instruction, text)
+
+    def generate_content(self, contents, generation_config=None, stream: bool = False, **kwargs) -> MockResponse:
+        prompt = str(contents)
+        if stream:
+            return MockResponse(chunks=self.provider.stream(prompt, self.system_instruction),
+                                finish=self._finish(prompt))
+        text, usage = self.provider.generate(prompt, self.system_instruction)
+        return MockResponse(text, usage)
+
+    async def generate_content_async(self, contents, generation_config=None, stream: bool = False,
+                                     **kwargs) -> MockResponse:
+        prompt = str(contents)
+        if stream:
+            return MockResponse(chunks=self.provider.astream(prompt, self.system_instruction),
+                                finish=self._finish(prompt))
+        text, usage = await self.provider.agenerate(prompt, self.system_instruction)
+        return MockResponse(text, usage)
+
+
+# ===== OpenAI / Claude 相容 HTTP 伺服器 =====
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    provider: MockLLMProvider = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, error: MockLLMError):
+        headers = {'Retry-After': str(error.retry_after)} if error.retry_after else None
+        self._json(error.code, {'error': {'code': error.code, 'message': error.message}}, headers)
+
+    def do_GET(self):
+        if self.path in ('/health', '/v1/health'):
+            self._json(200, {'status': 'healthy', 'service': 'mock-llm'})
+        elif self.path in ('/stats', '/v1/stats'):
+            self._json(200, self.provider.get_stats())
+        else:
+            self._json(404, {'error': {'code': 404, 'message': 'not found'}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        try:
+            if self.path.endswith('/chat/completions'):
+                self._openai(body)
+            elif self.path.endswith('/messages'):
+                self._claude(body)
+            else:
+                self._json(404, {'error': {'code': 404, 'message': 'not found'}})
+        except MockLLMError as e:
+            self._error(e)
+
+    @staticmethod
+    def _text(content: Any) -> str:
+        if isinstance(content, list):
+            return ''.join(block.get('text', '') for block in content if isinstance(block, dict))
+        return content or ''
+
+    def _openai(self, body: Dict[str, Any]):
+        messages = body.get('messages', [])
+        system = '\n'.join(self._text(m.get('content')) for m in messages if m.get('role') == 'system')
+        prompt = '\n'.join(self._text(m.get('content')) for m in messages if m.get('role') != 'system')
+        if body.get('stream'):
+            self._sse((json.dumps({'choices': [{'index': 0, 'delta': {'content': chunk}}]}, ensure_ascii=False)
+                       for chunk in self.provider.stream(prompt, system)))
+            return
+        text, usage = self.provider.generate(prompt, system)
+        self._json(200, {
+            'id': f"mock-{hashlib.md5(prompt.encode()).hexdigest()[:12]}",
+            'object': 'chat.completion',
+            'model': body.get('model', 'mock'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': usage['input_tokens'], 'completion_tokens': usage['output_tokens'],
+                      'total_tokens': usage['input_tokens'] + usage['output_tokens'],
+                      'prompt_tokens_details': {'cached_tokens': usage['cached_tokens']}},
+        })
+
+    def _claude(self, body: Dict[str, Any]):
+        system = self._text(body.get('system'))
+        prompt = '\n'.join(self._text(m.get('content')) for m in body.get('messages', []))
+        text, usage = self.provider.generate(prompt, system)
+        self._json(200, {
+            'id': f"msg_mock_{hashlib.md5(prompt.encode()).hexdigest()[:12]}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'mock'),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'usage': {'input_tokens': usage['input_tokens'] - usage['cached_tokens'],
+                      'output_tokens': usage['output_tokens'],
+                      'cache_read_input_tokens': usage['cached_tokens']},
+        })
+
+    def _sse(self, events: Iterator[str]):
+        first = next(events)  # 錯誤在送出標頭前拋出
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        for event in (first, *events):
+            self.wfile.write(f"data: {event}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+def create_server(host: str = '127.0.0.1', port: int = 8900,
+                  provider: Optional[MockLLMProvider] = None) -> ThreadingHTTPServer:
+    handler = type('BoundMockLLMHandler', (MockLLMHandler,), {'provider': provider or shared_mock_provider})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+# 程序內共用實例（設定來自 MOCK_LLM_* 環境變數）
+shared_mock_provider = MockLLMProvider.from_env()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 LLM 替身伺服器（OpenAI / Claude 相容）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', default=os.getenv('MOCK_LLM_LATENCY', 'lognormal:0.6,0.3'),
+                        help="fixed:秒 | uniform:a,b | normal:平均,標準差 | lognormal:中位數,sigma")
+    parser.add_argument('--chars-per-second', type=float, default=400.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="429 比例")
+    parser.add_argument('--server-error-rate', type=float, default=0.0, help="500 比例")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="卡住不回應的比例")
+    parser.add_argument('--hang-seconds', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    provider = MockLLMProvider(args.latency, args.chars_per_second, rate_limit_rate=args.rate_limit_rate,
+                               server_error_rate=args.server_error_rate, timeout_rate=args.timeout_rate,
+                               hang_seconds=args.hang_seconds, seed=args.seed)
+    server = create_server(args.host, args.port, provider)
+    print(f"🧪 Mock LLM 伺服器：http://{args.host}:{args.port}/v1（延遲 {args.latency}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,20 @@ M1 模組：失智症十大警訊比對
 """
 
 import json
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
+from keyword_matcher import KeywordMatches, shared_matcher
+
+KEYWORD_MODULE = "M1"
+
+# 警訊代碼 -> 關鍵字
+WARNING_SIGN_KEYWORDS = {
+    "M1-01": ["記憶", "忘記", "重複"],
+    "M1-02": ["洗衣機", "不會用", "家務"],
+    "M1-03": ["語言", "詞彙", "表達"],
+    "M1-04": ["迷路", "時間", "空間"],
+    "M1-05": ["判斷", "詐騙", "金錢"]
+}
 
 @dataclass
 class WarningSign:
@@ -20,6 +32,7 @@ class WarningSign:
 class M1WarningSignsModule:
     def __init__(self):
         self.warning_signs = self._load_warning_signs()
+        shared_matcher.register(KEYWORD_MODULE, WARNING_SIGN_KEYWORDS)
     
     def _load_warning_signs(self) -> List[WarningSign]:
         """載入十大警訊資料"""
@@ -271,35 +284,13 @@ class M1WarningSignsModule:
             }
         }
     
-    def analyze_warning_signs(self, user_input: str) -> Dict:
-        """分析用戶輸入中的警訊關鍵字"""
-        user_input_lower = user_input.lower()
-        matched_signs = []
-        
-        # 關鍵字對應
-        keyword_mapping = {
-            "記憶": ["M1-01"],
-            "忘記": ["M1-01"],
-            "重複": ["M1-01"],
-            "洗衣機": ["M1-02"],
-            "不會用": ["M1-02"],
-            "家務": ["M1-02"],
-            "語言": ["M1-03"],
-            "詞彙": ["M1-03"],
-            "表達": ["M1-03"],
-            "迷路": ["M1-04"],
-            "時間": ["M1-04"],
-            "空間": ["M1-04"],
-            "判斷": ["M1-05"],
-            "詐騙": ["M1-05"],
-            "金錢": ["M1-05"]
-        }
-        
-        for keyword, sign_ids in keyword_mapping.items():
-            if keyword in user_input_lower:
-                matched_signs.extend(sign_ids)
+    def analyze_warning_signs(self, user_input: str, matches: Optional[KeywordMatches] = None) -> Dict:
+        """分析用戶輸入中的警訊關鍵字（可傳入共用比對結果，避免重複掃描）"""
+        matches = matches or shared_matcher.match(user_input)
+        matched_signs = matches.categories(KEYWORD_MODULE)
+        hit_count = sum(matches.count(KEYWORD_MODULE, sign_id) for sign_id in matched_signs)
         
         return {
-            "matched_signs": list(set(matched_signs)),
-            "analysis": f"在您的描述中發現 {len(matched_signs)} 個可能的警訊"
+            "matched_signs": matched_signs,
+            "analysis": f"在您的描述中發現 {hit_count} 個可能的警訊"
         } 
\ No newline at end of file
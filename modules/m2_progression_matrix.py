@@ -3,16 +3,26 @@ M2 模組：病程階段評估矩陣
 提供視覺化的失智症病程階段評估，包含症狀特徵和照護重點
 """
 
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 from enum import Enum
 from safe_enum_handler import safe_enum_value
+from keyword_matcher import KeywordMatches, shared_matcher
 
 class Stage(Enum):
     MILD = "輕度"
     MODERATE = "中度" 
     SEVERE = "重度"
 
+KEYWORD_MODULE = "M2"
+
+# 關鍵字對應不同階段
+STAGE_KEYWORDS = {
+    Stage.MILD: ["輕度", "初期", "剛開始", "記憶力", "忘記", "語言"],
+    Stage.MODERATE: ["中度", "中期", "明顯", "迷路", "不會用", "暴躁"],
+    Stage.SEVERE: ["重度", "晚期", "嚴重", "完全", "不認識", "臥床"]
+}
+
 @dataclass
 class ProgressionStage:
     stage: Stage
@@ -25,6 +35,7 @@ class ProgressionStage:
 class M2ProgressionMatrixModule:
     def __init__(self):
         self.stages = self._load_progression_stages()
+        shared_matcher.register(KEYWORD_MODULE, STAGE_KEYWORDS)
     
     def _load_progression_stages(self) -> Dict[Stage, ProgressionStage]:
         """載入病程階段資料"""
@@ -88,24 +99,12 @@ class M2ProgressionMatrixModule:
             )
         }
     
-    def analyze_progression(self, user_input: str) -> Dict:
+    def analyze_progression(self, user_input: str, matches: Optional[KeywordMatches] = None) -> Dict:
         """分析用戶輸入，評估可能的病程階段"""
-        user_input_lower = user_input.lower()
-        
-        # 關鍵字對應不同階段
-        stage_keywords = {
-            Stage.MILD: ["輕度", "初期", "剛開始", "記憶力", "忘記", "語言"],
-            Stage.MODERATE: ["中度", "中期", "明顯", "迷路", "不會用", "暴躁"],
-            Stage.SEVERE: ["重度", "晚期", "嚴重", "完全", "不認識", "臥床"]
-        }
+        matches = matches or shared_matcher.match(user_input)
         
         # 症狀關鍵字分析
-        symptom_scores = {stage: 0 for stage in Stage}
-        
-        for stage, keywords in stage_keywords.items():
-            for keyword in keywords:
-                if keyword in user_input_lower:
-                    symptom_scores[stage] += 1
+        symptom_scores = {stage: matches.count(KEYWORD_MODULE, stage) for stage in Stage}
         
         # 選擇得分最高的階段
         detected_stage = max(symptom_scores.items(), key=lambda x: x[1])[0]
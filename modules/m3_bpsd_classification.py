@@ -3,10 +3,11 @@ M3 模組：行為心理症狀分類 (BPSD)
 提供視覺化的行為心理症狀分析，包含症狀分類和處理建議
 """
 
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 from enum import Enum
 from safe_enum_handler import safe_enum_value
+from keyword_matcher import KeywordMatches, shared_matcher
 
 class BPSDCategory(Enum):
     AGITATION = "激動/攻擊"
@@ -15,6 +16,17 @@ class BPSDCategory(Enum):
     APATHY = "冷漠/退縮"
     SLEEP = "睡眠障礙"
 
+KEYWORD_MODULE = "M3"
+
+# 關鍵字對應不同症狀類別（依序決定主要類別）
+CATEGORY_KEYWORDS = {
+    BPSDCategory.AGITATION: ["暴躁", "易怒", "攻擊", "打人", "罵人", "反抗"],
+    BPSDCategory.DEPRESSION: ["憂鬱", "低落", "不開心", "想哭", "沒興趣", "退縮"],
+    BPSDCategory.PSYCHOSIS: ["幻覺", "妄想", "看到", "聽到", "錯認", "懷疑"],
+    BPSDCategory.APATHY: ["冷漠", "沒興趣", "被動", "退縮", "不說話"],
+    BPSDCategory.SLEEP: ["睡不著", "日夜顛倒", "遊走", "睡眠", "晚上"]
+}
+
 @dataclass
 class BPSDSymptom:
     category: BPSDCategory
@@ -28,6 +40,7 @@ class BPSDSymptom:
 class M3BPSDClassificationModule:
     def __init__(self):
         self.bpsd_symptoms = self._load_bpsd_symptoms()
+        shared_matcher.register(KEYWORD_MODULE, CATEGORY_KEYWORDS)
     
     def _load_bpsd_symptoms(self) -> Dict[BPSDCategory, BPSDSymptom]:
         """載入 BPSD 症狀資料"""
@@ -179,26 +192,10 @@ class M3BPSDClassificationModule:
             )
         }
     
-    def analyze_bpsd_symptoms(self, user_input: str) -> Dict:
+    def analyze_bpsd_symptoms(self, user_input: str, matches: Optional[KeywordMatches] = None) -> Dict:
         """分析用戶輸入中的 BPSD 症狀"""
-        user_input_lower = user_input.lower()
-        
-        # 關鍵字對應不同症狀類別
-        category_keywords = {
-            BPSDCategory.AGITATION: ["暴躁", "易怒", "攻擊", "打人", "罵人", "反抗"],
-            BPSDCategory.DEPRESSION: ["憂鬱", "低落", "不開心", "想哭", "沒興趣", "退縮"],
-            BPSDCategory.PSYCHOSIS: ["幻覺", "妄想", "看到", "聽到", "錯認", "懷疑"],
-            BPSDCategory.APATHY: ["冷漠", "沒興趣", "被動", "退縮", "不說話"],
-            BPSDCategory.SLEEP: ["睡不著", "日夜顛倒", "遊走", "睡眠", "晚上"]
-        }
-        
-        # 分析症狀
-        detected_categories = []
-        for category, keywords in category_keywords.items():
-            for keyword in keywords:
-                if keyword in user_input_lower:
-                    detected_categories.append(category)
-                    break
+        matches = matches or shared_matcher.match(user_input)
+        detected_categories = matches.categories(KEYWORD_MODULE)
         
         return {
             "detected_categories": list(set(detected_categories)),
@@ -3,9 +3,10 @@ M4 模組：照護導航系統
 提供視覺化的照護資源導航，包含醫療資源、社會支持、照護技巧等
 """
 
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 from enum import Enum
+from keyword_matcher import KeywordMatches, shared_matcher
 
 class CareCategory(Enum):
     MEDICAL = "醫療資源"
@@ -14,6 +15,17 @@ class CareCategory(Enum):
     EMERGENCY = "緊急處理"
     LEGAL = "法律權益"
 
+KEYWORD_MODULE = "M4"
+
+# 關鍵字對應不同照護需求（依序決定主要需求）
+CARE_KEYWORDS = {
+    CareCategory.MEDICAL: ["醫生", "醫院", "治療", "藥物", "評估", "診斷"],
+    CareCategory.SOCIAL: ["補助", "資源", "支持", "團體", "服務", "幫助"],
+    CareCategory.SKILLS: ["技巧", "方法", "怎麼做", "照顧", "溝通", "活動"],
+    CareCategory.EMERGENCY: ["緊急", "走失", "意外", "危險", "救護", "警察"],
+    CareCategory.LEGAL: ["法律", "財產", "監護", "權益", "保險", "遺產"]
+}
+
 @dataclass
 class CareResource:
     category: CareCategory
@@ -28,6 +40,7 @@ class CareResource:
 class M4CareNavigationModule:
     def __init__(self):
         self.care_resources = self._load_care_resources()
+        shared_matcher.register(KEYWORD_MODULE, CARE_KEYWORDS)
     
     def _load_care_resources(self) -> Dict[CareCategory, CareResource]:
         """載入照護資源資料"""
@@ -164,26 +177,10 @@ class M4CareNavigationModule:
             )
         }
     
-    def analyze_care_tasks(self, user_input: str) -> Dict:
+    def analyze_care_tasks(self, user_input: str, matches: Optional[KeywordMatches] = None) -> Dict:
         """分析用戶的照護需求"""
-        user_input_lower = user_input.lower()
-        
-        # 關鍵字對應不同照護需求
-        care_keywords = {
-            CareCategory.MEDICAL: ["醫生", "醫院", "治療", "藥物", "評估", "診斷"],
-            CareCategory.SOCIAL: ["補助", "資源", "支持", "團體", "服務", "幫助"],
-            CareCategory.SKILLS: ["技巧", "方法", "怎麼做", "照顧", "溝通", "活動"],
-            CareCategory.EMERGENCY: ["緊急", "走失", "意外", "危險", "救護", "警察"],
-            CareCategory.LEGAL: ["法律", "財產", "監護", "權益", "保險", "遺產"]
-        }
-        
-        # 分析需求
-        detected_needs = []
-        for category, keywords in care_keywords.items():
-            for keyword in keywords:
-                if keyword in user_input_lower:
-                    detected_needs.append(category)
-                    break
+        matches = matches or shared_matcher.match(user_input)
+        detected_needs = matches.categories(KEYWORD_MODULE)
         
         return {
             "detected_needs": list(set(detected_needs)),
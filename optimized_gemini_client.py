@@ -4,19 +4,45 @@
 降低成本、提升效能、智能快取
 """
 
-import google.generativeai as genai
+import asyncio
 import time
 import json
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 from functools import wraps
 import os
+from rate_limiter import AsyncTokenBucket
 from redis_cache_manager import RedisCacheManager
+from single_flight import SingleFlight, flight_key
+from streaming_json import IncrementalJSONParser
+from token_budget import TokenBudgetManager
+
+try:
+    import google.generativeai as genai
+    GENAI_AVAILABLE = True
+except ImportError:
+    GENAI_AVAILABLE = False
 
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 批次生成：並行上限、配額（每分鐘請求數 / token 數）與單筆逾時
+GEMINI_BATCH_CONCURRENCY = int(os.getenv('GEMINI_BATCH_CONCURRENCY', '8'))
+GEMINI_RPM = int(os.getenv('GEMINI_RPM', '60'))
+GEMINI_TPM = int(os.getenv('GEMINI_TPM', '1000000'))
+GEMINI_ITEM_TIMEOUT = float(os.getenv('GEMINI_ITEM_TIMEOUT', '30'))
+
+# 提示詞輸入預算（tokens），輸出上限另由 max_tokens 控制
+GEMINI_MAX_INPUT_TOKENS = int(os.getenv('GEMINI_MAX_INPUT_TOKENS', '4000'))
+
+# gemini（預設）或 mock：改用本地替身（mock_llm_provider），離線壓測不耗配額
+GEMINI_PROVIDER = os.getenv('GEMINI_PROVIDER', 'gemini')
+
+# 串流時這些欄位一解析出來即可先組 Flex 回覆
+MODEL_UNAVAILABLE_ERROR = "Gemini 模型未初始化（缺少套件或 API 金鑰）"
+EARLY_REPLY_FIELDS = ('matched_warning_code', 'symptom_title')
+
 class OptimizedGeminiClient:
     """優化 Gemini API 客戶端"""
     
@@ -24,36 +50,55 @@ class OptimizedGeminiClient:
         """初始化優化 Gemini 客戶端"""
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         self.cache_manager = RedisCacheManager()
+        # 同一提示詞的並行請求只呼叫一次 API（跨程序以 Redis 鎖合併）
+        self.single_flight = SingleFlight(lock_manager=self.cache_manager)
         
-        # 成本優化配置
+        # 成本優化配置（輸入 / 輸出單價見 token_budget.MODEL_PRICING）
         self.model_config = {
             'gemini-1.5-flash': {
                 'max_tokens': 1000,
                 'temperature': 0.3,
-                'top_p': 0.8,
-                'cost_per_1k_tokens': 0.000075  # 美元
+                'top_p': 0.8
             },
             'gemini-1.5-pro': {
                 'max_tokens': 2000,
                 'temperature': 0.4,
-                'top_p': 0.9,
-                'cost_per_1k_tokens': 0.00375  # 美元
+                'top_p': 0.9
             }
         }
         
+        # token 計數、提示詞預算、計價與各端點直方圖
+        self.budget = TokenBudgetManager()
+        self.max_input_tokens = GEMINI_MAX_INPUT_TOKENS
+        
         # 使用統計
         self.usage_stats = {
             'total_requests': 0,
             'cache_hits': 0,
+            'deduplicated': 0,
+            'timeouts': 0,
             'total_tokens': 0,
             'estimated_cost': 0.0
         }
         
+        # 批次生成依 Gemini 配額限流，跨批次共用；請求數可突發到並行上限
+        self.request_bucket = AsyncTokenBucket.per_minute(GEMINI_RPM, burst=GEMINI_BATCH_CONCURRENCY, name='gemini_rpm')
+        self.token_bucket = AsyncTokenBucket.per_minute(GEMINI_TPM, name='gemini_tpm')
+        
         # 初始化 Gemini
         self._init_gemini()
     
     def _init_gemini(self):
         """初始化 Gemini API"""
+        if GEMINI_PROVIDER == 'mock':
+            from mock_llm_provider import MockGenerativeModel
+            self.model = MockGenerativeModel('gemini-1.5-flash')
+            logger.info("🧪 使用本地 Mock LLM（GEMINI_PROVIDER=mock）")
+            return
+        if not GENAI_AVAILABLE:
+            logger.error("❌ google-generativeai 未安裝")
+            self.model = None
+            return
         if not self.api_key or self.api_key == 'your_actual_gemini_api_key_here':
             logger.error("❌ 缺少 Gemini API 金鑰")
             self.model = None
@@ -68,36 +113,26 @@ class OptimizedGeminiClient:
             self.model = None
     
     def _estimate_tokens(self, text: str) -> int:
-        """估算 token 數量（粗略估算）"""
-        # 中文約 1.5 字元/token，英文約 4 字元/token
-        chinese_chars = sum(1 for c in text if '\u4e00' <= c <= '\u9fff')
-        english_chars = len(text) - chinese_chars
-        
-        return int(chinese_chars / 1.5 + english_chars / 4)
+        """計算 token 數量（本地 tokenizer）"""
+        return self.budget.count(text)
     
     def _calculate_cost(self, input_tokens: int, output_tokens: int, model: str = 'gemini-1.5-flash') -> float:
-        """計算 API 呼叫成本"""
-        config = self.model_config.get(model, self.model_config['gemini-1.5-flash'])
-        cost_per_1k = config['cost_per_1k_tokens']
-        
-        total_tokens = input_tokens + output_tokens
-        return (total_tokens / 1000) * cost_per_1k
+        """計算 API 呼叫成本（輸入與輸出分別計價）"""
+        return self.budget.cost(input_tokens, output_tokens, model)
     
-    def _optimize_prompt(self, prompt: str, max_tokens: int = 1000) -> str:
-        """優化提示詞，減少 token 使用"""
-        # 移除多餘空白
-        prompt = ' '.join(prompt.split())
-        
-        # 截斷過長的提示詞
-        estimated_tokens = self._estimate_tokens(prompt)
-        if estimated_tokens > max_tokens * 0.7:  # 保留 30% 給回應
-            # 智能截斷，保留重要部分
-            words = prompt.split()
-            target_words = int(max_tokens * 0.7 / 2)  # 粗略估算
-            if len(words) > target_words:
-                prompt = ' '.join(words[:target_words]) + '...'
-        
-        return prompt
+    def _optimize_prompt(self, prompt: str, max_input_tokens: int = None) -> str:
+        """優化提示詞：正規化空白，超出輸入預算時依 token 截斷"""
+        return self.budget.fit_prompt(prompt, max_input_tokens or self.max_input_tokens)
+    
+    def build_prompt(self, template: str, chunks: List[Dict[str, Any]],
+                     render: Callable[[int, Dict[str, Any]], str] = None,
+                     max_input_tokens: int = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """以檢索片段填入 template 的 {context}：扣除 template 本身後的預算依相關度排名放入片段，
+        回傳（提示詞, 實際放入的片段）"""
+        render = render or (lambda i, chunk: f"【片段{i}】{chunk.get('title', '')}: {chunk.get('content', '')}\n")
+        budget = (max_input_tokens or self.max_input_tokens) - self._estimate_tokens(template.format(context=''))
+        selected, context = self.budget.fit_chunks(chunks, max(budget, 0), render)
+        return template.format(context=context), selected
     
     def _get_cached_response(self, prompt: str) -> Optional[str]:
         """獲取快取的回應"""
@@ -108,16 +143,20 @@ class OptimizedGeminiClient:
         return self.cache_manager.cache_gemini_response(prompt, response)
     
     def generate_response(self, prompt: str, model: str = 'gemini-1.5-flash', 
-                         max_tokens: int = None, use_cache: bool = True) -> Dict[str, Any]:
+                         max_tokens: int = None, use_cache: bool = True,
+                         endpoint: str = 'default') -> Dict[str, Any]:
         """生成回應（優化版本）"""
         start_time = time.time()
         
         # 更新使用統計
         self.usage_stats['total_requests'] += 1
         
+        # 優化提示詞；快取以實際送出的提示詞（正規化後）為鍵
+        optimized_prompt = self._optimize_prompt(prompt)
+        
         # 檢查快取
         if use_cache:
-            cached_response = self._get_cached_response(prompt)
+            cached_response = self._get_cached_response(optimized_prompt)
             if cached_response:
                 self.usage_stats['cache_hits'] += 1
                 logger.info(f"✅ 快取命中，節省 API 呼叫")
@@ -129,80 +168,238 @@ class OptimizedGeminiClient:
                     'response_time': time.time() - start_time
                 }
         
-        # 優化提示詞
-        optimized_prompt = self._optimize_prompt(prompt, max_tokens or 1000)
-        
-        # 估算輸入 tokens
-        input_tokens = self._estimate_tokens(optimized_prompt)
+        # 同一提示詞已有請求進行中時共用其結果
+        result, shared = self.single_flight.do(
+            flight_key("gemini", optimized_prompt, model, max_tokens),
+            lambda: self._call_model(optimized_prompt, model, max_tokens, use_cache, start_time, endpoint),
+            check=(lambda: self._get_cached_response(optimized_prompt)) if use_cache else None,
+        )
+        if not shared:
+            return result
         
+        self.usage_stats['deduplicated'] += 1
+        logger.info("✅ 共用進行中的相同請求，節省 API 呼叫")
+        if not isinstance(result, dict) or 'cached' not in result:
+            # 其他程序寫入快取的回應
+            result = {'response': result, 'cached': True}
+        return {
+            **result,
+            'deduplicated': True,
+            'tokens_used': 0,
+            'cost': 0.0,
+            'response_time': time.time() - start_time
+        }
+    
+    def _generation_config(self, model: str, max_tokens: Optional[int]):
+        config = self.model_config.get(model, self.model_config['gemini-1.5-flash'])
+        if not GENAI_AVAILABLE:
+            return None
+        return genai.types.GenerationConfig(
+            max_output_tokens=max_tokens or config['max_tokens'],
+            temperature=config['temperature'],
+            top_p=config['top_p']
+        )
+    
+    def _call_model(self, optimized_prompt: str, model: str, max_tokens: Optional[int], use_cache: bool,
+                    start_time: float, endpoint: str = 'default') -> Dict[str, Any]:
+        """實際呼叫 Gemini API"""
+        if self.model is None:
+            return self._error_result(MODEL_UNAVAILABLE_ERROR, start_time)
         try:
-            # 配置模型參數
-            config = self.model_config.get(model, self.model_config['gemini-1.5-flash'])
-            generation_config = genai.types.GenerationConfig(
-                max_output_tokens=max_tokens or config['max_tokens'],
-                temperature=config['temperature'],
-                top_p=config['top_p']
-            )
-            
-            # 生成回應
             response = self.model.generate_content(
                 optimized_prompt,
-                generation_config=generation_config
+                generation_config=self._generation_config(model, max_tokens)
             )
-            
-            # 計算統計
-            output_tokens = self._estimate_tokens(response.text)
-            total_tokens = input_tokens + output_tokens
-            cost = self._calculate_cost(input_tokens, output_tokens, model)
-            
-            # 更新統計
-            self.usage_stats['total_tokens'] += total_tokens
-            self.usage_stats['estimated_cost'] += cost
-            
-            # 快取回應
+            result = self._build_result(optimized_prompt, response.text, model, start_time, endpoint)
             if use_cache:
-                self._cache_response(prompt, response.text)
-            
-            response_time = time.time() - start_time
-            
-            logger.info(f"💡 API 呼叫完成 - Tokens: {total_tokens}, 成本: ${cost:.6f}, 時間: {response_time:.2f}s")
-            
-            return {
-                'response': response.text,
-                'cached': False,
-                'tokens_used': total_tokens,
-                'input_tokens': input_tokens,
-                'output_tokens': output_tokens,
-                'cost': cost,
-                'response_time': response_time,
-                'model': model
-            }
-            
+                self._cache_response(optimized_prompt, response.text)
+            return result
         except Exception as e:
-            logger.error(f"❌ Gemini API 呼叫失敗: {e}")
-            return {
-                'response': f"抱歉，處理您的請求時發生錯誤: {str(e)}",
-                'cached': False,
-                'error': str(e),
-                'tokens_used': 0,
-                'cost': 0.0,
-                'response_time': time.time() - start_time
-            }
+            return self._error_result(e, start_time)
+    
+    async def _acall_model(self, optimized_prompt: str, model: str, max_tokens: Optional[int], use_cache: bool,
+                           start_time: float, timeout: float, endpoint: str = 'batch') -> Dict[str, Any]:
+        """非同步呼叫 Gemini API，逾時即放棄該筆"""
+        try:
+            response = await asyncio.wait_for(
+                self.model.generate_content_async(
+                    optimized_prompt,
+                    generation_config=self._generation_config(model, max_tokens)
+                ),
+                timeout=timeout
+            )
+            result = self._build_result(optimized_prompt, response.text, model, start_time, endpoint)
+            if use_cache:
+                await self.cache_manager.acache_gemini_response(optimized_prompt, response.text)
+            return result
+        except asyncio.TimeoutError:
+            self.usage_stats['timeouts'] += 1
+            return self._error_result(f"逾時（{timeout:.0f} 秒）", start_time)
+        except Exception as e:
+            return self._error_result(e, start_time)
+    
+    def _build_result(self, optimized_prompt: str, text: str, model: str, start_time: float,
+                      endpoint: str = 'default') -> Dict[str, Any]:
+        """計算 tokens 與成本並更新統計（含各端點直方圖）"""
+        input_tokens = self._estimate_tokens(optimized_prompt)
+        output_tokens = self._estimate_tokens(text)
+        total_tokens = input_tokens + output_tokens
+        cost = self.budget.record(endpoint, input_tokens, output_tokens, model)
+        
+        self.usage_stats['total_tokens'] += total_tokens
+        self.usage_stats['estimated_cost'] += cost
+        
+        response_time = time.time() - start_time
+        logger.info(f"💡 API 呼叫完成 - Tokens: {total_tokens}, 成本: ${cost:.6f}, 時間: {response_time:.2f}s")
+        
+        return {
+            'response': text,
+            'cached': False,
+            'tokens_used': total_tokens,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'cost': cost,
+            'response_time': response_time,
+            'model': model,
+            'endpoint': endpoint
+        }
+    
+    def _error_result(self, error: Any, start_time: float) -> Dict[str, Any]:
+        logger.error(f"❌ Gemini API 呼叫失敗: {error}")
+        return {
+            'response': f"抱歉，處理您的請求時發生錯誤: {str(error)}",
+            'cached': False,
+            'error': str(error),
+            'tokens_used': 0,
+            'cost': 0.0,
+            'response_time': time.time() - start_time
+        }
+    
+    def stream_response(self, prompt: str, model: str = 'gemini-1.5-flash',
+                        max_tokens: int = None, use_cache: bool = True,
+                        endpoint: str = 'stream') -> Iterator[str]:
+        """串流生成，逐段產出文字；快取命中時一次產出整段。完整收到後才計入統計並寫入快取"""
+        start_time = time.time()
+        self.usage_stats['total_requests'] += 1
+        optimized_prompt = self._optimize_prompt(prompt)
+        
+        if use_cache:
+            cached_response = self._get_cached_response(optimized_prompt)
+            if cached_response:
+                self.usage_stats['cache_hits'] += 1
+                yield cached_response
+                return
+        
+        parts = []
+        for chunk in self.model.generate_content(
+            optimized_prompt,
+            generation_config=self._generation_config(model, max_tokens),
+            stream=True
+        ):
+            text = chunk.text
+            if text:
+                parts.append(text)
+                yield text
+        
+        response_text = ''.join(parts)
+        self._build_result(optimized_prompt, response_text, model, start_time, endpoint)
+        if use_cache:
+            self._cache_response(optimized_prompt, response_text)
+    
+    def generate_json_stream(self, prompt: str, on_early: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                             early_fields: Tuple[str, ...] = EARLY_REPLY_FIELDS,
+                             model: str = 'gemini-1.5-flash', max_tokens: int = None,
+                             use_cache: bool = True, endpoint: str = 'stream') -> Dict[str, Any]:
+        """串流生成 JSON 回應並增量解析；early_fields 都解析出來時立即呼叫一次 on_early(已完成欄位)，
+        呼叫端可先送出回覆，其餘欄位繼續串流"""
+        start_time = time.time()
+        parser = IncrementalJSONParser()
+        result: Dict[str, Any] = {'early_sent': False}
+        try:
+            for text in self.stream_response(prompt, model, max_tokens, use_cache, endpoint):
+                result.setdefault('first_chunk_time', time.time() - start_time)
+                parser.feed(text)
+                if not result['early_sent'] and parser.has(early_fields):
+                    result['early_sent'] = True
+                    result['early_fields_time'] = time.time() - start_time
+                    if on_early:
+                        on_early(dict(parser.fields))
+        except Exception as e:
+            result.update(self._error_result(e, start_time))
+        
+        result.update({
+            'response': result.get('response') if 'error' in result else parser.buffer,
+            'parsed': parser.result(),
+            'fields': dict(parser.fields),
+            'response_time': time.time() - start_time
+        })
+        return result
     
     def batch_generate(self, prompts: List[str], model: str = 'gemini-1.5-flash') -> List[Dict[str, Any]]:
-        """批次生成回應（成本優化）"""
-        results = []
+        """批次生成回應（同步介面；已在事件迴圈內請改用 abatch_generate）"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.abatch_generate(prompts, model))
+        raise RuntimeError("batch_generate 不可在執行中的事件迴圈內呼叫，請改用 await abatch_generate(...)")
+    
+    async def abatch_generate(self, prompts: List[str], model: str = 'gemini-1.5-flash',
+                              max_tokens: int = None, use_cache: bool = True,
+                              concurrency: int = GEMINI_BATCH_CONCURRENCY,
+                              item_timeout: float = GEMINI_ITEM_TIMEOUT,
+                              endpoint: str = 'batch') -> List[Dict[str, Any]]:
+        """並行批次生成，結果依輸入順序回傳
+        先以一次 MGET 查完整批快取，命中者不佔配額；批內相同提示詞只呼叫一次；
+        其餘在並行上限內依每分鐘請求數 / token 數配額送出，每筆各自逾時"""
+        start_time = time.time()
+        self.usage_stats['total_requests'] += len(prompts)
+        optimized = [self._optimize_prompt(prompt) for prompt in prompts]
+        unique = list(dict.fromkeys(optimized))
+        
+        results: Dict[str, Dict[str, Any]] = {}
+        if use_cache:
+            cached = await self.cache_manager.aget_cached_gemini_responses(unique)
+            for prompt, response in zip(unique, cached):
+                if response is not None:
+                    results[prompt] = {'response': response, 'cached': True, 'tokens_used': 0, 'cost': 0.0,
+                                       'response_time': time.time() - start_time}
         
-        for i, prompt in enumerate(prompts):
-            logger.info(f"🔄 處理批次請求 {i+1}/{len(prompts)}")
-            result = self.generate_response(prompt, model)
-            results.append(result)
+        pending = [prompt for prompt in unique if prompt not in results]
+        if pending and self.model is None:
+            # 與 generate_response 相同的錯誤，且不佔用配額
+            for prompt in pending:
+                results[prompt] = self._error_result(MODEL_UNAVAILABLE_ERROR, time.time())
+        elif pending:
+            config = self.model_config.get(model, self.model_config['gemini-1.5-flash'])
+            output_budget = max_tokens or config['max_tokens']
+            slots = asyncio.Semaphore(concurrency)
+            
+            async def generate(prompt: str) -> Dict[str, Any]:
+                async with slots:
+                    await self.request_bucket.acquire()
+                    await self.token_bucket.acquire(self._estimate_tokens(prompt) + output_budget)
+                    return await self._acall_model(prompt, model, max_tokens, use_cache, time.time(), item_timeout,
+                                                   endpoint)
             
-            # 批次間隔，避免速率限制
-            if i < len(prompts) - 1:
-                time.sleep(0.5)
+            for prompt, result in zip(pending, await asyncio.gather(*(generate(p) for p in pending))):
+                results[prompt] = result
+        
+        ordered = []
+        seen = set()
+        for prompt in optimized:
+            result = results[prompt]
+            if result.get('cached'):
+                self.usage_stats['cache_hits'] += 1
+            elif prompt in seen:
+                # 批內重複的提示詞共用同一次呼叫
+                self.usage_stats['deduplicated'] += 1
+                result = {**result, 'deduplicated': True, 'tokens_used': 0, 'cost': 0.0}
+            seen.add(prompt)
+            ordered.append(result)
         
-        return results
+        logger.info(f"🔄 批次完成 {len(prompts)} 筆（快取 {len(unique) - len(pending)}、呼叫 {len(pending)}），"
+                    f"耗時 {time.time() - start_time:.2f}s")
+        return ordered
     
     def get_usage_stats(self) -> Dict[str, Any]:
         """獲取使用統計"""
@@ -211,6 +408,9 @@ class OptimizedGeminiClient:
         return {
             'api_usage': self.usage_stats,
             'cache_stats': cache_stats,
+            'single_flight': self.single_flight.get_stats(),
+            'rate_limits': [self.request_bucket.get_stats(), self.token_bucket.get_stats()],
+            'token_budget': self.budget.get_stats(),
             'cost_optimization': {
                 'cache_hit_rate': (self.usage_stats['cache_hits'] / max(self.usage_stats['total_requests'], 1)) * 100,
                 'estimated_savings': self.usage_stats['cache_hits'] * 0.001,  # 估算節省
@@ -219,17 +419,20 @@ class OptimizedGeminiClient:
         }
     
     def clear_cache(self) -> bool:
-        """清除快取"""
-        return self.cache_manager.clear_pattern("cache:gemini*")
+        """清除快取（遞增 gemini 命名空間的世代號）"""
+        return self.cache_manager.invalidate_namespace("gemini")
     
     def reset_stats(self):
         """重置統計"""
         self.usage_stats = {
             'total_requests': 0,
             'cache_hits': 0,
+            'deduplicated': 0,
+            'timeouts': 0,
             'total_tokens': 0,
             'estimated_cost': 0.0
         }
+        self.budget.reset()
 
 # 成本優化裝飾器
 def optimize_gemini_call(cache: bool = True, max_tokens: int = 1000):
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+提示詞組裝：固定前綴與動態後綴分離
+RAG 與 M1 分析的提示詞每次都重送同一段指示（十大警訊、JSON 格式），只有使用者描述與檢索片段不同。
+    - 前綴（靜態）在建立範本時壓縮一次：去除縮排與多餘空行，JSON schema 以緊湊、不跳脫中文的形式放入
+    - 前綴放在最前面、後綴放在最後，供應商的前綴快取才能命中：
+        OpenAI   相同前綴自動快取，usage.prompt_tokens_details.cached_tokens
+        Claude   前綴達最小可快取長度（CLAUDE_CACHE_MIN_TOKENS）時 system 區塊才加 cache_control，
+                 usage.cache_read_input_tokens；未達時供應商不快取，目前的 M1 / RAG 前綴都在此之下
+        Gemini   前綴夠長時建立 CachedContent（context caching），否則作為 system_instruction 建立一次模型重用，
+                 usage_metadata.cached_content_token_count
+    - 記錄每次呼叫節省的前綴 tokens（壓縮節省 + 供應商回報的快取命中）
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from token_budget import TokenBudgetManager
+
+try:
+    import google.generativeai as genai
+    GENAI_AVAILABLE = True
+except ImportError:
+    GENAI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Gemini context caching 的最小 token 數與存活時間
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv('GEMINI_CACHE_MIN_TOKENS', '32768'))
+GEMINI_CACHE_TTL = int(os.getenv('GEMINI_CACHE_TTL', '3600'))
+# Claude prompt caching 的最小可快取 tokens（Sonnet / Opus 為 1024，Haiku 為 2048）；低於此值 cache_control 無效
+CLAUDE_CACHE_MIN_TOKENS = int(os.getenv('CLAUDE_CACHE_MIN_TOKENS', '1024'))
+
+
+def minimize_static(text: str) -> str:
+    """去除每行前後空白與連續空行"""
+    lines, blank = [], False
+    for line in text.strip().splitlines():
+        line = line.strip()
+        if not line:
+            if not blank:
+                lines.append('')
+            blank = True
+            continue
+        lines.append(line)
+        blank = False
+    return '\n'.join(lines)
+
+
+def compact_schema(schema: Dict[str, Any]) -> str:
+    """JSON schema 的緊湊表示（中文不跳脫成 \\uXXXX）"""
+    return json.dumps(schema, ensure_ascii=False, separators=(',', ':'))
+
+
+class AssembledPrompt:
+    """一次呼叫的提示詞：靜態前綴 + 動態後綴"""
+
+    def __init__(self, template: 'PromptTemplate', suffix: str):
+        self.template = template
+        self.prefix = template.prefix
+        self.suffix = suffix
+
+    @property
+    def name(self) -> str:
+        return self.template.name
+
+    @property
+    def text(self) -> str:
+        """不支援分開傳送前綴的供應商使用：前綴在前、後綴在後"""
+        return f"{self.prefix}\n\n{self.suffix}"
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class PromptTemplate:
+    """靜態前綴（建立時壓縮一次）與動態後綴範本"""
+
+    def __init__(self, name: str, prefix: str, suffix: str, schema: Optional[Dict[str, Any]] = None):
+        self.name = name
+        original = prefix
+        if schema is not None:
+            original += f"\n\nPlease respond in valid JSON format matching this schema: {json.dumps(schema)}"
+            prefix += f"\n\nPlease respond in valid JSON format matching this schema: {compact_schema(schema)}"
+        self.original_prefix = original
+        self.prefix = minimize_static(prefix)
+        self.suffix_template = suffix.strip()
+        self.prefix_hash = hashlib.sha256(self.prefix.encode()).hexdigest()[:16]
+
+    def render(self, **values) -> AssembledPrompt:
+        return AssembledPrompt(self, self.suffix_template.format(**values))
+
+
+class PromptAssembler:
+    """登記範本並統計各範本每次呼叫節省的前綴 tokens"""
+
+    def __init__(self, budget: Optional[TokenBudgetManager] = None):
+        self.budget = budget or TokenBudgetManager()
+        self.templates: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _template_stats(self, template: PromptTemplate) -> Dict[str, Any]:
+        stats = self.templates.get(template.name)
+        if stats is None or stats['prefix_hash'] != template.prefix_hash:
+            prefix_tokens = self.budget.count(template.prefix)
+            stats = self.templates[template.name] = {
+                'prefix_hash': template.prefix_hash,
+                'prefix_tokens': prefix_tokens,
+                'minimized_tokens': max(self.budget.count(template.original_prefix) - prefix_tokens, 0),
+                'calls': 0,
+                'suffix_tokens': 0,
+                'provider_cached_tokens': 0,
+                'prefix_tokens_saved': 0,
+                'providers': {},
+            }
+        return stats
+
+    def prefix_tokens(self, template: PromptTemplate) -> int:
+        with self._lock:
+            return self._template_stats(template)['prefix_tokens']
+
+    def claude_cacheable(self, template: PromptTemplate) -> bool:
+        """前綴是否達 Claude 最小可快取長度；未達時不加 cache_control"""
+        return self.prefix_tokens(template) >= CLAUDE_CACHE_MIN_TOKENS
+
+    def record(self, prompt: AssembledPrompt, provider: str, cached_tokens: int = 0) -> int:
+        """記錄一次呼叫，回傳節省的前綴 tokens（壓縮節省 + 供應商快取命中，不超過原始前綴）"""
+        with self._lock:
+            stats = self._template_stats(prompt.template)
+            cached = min(max(int(cached_tokens or 0), 0), stats['prefix_tokens'])
+            saved = stats['minimized_tokens'] + cached
+            stats['calls'] += 1
+            stats['suffix_tokens'] += self.budget.count(prompt.suffix)
+            stats['provider_cached_tokens'] += cached
+            stats['prefix_tokens_saved'] += saved
+            stats['providers'][provider] = stats['providers'].get(provider, 0) + 1
+            return saved
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                name: {**stats, 'providers': dict(stats['providers']),
+                       'avg_saved_per_call': round(stats['prefix_tokens_saved'] / stats['calls'], 1)
+                       if stats['calls'] else 0.0}
+                for name, stats in self.templates.items()
+            }
+
+
+class GeminiPrefixCache:
+    """每個前綴建立一次 Gemini 模型：夠長時使用 context caching，否則以 system_instruction 重用"""
+
+    def __init__(self, assembler: PromptAssembler, min_tokens: int = GEMINI_CACHE_MIN_TOKENS,
+                 ttl: int = GEMINI_CACHE_TTL):
+        self.assembler = assembler
+        self.min_tokens = min_tokens
+        self.ttl = ttl
+        self._models: Dict[tuple, tuple] = {}  # (前綴, 模型) -> (模型, 到期時間)
+        self._lock = threading.Lock()
+
+    def model_for(self, template: PromptTemplate, model_name: str = 'gemini-1.5-flash'):
+        key = (template.prefix_hash, model_name)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None or time.monotonic() >= entry[1]:
+                entry = self._models[key] = self._create(template, model_name)
+            return entry[0]
+
+    def _create(self, template: PromptTemplate, model_name: str) -> tuple:
+        if self.assembler.prefix_tokens(template) >= self.min_tokens:
+            try:
+                # context caching 需指定固定版本的模型
+                version = model_name if model_name.endswith(('-001', '-002')) else f"{model_name}-001"
+                cached = genai.caching.CachedContent.create(
+                    model=f"models/{version}",
+                    display_name=f"{template.name}-{template.prefix_hash}",
+                    system_instruction=template.prefix,
+                    ttl=datetime.timedelta(seconds=self.ttl),
+                )
+                logger.info(f"✅ Gemini context cache 建立：{template.name}")
+                # 快取到期前重建
+                return (genai.GenerativeModel.from_cached_content(cached_content=cached),
+                        time.monotonic() + self.ttl * 0.9)
+            except Exception as e:
+                logger.warning(f"⚠️  Gemini context cache 建立失敗，改用 system_instruction: {e}")
+        return genai.GenerativeModel(model_name, system_instruction=template.prefix), float('inf')
+
+
+def gemini_cached_tokens(response: Any) -> int:
+    """Gemini 回應中命中 context cache 的 tokens"""
+    usage = getattr(response, 'usage_metadata', None)
+    return int(getattr(usage, 'cached_content_token_count', 0) or 0)
+
+
+# 程序內共用的範本統計與 Gemini 前綴模型
+prompt_assembler = PromptAssembler()
+gemini_prefix_cache = GeminiPrefixCache(prompt_assembler)
@@ -13,10 +13,42 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import uvicorn
 
+from async_redis_cache import AsyncRedisCache
+from keyword_matcher import shared_matcher
+
+try:
+    from redis_cache_manager import RedisCacheManager
+except ImportError:
+    RedisCacheManager = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keyword rules for comprehensive analysis: (code, title, confidence, module, keywords)
+KEYWORD_MODULE = "rag_api"
+SYMPTOM_RULES = [
+    # M1: Memory Warning Signs
+    ("M1-01", "記憶力減退", "high", "M1", ["記憶", "忘記", "健忘", "重複", "同樣", "剛吃過", "約會", "日期", "事件"]),
+    # M1: Daily Living Activities
+    ("M1-02", "日常生活能力下降", "high", "M1", ["熟悉", "工作", "迷路", "預算", "管理", "洗衣機", "煮飯", "瓦斯", "關門"]),
+    # M1: Language Problems
+    ("M1-03", "語言表達困難", "medium", "M1", ["語言", "表達", "用詞", "混亂", "對話", "說話", "詞彙", "理解"]),
+    # M2: Progression Stages
+    ("M2-01", "病程進展評估", "medium", "M2", ["階段", "進展", "早期", "中期", "晚期", "惡化", "加重", "嚴重"]),
+    # M3: BPSD Symptoms - Agitation
+    ("M3-01", "躁動不安", "medium", "M3", ["躁動", "不安", "激動", "煩躁", "易怒", "攻擊", "暴力", "衝動"]),
+    # M3: BPSD Symptoms - Depression
+    ("M3-02", "憂鬱情緒", "medium", "M3", ["憂鬱", "情緒低落", "悲傷", "無助", "絕望", "哭泣", "悲觀", "自責"]),
+    # M3: BPSD Symptoms - Hallucination
+    ("M3-03", "幻覺症狀", "high", "M3", ["看到", "聽到", "幻覺", "不存在", "有人", "聲音", "影像", "幻聽", "幻視"]),
+    # M3: BPSD Symptoms - Delusion
+    ("M3-04", "妄想症狀", "high", "M3", ["妄想", "懷疑", "被害", "被偷", "被騙", "監視", "跟蹤", "陰謀"]),
+    # M4: Care Tasks
+    ("M4-01", "照護任務", "high", "M4", ["照顧", "照護", "協助", "幫助", "洗澡", "穿衣", "進食", "服藥", "安全"]),
+]
+shared_matcher.register(KEYWORD_MODULE, {code: keywords for code, _, _, _, keywords in SYMPTOM_RULES})
+
 # Initialize FastAPI app
 app = FastAPI(
     title="RAG API Service",
@@ -24,6 +56,25 @@ app = FastAPI(
     version="2.0.0"
 )
 
+# Analysis cache: L1 + Redis, read and written through the asyncio backend
+CACHE_NAMESPACE = "rag_api"
+cache_manager = None
+async_cache = AsyncRedisCache()
+
+@app.on_event("startup")
+async def startup():
+    global cache_manager
+    if RedisCacheManager:
+        cache_manager = RedisCacheManager()
+        await async_cache.connect()
+        cache_manager.attach_async(async_cache)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await async_cache.close()
+    if cache_manager:
+        cache_manager.close()
+
 # Pydantic models
 class AnalysisRequest(BaseModel):
     text: str
@@ -268,6 +319,12 @@ async def health_check():
 async def comprehensive_analysis(request: AnalysisRequest):
     """Comprehensive analysis endpoint"""
     try:
+        cache_key = cache_manager.cache_key(CACHE_NAMESPACE, request.text) if cache_manager else None
+        if cache_key:
+            cached = await cache_manager.aget(cache_key)
+            if cached is not None:
+                return cached
+        
         user_input = request.text.lower()
         
         # Simple keyword-based analysis
@@ -284,86 +341,14 @@ async def comprehensive_analysis(request: AnalysisRequest):
         # Enhanced keyword-based analysis with more comprehensive detection
         symptoms_detected = []
         
-        # M1: Memory Warning Signs
-        memory_keywords = ["記憶", "忘記", "健忘", "重複", "同樣", "剛吃過", "約會", "日期", "事件"]
-        if any(word in user_input for word in memory_keywords):
-            analysis_result["matched_codes"].append("M1-01")
-            analysis_result["symptom_titles"].append("記憶力減退")
-            analysis_result["confidence_levels"].append("high")
-            analysis_result["modules_used"].append("M1")
-            symptoms_detected.append("記憶力減退")
-        
-        # M1: Daily Living Activities
-        daily_keywords = ["熟悉", "工作", "迷路", "預算", "管理", "洗衣機", "煮飯", "瓦斯", "關門"]
-        if any(word in user_input for word in daily_keywords):
-            analysis_result["matched_codes"].append("M1-02")
-            analysis_result["symptom_titles"].append("日常生活能力下降")
-            analysis_result["confidence_levels"].append("high")
-            analysis_result["modules_used"].append("M1")
-            symptoms_detected.append("日常生活能力下降")
-        
-        # M1: Language Problems
-        language_keywords = ["語言", "表達", "用詞", "混亂", "對話", "說話", "詞彙", "理解"]
-        if any(word in user_input for word in language_keywords):
-            analysis_result["matched_codes"].append("M1-03")
-            analysis_result["symptom_titles"].append("語言表達困難")
-            analysis_result["confidence_levels"].append("medium")
-            analysis_result["modules_used"].append("M1")
-            symptoms_detected.append("語言表達困難")
-        
-        # M2: Progression Stages
-        stage_keywords = ["階段", "進展", "早期", "中期", "晚期", "惡化", "加重", "嚴重"]
-        if any(word in user_input for word in stage_keywords):
-            analysis_result["matched_codes"].append("M2-01")
-            analysis_result["symptom_titles"].append("病程進展評估")
-            analysis_result["confidence_levels"].append("medium")
-            analysis_result["modules_used"].append("M2")
-            symptoms_detected.append("病程進展評估")
-        
-        # M3: BPSD Symptoms - Agitation
-        agitation_keywords = ["躁動", "不安", "激動", "煩躁", "易怒", "攻擊", "暴力", "衝動"]
-        if any(word in user_input for word in agitation_keywords):
-            analysis_result["matched_codes"].append("M3-01")
-            analysis_result["symptom_titles"].append("躁動不安")
-            analysis_result["confidence_levels"].append("medium")
-            analysis_result["modules_used"].append("M3")
-            symptoms_detected.append("躁動不安")
-        
-        # M3: BPSD Symptoms - Depression
-        depression_keywords = ["憂鬱", "情緒低落", "悲傷", "無助", "絕望", "哭泣", "悲觀", "自責"]
-        if any(word in user_input for word in depression_keywords):
-            analysis_result["matched_codes"].append("M3-02")
-            analysis_result["symptom_titles"].append("憂鬱情緒")
-            analysis_result["confidence_levels"].append("medium")
-            analysis_result["modules_used"].append("M3")
-            symptoms_detected.append("憂鬱情緒")
-        
-        # M3: BPSD Symptoms - Hallucination
-        hallucination_keywords = ["看到", "聽到", "幻覺", "不存在", "有人", "聲音", "影像", "幻聽", "幻視"]
-        if any(word in user_input for word in hallucination_keywords):
-            analysis_result["matched_codes"].append("M3-03")
-            analysis_result["symptom_titles"].append("幻覺症狀")
-            analysis_result["confidence_levels"].append("high")
-            analysis_result["modules_used"].append("M3")
-            symptoms_detected.append("幻覺症狀")
-        
-        # M3: BPSD Symptoms - Delusion
-        delusion_keywords = ["妄想", "懷疑", "被害", "被偷", "被騙", "監視", "跟蹤", "陰謀"]
-        if any(word in user_input for word in delusion_keywords):
-            analysis_result["matched_codes"].append("M3-04")
-            analysis_result["symptom_titles"].append("妄想症狀")
-            analysis_result["confidence_levels"].append("high")
-            analysis_result["modules_used"].append("M3")
-            symptoms_detected.append("妄想症狀")
-        
-        # M4: Care Tasks
-        care_keywords = ["照顧", "照護", "協助", "幫助", "洗澡", "穿衣", "進食", "服藥", "安全"]
-        if any(word in user_input for word in care_keywords):
-            analysis_result["matched_codes"].append("M4-01")
-            analysis_result["symptom_titles"].append("照護任務")
-            analysis_result["confidence_levels"].append("high")
-            analysis_result["modules_used"].append("M4")
-            symptoms_detected.append("照護任務")
+        matches = shared_matcher.match(user_input)
+        for code, title, confidence, module, _ in SYMPTOM_RULES:
+            if matches.keywords(KEYWORD_MODULE, code):
+                analysis_result["matched_codes"].append(code)
+                analysis_result["symptom_titles"].append(title)
+                analysis_result["confidence_levels"].append(confidence)
+                analysis_result["modules_used"].append(module)
+                symptoms_detected.append(title)
         
         # Generate specific summary based on detected symptoms
         if symptoms_detected:
@@ -412,12 +397,15 @@ async def comprehensive_analysis(request: AnalysisRequest):
         flex_message = create_analysis_flex_message(analysis_result, request.text, analysis_data_encoded)
         
         # Return format expected by webhook
-        return {
+        response = {
             "type": "flex",
             "altText": "失智症警訊分析結果",
             "contents": flex_message,
             "analysis_data": analysis_result
         }
+        if cache_key:
+            await cache_manager.aset(cache_key, response)
+        return response
         
     except Exception as e:
         logger.error(f"Analysis error: {str(e)}")
@@ -511,10 +499,10 @@ async def modules_status():
 @app.get("/cache/stats")
 async def cache_stats():
     """Cache statistics endpoint"""
+    if not cache_manager:
+        return {"status": "unavailable", "timestamp": datetime.now().isoformat()}
     return {
-        "cache_hits": 0,
-        "cache_misses": 0,
-        "cache_size": 0,
+        **cache_manager.get_cache_stats(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+非同步 token bucket 限流器
+以固定速率補充額度、容量為可突發的上限；acquire 在額度不足時等待到足夠為止。
+用於批次呼叫外部 API（如 Gemini 每分鐘請求數 / token 數配額），讓並行請求貼齊配額而不超出。
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+
+class AsyncTokenBucket:
+    """每秒補充 rate 個額度、最多累積 capacity 個的 token bucket"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, name: str = "bucket"):
+        if rate <= 0:
+            raise ValueError("rate 必須大於 0")
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+        self.stats = {"acquired": 0, "waits": 0, "total_wait": 0.0}
+
+    @classmethod
+    def per_minute(cls, amount: float, burst: Optional[float] = None, name: str = "bucket") -> "AsyncTokenBucket":
+        """以每分鐘配額建立（例如 Gemini RPM / TPM）；預設可突發一秒份的額度"""
+        rate = amount / 60.0
+        return cls(rate, burst if burst is not None else max(rate, 1.0), name)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _bind_loop(self) -> asyncio.Lock:
+        """Lock 綁定事件迴圈；換了迴圈（例如多次 asyncio.run）時重新建立"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """取得額度，回傳等待秒數；超過容量的需求以容量計，避免永遠等不到"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        # 依序排隊，先到的請求先取得額度
+        async with self._bind_loop():
+            self._refill()
+            if self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                self.stats["waits"] += 1
+                await asyncio.sleep(delay)
+                waited = delay
+                self._refill()
+            self.tokens -= amount
+        self.stats["acquired"] += 1
+        self.stats["total_wait"] += waited
+        return waited
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "name": self.name,
+            "rate_per_minute": round(self.rate * 60, 3),
+            "capacity": self.capacity,
+            "available": round(self.tokens, 3),
+            "acquired": self.stats["acquired"],
+            "waits": self.stats["waits"],
+            "total_wait_s": round(self.stats["total_wait"], 3),
+        }
@@ -2,21 +2,67 @@
 """
 Redis 快取管理器
 提升 API 效能，減少重複計算和 API 呼叫
+兩層快取：程序內有界 L1（MemoryCache）在前、Redis L2 在後，讀取穿透、寫入同步；
+各命名空間（analysis、flex、gemini、similarity、session）有各自的 TTL，
+寫入與刪除透過 Redis pub/sub 廣播失效訊息，讓各 worker 的 L1 保持一致。
+快取鍵帶有命名空間的世代號（cache:<namespace>:g<世代>:<hash>），清除命名空間只需遞增世代號（O(1)），
+舊世代的鍵由背景 SCAN + UNLINK 分批回收，不再以 KEYS / FLUSHDB 阻塞共用的 Redis。
 """
 
-import redis
+import asyncio
 import json
 import hashlib
+import queue
+import re
 import time
 import logging
-from typing import Optional, Dict, Any, List, Union
+import threading
+import uuid
+from fnmatch import fnmatch
+from typing import Optional, Dict, Any, List, Union, Callable, Tuple
 from functools import wraps
 import os
 
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+from cache_codec import CacheCodec
+from cache_keys import NearDuplicateIndex, canonicalize, keyword_codes
+from circuit_breaker import CircuitBreaker
+from memory_cache import MemoryCache
+
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 連線失敗類錯誤才會計入斷路器；其他錯誤（序列化、指令錯誤）只記錄
+CONNECTION_ERRORS = (OSError,)
+if REDIS_AVAILABLE:
+    CONNECTION_ERRORS += (redis.ConnectionError, redis.TimeoutError)
+
+# 跨 worker 的 L1 失效廣播頻道
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# 命名空間世代號
+GENERATION_KEY = "cache:gen:{namespace}"
+_GENERATIONAL_KEY = re.compile(r"^(?:cache:)?([^:]+):g(\d+):")
+REAP_BATCH_SIZE = 500
+
+# 以正規化文字產生快取鍵的命名空間；其中部分命名空間另查近似重複的輸入
+TEXT_NAMESPACES = {"analysis", "flex", "gemini", "similarity"}
+NEAR_DUPLICATE_NAMESPACES = {"analysis", "flex", "similarity"}
+
+# 比對 token 後才刪除，避免釋放到已逾時並被其他程序取得的鎖
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 class RedisCacheManager:
     """Redis 快取管理器"""
     
@@ -32,240 +78,680 @@ class RedisCacheManager:
         self.user_session_ttl = 7200  # 2 小時
         self.flex_message_ttl = 3600  # 1 小時
         
+        # 各命名空間的 TTL；L1 的 TTL 另以 l1_max_ttl 為上限，限制漏收失效訊息時的過期時間
+        self.namespace_ttls = {
+            "analysis": self.analysis_ttl,
+            "flex": self.flex_message_ttl,
+            "gemini": self.analysis_ttl,
+            "similarity": self.analysis_ttl,
+            "session": self.user_session_ttl,
+        }
+        self.l1_max_ttl = int(os.getenv('CACHE_L1_TTL', '300'))
+        l1_size = int(os.getenv('CACHE_L1_SIZE', '1000'))
+        l1_max_bytes = int(os.getenv('CACHE_L1_MAX_BYTES', '0')) or None
+        self.l1 = (MemoryCache(default_ttl=self.l1_max_ttl, max_size=l1_size, max_bytes=l1_max_bytes)
+                   if l1_size > 0 else None)
+        self.instance_id = uuid.uuid4().hex
+        self.codec = CacheCodec(compress_threshold=int(os.getenv('CACHE_COMPRESS_THRESHOLD', '512')))
+        
+        # 快取鍵正規化與近似重複查詢（索引只含本程序寫入的項目）
+        self.near_duplicates = NearDuplicateIndex(
+            threshold=float(os.getenv('CACHE_NEAR_DUPLICATE_THRESHOLD', '0.75')))
+        self._writers = MemoryCache(default_ttl=self.default_ttl, max_size=5000)  # 快取鍵 -> 寫入時的原始輸入雜湊
+        self.key_stats = {"lookups": 0, "raw_hits": 0, "canonical_hits": 0, "near_duplicate_hits": 0, "misses": 0}
+        self.async_backend = None
+        self._closed = False
+        self._listener: Optional[threading.Thread] = None
+        
+        # 命名空間世代號（本地快取，遞增時經失效頻道同步）與背景回收佇列
+        self._generations: Dict[str, int] = {}
+        self._reap_queue: "queue.Queue[Tuple[str, bool]]" = queue.Queue()  # (模式, 只刪舊世代)
+        self._reaper: Optional[threading.Thread] = None
+        self.reap_stats = {"scanned": 0, "unlinked": 0, "runs": 0}
+        
+        # 連線池配置：逾時要短，Redis 異常時快取路徑才能快速失敗
+        self.max_connections = int(os.getenv('REDIS_MAX_CONNECTIONS', '20'))
+        self.socket_timeout = float(os.getenv('REDIS_SOCKET_TIMEOUT', '1.0'))
+        
+        # 依實際指令結果追蹤健康狀態，斷路器開啟時以計時器 PING 探測恢復
+        self.breaker = CircuitBreaker(
+            "Redis",
+            failure_threshold=int(os.getenv('REDIS_FAILURE_THRESHOLD', '3')),
+            reset_timeout=float(os.getenv('REDIS_RESET_TIMEOUT', '5')),
+            probe=self._probe,
+        )
+        
         # 初始化 Redis 連接
         self.redis_client = None
         self._connect_redis()
     
     def _connect_redis(self):
-        """連接 Redis"""
+        """建立連線池並以一次 PING 確認初始狀態"""
+        if not REDIS_AVAILABLE:
+            logger.warning("⚠️  redis 套件未安裝，快取停用")
+            return
+        
         try:
-            if self.redis_url.startswith('redis://'):
-                # 解析 Redis URL
-                from urllib.parse import urlparse
-                parsed = urlparse(self.redis_url)
-                host = parsed.hostname or 'localhost'
-                port = parsed.port or 6379
-                password = parsed.password or self.password
-                db = parsed.path.lstrip('/') if parsed.path else str(self.db)
-                db = int(db) if db.isdigit() else self.db
-                
-                self.redis_client = redis.Redis(
-                    host=host,
-                    port=port,
-                    password=password,
-                    db=db,
-                    decode_responses=True,
-                    socket_connect_timeout=5,
-                    socket_timeout=5
+            if self.redis_url.startswith(('redis://', 'rediss://', 'unix://')):
+                # URL 中的密碼與 db 優先；快取值為二進位編碼，不自動解碼回應
+                pool = redis.ConnectionPool.from_url(
+                    self.redis_url,
+                    password=self.password,
+                    db=self.db,
+                    decode_responses=False,
+                    max_connections=self.max_connections,
+                    socket_connect_timeout=self.socket_timeout,
+                    socket_timeout=self.socket_timeout,
+                    health_check_interval=30
                 )
             else:
                 # 直接連接
-                self.redis_client = redis.Redis(
+                pool = redis.ConnectionPool(
                     host='localhost',
                     port=6379,
                     password=self.password,
                     db=self.db,
-                    decode_responses=True
+                    decode_responses=False,
+                    max_connections=self.max_connections,
+                    socket_connect_timeout=self.socket_timeout,
+                    socket_timeout=self.socket_timeout
                 )
-            
-            # 測試連接
+            self.redis_client = redis.Redis(connection_pool=pool)
+        except Exception as e:
+            logger.error(f"❌ Redis 初始化錯誤: {e}")
+            self.redis_client = None
+            return
+        
+        # 即使停用 L1 也要監聽：其他 worker 遞增的世代號只經由此頻道同步
+        self._listener = threading.Thread(target=self._listen_invalidations,
+                                          name="cache-invalidation", daemon=True)
+        self._listener.start()
+        self._reaper = threading.Thread(target=self._reap_loop, name="cache-reaper", daemon=True)
+        self._reaper.start()
+        
+        # 測試連接；失敗時開啟斷路器，由背景探測恢復
+        try:
             self.redis_client.ping()
             logger.info("✅ Redis 連接成功")
-            
-        except redis.ConnectionError as e:
+            self._refresh_generations()
+        except CONNECTION_ERRORS as e:
             logger.warning(f"⚠️  Redis 連接失敗: {e}")
-            self.redis_client = None
+            self.breaker.trip()
         except Exception as e:
             logger.error(f"❌ Redis 初始化錯誤: {e}")
-            self.redis_client = None
+            self.breaker.trip()
     
-    def is_available(self) -> bool:
-        """檢查 Redis 是否可用"""
-        if not self.redis_client:
+    def _probe(self):
+        """斷路器半開探測"""
+        self.redis_client.ping()
+    
+    def close(self):
+        """停止失效訊息監聽與斷路器探測"""
+        self._closed = True
+        self.breaker.shutdown()
+    
+    def _listen_invalidations(self):
+        """訂閱失效頻道，同步其他 worker 遞增的世代號並移除其已更新或刪除的 L1 項目"""
+        while not self._closed:
+            if self.breaker.state != CircuitBreaker.CLOSED:
+                time.sleep(1)
+                continue
+            
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # 訂閱中斷期間可能漏收失效訊息，重新訂閱時清空 L1 並重新讀取世代號
+                if self.l1 is not None:
+                    self.l1.clear()
+                self._refresh_generations()
+                while not self._closed:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._apply_invalidation(message.get("data"))
+            except Exception as e:
+                logger.warning(f"⚠️  快取失效訂閱中斷: {e}")
+                time.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+    
+    def _apply_invalidation(self, data: Any):
+        """套用其他 worker 廣播的失效訊息"""
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if message.get("origin") == self.instance_id:
+            return
+        
+        for namespace, generation in message.get("generations", {}).items():
+            self._set_generation(namespace, generation)
+        if self.l1 is not None:
+            for key in message.get("keys", []):
+                self.l1.delete(key)
+        pattern = message.get("pattern")
+        if pattern:
+            self._clear_l1_pattern(pattern)
+    
+    def _clear_l1_pattern(self, pattern: str):
+        if self.l1 is None:
+            return
+        if pattern == "*":
+            self.l1.clear()
+            return
+        for key in self.l1.keys():
+            if fnmatch(key, pattern):
+                self.l1.delete(key)
+    
+    def _invalidation_message(self, keys: List[str] = None, pattern: str = None,
+                              generations: Dict[str, int] = None) -> str:
+        message = {"origin": self.instance_id}
+        if keys:
+            message["keys"] = keys
+        if pattern:
+            message["pattern"] = pattern
+        if generations:
+            message["generations"] = generations
+        return json.dumps(message)
+    
+    # 命名空間世代號
+    
+    def _generation(self, namespace: str) -> int:
+        """命名空間目前的世代號（本地快取；未知的命名空間讀取一次 Redis）"""
+        generation = self._generations.get(namespace)
+        if generation is None:
+            value = self._execute("讀取世代", lambda: self.redis_client.get(GENERATION_KEY.format(namespace=namespace)), False)
+            if value is False:
+                return 0  # Redis 無法使用時不記住世代號，恢復後重新讀取
+            generation = int(value) if value else 0
+            self._generations.setdefault(namespace, generation)
+        return generation
+    
+    def _set_generation(self, namespace: str, generation: int):
+        if generation > self._generations.get(namespace, -1):
+            self._generations[namespace] = generation
+            self._clear_l1_namespace(namespace)
+    
+    def _refresh_generations(self):
+        """一次讀取所有已知命名空間的世代號"""
+        namespaces = sorted(set(self.namespace_ttls) | set(self._generations))
+        values = self._execute("讀取世代", lambda: self.redis_client.mget(
+            [GENERATION_KEY.format(namespace=namespace) for namespace in namespaces]))
+        if values is None:
+            return
+        for namespace, value in zip(namespaces, values):
+            self._set_generation(namespace, int(value) if value else 0)
+    
+    def _clear_l1_namespace(self, namespace: str):
+        self._clear_l1_pattern(f"cache:{namespace}:*")
+        self._clear_l1_pattern(f"{namespace}:*")
+    
+    def invalidate_namespace(self, namespace: str) -> bool:
+        """遞增世代號使整個命名空間失效（O(1)），舊世代的鍵排入背景回收"""
+        generation = self._execute("遞增世代", lambda: self.redis_client.incr(GENERATION_KEY.format(namespace=namespace)))
+        self._clear_l1_namespace(namespace)
+        if generation is None:
             return False
         
-        try:
-            self.redis_client.ping()
-            return True
-        except:
+        self._set_generation(namespace, int(generation))
+        self._execute("廣播世代", lambda: self.redis_client.publish(
+            INVALIDATION_CHANNEL, self._invalidation_message(generations={namespace: int(generation)})))
+        self._schedule_reap(f"cache:{namespace}:*" if namespace != "session" else "session:*")
+        logger.info(f"✅ 快取命名空間 {namespace} 已失效（世代 {generation}）")
+        return True
+    
+    def _is_stale(self, key: str) -> bool:
+        """舊世代或未帶世代號（舊格式）的鍵"""
+        if key.startswith("cache:gen:"):
             return False
+        match = _GENERATIONAL_KEY.match(key)
+        if match is None:
+            return True
+        namespace, generation = match.group(1), int(match.group(2))
+        return generation < self._generations.get(namespace, 0)
+    
+    # 背景回收
+    
+    def _schedule_reap(self, pattern: str, only_stale: bool = True):
+        self._reap_queue.put((pattern, only_stale))
+    
+    def _reap_loop(self):
+        while not self._closed:
+            self.run_reaper_once(timeout=1.0)
+    
+    def run_reaper_once(self, timeout: float = 0) -> int:
+        """處理目前排入的所有回收工作（最多等待 timeout 秒），回傳刪除的鍵數"""
+        patterns = []
+        try:
+            patterns.append(self._reap_queue.get(timeout=timeout) if timeout else self._reap_queue.get_nowait())
+            while True:
+                patterns.append(self._reap_queue.get_nowait())
+        except queue.Empty:
+            pass
+        return sum(self.reap(pattern, only_stale) for pattern, only_stale in dict.fromkeys(patterns))
+    
+    def reap(self, pattern: str, only_stale: bool = True) -> int:
+        """以 SCAN 分批找出符合模式的鍵並 UNLINK（非阻塞刪除）；only_stale 時只刪舊世代的鍵"""
+        unlinked = 0
+        cursor = 0
+        self.reap_stats["runs"] += 1
+        while True:
+            page = self._execute("掃描", lambda: self.redis_client.scan(cursor, match=pattern, count=REAP_BATCH_SIZE))
+            if page is None:
+                break
+            cursor, keys = page
+            keys = [key.decode() if isinstance(key, bytes) else key for key in keys]
+            self.reap_stats["scanned"] += len(keys)
+            doomed = [key for key in keys if not only_stale or self._is_stale(key)]
+            if doomed:
+                unlinked += self._execute("回收", lambda: self.redis_client.unlink(*doomed), 0) or 0
+            if not cursor:
+                break
+            time.sleep(0.001)  # 分批讓出 Redis
+        self.reap_stats["unlinked"] += unlinked
+        return unlinked
+    
+    def _namespace(self, key: str) -> str:
+        """由快取鍵取得命名空間（cache:<namespace>:<hash> 或 <namespace>:<id>）"""
+        parts = key.split(":")
+        if parts[0] == "cache" and len(parts) > 2:
+            return parts[1]
+        return parts[0]
+    
+    def _ttl_for(self, key: str) -> int:
+        return self.namespace_ttls.get(self._namespace(key), self.default_ttl)
+    
+    def is_available(self) -> bool:
+        """Redis 是否可用（依斷路器狀態判斷，不額外 PING）"""
+        return self.redis_client is not None and self.breaker.allow()
+    
+    def _execute(self, operation: str, command: Callable[[], Any], default: Any = None) -> Any:
+        """執行一個 Redis 指令並回報結果給斷路器；斷路器開啟時直接回傳預設值"""
+        if not self.is_available():
+            return default
+        
+        try:
+            result = command()
+        except CONNECTION_ERRORS as e:
+            self.breaker.record_failure()
+            logger.warning(f"⚠️  Redis {operation}連線錯誤: {e}")
+            return default
+        except Exception as e:
+            logger.error(f"❌ Redis {operation}錯誤: {e}")
+            return default
+        
+        self.breaker.record_success()
+        return result
+    
+    def _session_key(self, user_id: str) -> str:
+        return f"session:g{self._generation('session')}:{user_id}"
     
     def _generate_cache_key(self, prefix: str, *args, **kwargs) -> str:
-        """生成快取鍵值"""
+        """生成快取鍵值（文字命名空間的字串參數先正規化）"""
         # 將參數轉換為字串
         key_parts = [prefix]
         
         # 添加位置參數
         for arg in args:
-            key_parts.append(str(arg))
+            key_parts.append(canonicalize(arg) if prefix in TEXT_NAMESPACES and isinstance(arg, str) else str(arg))
         
         # 添加關鍵字參數（排序以確保一致性）
         for key in sorted(kwargs.keys()):
             key_parts.append(f"{key}:{kwargs[key]}")
         
-        # 生成 MD5 雜湊
+        # 生成 MD5 雜湊；保留前綴作為命名空間並附上世代號
         key_string = "|".join(key_parts)
-        return f"cache:{hashlib.md5(key_string.encode()).hexdigest()}"
+        return f"cache:{prefix}:g{self._generation(prefix)}:{hashlib.md5(key_string.encode()).hexdigest()}"
     
-    def get(self, key: str) -> Optional[Any]:
-        """獲取快取值"""
-        if not self.is_available():
+    def cache_key(self, namespace: str, *args, **kwargs) -> str:
+        """命名空間內的快取鍵（正規化並帶目前世代號），供自行 get/set 或 aget/aset 的呼叫端使用"""
+        return self._generate_cache_key(namespace, *args, **kwargs)
+    
+    def _backfill(self, key: str, value: Optional[bytes]) -> Optional[Any]:
+        """Redis 讀回的值回填 L1 並解碼"""
+        if not value:
             return None
-        
+        if self.l1 is not None:
+            self.l1.set(key, value, min(self._ttl_for(key), self.l1_max_ttl))
+        return self._decode(value)
+    
+    def _decode(self, value: bytes) -> Optional[Any]:
         try:
-            value = self.redis_client.get(key)
-            if value:
-                return json.loads(value)
-            return None
+            return self.codec.decode(value)
         except Exception as e:
             logger.error(f"❌ Redis 讀取錯誤: {e}")
             return None
     
-    def set(self, key: str, value: Any, ttl: int = None) -> bool:
-        """設置快取值"""
-        if not self.is_available():
-            return False
-        
+    def _encode(self, key: str, value: Any, ttl: int = None) -> Optional[tuple]:
+        """編碼並寫入 L1，回傳 (ttl, 編碼後內容)；無法編碼時回傳 None"""
         try:
-            ttl = ttl or self.default_ttl
-            
-            # 處理不可序列化的物件
-            if hasattr(value, '__dict__'):
-                # 如果是物件，轉換為字典
-                serializable_value = value.__dict__
-            elif isinstance(value, (list, dict)):
-                # 如果是列表或字典，檢查是否可序列化
-                serializable_value = value
-            else:
-                # 其他類型轉換為字符串
-                serializable_value = {"value": str(value), "type": type(value).__name__}
-            
-            serialized_value = json.dumps(serializable_value, ensure_ascii=False, default=str)
-            return self.redis_client.setex(key, ttl, serialized_value)
+            ttl = ttl or self._ttl_for(key)
+            # 依型別編碼（AnalysisResult、片段列表等讀回時還原成原本的物件）
+            serialized_value = self.codec.encode(value)
         except Exception as e:
             logger.error(f"❌ Redis 寫入錯誤: {e}")
+            return None
+        
+        # L1 存編碼後的內容，讀取時重新解碼，呼叫端修改回傳值不會污染快取
+        if self.l1 is not None:
+            self.l1.set(key, serialized_value, min(ttl, self.l1_max_ttl))
+        return ttl, serialized_value
+    
+    def get(self, key: str) -> Optional[Any]:
+        """獲取快取值（先查 L1，未命中再讀 Redis 並回填 L1）"""
+        value = self.l1.get(key) if self.l1 is not None else None
+        if value is not None:
+            return self._decode(value)
+        return self._backfill(key, self._execute("讀取", lambda: self.redis_client.get(key)))
+    
+    def set(self, key: str, value: Any, ttl: int = None) -> bool:
+        """設置快取值（同時寫入 L1 與 Redis，並廣播失效訊息）"""
+        encoded = self._encode(key, value, ttl)
+        if encoded is None:
             return False
+        ttl, serialized_value = encoded
+        
+        def write():
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.setex(key, ttl, serialized_value)
+            pipe.publish(INVALIDATION_CHANNEL, self._invalidation_message(keys=[key]))
+            return pipe.execute()[0]
+        
+        return bool(self._execute("寫入", write, False))
     
     def delete(self, key: str) -> bool:
         """刪除快取值"""
-        if not self.is_available():
-            return False
+        if self.l1 is not None:
+            self.l1.delete(key)
         
-        try:
-            return bool(self.redis_client.delete(key))
-        except Exception as e:
-            logger.error(f"❌ Redis 刪除錯誤: {e}")
+        def remove():
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.delete(key)
+            pipe.publish(INVALIDATION_CHANNEL, self._invalidation_message(keys=[key]))
+            return pipe.execute()[0]
+        
+        return bool(self._execute("刪除", remove, 0))
+    
+    # 非同步介面：async 端點使用，不在事件迴圈內呼叫同步 Redis
+    
+    def attach_async(self, backend: Any):
+        """掛上 AsyncRedisCache；未掛上時非同步介面改在執行緒中呼叫同步版本"""
+        self.async_backend = backend
+    
+    async def aget(self, key: str) -> Optional[Any]:
+        value = self.l1.get(key) if self.l1 is not None else None
+        if value is not None:
+            return self._decode(value)
+        if self.async_backend is None:
+            return await asyncio.to_thread(self.get, key)
+        return self._backfill(key, await self.async_backend.get(key))
+    
+    async def aget_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """批次讀取：L1 未命中的鍵以一次 MGET 讀取"""
+        results: List[Optional[Any]] = [None] * len(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.l1.get(key) if self.l1 is not None else None
+            if value is not None:
+                results[i] = self._decode(value)
+            else:
+                missing.append(i)
+        if missing:
+            if self.async_backend is None:
+                values = await asyncio.to_thread(
+                    lambda: self._execute("批次讀取", lambda: self.redis_client.mget([keys[i] for i in missing])))
+            else:
+                values = await self.async_backend.get_many([keys[i] for i in missing])
+            for i, value in zip(missing, values or []):
+                results[i] = self._backfill(keys[i], value)
+        return results
+    
+    async def aset(self, key: str, value: Any, ttl: int = None) -> bool:
+        if self.async_backend is None:
+            return await asyncio.to_thread(self.set, key, value, ttl)
+        encoded = self._encode(key, value, ttl)
+        if encoded is None:
             return False
+        ttl, serialized_value = encoded
+        return await self.async_backend.set(
+            key, serialized_value, ttl, publish=(INVALIDATION_CHANNEL, self._invalidation_message(keys=[key])))
+    
+    async def adelete(self, key: str) -> bool:
+        if self.async_backend is None:
+            return await asyncio.to_thread(self.delete, key)
+        if self.l1 is not None:
+            self.l1.delete(key)
+        return bool(await self.async_backend.delete(
+            key, publish=(INVALIDATION_CHANNEL, self._invalidation_message(keys=[key]))))
     
     def exists(self, key: str) -> bool:
         """檢查鍵是否存在"""
-        if not self.is_available():
-            return False
-        
-        try:
-            return bool(self.redis_client.exists(key))
-        except Exception as e:
-            logger.error(f"❌ Redis 檢查錯誤: {e}")
-            return False
+        return bool(self._execute("檢查", lambda: self.redis_client.exists(key), 0))
     
     def clear_pattern(self, pattern: str) -> int:
-        """清除符合模式的鍵"""
-        if not self.is_available():
-            return 0
+        """清除符合模式的鍵：整個命名空間（cache:<ns>:*、已知命名空間的 cache:<ns>*、session:*）以世代號失效，
+        其他模式（例如前綴 cache:gem*）排入背景 SCAN + UNLINK（不論世代全部刪除）；回傳失效的命名空間或排入的回收工作數"""
+        match = re.fullmatch(r"cache:([^:*?\[]+)(:?)\*|(session):\*", pattern)
+        if match:
+            namespace = match.group(1) or match.group(3)
+            if match.group(2) or match.group(3) or namespace in self.namespace_ttls or namespace in self._generations:
+                return int(self.invalidate_namespace(namespace))
         
-        try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                return self.redis_client.delete(*keys)
-            return 0
-        except Exception as e:
-            logger.error(f"❌ Redis 清除模式錯誤: {e}")
-            return 0
+        self._clear_l1_pattern(pattern)
+        self._execute("廣播清除", lambda: self.redis_client.publish(
+            INVALIDATION_CHANNEL, self._invalidation_message(pattern=pattern)))
+        self._schedule_reap(pattern, only_stale=False)
+        return 1
+    
+    # 分散式鎖（single-flight 跨程序合併）
+    
+    def acquire_lock(self, name: str, token: str, ttl: float) -> Optional[bool]:
+        """取得鎖：True 取得、False 已被持有、None Redis 無法使用"""
+        return self._execute(
+            "鎖定", lambda: bool(self.redis_client.set(f"lock:{name}", token, nx=True, px=int(ttl * 1000))))
+    
+    def release_lock(self, name: str, token: str) -> bool:
+        """只釋放自己持有的鎖"""
+        return bool(self._execute(
+            "解鎖", lambda: self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token), 0))
+    
+    def lock_held(self, name: str) -> bool:
+        return bool(self._execute("檢查鎖", lambda: self.redis_client.exists(f"lock:{name}"), 0))
     
     # 特定功能的快取方法
     
+    def _store_text(self, namespace: str, text: str, value: Any, ttl: int) -> bool:
+        """以正規化文字為鍵寫入，並登記近似重複索引"""
+        key = self._generate_cache_key(namespace, text)
+        self._writers.set(key, hashlib.md5(text.encode()).hexdigest(), ttl)
+        if namespace in NEAR_DUPLICATE_NAMESPACES:
+            self.near_duplicates.add(key, canonicalize(text), keyword_codes(text))
+        return self.set(key, value, ttl)
+    
+    def _record_hit(self, key: str, text: str):
+        """區分原始字串就會命中，或是正規化後才命中"""
+        if self._writers.get(key) == hashlib.md5(text.encode()).hexdigest():
+            self.key_stats["raw_hits"] += 1
+        else:
+            self.key_stats["canonical_hits"] += 1
+    
+    def _similar_key(self, namespace: str, text: str) -> Optional[str]:
+        if namespace not in NEAR_DUPLICATE_NAMESPACES:
+            return None
+        key = self.near_duplicates.find(canonicalize(text), keyword_codes(text))
+        if key is not None and self._is_stale(key):
+            # 命名空間已遞增世代號，舊世代的鍵不再命中
+            self.near_duplicates.discard(key)
+            return None
+        return key
+    
+    def _lookup_text(self, namespace: str, text: str) -> Optional[Any]:
+        """以正規化文字查詢，未命中時改查近似重複的輸入"""
+        key = self._generate_cache_key(namespace, text)
+        self.key_stats["lookups"] += 1
+        value = self.get(key)
+        if value is not None:
+            self._record_hit(key, text)
+            return value
+        
+        similar_key = self._similar_key(namespace, text)
+        if similar_key is not None:
+            value = self.get(similar_key)
+            if value is not None:
+                self.key_stats["near_duplicate_hits"] += 1
+                return value
+            self.near_duplicates.discard(similar_key)
+        
+        self.key_stats["misses"] += 1
+        return None
+    
+    async def _alookup_text(self, namespace: str, text: str) -> Optional[Any]:
+        """_lookup_text 的非同步版本：正規化鍵與近似重複鍵以一次 MGET 讀取"""
+        key = self._generate_cache_key(namespace, text)
+        self.key_stats["lookups"] += 1
+        similar_key = self._similar_key(namespace, text)
+        keys = [key] if similar_key in (None, key) else [key, similar_key]
+        values = await self.aget_many(keys)
+        if values[0] is not None:
+            self._record_hit(key, text)
+            return values[0]
+        if similar_key is not None:
+            value = values[-1] if len(values) > 1 else None
+            if value is not None:
+                self.key_stats["near_duplicate_hits"] += 1
+                return value
+            self.near_duplicates.discard(similar_key)
+        
+        self.key_stats["misses"] += 1
+        return None
+    
+    async def _astore_text(self, namespace: str, text: str, value: Any, ttl: int) -> bool:
+        key = self._generate_cache_key(namespace, text)
+        self._writers.set(key, hashlib.md5(text.encode()).hexdigest(), ttl)
+        if namespace in NEAR_DUPLICATE_NAMESPACES:
+            self.near_duplicates.add(key, canonicalize(text), keyword_codes(text))
+        return await self.aset(key, value, ttl)
+    
     def cache_analysis_result(self, user_input: str, result: Dict[str, Any]) -> bool:
         """快取分析結果"""
-        key = self._generate_cache_key("analysis", user_input)
-        return self.set(key, result, self.analysis_ttl)
+        return self._store_text("analysis", user_input, result, self.analysis_ttl)
     
     def get_cached_analysis(self, user_input: str) -> Optional[Dict[str, Any]]:
         """獲取快取的分析結果"""
-        key = self._generate_cache_key("analysis", user_input)
-        return self.get(key)
+        return self._lookup_text("analysis", user_input)
+    
+    async def acache_analysis_result(self, user_input: str, result: Dict[str, Any]) -> bool:
+        return await self._astore_text("analysis", user_input, result, self.analysis_ttl)
+    
+    async def aget_cached_analysis(self, user_input: str) -> Optional[Dict[str, Any]]:
+        return await self._alookup_text("analysis", user_input)
     
     def cache_flex_message(self, user_input: str, flex_message: Dict[str, Any]) -> bool:
         """快取 Flex Message"""
-        key = self._generate_cache_key("flex", user_input)
-        return self.set(key, flex_message, self.flex_message_ttl)
+        return self._store_text("flex", user_input, flex_message, self.flex_message_ttl)
     
     def get_cached_flex_message(self, user_input: str) -> Optional[Dict[str, Any]]:
         """獲取快取的 Flex Message"""
-        key = self._generate_cache_key("flex", user_input)
-        return self.get(key)
+        return self._lookup_text("flex", user_input)
+    
+    async def acache_flex_message(self, user_input: str, flex_message: Dict[str, Any]) -> bool:
+        return await self._astore_text("flex", user_input, flex_message, self.flex_message_ttl)
+    
+    async def aget_cached_flex_message(self, user_input: str) -> Optional[Dict[str, Any]]:
+        return await self._alookup_text("flex", user_input)
     
     def cache_user_session(self, user_id: str, session_data: Dict[str, Any]) -> bool:
         """快取用戶會話"""
-        key = f"session:{user_id}"
-        return self.set(key, session_data, self.user_session_ttl)
+        return self.set(self._session_key(user_id), session_data, self.user_session_ttl)
     
     def get_user_session(self, user_id: str) -> Optional[Dict[str, Any]]:
         """獲取用戶會話"""
-        key = f"session:{user_id}"
-        return self.get(key)
+        return self.get(self._session_key(user_id))
     
     def cache_gemini_response(self, prompt: str, response: str) -> bool:
-        """快取 Gemini API 回應"""
-        key = self._generate_cache_key("gemini", prompt)
-        return self.set(key, response, self.analysis_ttl)
+        """快取 Gemini API 回應（提示詞只做正規化，不查近似重複）"""
+        return self._store_text("gemini", prompt, response, self.analysis_ttl)
     
     def get_cached_gemini_response(self, prompt: str) -> Optional[str]:
         """獲取快取的 Gemini API 回應"""
-        key = self._generate_cache_key("gemini", prompt)
-        return self.get(key)
-    
+        return self._lookup_text("gemini", prompt)
+
+    async def acache_gemini_response(self, prompt: str, response: str) -> bool:
+        return await self._astore_text("gemini", prompt, response, self.analysis_ttl)
+
+    async def aget_cached_gemini_responses(self, prompts: List[str]) -> List[Optional[str]]:
+        """批次查詢 Gemini 回應快取：全部提示詞以一次 MGET 讀取（gemini 不查近似重複）"""
+        keys = [self._generate_cache_key("gemini", prompt) for prompt in prompts]
+        self.key_stats["lookups"] += len(keys)
+        values = await self.aget_many(keys)
+        for key, prompt, value in zip(keys, prompts, values):
+            if value is not None:
+                self._record_hit(key, prompt)
+            else:
+                self.key_stats["misses"] += 1
+        return values
+
     def cache_similarity_search(self, query: str, results: List[Dict[str, Any]]) -> bool:
         """快取相似度搜尋結果"""
-        key = self._generate_cache_key("similarity", query)
-        return self.set(key, results, self.analysis_ttl)
+        return self._store_text("similarity", query, results, self.analysis_ttl)
     
     def get_cached_similarity_search(self, query: str) -> Optional[List[Dict[str, Any]]]:
         """獲取快取的相似度搜尋結果"""
-        key = self._generate_cache_key("similarity", query)
-        return self.get(key)
+        return self._lookup_text("similarity", query)
     
     # 統計和監控方法
     
+    def get_key_stats(self) -> Dict[str, Any]:
+        """快取鍵正規化前後的命中率（raw_key_hit_rate 為原始字串鍵的命中率）"""
+        stats = dict(self.key_stats)
+        lookups = stats["lookups"]
+        hits = stats["raw_hits"] + stats["canonical_hits"] + stats["near_duplicate_hits"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["raw_key_hit_rate"] = stats["raw_hits"] / lookups if lookups else 0.0
+        stats["hit_rate_gain"] = stats["hit_rate"] - stats["raw_key_hit_rate"]
+        stats["near_duplicate_entries"] = len(self.near_duplicates)
+        return stats
+    
     def get_cache_stats(self) -> Dict[str, Any]:
         """獲取快取統計資訊"""
+        local_stats = {
+            "l1": {"enabled": self.l1 is not None, **(self.l1.get_stats() if self.l1 is not None else {})},
+            "key_canonicalization": self.get_key_stats(),
+            "circuit_breaker": self.breaker.get_stats(),
+            "async_backend": self.async_backend.get_stats() if self.async_backend is not None else None,
+            "generations": dict(self._generations),
+            "reaper": {**self.reap_stats, "pending": self._reap_queue.qsize()},
+        }
         if not self.is_available():
-            return {"status": "unavailable"}
+            return {"status": "unavailable", **local_stats}
         
-        try:
-            info = self.redis_client.info()
-            return {
-                "status": "available",
-                "total_keys": info.get('db0', {}).get('keys', 0),
-                "memory_usage": info.get('used_memory_human', 'N/A'),
-                "hit_rate": info.get('keyspace_hits', 0),
-                "miss_rate": info.get('keyspace_misses', 0)
-            }
-        except Exception as e:
-            logger.error(f"❌ 獲取快取統計錯誤: {e}")
-            return {"status": "error", "error": str(e)}
+        info = self._execute("統計", lambda: self.redis_client.info())
+        if info is None:
+            return {"status": "error", **local_stats}
+        
+        return {
+            **local_stats,
+            "status": "available",
+            "total_keys": info.get('db0', {}).get('keys', 0),
+            "memory_usage": info.get('used_memory_human', 'N/A'),
+            "hit_rate": info.get('keyspace_hits', 0),
+            "miss_rate": info.get('keyspace_misses', 0)
+        }
     
     def clear_all_cache(self) -> bool:
-        """清除所有快取"""
-        if not self.is_available():
-            return False
+        """清除所有快取：遞增所有命名空間的世代號（不使用 FLUSHDB），舊鍵由背景回收"""
+        self._clear_l1_pattern("*")
+        self.near_duplicates.clear()
         
-        try:
-            self.redis_client.flushdb()
-            logger.info("✅ 所有快取已清除")
-            return True
-        except Exception as e:
-            logger.error(f"❌ 清除快取錯誤: {e}")
+        namespaces = sorted(set(self.namespace_ttls) | set(self._generations))
+        if not all([self.invalidate_namespace(namespace) for namespace in namespaces]):
             return False
+        logger.info("✅ 所有快取已清除")
+        return True
 
 # 快取裝飾器
 def cache_result(ttl: int = None, key_prefix: str = "default"):
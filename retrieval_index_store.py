@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+檢索索引磁碟儲存
+將建好的檢索索引（詞彙表、postings、向量矩陣、片段中繼資料）寫成
+版本化的目錄，服務程序以 mmap 開啟，多個 uvicorn worker 共用同一份
+page cache，啟動時不需重新分詞。
+
+目錄結構：
+    <index_dir>/manifest.json          指向目前世代，最後以 os.replace 原子寫入
+    <index_dir>/<generation>/terms.json
+    <index_dir>/<generation>/<name>.npy
+    <index_dir>/<generation>/chunks.jsonl + chunk_offsets.npy
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import time
+import logging
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+    STORE_AVAILABLE = True
+except ImportError:
+    STORE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+
+def corpus_fingerprint(*parts: Any) -> str:
+    """計算語料指紋，語料或分詞規則變更時指紋會不同"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def file_fingerprint(*paths: str) -> List[Any]:
+    """以檔名、大小、修改時間代表來源檔案（不存在者記為 None）"""
+    result = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            result.append([path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            result.append([path, None])
+    return result
+
+
+def is_memory_mapped(array) -> bool:
+    """判斷陣列是否（經由 view）直接對應到 mmap 檔案"""
+    while array is not None:
+        if isinstance(array, mmap.mmap):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+class MappedChunkList(Sequence):
+    """以 mmap 讀取的片段中繼資料，存取時才解碼單一片段"""
+
+    def __init__(self, path: str, offsets):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return json.loads(self._mmap[start:end].decode("utf-8"))
+
+
+class MappedIndex:
+    """已開啟的索引世代"""
+
+    def __init__(self, index_dir: str, manifest: Dict[str, Any]):
+        self.index_dir = index_dir
+        self.manifest = manifest
+        self.path = os.path.join(index_dir, manifest["generation"])
+
+        with open(os.path.join(self.path, "terms.json"), "r", encoding="utf-8") as f:
+            self.terms: List[str] = json.load(f)
+        self.term_index: Dict[str, int] = {term: i for i, term in enumerate(self.terms)}
+
+        self.arrays: Dict[str, Any] = {
+            name: np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+            for name in manifest["arrays"]
+        }
+        self.chunks = MappedChunkList(
+            os.path.join(self.path, "chunks.jsonl"),
+            np.load(os.path.join(self.path, "chunk_offsets.npy"), mmap_mode="r")
+        )
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        return self.manifest.get("meta", {})
+
+
+def write_index(index_dir: str, kind: str, fingerprint: str, terms: List[str],
+                arrays: Dict[str, Any], chunks: List[Dict[str, Any]],
+                meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """寫入新的索引世代並切換 manifest，回傳 manifest"""
+    if not STORE_AVAILABLE:
+        raise RuntimeError("numpy 未安裝，無法寫入索引")
+
+    os.makedirs(index_dir, exist_ok=True)
+    generation = f"v{INDEX_FORMAT_VERSION}-{fingerprint[:12]}-{time.time_ns()}"
+    tmp_path = os.path.join(index_dir, f".{generation}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    with open(os.path.join(tmp_path, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump(list(terms), f, ensure_ascii=False)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+
+    offsets = [0]
+    with open(os.path.join(tmp_path, "chunks.jsonl"), "wb") as f:
+        for chunk in chunks:
+            line = json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(tmp_path, "chunk_offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+    os.replace(tmp_path, os.path.join(index_dir, generation))
+
+    manifest = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "kind": kind,
+        "fingerprint": fingerprint,
+        "generation": generation,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "num_terms": len(terms),
+        "num_chunks": len(chunks),
+        "arrays": sorted(arrays),
+        "meta": meta or {},
+    }
+    manifest_tmp = os.path.join(index_dir, f".{MANIFEST_FILE}.{os.getpid()}.tmp")
+    with open(manifest_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_tmp, os.path.join(index_dir, MANIFEST_FILE))
+
+    logger.info(f"✅ 索引已寫入 {index_dir}/{generation}（{len(chunks)} 個片段，{len(terms)} 個詞彙）")
+    return manifest
+
+
+def open_index(index_dir: Optional[str], kind: str,
+               fingerprint: Optional[str] = None) -> Optional[MappedIndex]:
+    """開啟目前世代的索引；不存在、版本不符或指紋不符時回傳 None"""
+    if not STORE_AVAILABLE or not index_dir:
+        return None
+
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("format_version") != INDEX_FORMAT_VERSION or manifest.get("kind") != kind:
+        logger.warning(f"⚠️  索引格式不符，忽略 {index_dir}")
+        return None
+    if fingerprint is not None and manifest.get("fingerprint") != fingerprint:
+        logger.warning(f"⚠️  索引指紋與目前語料不符，忽略 {index_dir}")
+        return None
+
+    try:
+        return MappedIndex(index_dir, manifest)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"⚠️  索引開啟失敗 {index_dir}: {e}")
+        return None
+
+
+def prune_generations(index_dir: str, keep: int = 2) -> int:
+    """刪除舊世代，保留最新的 keep 個（仍在使用的 mmap 不受影響）"""
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            current = json.load(f).get("generation")
+    except (OSError, ValueError):
+        current = None
+
+    generations = sorted(
+        (name for name in os.listdir(index_dir)
+         if name.startswith("v") and os.path.isdir(os.path.join(index_dir, name))),
+        key=lambda name: os.path.getmtime(os.path.join(index_dir, name)),
+        reverse=True
+    )
+    removed = 0
+    for name in generations[keep:]:
+        if name != current:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+            removed += 1
+    return removed
@@ -1,76 +1,124 @@
-from flask import Flask, request, abort
-from linebot.webhook import WebhookHandler
-from linebot.models import MessageEvent, TextMessage, FlexSendMessage
-from linebot import LineBotApi, WebhookHandler as V2WebhookHandler
-import httpx
+"""
+LINE webhook for the XAI wrapper.
+ASGI app on one long-lived event loop: the webhook verifies the signature, schedules each text
+message as a task and returns immediately. The XAI call and the LINE reply share one pooled
+httpx client, so a single container serves many conversations concurrently.
+"""
+
 import asyncio
-import json
-import os
 import logging
+import os
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+from fastapi import FastAPI, Request
+from linebot import WebhookParser
+from linebot.exceptions import InvalidSignatureError
+from linebot.models import MessageEvent, TextMessage
 
-app = Flask(__name__)
+app = FastAPI(title="LINE Bot - XAI", version="2.0.0")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # LINE Bot configuration
-line_bot_api = LineBotApi(os.getenv("LINE_CHANNEL_ACCESS_TOKEN"))
-handler = WebhookHandler(os.getenv("LINE_CHANNEL_SECRET"))
+LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN", "")
+parser = WebhookParser(os.getenv("LINE_CHANNEL_SECRET", ""))
+LINE_REPLY_URL = "https://api.line.me/v2/bot/message/reply"
 
 XAI_SERVICE_URL = os.getenv("XAI_SERVICE_URL", "http://localhost:8005")
+XAI_TIMEOUT = httpx.Timeout(float(os.getenv("XAI_TIMEOUT", "8")), connect=2.0)
+REPLY_TIMEOUT = httpx.Timeout(float(os.getenv("LINE_REPLY_TIMEOUT", "10")), connect=3.0)
+MAX_CONCURRENT_MESSAGES = int(os.getenv("MAX_CONCURRENT_MESSAGES", "100"))
+
+# Created on startup, bound to the app's event loop
+http_client: Optional[httpx.AsyncClient] = None
+message_slots: Optional[asyncio.Semaphore] = None
+pending: Set[asyncio.Task] = set()
+stats = {"received": 0, "replied": 0, "failed": 0, "flex_fallbacks": 0}
+
+
+@app.on_event("startup")
+async def startup():
+    global http_client, message_slots
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+    )
+    message_slots = asyncio.Semaphore(MAX_CONCURRENT_MESSAGES)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Let in-flight replies finish before closing the pool
+    if pending:
+        await asyncio.wait(pending, timeout=10)
+    if http_client is not None:
+        await http_client.aclose()
+
+
+async def handle_message(event):
+    """Handle one LINE text message on the app loop"""
+    stats["received"] += 1
+    sent = False
+    async with message_slots:
+        try:
+            result = await process_with_xai(event.message.text, event.source.user_id)
+            messages = build_reply(result)
+            sent = await reply(event.reply_token, messages)
+            if not sent and messages[0]["type"] == "flex":
+                # Flex rejected: fall back to text, the reply token is still unused
+                stats["flex_fallbacks"] += 1
+                fallback = result.get("bot_response", {}).get("text", "處理中...")
+                sent = await reply(event.reply_token, [{"type": "text", "text": fallback}])
+        except Exception as e:
+            logger.error(f"❌ Message handling error: {e}")
+    # Each message counts once, whether or not the text fallback was needed
+    stats["replied" if sent else "failed"] += 1
 
 
-@handler.add(MessageEvent, message=TextMessage)
-def handle_message(event):
-    """Handle LINE message events"""
-    user_input = event.message.text
-    user_id = event.source.user_id
-    reply_token = event.reply_token
+async def process_with_xai(user_input: str, user_id: str):
+    """Call XAI wrapper service"""
+    try:
+        response = await http_client.post(
+            f"{XAI_SERVICE_URL}/api/v1/analyze",
+            json={"user_input": user_input, "user_id": user_id},
+            timeout=XAI_TIMEOUT,
+        )
+        return response.json()
+    except Exception as e:
+        logger.error(f"XAI service error: {e}")
+        return None
 
-    # Process with XAI wrapper
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(process_with_xai(user_input, user_id))
 
-    # Send response
-    if result and result.get("confidence", 0) > 0.6:
-        # Send Flex Message
-        flex_json = create_flex_message(result)
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                FlexSendMessage(
-                    alt_text=f"分析結果: {result['module']}", contents=flex_json
-                ),
-            )
-        except Exception as e:
-            logger.error(f"Flex message error: {e}")
-            # Fallback to text
-            line_bot_api.reply_message(
-                reply_token,
-                TextMessage(
-                    text=result.get("bot_response", {}).get("text", "處理中...")
-                ),
-            )
-    else:
-        # Low confidence - send text only
-        line_bot_api.reply_message(
-            reply_token, TextMessage(text="請提供更多資訊以便分析")
+async def reply(reply_token: str, messages: List[Dict[str, Any]]) -> bool:
+    """Send a reply through the LINE Messaging API"""
+    try:
+        response = await http_client.post(
+            LINE_REPLY_URL,
+            json={"replyToken": reply_token, "messages": messages},
+            headers={"Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"},
+            timeout=REPLY_TIMEOUT,
         )
+    except httpx.HTTPError as e:
+        logger.error(f"LINE reply error: {e}")
+        return False
+    if response.status_code != 200:
+        logger.error(f"LINE reply failed {response.status_code}: {response.text[:200]}")
+        return False
+    return True
 
 
-async def process_with_xai(user_input: str, user_id: str):
-    """Call XAI wrapper service"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{XAI_SERVICE_URL}/api/v1/analyze",
-                json={"user_input": user_input, "user_id": user_id},
-                timeout=8.0,
-            )
-            return response.json()
-        except Exception as e:
-            logger.error(f"XAI service error: {e}")
-            return None
+def build_reply(result) -> List[Dict[str, Any]]:
+    """Flex Message for confident results, otherwise ask for more detail"""
+    if result and result.get("confidence", 0) > 0.6:
+        return [
+            {
+                "type": "flex",
+                "altText": f"分析結果: {result['module']}",
+                "contents": create_flex_message(result),
+            }
+        ]
+    # Low confidence - send text only
+    return [{"type": "text", "text": "請提供更多資訊以便分析"}]
 
 
 def create_flex_message(result):
@@ -126,26 +174,33 @@ def create_default_flex(result):
     }
 
 
-@app.route("/webhook", methods=["POST"])
-def callback():
+@app.post("/webhook")
+async def callback(request: Request):
     signature = request.headers.get("X-Line-Signature", "")
-    body = request.get_data(as_text=True)
+    body = (await request.body()).decode("utf-8")
 
     try:
-        handler.handle(body, signature)
-        logger.info("✅ Webhook processed successfully")
-    except Exception as e:
-        logger.error(f"❌ Handler error: {e}")
+        events = parser.parse(body, signature)
+    except InvalidSignatureError as e:
+        logger.error(f"❌ Invalid signature: {e}")
         # Return 200 OK even for errors to prevent LINE from retrying
         return "OK"
 
+    for event in events:
+        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+            task = asyncio.create_task(handle_message(event))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    logger.info("✅ Webhook processed successfully")
     return "OK"
 
 
-@app.route("/health", methods=["GET"])
-def health():
-    return {"status": "healthy", "service": "line-bot"}
+@app.get("/health")
+async def health():
+    return {"status": "healthy", "service": "line-bot", "in_flight": len(pending), **stats}
 
 
 if __name__ == "__main__":
-    app.run(port=8081, debug=True)
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=8081)
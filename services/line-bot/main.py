@@ -5,9 +5,12 @@ Enhanced for microservices architecture
 """
 
 import os
+import sys
 import json
+import asyncio
+import inspect
 import logging
-import requests
+import httpx
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 from fastapi import FastAPI, Request, HTTPException
@@ -26,6 +29,18 @@ from linebot.models import (
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
+# Shared keyword matcher lives at the repo root; the standalone container falls back to substring scans
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+try:
+    from keyword_matcher import shared_matcher
+except ImportError:
+    shared_matcher = None
+# Shared pooled HTTP client; the standalone container falls back to one pooled httpx.AsyncClient without per-upstream limits
+try:
+    from async_http_client import AsyncHTTPClient
+except ImportError:
+    AsyncHTTPClient = None
+
 # Load environment variables
 load_dotenv()
 
@@ -55,6 +70,50 @@ app = FastAPI(
     version="3.0.0",
 )
 
+# One pooled async HTTP client per process, opened and closed with the app
+XAI_TIMEOUT = float(os.getenv("XAI_TIMEOUT", "15"))
+RAG_TIMEOUT = float(os.getenv("RAG_TIMEOUT", "10"))
+if AsyncHTTPClient is not None:
+    http_client = AsyncHTTPClient()
+    http_client.register("xai", XAI_API_URL, timeout=XAI_TIMEOUT, max_concurrency=32)
+    http_client.register("rag", RAG_API_URL, timeout=RAG_TIMEOUT, max_concurrency=32)
+else:
+    http_client = None
+_fallback_client: Optional[httpx.AsyncClient] = None
+
+
+async def upstream_request(
+    upstream: str, method: str, path: str, timeout: Optional[float] = None, **kwargs
+) -> httpx.Response:
+    """Send a request to the xai or rag upstream through the shared pool (timeout defaults to the upstream's)"""
+    global _fallback_client
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    if http_client is not None:
+        return await http_client.request(upstream, method, path, **kwargs)
+    if _fallback_client is None:
+        _fallback_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=16)
+        )
+    kwargs.setdefault("timeout", XAI_TIMEOUT if upstream == "xai" else RAG_TIMEOUT)
+    base_url = XAI_API_URL if upstream == "xai" else RAG_API_URL
+    return await _fallback_client.request(method, f"{base_url}{path}", **kwargs)
+
+
+@app.on_event("startup")
+async def startup():
+    if http_client is not None:
+        await http_client.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if http_client is not None:
+        await http_client.close()
+    if _fallback_client is not None:
+        await _fallback_client.aclose()
+
+
 # User session management
 user_sessions = {}
 
@@ -90,17 +149,23 @@ class NonLinearNavigationEngine:
             },
         }
         self.navigation_history = {}
+        if shared_matcher is not None:
+            shared_matcher.register(
+                "navigation",
+                {module_id: info["keywords"] for module_id, info in self.modules.items()},
+            )
 
     def detect_user_intent(self, text: str, user_id: str) -> Dict[str, Any]:
         """Detect user intent and suggest relevant modules"""
         detected_modules = []
         confidence_scores = {}
+        matches = shared_matcher.match(text) if shared_matcher is not None else None
 
         for module_id, module_info in self.modules.items():
-            score = 0
-            for keyword in module_info["keywords"]:
-                if keyword in text:
-                    score += 1
+            if matches is not None:
+                score = matches.count("navigation", module_id)
+            else:
+                score = sum(1 for keyword in module_info["keywords"] if keyword in text)
 
             if score > 0:
                 confidence = score / len(module_info["keywords"])
@@ -158,8 +223,10 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     try:
-        xai_response = requests.get(f"{XAI_API_URL}/health", timeout=5)
-        rag_response = requests.get(f"{RAG_API_URL}/health", timeout=5)
+        xai_response, rag_response = await asyncio.gather(
+            upstream_request("xai", "GET", "/health", timeout=5.0),
+            upstream_request("rag", "GET", "/health", timeout=5.0),
+        )
 
         return {
             "status": "healthy",
@@ -205,7 +272,11 @@ async def webhook(request: Request):
     body = await request.body()
 
     try:
-        handler.handle(body.decode("utf-8"), signature)
+        # The SDK handler calls handlers synchronously; dispatch here so the async handlers are awaited
+        for event in handler.parser.parse(body.decode("utf-8"), signature):
+            result = dispatch_event(event)
+            if inspect.isawaitable(result):
+                await result
         logger.info("✅ Webhook processed successfully")
     except InvalidSignatureError as e:
         logger.error(f"❌ Invalid LINE signature: {e}")
@@ -262,10 +333,11 @@ def create_error_flex_message(error_msg: str) -> FlexSendMessage:
 async def call_xai_analysis(text: str, user_id: str) -> Dict[str, Any]:
     """Call XAI analysis service"""
     try:
-        response = requests.post(
-            f"{XAI_API_URL}/comprehensive-analysis",
+        response = await upstream_request(
+            "xai",
+            "POST",
+            "/comprehensive-analysis",
             json={"text": text, "user_id": user_id, "include_visualization": True},
-            timeout=30,
         )
         response.raise_for_status()
         return response.json()
@@ -277,10 +349,11 @@ async def call_xai_analysis(text: str, user_id: str) -> Dict[str, Any]:
 async def call_rag_service(query: str) -> Dict[str, Any]:
     """Call RAG service"""
     try:
-        response = requests.post(
-            f"{RAG_API_URL}/search",
+        response = await upstream_request(
+            "rag",
+            "POST",
+            "/search",
             json={"query": query, "top_k": 3, "threshold": 0.5, "use_gpu": True},
-            timeout=30,
         )
         response.raise_for_status()
         return response.json()
@@ -515,7 +588,11 @@ def create_welcome_flex_message() -> FlexSendMessage:
     return FlexSendMessage(alt_text="歡迎使用失智症照護智能助手", contents=flex_message)
 
 
-@handler.add(MessageEvent, message=TextMessage)
+async def reply_message(reply_token: str, message) -> None:
+    """LineBotApi is synchronous; run it in a worker thread so a reply never stalls the event loop"""
+    await asyncio.to_thread(line_bot_api.reply_message, reply_token, message)
+
+
 async def handle_text_message(event):
     """Handle text messages with non-linear navigation"""
     try:
@@ -534,22 +611,21 @@ async def handle_text_message(event):
 
             if analysis_result.get("success"):
                 flex_message = create_analysis_flex_message(analysis_result, user_text)
-                line_bot_api.reply_message(event.reply_token, flex_message)
+                await reply_message(event.reply_token, flex_message)
             else:
                 flex_message = create_navigation_flex_message(user_id, intent)
-                line_bot_api.reply_message(event.reply_token, flex_message)
+                await reply_message(event.reply_token, flex_message)
         else:
             # Show navigation options
             flex_message = create_navigation_flex_message(user_id, intent)
-            line_bot_api.reply_message(event.reply_token, flex_message)
+            await reply_message(event.reply_token, flex_message)
 
     except Exception as e:
         logger.error(f"❌ Text message handling failed: {e}")
         error_message = create_error_flex_message("訊息處理失敗，請稍後再試")
-        line_bot_api.reply_message(event.reply_token, error_message)
+        await reply_message(event.reply_token, error_message)
 
 
-@handler.add(PostbackEvent)
 async def handle_postback(event):
     """Handle postback events for non-linear navigation"""
     try:
@@ -562,7 +638,7 @@ async def handle_postback(event):
             flex_message = create_navigation_flex_message(
                 user_id, {"detected_modules": [], "suggested_modules": ["M1", "M4"]}
             )
-            line_bot_api.reply_message(event.reply_token, flex_message)
+            await reply_message(event.reply_token, flex_message)
 
         elif postback_data.startswith("analyze_"):
             module_id = postback_data.replace("analyze_", "")
@@ -576,10 +652,10 @@ async def handle_postback(event):
                 flex_message = create_analysis_flex_message(
                     analysis_result, f"{module_id}分析"
                 )
-                line_bot_api.reply_message(event.reply_token, flex_message)
+                await reply_message(event.reply_token, flex_message)
             else:
                 error_message = create_error_flex_message("模組分析失敗")
-                line_bot_api.reply_message(event.reply_token, error_message)
+                await reply_message(event.reply_token, error_message)
 
         elif postback_data == "knowledge_search":
             # Perform knowledge search
@@ -592,39 +668,37 @@ async def handle_postback(event):
                         f"• {result['title']}: {result['content'][:100]}...\n\n"
                     )
 
-                line_bot_api.reply_message(
+                await reply_message(
                     event.reply_token, TextSendMessage(text=knowledge_text)
                 )
             else:
                 error_message = create_error_flex_message("知識檢索失敗")
-                line_bot_api.reply_message(event.reply_token, error_message)
+                await reply_message(event.reply_token, error_message)
 
         else:
-            line_bot_api.reply_message(
+            await reply_message(
                 event.reply_token, TextSendMessage(text="請選擇您需要的功能")
             )
 
     except Exception as e:
         logger.error(f"❌ Postback handling failed: {e}")
         error_message = create_error_flex_message("功能處理失敗")
-        line_bot_api.reply_message(event.reply_token, error_message)
+        await reply_message(event.reply_token, error_message)
 
 
-@handler.add(FollowEvent)
-def handle_follow(event):
+async def handle_follow(event):
     """Handle follow events"""
     try:
         user_id = event.source.user_id
         logger.info(f"👋 New user followed: {user_id}")
 
         welcome_message = create_welcome_flex_message()
-        line_bot_api.reply_message(event.reply_token, welcome_message)
+        await reply_message(event.reply_token, welcome_message)
 
     except Exception as e:
         logger.error(f"❌ Follow event handling failed: {e}")
 
 
-@handler.add(UnfollowEvent)
 def handle_unfollow(event):
     """Handle unfollow events"""
     try:
@@ -639,6 +713,19 @@ def handle_unfollow(event):
         logger.error(f"❌ Unfollow event handling failed: {e}")
 
 
+def dispatch_event(event):
+    """Route a parsed webhook event to its handler"""
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        return handle_text_message(event)
+    if isinstance(event, PostbackEvent):
+        return handle_postback(event)
+    if isinstance(event, FollowEvent):
+        return handle_follow(event)
+    if isinstance(event, UnfollowEvent):
+        return handle_unfollow(event)
+    return None
+
+
 if __name__ == "__main__":
     import uvicorn
 
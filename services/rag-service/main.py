@@ -5,7 +5,10 @@ Enhanced for microservices architecture
 """
 
 import os
+import sys
 import json
+import time
+import hashlib
 import logging
 import torch
 import numpy as np
@@ -32,6 +35,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Persisted embedding index (shared by all workers via mmap)
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+INDEX_FORMAT_VERSION = 1
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", "/app/data/vector_index/gpu_embeddings")
+
 # Create FastAPI app
 app = FastAPI(
     title="RAG Service - GPU Accelerated",
@@ -56,18 +64,20 @@ class QueryResponse(BaseModel):
 
 # Initialize RAG engine with GPU support
 class GPUAcceleratedRAGEngine:
-    def __init__(self):
+    def __init__(self, index_dir: Optional[str] = INDEX_DIR):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         logger.info(f"🚀 Using device: {self.device}")
         
         # Initialize sentence transformer
-        self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+        self.model = SentenceTransformer(MODEL_NAME)
         self.model.to(self.device)
         
         # Initialize knowledge base
         self.knowledge_base = self._initialize_knowledge_base()
+        self.index_dir = index_dir
         self.vector_index = None
         self.embeddings = None
+        self.index_source = None
         
         # Build vector index
         self._build_vector_index()
@@ -102,38 +112,101 @@ class GPUAcceleratedRAGEngine:
             }
         }
     
+    def _prepare_documents(self) -> List[Dict[str, Any]]:
+        """Flatten the knowledge base into retrievable documents"""
+        documents = []
+        for domain, items in self.knowledge_base.items():
+            for title, content in items.items():
+                documents.append({
+                    "id": f"{domain}_{title}",
+                    "domain": domain,
+                    "title": title,
+                    "content": content,
+                    "text": f"{title}: {content}"
+                })
+        return documents
+    
+    def _index_fingerprint(self, documents: List[Dict[str, Any]]) -> str:
+        """Fingerprint of model + corpus; a mismatch forces re-encoding"""
+        payload = json.dumps([MODEL_NAME, [doc["text"] for doc in documents]], ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    
+    def _load_persisted_embeddings(self, fingerprint: str) -> Optional[np.ndarray]:
+        """Open persisted embeddings read-only via mmap if they match the corpus"""
+        if not self.index_dir:
+            return None
+        try:
+            with open(os.path.join(self.index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format_version") != INDEX_FORMAT_VERSION or manifest.get("fingerprint") != fingerprint:
+                logger.info("ℹ️ Persisted embedding index is stale, re-encoding corpus")
+                return None
+            path = os.path.join(self.index_dir, manifest["generation"], "embeddings.npy")
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def save_index(self, index_dir: Optional[str] = None) -> Dict[str, Any]:
+        """Write embeddings + chunk metadata as a new versioned generation"""
+        index_dir = index_dir or self.index_dir
+        fingerprint = self._index_fingerprint(self.documents)
+        generation = f"v{INDEX_FORMAT_VERSION}-{fingerprint[:12]}-{time.time_ns()}"
+        tmp_path = os.path.join(index_dir, f".{generation}.tmp")
+        os.makedirs(tmp_path, exist_ok=True)
+        
+        np.save(os.path.join(tmp_path, "embeddings.npy"), np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        with open(os.path.join(tmp_path, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(self.documents, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(index_dir, generation))
+        
+        manifest = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "kind": "gpu_embeddings",
+            "fingerprint": fingerprint,
+            "generation": generation,
+            "model": MODEL_NAME,
+            "num_chunks": len(self.documents),
+            "dimension": int(self.embeddings.shape[1]),
+            "built_at": datetime.now().isoformat()
+        }
+        manifest_tmp = os.path.join(index_dir, f".manifest.json.{os.getpid()}.tmp")
+        with open(manifest_tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(manifest_tmp, os.path.join(index_dir, "manifest.json"))
+        
+        logger.info(f"✅ Embedding index written to {index_dir}/{generation}")
+        return manifest
+    
     def _build_vector_index(self):
         """Build FAISS vector index for fast similarity search"""
         try:
             # Prepare documents
-            documents = []
-            for domain, items in self.knowledge_base.items():
-                for title, content in items.items():
-                    documents.append({
-                        "id": f"{domain}_{title}",
-                        "domain": domain,
-                        "title": title,
-                        "content": content,
-                        "text": f"{title}: {content}"
-                    })
+            documents = self._prepare_documents()
+            fingerprint = self._index_fingerprint(documents)
             
-            # Generate embeddings
-            texts = [doc["text"] for doc in documents]
-            embeddings = self.model.encode(texts, convert_to_tensor=True, device=self.device)
-            
-            # Convert to numpy for FAISS
-            embeddings_np = embeddings.cpu().numpy().astype('float32')
+            # Reuse persisted embeddings (mmap, page cache shared across workers)
+            embeddings_np = self._load_persisted_embeddings(fingerprint)
+            if embeddings_np is not None:
+                self.index_source = "mmap"
+            else:
+                # Generate embeddings
+                texts = [doc["text"] for doc in documents]
+                embeddings = self.model.encode(texts, convert_to_tensor=True, device=self.device)
+                
+                # Convert to numpy for FAISS
+                embeddings_np = embeddings.cpu().numpy().astype('float32')
+                self.index_source = "encoded"
             
-            # Build FAISS index
+            # Build FAISS index (FAISS keeps its own copy of the vectors)
             dimension = embeddings_np.shape[1]
             self.vector_index = faiss.IndexFlatIP(dimension)
-            self.vector_index.add(embeddings_np)
+            self.vector_index.add(np.ascontiguousarray(embeddings_np, dtype=np.float32))
             
             # Store documents for retrieval
             self.documents = documents
             self.embeddings = embeddings_np
             
-            logger.info(f"✅ Vector index built with {len(documents)} documents")
+            logger.info(f"✅ Vector index built with {len(documents)} documents ({self.index_source})")
             
         except Exception as e:
             logger.error(f"❌ Failed to build vector index: {e}")
@@ -212,6 +285,12 @@ class GPUAcceleratedRAGEngine:
         return results
 
 # Initialize RAG engine
+if __name__ == "__main__" and "--build-index" in sys.argv:
+    # Build step: encode once and persist, then exit
+    builder = GPUAcceleratedRAGEngine(index_dir=None)
+    builder.save_index(INDEX_DIR)
+    sys.exit(0)
+
 rag_engine = GPUAcceleratedRAGEngine()
 
 @app.get("/")
@@ -237,6 +316,7 @@ async def health_check():
         "gpu_available": torch.cuda.is_available(),
         "device": str(rag_engine.device),
         "vector_index_ready": rag_engine.vector_index is not None,
+        "vector_index_source": rag_engine.index_source,
         "timestamp": datetime.now().isoformat()
     }
 
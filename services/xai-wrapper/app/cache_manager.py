@@ -1,32 +1,57 @@
-import redis
-import json
+import asyncio
+import os
 from typing import Optional
 
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
 class CacheManager:
-    def __init__(self):
+    """redis.asyncio cache: connection pool from REDIS_URL and per-command timeouts.
+    Any Redis error is treated as a cache miss so /api/v1/analyze keeps serving."""
+
+    def __init__(self, redis_url: Optional[str] = None):
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+        self.timeout = float(os.getenv("REDIS_SOCKET_TIMEOUT", "1.0"))
+        self.redis_client = None
+
+    async def connect(self):
+        if aioredis is None:
+            return
+        pool = aioredis.ConnectionPool.from_url(
+            self.redis_url,
+            decode_responses=True,
+            max_connections=self.max_connections,
+            socket_timeout=self.timeout,
+            socket_connect_timeout=self.timeout,
+            health_check_interval=30
+        )
+        self.redis_client = aioredis.Redis(connection_pool=pool)
         try:
-            self.redis_client = redis.Redis(
-                host='localhost',
-                port=6379,
-                decode_responses=True
-            )
-            self.redis_client.ping()
-        except:
-            self.redis_client = None
-    
+            await asyncio.wait_for(self.redis_client.ping(), self.timeout)
+        except Exception:
+            await self.close()
+
+    async def close(self):
+        if self.redis_client:
+            client, self.redis_client = self.redis_client, None
+            await client.connection_pool.disconnect()
+
     async def get(self, key: str) -> Optional[str]:
         if not self.redis_client:
             return None
         try:
-            return self.redis_client.get(key)
-        except:
+            return await asyncio.wait_for(self.redis_client.get(key), self.timeout)
+        except Exception:
             return None
-    
+
     async def set(self, key: str, value: str, ttl: int = 3600) -> bool:
         if not self.redis_client:
             return False
         try:
-            self.redis_client.setex(key, ttl, value)
+            await asyncio.wait_for(self.redis_client.setex(key, ttl, value), self.timeout)
             return True
-        except:
+        except Exception:
             return False
@@ -1,9 +1,11 @@
 from fastapi import FastAPI, HTTPException
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 import httpx
 import asyncio
 import hashlib
+import importlib.util
 import json
+import os
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -14,6 +16,8 @@ from .cache_manager import CacheManager
 
 app = FastAPI(title="XAI Wrapper Service", version="1.0.0")
 
+BOT_FALLBACK = {"text": "無法連接到失智小幫手", "confidence": 0.3}
+
 class AnalysisRequest(BaseModel):
     user_input: str
     user_id: str
@@ -26,29 +30,68 @@ class XAIWrapperService:
         self.xai_analyzer = XAIAnalyzer()
         self.viz_generator = VisualizationGenerator()
         self.cache = CacheManager()
+        # One pooled client for the bot API, opened and closed with the app
+        self.bot_api_timeout = httpx.Timeout(float(os.getenv("BOT_API_TIMEOUT", "10")), connect=3.0)
+        self.http: Optional[httpx.AsyncClient] = None
+        self.concurrency = asyncio.Semaphore(int(os.getenv("BOT_API_MAX_CONCURRENCY", "32")))
+        # Overall budget per message; the bot call gets whatever is left after the local steps' reserve
+        self.deadline = float(os.getenv("ANALYZE_DEADLINE", "6"))
+        self.local_reserve = float(os.getenv("ANALYZE_LOCAL_RESERVE", "0.5"))
+
+    async def start(self):
+        await self.cache.connect()
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                http2=importlib.util.find_spec("h2") is not None,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=16, keepalive_expiry=30)
+            )
+
+    async def close(self):
+        await self.cache.close()
+        if self.http is not None:
+            client, self.http = self.http, None
+            await client.aclose()
         
+    async def _call_bot_api(self, user_input: str, deadline: float) -> Tuple[Dict[str, Any], bool]:
+        """Call dementia bot API through the pooled client, bounded by the message deadline.
+        Returns (bot data, degraded); degraded means the fallback answer was used"""
+        if self.http is None:
+            await self.start()
+        remaining = deadline - self.local_reserve - asyncio.get_running_loop().time()
+
+        async def post():
+            # Time spent queued for a slot counts against the deadline too
+            async with self.concurrency:
+                return await self.http.post(self.bot_api_url, json={"text": user_input}, timeout=self.bot_api_timeout)
+
+        try:
+            bot_response = await asyncio.wait_for(post(), timeout=max(remaining, 0))
+            return bot_response.json(), False
+        except Exception:
+            return dict(BOT_FALLBACK), True
+
+    async def _extract_features(self, user_input: str):
+        """Tokenize once with jieba and derive keywords and intent from it"""
+        words = await self.xai_analyzer.tokenize(user_input)
+        return await asyncio.gather(
+            self.xai_analyzer.extract_keywords(user_input, words),
+            self.xai_analyzer.classify_intent(user_input)
+        )
+
     async def process_message(self, request: AnalysisRequest) -> Dict[str, Any]:
+        deadline = asyncio.get_running_loop().time() + self.deadline
+
         # Check cache
         cache_key = f"analysis:{hashlib.md5(request.user_input.encode()).hexdigest()}"
         cached = await self.cache.get(cache_key)
         if cached:
             return json.loads(cached)
             
-        # Call dementia bot API
-        async with httpx.AsyncClient() as client:
-            try:
-                bot_response = await client.post(
-                    self.bot_api_url,
-                    json={"text": request.user_input},
-                    timeout=10.0
-                )
-                bot_data = bot_response.json()
-            except:
-                bot_data = {"text": "無法連接到失智小幫手", "confidence": 0.3}
-        
-        # Extract keywords and classify intent
-        keywords = await self.xai_analyzer.extract_keywords(request.user_input)
-        intent = await self.xai_analyzer.classify_intent(request.user_input)
+        # The upstream bot call and local keyword/intent extraction are independent: run them together
+        (bot_data, degraded), (keywords, intent) = await asyncio.gather(
+            self._call_bot_api(request.user_input, deadline),
+            self._extract_features(request.user_input)
+        )
         
         # Detect module
         module = self.module_detector.detect(
@@ -62,7 +105,8 @@ class XAIWrapperService:
         xai_data = await self.xai_analyzer.analyze(
             user_input=request.user_input,
             bot_response=bot_data,
-            module=module
+            module=module,
+            keywords=keywords
         )
         
         # Generate visualization
@@ -78,21 +122,36 @@ class XAIWrapperService:
             "bot_response": bot_data,
             "xai_analysis": xai_data,
             "visualization": visualization,
-            "confidence": xai_data["confidence"]
+            "confidence": xai_data["confidence"],
+            "degraded": degraded
         }
         
-        # Cache result
-        await self.cache.set(cache_key, json.dumps(result), ttl=3600)
+        # Cache result (not the fallback answer, so the next request retries the bot API)
+        if not degraded:
+            await self.cache.set(cache_key, json.dumps(result), ttl=3600)
         
         return result
 
 wrapper_service = XAIWrapperService()
 
+@app.on_event("startup")
+async def startup():
+    await wrapper_service.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await wrapper_service.close()
+
 @app.post("/api/v1/analyze")
 async def analyze(request: AnalysisRequest):
     try:
-        result = await wrapper_service.process_message(request)
+        # Hard stop in case a local step overruns the per-message deadline
+        result = await asyncio.wait_for(
+            wrapper_service.process_message(request), timeout=wrapper_service.deadline + 1
+        )
         return result
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="analysis deadline exceeded")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -5,6 +5,7 @@ Implements performance-optimized XAI visualizations with progressive loading
 
 import time
 import json
+from collections import OrderedDict
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
 from enum import Enum
@@ -894,10 +895,11 @@ class OptimizedVisualizationGenerator:
 
 # 快取管理器
 class VisualizationCache:
-    """視覺化快取管理器"""
+    """視覺化快取管理器（有界 LRU，依快取類型設定 TTL）"""
     
-    def __init__(self):
-        self.cache = {}
+    def __init__(self, max_size: int = 500):
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.max_size = max_size
         self.cache_ttl = {
             "症狀組合": 3600,  # 1小時
             "處理方案": 86400,  # 24小時
@@ -911,27 +913,30 @@ class VisualizationCache:
     
     def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
         """獲取快取"""
-        if cache_key in self.cache:
-            cached_data = self.cache[cache_key]
-            if time.time() - cached_data["timestamp"] < self.cache_ttl.get("症狀組合", 3600):
-                return cached_data["data"]
-        return None
+        cached_data = self.cache.get(cache_key)
+        if cached_data is None:
+            return None
+        if time.time() >= cached_data["expires_at"]:
+            del self.cache[cache_key]
+            return None
+        self.cache.move_to_end(cache_key)
+        return cached_data["data"]
     
-    def set(self, cache_key: str, data: Dict[str, Any]) -> None:
-        """設置快取"""
+    def set(self, cache_key: str, data: Dict[str, Any], cache_type: str = "症狀組合") -> None:
+        """設置快取，超過上限時淘汰最久未使用的項目"""
         self.cache[cache_key] = {
             "data": data,
-            "timestamp": time.time()
+            "timestamp": time.time(),
+            "expires_at": time.time() + self.cache_ttl.get(cache_type, 3600)
         }
+        self.cache.move_to_end(cache_key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
     
     def clear_expired(self) -> None:
         """清理過期快取"""
         current_time = time.time()
-        expired_keys = []
-        
-        for key, value in self.cache.items():
-            if current_time - value["timestamp"] > self.cache_ttl.get("症狀組合", 3600):
-                expired_keys.append(key)
+        expired_keys = [key for key, value in self.cache.items() if current_time >= value["expires_at"]]
         
         for key in expired_keys:
-            del self.cache[key] 
\ No newline at end of file
+            del self.cache[key]
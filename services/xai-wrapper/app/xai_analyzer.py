@@ -1,4 +1,5 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import asyncio
 import jieba
 import random
 
@@ -9,8 +10,13 @@ class XAIAnalyzer:
             "記憶", "時間", "空間", "行為", "情緒", "照護"
         ]
         
-    async def extract_keywords(self, text: str) -> List[str]:
-        words = jieba.lcut(text)
+    async def tokenize(self, text: str) -> List[str]:
+        # jieba is CPU-bound; run it off the loop so it overlaps the upstream call
+        return await asyncio.to_thread(jieba.lcut, text)
+
+    async def extract_keywords(self, text: str, words: Optional[List[str]] = None) -> List[str]:
+        if words is None:
+            words = await self.tokenize(text)
         return [w for w in words if w in self.important_words or len(w) > 1]
     
     async def classify_intent(self, text: str) -> str:
@@ -25,8 +31,9 @@ class XAIAnalyzer:
         return "general_inquiry"
     
     async def analyze(self, user_input: str, bot_response: Dict, 
-                     module: str) -> Dict[str, Any]:
-        keywords = await self.extract_keywords(user_input)
+                     module: str, keywords: Optional[List[str]] = None) -> Dict[str, Any]:
+        if keywords is None:
+            keywords = await self.extract_keywords(user_input)
         
         # Calculate confidence based on keywords and response
         base_confidence = 0.7
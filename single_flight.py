@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Single-flight 合併並行請求
+熱門問題的快取失效時，多個 webhook worker 會同時對同一輸入執行分析或呼叫 Gemini。
+以正規化輸入的雜湊為鍵：第一個呼叫者負責計算，其他並行呼叫者等待同一個 Future。
+提供 lock_manager（RedisCacheManager）時另以 Redis 鎖跨程序合併：
+未取得鎖的程序輪詢快取，等待持鎖程序寫入結果。
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+import uuid
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_input(text: str) -> str:
+    """正規化輸入：NFKC（全半形統一）並合併空白"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
+def flight_key(namespace: str, text: str, *extra: Any) -> str:
+    """以命名空間與正規化輸入的雜湊產生 single-flight 鍵"""
+    parts = [normalize_input(text)] + [str(item) for item in extra]
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class SingleFlight:
+    """同一鍵同時只計算一次，並行呼叫者共用結果"""
+
+    def __init__(self, lock_manager: Any = None, lock_ttl: float = 30.0, poll_interval: float = 0.05):
+        self.lock_manager = lock_manager
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "leaders": 0,          # 實際計算次數
+            "shared": 0,           # 等待程序內同一計算的呼叫
+            "remote_waits": 0,     # 其他程序持鎖而等待
+            "remote_hits": 0,      # 等待後由快取取得其他程序的結果
+        }
+
+    def do(self, key: str, fn: Callable[[], Any],
+           check: Optional[Callable[[], Any]] = None) -> Tuple[Any, bool]:
+        """執行 fn；同鍵已有計算進行中時等待其結果。回傳 (結果, 是否共用他人的結果)。
+        check 用於跨程序等待時查詢快取，共用的結果此時為 check 的回傳值"""
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._flights[key] = future
+                self.stats["leaders"] += 1
+            else:
+                self.stats["shared"] += 1
+
+        if not leader:
+            return future.result()[0], True
+
+        try:
+            outcome = self._run_locked(key, fn, check)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(outcome)
+            return outcome
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _run_locked(self, key: str, fn: Callable[[], Any],
+                    check: Optional[Callable[[], Any]]) -> Tuple[Any, bool]:
+        if self.lock_manager is None:
+            return fn(), False
+
+        lock_name = f"flight:{key}"
+        token = uuid.uuid4().hex
+        acquired = self.lock_manager.acquire_lock(lock_name, token, self.lock_ttl)
+        if acquired is False:
+            # 其他程序正在計算：輪詢快取直到結果出現、鎖釋放或逾時
+            self.stats["remote_waits"] += 1
+            deadline = time.monotonic() + self.lock_ttl
+            while time.monotonic() < deadline:
+                if check is not None:
+                    cached = check()
+                    if cached is not None:
+                        self.stats["remote_hits"] += 1
+                        return cached, True
+                if not self.lock_manager.lock_held(lock_name):
+                    break
+                time.sleep(self.poll_interval)
+            if check is not None:
+                cached = check()
+                if cached is not None:
+                    self.stats["remote_hits"] += 1
+                    return cached, True
+            logger.info("⚠️  其他程序未寫入結果，改由本程序計算")
+
+        # acquired 為 None 表示 Redis 無法使用，直接在本程序計算
+        try:
+            return fn(), False
+        finally:
+            if acquired:
+                self.lock_manager.release_lock(lock_name, token)
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": self.in_flight()}
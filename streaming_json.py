@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+串流 JSON 增量解析
+LLM 以串流回傳 JSON 時逐段 feed，頂層物件的欄位一完成就可取得，不必等整段回應。
+容忍開頭的說明文字或 ```json 區塊標記（從第一個 { 開始解析），頂層物件結束後的內容忽略。
+"""
+
+import json
+from typing import Any, Dict, Iterable, Optional
+
+
+class IncrementalJSONParser:
+    """逐段解析頂層 JSON 物件，回報已完成的欄位"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.started = False
+        self.complete = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = 0          # 目前成員（"key": value）的起點
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """加入一段文字，回傳這段新完成的欄位"""
+        self.buffer += chunk
+        completed: Dict[str, Any] = {}
+        buffer = self.buffer
+        while self._pos < len(buffer) and not self.complete:
+            i = self._pos
+            char = buffer[i]
+            self._pos += 1
+
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self._depth = 1
+                    self._member_start = i + 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    # 頂層字串值在結束引號即完成，不必等逗號
+                    if self._depth == 1 and self._value_start is not None \
+                            and buffer[self._value_start] == '"':
+                        self._finish_value(i + 1, completed, reset=False)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = i
+            elif char in "{[":
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(i, completed)
+                    self.complete = True
+            elif self._depth == 1:
+                if char == ":" and self._key is None:
+                    self._key = self._parse(buffer[self._member_start:i])
+                elif char == ",":
+                    self._finish_value(i, completed)
+                    self._member_start = i + 1
+                elif not char.isspace() and self._key is not None and self._value_start is None:
+                    self._value_start = i  # 數字、true/false/null
+        return completed
+
+    def _finish_value(self, end: int, completed: Dict[str, Any], reset: bool = True):
+        if self._key is not None and self._value_start is not None and self._key not in self.fields:
+            text = self.buffer[self._value_start:end]
+            value = self._parse(text)
+            if value is not None or text.strip() == "null":
+                self.fields[self._key] = value
+                completed[self._key] = value
+        if reset:
+            self._key = None
+            self._value_start = None
+
+    @staticmethod
+    def _parse(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
+
+    def has(self, names: Iterable[str]) -> bool:
+        return all(name in self.fields for name in names)
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """整個物件解析完成時回傳，否則 None"""
+        return dict(self.fields) if self.complete else None
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+共用非同步 HTTP 客戶端測試
+驗證各上游的網址、標頭與逾時設定，以及上游與全域並行上限
+"""
+
+import asyncio
+import contextlib
+
+from async_http_client import AsyncHTTPClient
+
+
+class FakeResponse:
+    status_code = 200
+
+
+class FakeAsyncClient:
+    """記錄請求並統計同時進行中的最大請求數"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.peak = 0
+
+    async def request(self, method, url, headers=None, timeout=None, **kwargs):
+        self.requests.append((method, url, headers, timeout, kwargs))
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return FakeResponse()
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, url, headers=None, timeout=None, **kwargs):
+        self.requests.append((method, url, headers, timeout, kwargs))
+        yield FakeStreamResponse(['{"stage": "early"}', "", '{"stage": "complete"}'], self.delay)
+
+
+class FakeStreamResponse:
+    def __init__(self, lines, delay):
+        self.lines = lines
+        self.delay = delay
+
+    def raise_for_status(self):
+        pass
+
+    async def aiter_lines(self):
+        for line in self.lines:
+            await asyncio.sleep(self.delay)
+            yield line
+
+
+def build_client(**kwargs):
+    client = AsyncHTTPClient(**kwargs)
+    client._client = FakeAsyncClient()
+    return client
+
+
+def test_upstream_settings_applied():
+    """測試上游的基底網址、標頭與逾時套用到請求，呼叫端可覆寫"""
+    client = build_client()
+    client.register("rag", "http://rag:8005/", timeout=7.0, headers={"Authorization": "Bearer k"})
+
+    async def scenario():
+        await client.post("rag", "/comprehensive-analysis", json={"text": "媽媽忘記關瓦斯"})
+        await client.get("rag", "http://rag:8005/health", timeout=2.0, headers={"X-Trace": "1"})
+
+    asyncio.run(scenario())
+    (method, url, headers, timeout, kwargs), health = client._client.requests
+    assert (method, url, kwargs) == ("POST", "http://rag:8005/comprehensive-analysis", {"json": {"text": "媽媽忘記關瓦斯"}})
+    assert headers == {"Authorization": "Bearer k"}
+    assert health[1:4] == ("http://rag:8005/health", {"Authorization": "Bearer k", "X-Trace": "1"}, 2.0)
+    stats = client.get_stats()["upstreams"]["rag"]
+    assert stats["requests"] == 2 and stats["in_flight"] == 0 and stats["timeout"] == 7.0
+
+
+def test_concurrency_limits():
+    """測試上游並行上限與全域並行上限"""
+    client = build_client(max_concurrency=3)
+    client.register("xai", "http://xai", max_concurrency=2)
+    client.register("rag", "http://rag", max_concurrency=10)
+
+    async def burst(upstream, count):
+        await asyncio.gather(*(client.post(upstream, "/analyze") for _ in range(count)))
+
+    asyncio.run(burst("xai", 6))
+    assert client._client.peak == 2
+
+    client._client.peak = 0
+    asyncio.run(burst("rag", 8))
+    assert client._client.peak == 3
+
+
+def test_errors_counted_and_raised():
+    """測試上游錯誤照常拋出並計數"""
+    client = build_client()
+
+    async def failing(*args, **kwargs):
+        raise ConnectionError("refused")
+
+    client._client.request = failing
+    try:
+        asyncio.run(client.post("chatbot", "http://chatbot/api"))
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("錯誤應拋出給呼叫端")
+    stats = client.get_stats()["upstreams"]["chatbot"]
+    assert stats["errors"] == 1 and stats["in_flight"] == 0
+
+
+def test_base_url_kept_as_configured():
+    """測試設定的上游網址保留原樣（含結尾斜線），接路徑時只留一個斜線"""
+    client = build_client()
+    api = client.register("third_party", "https://example.com/api/")
+    assert api.url("") == "https://example.com/api/"
+    assert api.url("/analyze") == "https://example.com/api/analyze"
+    assert client.register("rag", "http://rag:8005").url("health") == "http://rag:8005/health"
+
+
+def test_stream_lines_yields_as_received():
+    """測試串流回應逐行產出（略過空行），並計入上游統計"""
+    client = build_client()
+    client.register("rag", "http://rag:8005")
+
+    async def scenario():
+        return [line async for line in client.stream_lines("rag", "POST", "/m1-flex/stream", json={"user_input": "x"})]
+
+    assert asyncio.run(scenario()) == ['{"stage": "early"}', '{"stage": "complete"}']
+    assert client._client.requests[0][:2] == ("POST", "http://rag:8005/m1-flex/stream")
+    stats = client.get_stats()["upstreams"]["rag"]
+    assert stats["requests"] == 1 and stats["in_flight"] == 0
+
+
+if __name__ == "__main__":
+    test_upstream_settings_applied()
+    test_concurrency_limits()
+    test_errors_counted_and_raised()
+    test_base_url_kept_as_configured()
+    test_stream_lines_yields_as_received()
+    print("✅ 共用非同步 HTTP 客戶端測試通過")
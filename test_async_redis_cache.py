@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+非同步 Redis 快取測試
+驗證 async 介面經 AsyncRedisCache 讀寫（MGET / pipeline 一次往返）、逾時計入斷路器，
+以及未掛上非同步後端時改在執行緒中執行
+"""
+
+import asyncio
+
+from async_redis_cache import AsyncRedisCache
+from fake_redis import FakeRedis, build_manager
+from redis_cache_manager import INVALIDATION_CHANNEL
+
+
+class FakeAsyncPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    async def execute(self):
+        self.client.commands.append("pipeline")
+        return [getattr(self.client.sync, name)(*args) for name, args in self.calls]
+
+
+class FakeAsyncRedis:
+    """以 FakeRedis 的資料模擬 redis.asyncio 客戶端，可設定每個指令的延遲"""
+
+    def __init__(self, sync, delay=0.0):
+        self.sync = sync
+        self.delay = delay
+        self.commands = []
+
+    async def _call(self, name, *args):
+        self.commands.append(name)
+        await asyncio.sleep(self.delay)
+        return getattr(self.sync, name)(*args)
+
+    async def get(self, key):
+        return await self._call("get", key)
+
+    async def mget(self, keys):
+        return await self._call("mget", keys)
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self)
+
+
+def build_backend(client, **kwargs):
+    backend = AsyncRedisCache(redis_url="redis://127.0.0.1:1", **kwargs)
+    backend.client = client
+    return backend
+
+
+def test_async_roundtrip_through_backend():
+    """測試 async 寫入一次 pipeline（含失效廣播），查詢以一次 MGET 同時讀取近似重複鍵"""
+    sync = FakeRedis()
+    client = FakeAsyncRedis(sync)
+    writer, reader = build_manager(sync), build_manager(sync)
+    backend = build_backend(client)
+    writer.attach_async(backend)
+    reader.attach_async(backend)
+
+    async def scenario():
+        assert await writer.acache_analysis_result("媽媽最近常常忘記關瓦斯", {"summary": "記憶力減退"})
+        assert client.commands == ["pipeline"]
+        assert sync.published[-1][0] == INVALIDATION_CHANNEL
+
+        # reader 的近似重複索引沒有這筆，writer 的有：正規化鍵與近似鍵一起 MGET
+        client.commands.clear()
+        assert await reader.aget_cached_analysis("媽媽最近常常忘記關瓦斯。") == {"summary": "記憶力減退"}
+        writer.l1.clear()
+        assert await writer.aget_cached_analysis("媽媽最近常忘記關瓦斯") == {"summary": "記憶力減退"}
+        assert client.commands == ["mget", "mget"]
+
+        # L1 命中不經網路
+        client.commands.clear()
+        assert await reader.aget_cached_analysis("媽媽最近常常忘記關瓦斯") == {"summary": "記憶力減退"}
+        assert client.commands == []
+
+    asyncio.run(scenario())
+    assert writer.get_key_stats()["near_duplicate_hits"] == 1
+    assert backend.get_stats()["commands"] == 3
+
+
+def test_timeouts_open_breaker():
+    """測試指令逾時計入斷路器，開啟後不再等待 Redis"""
+    backend = build_backend(FakeAsyncRedis(FakeRedis(), delay=0.2), operation_timeout=0.01)
+
+    async def scenario():
+        for _ in range(3):
+            assert await backend.get("k") is None
+        assert backend.breaker.state == backend.breaker.OPEN
+        assert await backend.get_many(["a", "b"]) == [None, None]
+
+    asyncio.run(scenario())
+    stats = backend.get_stats()
+    assert stats["timeouts"] == 3 and stats["commands"] == 3
+    assert stats["circuit_breaker"]["short_circuited"] >= 1
+    backend.breaker.shutdown()
+
+
+def test_falls_back_to_thread_without_backend():
+    """測試未掛上非同步後端時，async 介面改用同步版本"""
+    sync = FakeRedis()
+    manager = build_manager(sync)
+
+    async def scenario():
+        assert await manager.aset(manager._session_key("U1"), {"step": 1})
+        manager.l1.clear()
+        assert await manager.aget(manager._session_key("U1")) == {"step": 1}
+
+    asyncio.run(scenario())
+    assert "setex" in sync.commands and "get" in sync.commands
+
+
+if __name__ == "__main__":
+    test_async_roundtrip_through_backend()
+    test_timeouts_open_breaker()
+    test_falls_back_to_thread_without_backend()
+    print("✅ 非同步 Redis 快取測試通過")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+快取值編碼器測試
+驗證 AnalysisResult、片段列表與 Flex payload 往返後型別不變，且比 JSON 精簡
+"""
+
+import json
+
+from cache_codec import CacheCodec, MAGIC
+from fake_redis import FakeRedis, build_manager
+from m1_m2_m3_integrated_rag import AnalysisResult, M1M2M3IntegratedEngine
+
+
+def sample_result():
+    engine = M1M2M3IntegratedEngine(index_dir=None)
+    result = engine.analyze_comprehensive("記憶力減退，忘記吃藥，重複問問題，晚上很暴躁")
+    result.retrieved_chunks = engine.chunks[:5] + result.retrieved_chunks
+    return result
+
+
+def test_analysis_result_round_trip():
+    """測試 AnalysisResult 讀回仍是 AnalysisResult，且比 JSON 小"""
+    codec = CacheCodec()
+    result = sample_result()
+    encoded = codec.encode(result)
+    assert encoded[0] == MAGIC
+
+    decoded = codec.decode(encoded)
+    assert isinstance(decoded, AnalysisResult)
+    assert decoded.__dict__ == json.loads(json.dumps(result.__dict__, ensure_ascii=False))
+
+    as_json = json.dumps(result.__dict__, ensure_ascii=False).encode("utf-8")
+    assert len(encoded) < len(as_json) * 0.8
+
+
+def test_chunks_flex_and_strings():
+    """測試片段列表、Flex payload 與字串往返"""
+    codec = CacheCodec()
+    chunks = [{"chunk_id": "M1-01", "title": "記憶力減退", "content": "忘記剛發生的事", "keywords": ["記憶"],
+               "similarity_score": None, "extra": 1}, {"chunk_id": "M1-02", "content": "迷路"}]
+    flex = {"type": "flex", "altText": "分析結果", "contents": {"type": "bubble", "body": {"type": "box"}}}
+    for value in [chunks, flex, "Gemini 回應", 42, None, [1, "二"]]:
+        assert codec.decode(codec.encode(value)) == value
+
+
+def test_legacy_json_values_still_decode():
+    """測試舊版 JSON 快取值仍可讀取，字串包裝會還原"""
+    codec = CacheCodec()
+    assert codec.decode('{"summary": "舊資料"}') == {"summary": "舊資料"}
+    assert codec.decode(b'{"value": "Gemini", "type": "str"}') == "Gemini"
+    assert codec.decode(bytes((MAGIC, 99, 0)) + b"[]") is None  # 未知版本視為未命中
+
+
+def test_cache_hit_returns_real_object():
+    """測試快取命中時 handle_message 拿到的是 AnalysisResult"""
+    manager = build_manager(FakeRedis())
+    manager.cache_analysis_result("忘記吃藥", sample_result())
+    manager.l1.clear()  # 從 Redis 讀取
+    cached = manager.get_cached_analysis("忘記吃藥")
+    assert isinstance(cached, AnalysisResult)
+    assert cached.comprehensive_summary
+
+
+if __name__ == "__main__":
+    test_analysis_result_round_trip()
+    test_chunks_flex_and_strings()
+    test_legacy_json_values_still_decode()
+    test_cache_hit_returns_real_object()
+    print("✅ 快取值編碼器測試通過")
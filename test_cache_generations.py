@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+命名空間世代號測試
+驗證遞增世代號即可讓整個命名空間失效、其他 worker 經失效訊息同步，
+以及背景回收以 SCAN + UNLINK 只刪除舊世代的鍵（不使用 KEYS / FLUSHDB）
+"""
+
+import os
+import types
+
+import redis_cache_manager
+from fake_redis import FakeRedis, build_manager
+
+
+def test_bump_invalidates_namespace():
+    """測試遞增世代號後舊值不再命中，其他命名空間不受影響"""
+    client = FakeRedis()
+    manager = build_manager(client)
+    manager.cache_gemini_response("提示", "舊回應")
+    manager.cache_analysis_result("媽媽忘記關瓦斯", {"ok": True})
+    old_key = manager._generate_cache_key("gemini", "提示")
+
+    client.commands.clear()
+    assert manager.clear_pattern("cache:gemini*") == 1
+    assert client.commands == ["incr", "publish"]
+    assert manager._generate_cache_key("gemini", "提示") != old_key
+    assert manager.get_cached_gemini_response("提示") is None
+    assert manager.get_cached_analysis("媽媽忘記關瓦斯") == {"ok": True}
+    assert old_key in client.data  # 實體刪除交給背景回收
+
+
+def test_generation_syncs_across_workers():
+    """測試其他 worker 收到世代號後改用新鍵並清除該命名空間的 L1"""
+    client = FakeRedis()
+    a, b = build_manager(client), build_manager(client)
+    a.cache_flex_message("問題", {"type": "flex"})
+    assert b.get_cached_flex_message("問題") == {"type": "flex"}
+
+    a.invalidate_namespace("flex")
+    _, message = client.published[-1]
+    b._apply_invalidation(message)
+    assert b._generation("flex") == a._generation("flex") == 1
+    assert b.l1.keys() == []
+    assert b.get_cached_flex_message("問題") is None
+
+
+def test_reaper_unlinks_only_stale_keys():
+    """測試背景回收以 SCAN 分批 UNLINK 舊世代與舊格式的鍵"""
+    client = FakeRedis()
+    manager = build_manager(client)
+    for i in range(1200):
+        manager.cache_gemini_response(f"提示{i}", "回應")
+    client.data["cache:gemini:legacyhash"] = b"{}"
+    assert manager.clear_all_cache()
+    manager.cache_gemini_response("新提示", "新回應")
+
+    client.commands.clear()
+    assert manager.run_reaper_once() == 1201
+    assert "keys" not in client.commands and "flushdb" not in client.commands
+    assert client.commands.count("scan") >= 3
+    assert not any(key.startswith("cache:gemini:g0:") or key == "cache:gemini:legacyhash" for key in client.data)
+    assert manager.get_cached_gemini_response("新提示") == "新回應"
+    assert client.data["cache:gen:gemini"] == b"1"
+
+    stats = manager.get_cache_stats()
+    assert stats["generations"]["gemini"] == 1
+    assert stats["reaper"]["unlinked"] == 1201 and stats["reaper"]["pending"] == 0
+    assert manager.run_reaper_once(timeout=0.01) == 0  # 佇列為空時等待後回傳，背景執行緒不會中止
+
+
+def test_clear_explicit_pattern_removes_current_keys():
+    """測試非整個命名空間的模式會刪除目前世代的鍵；session:* 以世代號立即失效"""
+    client = FakeRedis()
+    manager = build_manager(client)
+    manager.cache_user_session("u1", {"step": 1})
+    manager.cache_user_session("u2", {"step": 2})
+
+    assert manager.clear_pattern("session:*u1") == 1
+    assert manager.run_reaper_once() == 1
+    assert manager.get_user_session("u1") is None
+    assert manager.get_user_session("u2") == {"step": 2}
+
+    assert manager.clear_pattern("session:*") == 1
+    assert manager.get_user_session("u2") is None
+    assert manager.run_reaper_once() == 1 and not any(key.startswith("session:") for key in client.data)
+
+
+def test_prefix_glob_reaps_instead_of_bumping():
+    """測試不是已知命名空間的前綴模式（cache:gem*）不遞增世代號，改由回收刪除符合的鍵"""
+    client = FakeRedis()
+    manager = build_manager(client)
+    manager.cache_gemini_response("提示", "回應")
+
+    client.commands.clear()
+    assert manager.clear_pattern("cache:gem*") == 1
+    assert "incr" not in client.commands and "gem" not in manager._generations
+    assert manager.run_reaper_once() == 1
+    assert manager.get_cached_gemini_response("提示") is None
+
+
+def test_generation_syncs_without_l1():
+    """測試停用 L1 時仍啟動失效監聽，其他 worker 遞增世代號後不再讀寫舊世代"""
+    client = FakeRedis()
+    original_redis, original_size = getattr(redis_cache_manager, "redis", None), os.environ.get("CACHE_L1_SIZE")
+    redis_cache_manager.REDIS_AVAILABLE = True
+    redis_cache_manager.redis = types.SimpleNamespace(
+        ConnectionPool=types.SimpleNamespace(from_url=lambda *args, **kwargs: None),
+        Redis=lambda connection_pool: client)
+    os.environ["CACHE_L1_SIZE"] = "0"
+    try:
+        a = redis_cache_manager.RedisCacheManager(redis_url="redis://fake")
+        assert a.l1 is None and a._listener is not None and a._listener.is_alive()
+    finally:
+        a.close()
+        redis_cache_manager.REDIS_AVAILABLE = original_redis is not None
+        if original_redis is None:
+            del redis_cache_manager.redis
+        else:
+            redis_cache_manager.redis = original_redis
+        if original_size is None:
+            del os.environ["CACHE_L1_SIZE"]
+        else:
+            os.environ["CACHE_L1_SIZE"] = original_size
+
+    b = build_manager(client)
+    a.cache_analysis_result("媽媽忘記關瓦斯", {"v": "old"})
+    assert b.invalidate_namespace("analysis")
+    _, message = client.published[-1]
+    a._apply_invalidation(message)  # 監聽執行緒收到的訊息
+    assert a._generation("analysis") == 1
+    assert a.get_cached_analysis("媽媽忘記關瓦斯") is None
+    a.cache_analysis_result("媽媽忘記關瓦斯", {"v": "new"})
+    assert b.run_reaper_once() == 1
+    assert b.get_cached_analysis("媽媽忘記關瓦斯") == {"v": "new"}
+
+
+if __name__ == "__main__":
+    test_bump_invalidates_namespace()
+    test_generation_syncs_across_workers()
+    test_reaper_unlinks_only_stale_keys()
+    test_clear_explicit_pattern_removes_current_keys()
+    test_prefix_glob_reaps_instead_of_bumping()
+    test_generation_syncs_without_l1()
+    print("✅ 命名空間世代號測試通過")
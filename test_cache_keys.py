@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+快取鍵正規化測試
+驗證標點、空白、全半形與繁簡差異共用同一快取鍵，以及近似重複查詢與命中率統計
+"""
+
+from cache_keys import NearDuplicateIndex, canonical_key, canonicalize
+from fake_redis import FakeRedis, build_manager
+
+
+def test_canonicalize_folds_surface_differences():
+    """測試表面差異正規化後相同"""
+    base = canonicalize("媽媽常常忘記")
+    for variant in ["媽媽常常忘記。", "媽媽常常忘記 ", "  媽媽，常常忘記！", "妈妈常常忘记"]:
+        assert canonicalize(variant) == base
+    assert canonicalize("ＡＢＣ　123") == canonicalize("abc123")
+    assert canonical_key("媽媽忘記關瓦斯", with_keyword_codes=True).startswith(canonicalize("媽媽忘記關瓦斯") + "|")
+
+
+def test_near_duplicate_index():
+    """測試改寫的問題找到相同快取鍵，關鍵字代碼不同時不採用"""
+    index = NearDuplicateIndex(threshold=0.75)
+    codes = frozenset({"M1:M1-01"})
+    index.add("k1", canonicalize("媽媽最近常常忘記關瓦斯"), codes)
+    assert index.find(canonicalize("媽媽最近常忘記關瓦斯"), codes) == "k1"
+    assert index.find(canonicalize("媽媽最近常忘記關瓦斯"), frozenset()) is None
+    assert index.find(canonicalize("爸爸晚上睡不著還很暴躁"), codes) is None
+    index.discard("k1")
+    assert len(index) == 0
+
+
+def test_manager_hit_rate_gain():
+    """測試快取管理器以正規化鍵與近似重複命中，並回報命中率變化"""
+    manager = build_manager(FakeRedis())
+    manager.cache_analysis_result("媽媽最近常常忘記關瓦斯", {"summary": "記憶力減退"})
+
+    assert manager.get_cached_analysis("媽媽最近常常忘記關瓦斯") is not None
+    assert manager.get_cached_analysis("媽媽最近常常忘記關瓦斯。") is not None
+    assert manager.get_cached_analysis("媽媽最近常忘記關瓦斯") == {"summary": "記憶力減退"}
+    assert manager.get_cached_analysis("爸爸晚上睡不著") is None
+
+    stats = manager.get_cache_stats()["key_canonicalization"]
+    assert (stats["raw_hits"], stats["canonical_hits"], stats["near_duplicate_hits"], stats["misses"]) == (1, 1, 1, 1)
+    assert stats["raw_key_hit_rate"] == 0.25 and stats["hit_rate"] == 0.75
+    assert stats["hit_rate_gain"] == 0.5
+
+    # Gemini 提示詞只做正規化，不查近似重複
+    manager.cache_gemini_response("請說明失智症的早期症狀", "回應")
+    assert manager.get_cached_gemini_response("請說明 失智症的早期症狀？") == "回應"
+    assert manager.get_cached_gemini_response("請說明失智症的晚期症狀") is None
+
+
+def test_public_cache_key():
+    """測試公開的 cache_key：正規化輸入並帶目前世代號"""
+    manager = build_manager(FakeRedis())
+    key = manager.cache_key("analysis", "媽媽忘記關瓦斯")
+    assert key == manager.cache_key("analysis", " 媽媽忘記關瓦斯 ")
+    assert key.startswith("cache:analysis:g0:")
+    manager.invalidate_namespace("analysis")
+    assert manager.cache_key("analysis", "媽媽忘記關瓦斯").startswith("cache:analysis:g1:")
+
+
+if __name__ == "__main__":
+    test_canonicalize_folds_surface_differences()
+    test_near_duplicate_index()
+    test_manager_hit_rate_gain()
+    test_public_cache_key()
+    print("✅ 快取鍵正規化測試通過")
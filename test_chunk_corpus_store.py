@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+知識片段欄位式語料測試
+驗證編譯後的語料與原始 JSON 片段內容一致
+"""
+
+import glob
+import json
+import os
+import tempfile
+
+from chunk_corpus_store import ColumnarChunkCorpus, compile_corpus, load_corpus, read_chunk_file
+
+
+def load_source_chunks():
+    chunks = []
+    for path in sorted(glob.glob("data/chunks/*.jsonl")):
+        chunks.extend(read_chunk_file(path))
+    # 缺欄位、巢狀結構與 None 值
+    chunks.append({"chunk_id": "X-01", "title": "巢狀", "severity_indicators": {"輕度": ["偶爾"]}, "rank": 3})
+    chunks.append({"chunk_id": "X-02", "content": None, "keywords": [], "confidence_score": 1})
+    return chunks
+
+
+def test_roundtrip_matches_source():
+    """測試編譯後逐片段還原結果與原始資料相同"""
+    chunks = load_source_chunks()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "corpus.bin")
+        header = compile_corpus(chunks, path, fingerprint="abc")
+        corpus = load_corpus(path, fingerprint="abc")
+
+        assert len(corpus) == len(chunks)
+        assert list(corpus) == chunks
+        assert corpus[-1] == chunks[-1]
+        assert corpus[1:3] == chunks[1:3]
+        assert corpus.column("chunk_id") == [c.get("chunk_id") for c in chunks]
+        assert header["num_chunks"] == len(chunks)
+
+
+def test_columns_and_scores():
+    """測試欄位存取與分數陣列"""
+    chunks = [
+        {"chunk_id": "A", "module_id": "M2", "confidence_score": 0.5, "keywords": ["a", "b"]},
+        {"chunk_id": "B", "module_id": "M2", "confidence_score": 0.25, "keywords": ["b"]},
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "corpus.bin")
+        compile_corpus(chunks, path)
+        corpus = ColumnarChunkCorpus(path)
+        assert list(corpus.scores("confidence_score")) == [0.5, 0.25]
+        assert corpus.column("keywords") == [["a", "b"], ["b"]]
+        assert corpus.column("missing") == [None, None]
+        # "M2" 與 "b" 只存一次
+        assert corpus.header["num_strings"] == 5
+
+
+def test_nulls_and_mixed_numbers_roundtrip():
+    """測試 None 值與缺少的欄位有所區別，int/float 混用時保留原型別，並可關閉語料"""
+    chunks = [
+        {"id": "a", "n": None, "f": 0.5, "kw": None, "s": None},
+        {"id": "b", "n": 3, "f": 1, "kw": ["x"]},
+        {"id": "c", "n": 0, "f": 2.0, "kw": []},
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "corpus.bin")
+        compile_corpus(chunks, path)
+        with ColumnarChunkCorpus(path) as corpus:
+            # json.dumps 區分 1 與 1.0、None 與 0 / []
+            assert json.dumps(list(corpus)) == json.dumps(chunks)
+            assert corpus.column("n") == [None, 3, 0]
+            assert corpus.column("s") == [None, None, None] and "s" not in corpus[1]
+        assert corpus._file.closed
+        corpus.close()
+
+
+def test_stale_or_invalid_corpus_is_ignored():
+    """測試指紋不符或檔案損毀時回傳 None"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "corpus.bin")
+        compile_corpus([{"chunk_id": "A"}], path, fingerprint="old")
+        assert load_corpus(path, fingerprint="new") is None
+        assert load_corpus(os.path.join(tmp, "missing.bin")) is None
+
+        bad = os.path.join(tmp, "bad.bin")
+        with open(bad, "wb") as f:
+            f.write(b"not a corpus")
+        assert load_corpus(bad) is None
+
+
+def test_engine_uses_compiled_corpus():
+    """測試 M1+M2+M3 引擎可由編譯語料載入並得到相同分析結果"""
+    import m1_m2_m3_integrated_rag as rag
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            for name, jsonl in (("m2_stage_data.json", "m2_stage_chunks.jsonl"),
+                                ("m3_bpsd_data.json", "m3_bpsd_chunks.jsonl")):
+                with open(name, "w", encoding="utf-8") as f:
+                    json.dump(read_chunk_file(os.path.join(cwd, "data", "chunks", jsonl)), f, ensure_ascii=False)
+
+            parsed = rag.M1M2M3IntegratedEngine(index_dir=None, corpus_file=None)
+            rag.M1M2M3IntegratedEngine.compile_corpus("corpus.bin")
+            compiled = rag.M1M2M3IntegratedEngine(index_dir=None, corpus_file="corpus.bin")
+
+            assert isinstance(compiled.chunks, ColumnarChunkCorpus)
+            assert list(compiled.chunks) == parsed.chunks
+            for query in ["媽媽一直重複問同樣的問題", "爺爺懷疑東西被偷", "中度 協助 穿衣"]:
+                a = parsed.analyze_comprehensive(query)
+                b = compiled.analyze_comprehensive(query)
+                assert a.matched_codes == b.matched_codes
+                assert a.retrieved_chunks == b.retrieved_chunks
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    test_roundtrip_matches_source()
+    test_columns_and_scores()
+    test_nulls_and_mixed_numbers_roundtrip()
+    test_stale_or_invalid_corpus_is_ignored()
+    test_engine_uses_compiled_corpus()
+    print("✅ 欄位式語料測試通過")
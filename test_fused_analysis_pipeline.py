@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+融合分析管線測試
+驗證同一請求內同一則訊息只檢索一次、請求結束即不再記憶，且四個模組的評分與個別呼叫相同
+"""
+
+from fused_analysis_pipeline import FusedAnalysisPipeline
+from m1_m2_m3_integrated_rag import M1M2M3IntegratedEngine
+from modules.m1_warning_signs import M1WarningSignsModule
+from modules.m2_progression_matrix import M2ProgressionMatrixModule
+from modules.m3_bpsd_classification import M3BPSDClassificationModule
+from modules.m4_care_navigation import M4CareNavigationModule
+
+
+class CountingEngine(M1M2M3IntegratedEngine):
+    """記錄 analyze_comprehensive 呼叫次數"""
+
+    calls = 0
+
+    def analyze_comprehensive(self, user_input):
+        CountingEngine.calls += 1
+        return super().analyze_comprehensive(user_input)
+
+
+def build_pipeline():
+    engine = CountingEngine(index_dir=None)
+    modules = (M1WarningSignsModule(), M2ProgressionMatrixModule(),
+               M3BPSDClassificationModule(), M4CareNavigationModule())
+    return engine, modules, FusedAnalysisPipeline(engine, *modules)
+
+
+def test_one_analysis_per_message():
+    """測試同一請求內產生 Flex 與取得綜合結果共用同一次分析"""
+    engine, _, pipeline = build_pipeline()
+    CountingEngine.calls = 0
+    message = "媽媽最近常忘記關瓦斯，晚上睡不著還很暴躁"
+
+    # 模擬 /m1-flex：生成 Flex 與回傳綜合結果各取一次分析
+    with pipeline.scope():
+        results = [pipeline.analyze(message) for _ in range(3)]
+        with pipeline.scope():  # 巢狀範圍沿用外層記憶
+            results.append(pipeline.analyze(message))
+    assert CountingEngine.calls == 1
+    assert all(r is results[0] for r in results)
+    assert pipeline.get_stats()["hits"] == 3
+
+    expected = M1M2M3IntegratedEngine.analyze_comprehensive(engine, message)
+    assert results[0].result.matched_codes == expected.matched_codes
+    assert results[0].result_dict["comprehensive_summary"] == expected.comprehensive_summary
+
+
+def test_memo_dropped_after_request():
+    """測試請求結束後不再記憶（跨請求的重用交給 Redis，清除快取後不會回傳舊結果）"""
+    _, _, pipeline = build_pipeline()
+    CountingEngine.calls = 0
+    message = "爸爸常迷路"
+    with pipeline.scope():
+        first = pipeline.analyze(message)
+    with pipeline.scope():
+        second = pipeline.analyze(message)
+    assert second is not first and CountingEngine.calls == 2
+
+    pipeline.analyze(message)
+    pipeline.analyze(message)
+    assert CountingEngine.calls == 4 and pipeline.get_stats()["hits"] == 0
+
+
+def test_module_scores_match_individual_calls():
+    """測試分送給 M1–M4 的結果與各模組單獨分析相同"""
+    _, (m1, m2, m3, m4), pipeline = build_pipeline()
+    for message in ["爺爺懷疑東西被偷，需要申請補助", "已經是重度，臥床不認識人", "hello"]:
+        fused = pipeline.analyze(message)
+        assert fused.module("M1") == m1.analyze_warning_signs(message)
+        assert fused.module("M2")["detected_stage"] == m2.analyze_progression(message)["detected_stage"]
+        assert fused.module("M3") == m3.analyze_bpsd_symptoms(message)
+        assert fused.module("M4") == m4.analyze_care_tasks(message)
+
+
+def test_memo_keyed_on_normalized_input():
+    """測試只差空白或全半形的訊息共用同一次分析"""
+    engine, _, pipeline = build_pipeline()
+    CountingEngine.calls = 0
+    with pipeline.scope():
+        first = pipeline.analyze("媽媽 忘記關瓦斯")
+        assert pipeline.analyze("  媽媽\u3000忘記關瓦斯 ") is first
+        assert pipeline.analyze("媽媽  忘記關瓦斯") is first
+    assert CountingEngine.calls == 1 and pipeline.get_stats()["hits"] == 2
+
+
+if __name__ == "__main__":
+    test_one_analysis_per_message()
+    test_memo_dropped_after_request()
+    test_module_scores_match_individual_calls()
+    test_memo_keyed_on_normalized_input()
+    print("✅ 融合分析管線測試通過")
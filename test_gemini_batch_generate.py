@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Gemini 批次生成測試
+驗證並行呼叫、依輸入順序回傳、快取預先查詢、批內去重、單筆逾時與配額限流
+"""
+
+import asyncio
+import time
+
+from fake_redis import FakeRedis, build_manager
+from optimized_gemini_client import OptimizedGeminiClient
+from rate_limiter import AsyncTokenBucket
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """模擬 generate_content_async：可設定延遲，特定提示詞永不回應"""
+
+    def __init__(self, delay=0.05, hang=()):
+        self.delay = delay
+        self.hang = set(hang)
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        self.calls.append(prompt)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(3600 if prompt in self.hang else self.delay)
+            return FakeResponse(f"回應：{prompt}")
+        finally:
+            self.active -= 1
+
+
+def build_client(model, redis=None):
+    client = OptimizedGeminiClient(api_key="test-key")
+    client.cache_manager = build_manager(redis or FakeRedis())
+    client.model = model
+    client._generation_config = lambda model_name, max_tokens: None
+    # 配額不是這裡要測的，放寬到不影響並行
+    client.request_bucket = AsyncTokenBucket(rate=1000, capacity=100, name="gemini_rpm")
+    return client
+
+
+def test_concurrent_and_ordered():
+    """測試批次並行送出、結果依輸入順序，且並行數不超過上限"""
+    model = FakeModel(delay=0.1)
+    client = build_client(model)
+    prompts = [f"失智症照護問題 {i}" for i in range(10)]
+
+    start = time.perf_counter()
+    results = asyncio.run(client.abatch_generate(prompts, concurrency=4))
+    elapsed = time.perf_counter() - start
+
+    assert [r["response"] for r in results] == [f"回應：{p}" for p in prompts]
+    assert model.peak == 4
+    assert elapsed < 0.6  # 逐一呼叫需 1 秒以上
+
+
+def test_cache_precheck_and_dedup():
+    """測試快取命中不呼叫 API，批內相同提示詞只呼叫一次"""
+    redis = FakeRedis()
+    model = FakeModel(delay=0.01)
+    client = build_client(model, redis)
+    client.cache_manager.cache_gemini_response("什麼是記憶力減退？", "已快取的回應")
+    redis.commands.clear()
+
+    results = asyncio.run(client.abatch_generate(
+        ["什麼是記憶力減退？", "如何照顧失智症患者？", "如何照顧失智症患者？"]))
+
+    assert model.calls == ["如何照顧失智症患者？"]
+    assert results[0]["cached"] and results[0]["response"] == "已快取的回應"
+    assert not results[1]["cached"] and results[2]["deduplicated"]
+    assert redis.commands.count("mget") == 1
+    stats = client.usage_stats
+    assert stats["total_requests"] == 3 and stats["cache_hits"] == 1 and stats["deduplicated"] == 1
+    key_stats = client.cache_manager.key_stats
+    assert key_stats["lookups"] == 2 and key_stats["misses"] == 1
+
+
+def test_item_timeout_isolated():
+    """測試單筆逾時只影響該筆，其餘照常回傳且逾時的不寫入快取"""
+    model = FakeModel(delay=0.01, hang=["卡住的提示詞"])
+    client = build_client(model)
+
+    results = asyncio.run(client.abatch_generate(["正常提示詞", "卡住的提示詞"], item_timeout=0.1))
+
+    assert results[0]["response"] == "回應：正常提示詞"
+    assert "逾時" in results[1]["error"]
+    assert client.usage_stats["timeouts"] == 1
+    assert client.cache_manager.get_cached_gemini_response("卡住的提示詞") is None
+
+
+def test_token_bucket_paces_requests():
+    """測試配額用完後依補充速率等待"""
+    client = build_client(FakeModel(delay=0.0))
+    client.request_bucket = AsyncTokenBucket(rate=20, capacity=2, name="gemini_rpm")
+
+    start = time.perf_counter()
+    asyncio.run(client.abatch_generate([f"問題 {i}" for i in range(6)], use_cache=False))
+    elapsed = time.perf_counter() - start
+
+    # 前 2 筆用掉突發額度，其餘 4 筆每 50ms 補充一筆
+    assert 0.18 < elapsed < 0.5
+    assert client.request_bucket.get_stats()["acquired"] == 6
+
+
+def test_unconfigured_model_matches_generate_response():
+    """測試模型未初始化時每筆回傳與 generate_response 相同的錯誤，且不佔用配額"""
+    client = build_client(None)
+    single = client.generate_response("尚未設定金鑰", use_cache=False)
+    results = asyncio.run(client.abatch_generate(["尚未設定金鑰", "另一個問題"], use_cache=False))
+
+    assert [r["error"] for r in results] == [single["error"]] * 2
+    assert client.request_bucket.get_stats()["acquired"] == 0
+
+
+def test_batch_generate_inside_running_loop():
+    """測試在事件迴圈內呼叫同步介面時提示改用 abatch_generate"""
+    client = build_client(FakeModel(delay=0.0))
+    assert client.batch_generate(["同步呼叫"])[0]["response"] == "回應：同步呼叫"
+
+    async def scenario():
+        try:
+            client.batch_generate(["迴圈內呼叫"])
+            raise AssertionError("應拒絕在事件迴圈內呼叫")
+        except RuntimeError as e:
+            assert "abatch_generate" in str(e)
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_concurrent_and_ordered()
+    test_cache_precheck_and_dedup()
+    test_item_timeout_isolated()
+    test_token_bucket_paces_requests()
+    test_unconfigured_model_matches_generate_response()
+    test_batch_generate_inside_running_loop()
+    print("✅ Gemini 批次生成測試通過")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Gemini 串流回應測試
+驗證增量 JSON 解析、警訊代碼與標題一出現就通知呼叫端（早於完整回應），以及完整結果與快取
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from enhanced.lightweight_rag_for_replit import LightweightRAGEngine
+from fake_redis import FakeRedis, build_manager
+from optimized_gemini_client import OptimizedGeminiClient
+from streaming_json import IncrementalJSONParser
+
+ANALYSIS = {
+    "matched_warning_code": "M1-01",
+    "symptom_title": "記憶力減退影響日常生活",
+    "user_behavior_summary": "媽媽常忘記關瓦斯，還說 \"沒有開過\"",
+    "normal_behavior": "偶爾忘記，事後會想起來",
+    "dementia_indicator": "經常忘記且無法回想",
+    "action_suggestion": "記錄發生頻率並諮詢醫師",
+    "confidence_level": "high",
+    "source": "TADA 十大警訊",
+}
+
+
+def stream_text(obj, size=6):
+    text = "```json\n" + json.dumps(obj, ensure_ascii=False, indent=2) + "\n```"
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStreamingModel:
+    """模擬 generate_content(stream=True)：逐段產出並記錄每段送出的時間"""
+
+    def __init__(self, obj=ANALYSIS, delay=0.005):
+        self.parts = stream_text(obj)
+        self.delay = delay
+        self.calls = 0
+        self.sent_at = []
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        self.calls += 1
+        if not stream:
+            return FakeChunk("".join(self.parts))
+        return self._stream()
+
+    def _stream(self):
+        for part in self.parts:
+            time.sleep(self.delay)
+            self.sent_at.append(time.perf_counter())
+            yield FakeChunk(part)
+
+
+def test_parser_reports_fields_as_they_complete():
+    """測試欄位在結束引號即完成，任意切段與跳脫字元都不影響結果"""
+    parser = IncrementalJSONParser()
+    assert parser.feed('好的：{"matched_warning_code": "M1-0') == {}
+    assert parser.feed('2", "symptom_title": "迷路"') == {"matched_warning_code": "M1-02", "symptom_title": "迷路"}
+    assert parser.result() is None
+    parser.feed(', "score": 0.8, "tags": ["a", {"b": "}"}], "ok": true}\n以上')
+    assert parser.result() == {"matched_warning_code": "M1-02", "symptom_title": "迷路",
+                               "score": 0.8, "tags": ["a", {"b": "}"}], "ok": True}
+
+    for size in (1, 3, 17):
+        parser = IncrementalJSONParser()
+        for part in stream_text(ANALYSIS, size):
+            parser.feed(part)
+        assert parser.result() == ANALYSIS
+
+
+def test_client_early_callback_before_completion():
+    """測試 generate_json_stream 在串流結束前就回報警訊代碼與標題，完成後寫入快取"""
+    model = FakeStreamingModel()
+    client = OptimizedGeminiClient(api_key="test-key")
+    client.cache_manager = build_manager(FakeRedis())
+    client.model = model
+    client._generation_config = lambda model_name, max_tokens: None
+
+    early = []
+    result = client.generate_json_stream("分析：媽媽常忘記關瓦斯", on_early=lambda fields: early.append(
+        (time.perf_counter(), fields)))
+
+    (notified_at, fields), = early
+    assert fields == {key: ANALYSIS[key] for key in ("matched_warning_code", "symptom_title")}
+    assert notified_at < model.sent_at[-1]
+    assert result["parsed"] == ANALYSIS and result["early_sent"]
+    assert result["early_fields_time"] < result["response_time"]
+
+    # 第二次由快取回覆，不再呼叫模型
+    cached = client.generate_json_stream("分析：媽媽常忘記關瓦斯")
+    assert cached["parsed"] == ANALYSIS and model.calls == 1
+    assert client.usage_stats["cache_hits"] == 1
+
+
+def test_engine_streaming_and_rule_paths_notify_once():
+    """測試 RAG 引擎串流時提早通知一次；規則分析時以完整結果通知一次"""
+    engine = LightweightRAGEngine(index_dir=None)
+    early = []
+    result = engine.analyze_with_lightweight_rag("媽媽最近常忘記關瓦斯爐", on_early=early.append)
+    assert len(early) == 1 and early[0] is result and result["analysis_method"] == "rule_based"
+
+    model = FakeStreamingModel()
+    engine.model = model
+    engine.gemini_available = True
+    early = []
+    result = engine.analyze_with_lightweight_rag(
+        "媽媽最近常忘記關瓦斯爐", on_early=lambda fields: early.append((time.perf_counter(), fields)))
+
+    (notified_at, fields), = early
+    assert fields["symptom_title"] == ANALYSIS["symptom_title"] and "action_suggestion" not in fields
+    assert notified_at < model.sent_at[-1]
+    assert result["analysis_method"] == "gemini_ai" and result["action_suggestion"] == ANALYSIS["action_suggestion"]
+
+
+class BrokenStreamingModel(FakeStreamingModel):
+    """串流送出警訊代碼與標題後中斷"""
+
+    def _stream(self):
+        for part in self.parts[:len(self.parts) // 2]:
+            yield FakeChunk(part)
+        raise ConnectionError("stream reset")
+
+
+def test_engine_keeps_early_fields_when_stream_fails():
+    """測試提早回覆已送出後串流中斷，退回規則分析時保留已送出的警訊代碼與標題"""
+    streamed = {**ANALYSIS, "matched_warning_code": "M1-07", "symptom_title": "東西擺放錯亂且失去回頭尋找的能力"}
+    engine = LightweightRAGEngine(index_dir=None)
+    engine.model = BrokenStreamingModel(streamed)
+    engine.gemini_available = True
+    early = []
+    result = engine.analyze_with_lightweight_rag("媽媽最近常忘記關瓦斯爐", on_early=early.append)
+
+    assert early[0]["matched_warning_code"] == "M1-07"
+    assert result["analysis_method"] == "rule_based" and result["early_reply_kept"]
+    assert {k: result[k] for k in early[0]} == early[0]
+
+
+if __name__ == "__main__":
+    test_parser_reports_fields_as_they_complete()
+    test_client_early_callback_before_completion()
+    test_engine_streaming_and_rule_paths_notify_once()
+    test_engine_keeps_early_fields_when_stream_fails()
+    print("✅ Gemini 串流回應測試通過")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+共用關鍵字比對器測試
+驗證 Aho–Corasick 單次掃描結果與逐一 `keyword in text` 相同
+"""
+
+import random
+
+from keyword_matcher import AhoCorasickAutomaton, KeywordMatcher, shared_matcher
+from modules.m1_warning_signs import M1WarningSignsModule, WARNING_SIGN_KEYWORDS
+from modules.m2_progression_matrix import M2ProgressionMatrixModule, STAGE_KEYWORDS, Stage
+from modules.m3_bpsd_classification import M3BPSDClassificationModule, CATEGORY_KEYWORDS
+from modules.m4_care_navigation import M4CareNavigationModule, CARE_KEYWORDS
+
+MESSAGES = [
+    "媽媽最近常忘記關瓦斯，還重複問同樣的問題",
+    "爸爸在熟悉的地方迷路，晚上睡不著一直遊走",
+    "奶奶懷疑東西被偷，脾氣暴躁易怒",
+    "想知道有什麼補助資源，要去哪家醫院看醫生",
+    "已經是中度了，不會用洗衣機，也不認識家人",
+    "Hello 沒有任何關鍵字",
+    "",
+]
+
+
+def test_automaton_matches_substring_search():
+    """測試自動機命中與逐字比對一致（含重疊與互為前後綴的關鍵字）"""
+    rng = random.Random(0)
+    alphabet = "abc記憶"
+    for _ in range(200):
+        keywords = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(8)]
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        automaton = AhoCorasickAutomaton(keywords)
+        found = {(start, automaton.keywords[k]) for start, k in automaton.iter_matches(text)}
+        expected = {
+            (i, kw) for kw in set(keywords)
+            for i in range(len(text)) if text.startswith(kw, i)
+        }
+        assert found == expected, (keywords, text)
+
+
+def test_modules_match_original_scan():
+    """測試 M1–M4 模組取用共用結果後與原本逐字掃描相同"""
+    m1, m2, m3, m4 = (M1WarningSignsModule(), M2ProgressionMatrixModule(),
+                      M3BPSDClassificationModule(), M4CareNavigationModule())
+    for message in MESSAGES:
+        text = message.lower()
+        matches = shared_matcher.match(message)
+
+        signs = [s for s, kws in WARNING_SIGN_KEYWORDS.items() if any(k in text for k in kws)]
+        hits = sum(1 for kws in WARNING_SIGN_KEYWORDS.values() for k in kws if k in text)
+        m1_result = m1.analyze_warning_signs(message, matches)
+        assert m1_result["matched_signs"] == signs
+        assert f"發現 {hits} 個" in m1_result["analysis"]
+
+        scores = {stage: sum(1 for k in STAGE_KEYWORDS[stage] if k in text) for stage in Stage}
+        assert m2.analyze_progression(message)["detected_stage"] == max(scores.items(), key=lambda x: x[1])[0]
+
+        categories = [c for c, kws in CATEGORY_KEYWORDS.items() if any(k in text for k in kws)]
+        assert m3.analyze_bpsd_symptoms(message)["primary_category"] == (categories[0] if categories else None)
+
+        needs = [c for c, kws in CARE_KEYWORDS.items() if any(k in text for k in kws)]
+        assert m4.analyze_care_tasks(message)["primary_need"] == (needs[0] if needs else None)
+
+
+def test_single_pass_and_recompile_on_change():
+    """測試同一訊息只掃描一次，且只有關鍵字表變更時才重新編譯"""
+    matcher = KeywordMatcher()
+    matcher.register("A", {"x": ["記憶", "忘記"]})
+    matcher.register("B", {"y": ["忘記", "迷路"], "z": ["迷路", "迷路"]})
+
+    first = matcher.match("常忘記又迷路")
+    assert matcher.match("常忘記又迷路") is first
+    assert matcher.compile_count == 1
+    assert {(h.keyword, h.module, h.category) for h in first.hits} == {
+        ("忘記", "A", "x"), ("忘記", "B", "y"), ("迷路", "B", "y"), ("迷路", "B", "z")
+    }
+    assert first.modules() == ["A", "B"]
+    assert first.count("B", "z") == 2
+
+    assert not matcher.register("A", {"x": ["記憶", "忘記"]})
+    matcher.match("記憶")
+    assert matcher.compile_count == 1
+
+    assert matcher.register("A", {"x": ["記憶"]})
+    assert matcher.match("常忘記又迷路").categories("A") == []
+    assert matcher.compile_count == 2
+
+
+if __name__ == "__main__":
+    test_automaton_matches_substring_search()
+    test_modules_match_original_scan()
+    test_single_pass_and_recompile_on_change()
+    print("✅ 關鍵字比對器測試通過")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+兩層快取測試
+驗證 L1 命中不經網路、寫入同步到 Redis，以及 pub/sub 失效讓其他 worker 的 L1 保持一致
+"""
+
+from fake_redis import FakeRedis, build_manager
+from redis_cache_manager import INVALIDATION_CHANNEL
+
+
+def test_l1_hit_skips_network():
+    """測試重複問題由 L1 回答，不經網路"""
+    client = FakeRedis()
+    manager = build_manager(client)
+    question = "媽媽一直重複問同樣的問題"
+    manager.cache_analysis_result(question, {"matched_codes": ["M1-01"]})
+
+    client.commands.clear()
+    for _ in range(5):
+        result = manager.get_cached_analysis(question)
+        assert result == {"matched_codes": ["M1-01"]}
+        result["matched_codes"].append("mutated")  # 修改回傳值不影響快取
+    assert client.commands == []
+    assert manager.get_cache_stats()["l1"]["hits"] == 5
+
+
+def test_read_through_and_namespace_ttl():
+    """測試 L1 未命中時讀取 Redis 並回填，TTL 依命名空間決定"""
+    client = FakeRedis()
+    writer, reader = build_manager(client), build_manager(client)
+    writer.cache_user_session("U1", {"step": 2})
+    key = writer._generate_cache_key("flex", "問題")
+    assert key.startswith("cache:flex:")
+    assert writer._ttl_for(key) == writer.flex_message_ttl
+    assert writer._ttl_for(writer._session_key("U1")) == writer.user_session_ttl
+
+    client.commands.clear()
+    assert reader.get_user_session("U1") == {"step": 2}
+    assert reader.get_user_session("U1") == {"step": 2}
+    assert client.commands == ["get"]
+
+
+def test_invalidation_keeps_workers_coherent():
+    """測試一個 worker 寫入或刪除後，其他 worker 的 L1 失效"""
+    client = FakeRedis()
+    a, b = build_manager(client), build_manager(client)
+    a.cache_gemini_response("提示", {"text": "舊"})
+    assert b.get_cached_gemini_response("提示") == {"text": "舊"}
+
+    a.cache_gemini_response("提示", {"text": "新"})
+    channel, message = client.published[-1]
+    assert channel == INVALIDATION_CHANNEL
+    a._apply_invalidation(message)  # 自己發出的訊息不影響自己的 L1
+    b._apply_invalidation(message)
+    assert b.get_cached_gemini_response("提示") == {"text": "新"}
+
+    b.cache_analysis_result("分析", {"ok": True})
+    b._apply_invalidation(a._invalidation_message(pattern="cache:gemini*"))
+    assert [key.split(":")[1] for key in b.l1.keys()] == ["analysis"]
+
+
+if __name__ == "__main__":
+    test_l1_hit_skips_network()
+    test_read_through_and_namespace_ttl()
+    test_invalidation_keeps_workers_coherent()
+    print("✅ 兩層快取測試通過")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+XAI LINE webhook（services/line-bot/app）測試
+驗證 webhook 在回覆送出前即回應、Flex 被拒時改送文字且每則訊息只計一次，以及關閉時等待未完成的回覆
+（需要 fastapi、line-bot-sdk 與 httpx；未安裝時標為 SKIPPED）
+"""
+
+import asyncio
+import importlib.util
+import json
+import os
+
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "services", "line-bot", "app", "main.py")
+
+XAI_RESULT = {"module": "M1", "confidence": 0.9, "bot_response": {"text": "可能是記憶力減退"},
+              "visualization": {"flex_message": {"confidence_bar": {"label": "高"}}}}
+
+
+def load_app():
+    """載入 webhook 模組；缺少相依套件時略過測試"""
+    for name in ("fastapi", "httpx", "linebot"):
+        pytest.importorskip(name)
+    spec = importlib.util.spec_from_file_location("line_bot_xai_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeParser:
+    """不驗證簽名，直接回傳預先建立的事件"""
+
+    def __init__(self, events):
+        self.events = events
+
+    def parse(self, body, signature):
+        return self.events
+
+
+class FakeRequest:
+    headers = {"X-Line-Signature": "sig"}
+
+    async def body(self):
+        return b"{}"
+
+
+def text_event(text, token="token-1"):
+    from linebot.models import MessageEvent, SourceUser, TextMessage
+    return MessageEvent(reply_token=token, source=SourceUser(user_id="u1"), message=TextMessage(id="1", text=text))
+
+
+class LineAndXAI:
+    """httpx.MockTransport 後端：XAI 可延後回應，LINE 回覆依序回傳指定狀態碼"""
+
+    def __init__(self, reply_statuses=(200,)):
+        self.gate = asyncio.Event()
+        self.reply_statuses = list(reply_statuses)
+        self.replies = []
+
+    async def __call__(self, request):
+        import httpx
+        if request.url.path == "/api/v1/analyze":
+            await self.gate.wait()
+            return httpx.Response(200, json=XAI_RESULT)
+        self.replies.append(json.loads(request.content)["messages"])
+        return httpx.Response(self.reply_statuses.pop(0) if self.reply_statuses else 200, json={})
+
+
+def install(bot, backend):
+    import httpx
+    bot.http_client = httpx.AsyncClient(transport=httpx.MockTransport(backend))
+    bot.message_slots = asyncio.Semaphore(10)
+    bot.pending.clear()
+    bot.stats.update({name: 0 for name in bot.stats})
+
+
+def test_webhook_returns_before_reply():
+    """測試 webhook 只排程處理即回應，XAI 完成後才送出回覆"""
+    bot = load_app()
+
+    async def scenario():
+        backend = LineAndXAI()
+        install(bot, backend)
+        bot.parser = FakeParser([text_event("媽媽常忘記關瓦斯")])
+
+        assert await bot.callback(FakeRequest()) == "OK"
+        assert backend.replies == [] and len(bot.pending) == 1
+
+        backend.gate.set()
+        await asyncio.gather(*bot.pending)
+        assert backend.replies[0][0]["type"] == "flex"
+        assert bot.stats["replied"] == 1 and bot.stats["failed"] == 0
+        await bot.http_client.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_rejected_flex_falls_back_to_text():
+    """測試 Flex 被拒時以同一 reply token 改送文字；兩者都失敗時只計一次失敗"""
+    bot = load_app()
+
+    async def scenario():
+        backend = LineAndXAI(reply_statuses=[400, 200])
+        backend.gate.set()
+        install(bot, backend)
+        await bot.handle_message(text_event("爸爸常迷路"))
+        assert [messages[0]["type"] for messages in backend.replies] == ["flex", "text"]
+        assert backend.replies[1][0]["text"] == "可能是記憶力減退"
+        assert bot.stats == {"received": 1, "replied": 1, "failed": 0, "flex_fallbacks": 1}
+
+        backend.reply_statuses = [400, 500]
+        await bot.handle_message(text_event("爸爸常迷路", token="token-2"))
+        assert bot.stats["failed"] == 1 and bot.stats["replied"] == 1 and bot.stats["received"] == 2
+        await bot.http_client.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_drains_pending_replies():
+    """測試關閉時先等待未完成的訊息送出回覆，再關閉連線池"""
+    bot = load_app()
+
+    async def scenario():
+        backend = LineAndXAI()
+        install(bot, backend)
+        client = bot.http_client
+        bot.parser = FakeParser([text_event("奶奶懷疑東西被偷", token=f"token-{i}") for i in range(3)])
+        await bot.callback(FakeRequest())
+
+        shutdown = asyncio.create_task(bot.shutdown())
+        await asyncio.sleep(0.05)
+        assert not shutdown.done() and backend.replies == []
+        backend.gate.set()
+        await shutdown
+
+        assert len(backend.replies) == 3 and bot.stats["replied"] == 3
+        assert not bot.pending and client.is_closed
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_webhook_returns_before_reply()
+    test_rejected_flex_falls_back_to_text()
+    test_shutdown_drains_pending_replies()
+    print("✅ XAI LINE webhook 測試通過")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+LINE 回覆派送器測試
+驗證有界佇列、worker 併發、逾期丟棄與背壓指標
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from line_reply_dispatcher import LineReplyDispatcher
+
+
+def make_event(token, timestamp=None, user_id=None):
+    return SimpleNamespace(reply_token=token, timestamp=timestamp,
+                           source=SimpleNamespace(user_id=user_id),
+                           message=SimpleNamespace(text=f"訊息 {token}"))
+
+
+class RecordingSender:
+    def __init__(self):
+        self.sent = []
+
+    async def __call__(self, reply_token, messages, deadline=None):
+        self.sent.append((reply_token, messages))
+        return True
+
+
+def test_events_are_processed_off_loop():
+    """測試分析在專用執行緒執行，回覆依序送出"""
+    sender = RecordingSender()
+    threads = set()
+
+    def process(events):
+        threads.add(threading.current_thread().name)
+        time.sleep(0.05)
+        return [{"type": "text", "text": event.message.text} for event in events]
+
+    async def scenario():
+        dispatcher = LineReplyDispatcher(process, sender, workers=3, queue_size=10)
+        await dispatcher.start()
+        started = time.monotonic()
+        assert all(dispatcher.submit(make_event(f"t{i}")) for i in range(6))
+        await dispatcher.stop()
+        return dispatcher, time.monotonic() - started
+
+    dispatcher, elapsed = asyncio.run(scenario())
+    assert sorted(token for token, _ in sender.sent) == [f"t{i}" for i in range(6)]
+    assert all(name.startswith("line-reply") for name in threads)
+    assert elapsed < 0.05 * 6  # 3 個 worker 併行
+    stats = dispatcher.get_stats()
+    assert stats["accepted"] == 6 and stats["replied"] == 6 and stats["in_flight"] == 0
+
+
+def test_backpressure_and_expiry():
+    """測試佇列滿時拒收、reply token 逾期時略過"""
+    sender = RecordingSender()
+    gate = threading.Event()
+
+    def process(events):
+        gate.wait(1)
+        return [{"type": "text", "text": "ok"}]
+
+    async def scenario():
+        dispatcher = LineReplyDispatcher(process, sender, workers=1, queue_size=2, reply_deadline=30)
+        await dispatcher.start()
+        assert dispatcher.submit(make_event("a"))
+        await asyncio.sleep(0.01)  # worker 取出 a，卡在 gate
+        assert dispatcher.submit(make_event("b"))
+        # 事件在 40 秒前發生，reply token 已過期
+        assert dispatcher.submit(make_event("old", timestamp=(time.time() - 40) * 1000))
+        assert not dispatcher.submit(make_event("c"))
+        gate.set()
+        await dispatcher.stop()
+        return dispatcher
+
+    stats = asyncio.run(scenario()).get_stats()
+    assert [token for token, _ in sender.sent] == ["a", "b"]
+    assert stats["rejected"] == 1
+    assert stats["expired"] == 1
+    assert stats["queue_high_watermark"] == 2
+
+
+def test_processing_error_sends_fallback():
+    """測試分析失敗時送出備用訊息"""
+    sender = RecordingSender()
+
+    def process(events):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        dispatcher = LineReplyDispatcher(process, sender, workers=1)
+        await dispatcher.start()
+        dispatcher.submit(make_event("x"))
+        await dispatcher.stop()
+        return dispatcher
+
+    dispatcher = asyncio.run(scenario())
+    assert sender.sent == [("x", dispatcher.fallback_messages)]
+    assert dispatcher.get_stats()["fallbacks"] == 1
+
+
+def test_events_from_same_user_are_coalesced():
+    """測試同一使用者的連續訊息合併成一次分析、一次回覆"""
+    sender = RecordingSender()
+    batches = []
+
+    def process(events):
+        batches.append([event.reply_token for event in events])
+        return [{"type": "text", "text": event.message.text} for event in events] * 2
+
+    async def scenario():
+        dispatcher = LineReplyDispatcher(process, sender, workers=2, coalesce_window=0.05)
+        await dispatcher.start()
+        for token, user_id in [("a1", "A"), ("b1", "B"), ("a2", "A"), ("a3", "A"), ("n1", None)]:
+            dispatcher.submit(make_event(token, user_id=user_id))
+        await asyncio.sleep(0.1)
+        await dispatcher.stop()
+        return dispatcher
+
+    dispatcher = asyncio.run(scenario())
+    assert sorted(batches) == [["a1", "a2", "a3"], ["b1"], ["n1"]]
+    replies = dict(sender.sent)
+    assert set(replies) == {"a1", "b1", "n1"}
+    assert len(replies["a1"]) == 5  # 單次回覆最多 5 則
+    stats = dispatcher.get_stats()
+    assert stats["accepted"] == 5 and stats["coalesced"] == 2 and stats["batches"] == 3
+
+
+def test_full_batch_is_flushed_early():
+    """測試批次達上限時不等視窗結束即送出"""
+    sender = RecordingSender()
+
+    async def scenario():
+        dispatcher = LineReplyDispatcher(lambda events: [{"type": "text", "text": str(len(events))}],
+                                         sender, workers=1, coalesce_window=10, max_batch_events=2)
+        await dispatcher.start()
+        for token in ["x1", "x2", "x3"]:
+            dispatcher.submit(make_event(token, user_id="X"))
+        await asyncio.sleep(0.05)
+        assert sender.sent == [("x1", [{"type": "text", "text": "2"}])]
+        await dispatcher.stop()
+
+    asyncio.run(scenario())
+    assert sender.sent[-1] == ("x3", [{"type": "text", "text": "1"}])
+
+
+if __name__ == "__main__":
+    test_events_are_processed_off_loop()
+    test_backpressure_and_expiry()
+    test_processing_error_sends_fallback()
+    test_events_from_same_user_are_coalesced()
+    test_full_batch_is_flushed_early()
+    print("✅ LINE 回覆派送器測試通過")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+M1+M2+M3 整合引擎檢索測試
+驗證倒排索引檢索結果與逐片段計分一致
+"""
+
+import re
+import tempfile
+
+from m1_m2_m3_integrated_rag import M1M2M3IntegratedEngine
+from retrieval_index_store import is_memory_mapped
+
+
+def brute_force_retrieve(engine, query, top_k=5):
+    """逐片段計分並整體排序（原本的檢索邏輯），作為比對基準"""
+    query_words = set(re.findall(r'[\u4e00-\u9fff]+', query))
+    if any(word in query for word in ["迷路", "方向", "找不到"]):
+        priority_chunk_ids = ["M1-02"]
+    elif any(word in query for word in ["重複", "同樣", "一樣", "反覆"]):
+        priority_chunk_ids = ["M1-01"]
+    elif any(word in query for word in ["語言", "說話", "表達", "詞彙"]):
+        priority_chunk_ids = ["M1-03"]
+    else:
+        priority_chunk_ids = []
+
+    scored = []
+    for chunk in engine.chunks:
+        chunk_keywords = set(chunk.get("keywords", []))
+        content_words = set(re.findall(r'[\u4e00-\u9fff]+', chunk.get("content", "")))
+        title_words = set(re.findall(r'[\u4e00-\u9fff]+', chunk.get("title", "")))
+        all_chunk_words = chunk_keywords | content_words | title_words
+        overlap = len(query_words & all_chunk_words)
+        total_words = len(query_words | all_chunk_words)
+        if total_words > 0:
+            similarity = overlap / total_words + len(query_words & chunk_keywords) * 0.3
+            if chunk.get("chunk_id") in priority_chunk_ids:
+                similarity += 0.5
+            scored.append((chunk["chunk_id"], round(similarity, 4)))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored[:top_k]
+
+
+def test_inverted_index_covers_all_terms():
+    """測試倒排索引涵蓋所有片段詞彙"""
+    engine = M1M2M3IntegratedEngine(index_dir=None)
+    for idx, chunk in enumerate(engine.chunks):
+        keywords = set(chunk.get("keywords", []))
+        terms = keywords | set(re.findall(r'[\u4e00-\u9fff]+', chunk["content"] + " " + chunk["title"]))
+        assert engine.chunk_term_counts[idx] == len(terms)
+        for term in terms:
+            term_id = engine.term_index[term]
+            start, end = engine.postings_indptr[term_id], engine.postings_indptr[term_id + 1]
+            postings = dict(zip(engine.postings_chunks[start:end], engine.postings_is_keyword[start:end]))
+            assert postings[idx] == (term in keywords)
+    assert engine.vocabulary == set(engine.term_index)
+
+
+def test_retrieval_matches_brute_force():
+    """測試檢索結果（含順序與以 0 分片段補足 top_k）與逐片段計分相同"""
+    engine = M1M2M3IntegratedEngine()
+    for query in ["記憶", "預算", "對話 混亂", "完全無關的句子", "媽媽最近常常忘記吃藥", "爸爸迷路了"]:
+        for top_k in (2, 5):
+            expected = brute_force_retrieve(engine, query, top_k)
+            retrieved = engine._retrieve_relevant_chunks(query, top_k=top_k)
+            assert [(c["chunk_id"], c["similarity_score"]) for c in retrieved] == expected
+
+
+def test_natural_sentence_still_matches():
+    """測試整句中文查詢（與片段沒有共同詞彙）仍檢索到片段並對應警訊"""
+    engine = M1M2M3IntegratedEngine()
+    result = engine.analyze_comprehensive("媽媽最近常常忘記吃藥")
+    assert [c["chunk_id"] for c in result.retrieved_chunks][:3] == ["M1-01", "M1-02", "M1-03"]
+    assert result.matched_codes == ["M1-01"]
+
+
+def test_priority_chunk_is_candidate():
+    """測試優先片段即使沒有共同詞彙也會被檢索"""
+    engine = M1M2M3IntegratedEngine()
+    retrieved = engine._retrieve_relevant_chunks("爸爸迷路了", top_k=5)
+    assert retrieved[0]["chunk_id"] == "M1-02"
+    assert retrieved[0]["similarity_score"] >= 0.5
+
+
+def test_top_k_limit_and_order():
+    """測試 top_k 限制與排序"""
+    engine = M1M2M3IntegratedEngine()
+    retrieved = engine._retrieve_relevant_chunks("記憶 工作 語言", top_k=2)
+    assert len(retrieved) == 2
+    assert retrieved[0]["similarity_score"] >= retrieved[1]["similarity_score"]
+    # 原始片段不應被加上分數欄位
+    assert all("similarity_score" not in c for c in engine.chunks)
+
+
+def test_saved_index_roundtrip():
+    """測試磁碟索引以 mmap 開啟後檢索結果相同"""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return
+
+    built = M1M2M3IntegratedEngine(index_dir=None)
+    with tempfile.TemporaryDirectory() as index_dir:
+        built.save_index(index_dir)
+        loaded = M1M2M3IntegratedEngine(index_dir=index_dir)
+        assert is_memory_mapped(loaded.postings_chunks)
+        assert len(loaded.chunks) == len(built.chunks)
+        for query in ["記憶", "爸爸迷路了", "對話 混亂", "完全無關的句子"]:
+            assert loaded._retrieve_relevant_chunks(query) == built._retrieve_relevant_chunks(query)
+
+
+if __name__ == "__main__":
+    test_inverted_index_covers_all_terms()
+    test_retrieval_matches_brute_force()
+    test_natural_sentence_still_matches()
+    test_priority_chunk_is_candidate()
+    test_top_k_limit_and_order()
+    test_saved_index_roundtrip()
+    print("✅ 所有檢索測試通過")
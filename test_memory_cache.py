@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+內存快取測試
+驗證 LRU 淘汰、過期堆主動清除、位元組預算與命中統計
+"""
+
+import time
+
+from memory_cache import MemoryCache
+
+
+def test_lru_eviction():
+    """測試淘汰最久未使用的項目，而非最早寫入的項目"""
+    cache = MemoryCache(max_size=3)
+    for key in "abc":
+        cache.set(key, key.upper())
+    assert cache.get("a") == "A"  # a 變成最近使用
+    cache.set("d", "D")
+    assert cache.keys() == ["c", "a", "d"]
+    assert cache.get("b") is None
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1 and stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_expired_entries_are_purged_on_write():
+    """測試過期項目在寫入時由過期堆清除，不需等待讀取"""
+    cache = MemoryCache(max_size=100)
+    cache.set("short", 1, ttl=0.02)
+    cache.set("rewritten", 1, ttl=0.02)
+    cache.set("rewritten", 2, ttl=60)  # 舊的堆記錄不可刪除新值
+    time.sleep(0.03)
+    cache.set("other", 3)
+    assert cache.keys() == ["rewritten", "other"]
+    assert cache.get("rewritten") == 2
+    assert cache.get_stats()["expirations"] == 1
+    assert cache.get_stats()["evictions"] == 0
+
+
+def test_byte_budget():
+    """測試超過位元組預算時淘汰"""
+    cache = MemoryCache(max_size=100, max_bytes=10)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.set("c", "123")
+    assert cache.keys() == ["b", "c"]
+    assert cache.current_bytes == 8
+    cache.delete("b")
+    assert cache.current_bytes == 3
+
+
+def test_heap_stays_bounded():
+    """測試反覆覆寫同一鍵時過期堆不會無限成長"""
+    cache = MemoryCache(max_size=10)
+    for i in range(1000):
+        cache.set("k", i)
+    assert len(cache._expiry_heap) <= 2 * len(cache) + 65
+    assert cache.get("k") == 999
+
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_expired_entries_are_purged_on_write()
+    test_byte_budget()
+    test_heap_stays_bounded()
+    print("✅ 內存快取測試通過")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+本地 LLM 替身測試
+驗證確定性且符合 M1_SCHEMA 的輸出、延遲分布與串流、429/500/逾時注入，
+以及透過 OptimizedGeminiClient、RAG 引擎與 OpenAI / Claude 相容 HTTP 端點使用
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from enhanced.lightweight_rag_for_replit import ANALYSIS_PROMPT, LightweightRAGEngine
+from fake_redis import FakeRedis, build_manager
+from mock_llm_provider import MockGenerativeModel, MockLLMError, MockLLMProvider, create_server, parse_latency
+from optimized_gemini_client import OptimizedGeminiClient
+from rate_limiter import AsyncTokenBucket
+
+M1_REQUIRED = {"analysis_process", "matched_warnings", "overall_confidence", "risk_level", "recommendations"}
+M1_PROMPT = '請依 schema 回應 matched_warnings 與 overall_confidence。\n\n用戶描述："{}"'
+RAG_PROMPT = '請以JSON格式回應 matched_warning_code 與 symptom_title。\n\n使用者描述："{}"'
+
+
+def fast_provider(**kwargs):
+    return MockLLMProvider(latency="fixed:0", chars_per_second=10 ** 6, seed=7, **kwargs)
+
+
+def build_client(provider):
+    client = OptimizedGeminiClient(api_key="test-key")
+    client.cache_manager = build_manager(FakeRedis())
+    client.model = MockGenerativeModel(provider=provider)
+    client.request_bucket = AsyncTokenBucket(rate=1000, capacity=100, name="gemini_rpm")
+    return client
+
+
+def test_deterministic_m1_schema_output():
+    """測試同一描述輸出相同、符合 M1_SCHEMA，並依關鍵字對應警訊"""
+    provider = fast_provider()
+    prompt = M1_PROMPT.format("爸爸常忘記吃藥，最近脾氣也變得很差")
+    first, second = provider.respond(prompt), MockLLMProvider(seed=99).respond(prompt)
+    assert first == second
+
+    result = json.loads(first)
+    assert set(result) == M1_REQUIRED
+    assert [w["warning_id"] for w in result["matched_warnings"]] == [1, 10]
+    assert result["risk_level"] in ("low", "moderate", "high", "urgent")
+    assert 1 <= result["overall_confidence"] <= 10
+    assert all(0 <= w["match_confidence"] <= 1 for w in result["matched_warnings"])
+
+    rag = json.loads(provider.respond(RAG_PROMPT.format("出門後在路口迷路")))
+    assert rag["matched_warning_code"] == "M1-04" and rag["symptom_title"] == "對時間地點感到混淆"
+
+
+def test_latency_distributions_and_streaming():
+    """測試延遲分布、首段延遲與依輸出速率逐段串流"""
+    import random
+    rng = random.Random(1)
+    assert parse_latency("fixed:0.25")(rng) == 0.25
+    assert all(0.1 <= parse_latency("uniform:0.1,0.2")(rng) <= 0.2 for _ in range(50))
+    assert parse_latency("lognormal:0.5,0.3")(rng) > 0
+    try:
+        parse_latency("pareto:1")
+        assert False, "應拒絕不支援的分布"
+    except ValueError:
+        pass
+
+    provider = MockLLMProvider(latency="fixed:0.1", chars_per_second=2400, chunk_chars=24)
+    start = time.perf_counter()
+    stamps = [time.perf_counter() - start for _ in provider.stream(RAG_PROMPT.format("忘記關瓦斯"))]
+    assert stamps[0] >= 0.1 and stamps[-1] >= 0.1 + 0.01 * (len(stamps) - 1)
+    assert provider.get_stats()["streamed"] == 1
+
+
+def test_error_injection():
+    """測試 429 附 Retry-After、500，以及逾時時卡住到客戶端放棄"""
+    try:
+        fast_provider(rate_limit_rate=1.0).generate("hi")
+        assert False, "應注入 429"
+    except MockLLMError as e:
+        assert e.code == 429 and e.retry_after == 1.0
+
+    provider = fast_provider(server_error_rate=0.5)
+    codes = []
+    for _ in range(200):
+        try:
+            provider.generate("hi")
+            codes.append(200)
+        except MockLLMError as e:
+            codes.append(e.code)
+    assert set(codes) == {200, 500} and 60 < codes.count(500) < 140
+    assert provider.get_stats()["server_errors"] == codes.count(500)
+
+    client = build_client(fast_provider(timeout_rate=1.0, hang_seconds=5))
+    start = time.perf_counter()
+    results = asyncio.run(client.abatch_generate(["問題一", "問題二"], item_timeout=0.2))
+    assert time.perf_counter() - start < 2
+    assert all("error" in result for result in results)
+    assert client.usage_stats["timeouts"] == 2
+
+
+def test_gemini_client_and_engine_use_mock():
+    """測試 OptimizedGeminiClient 串流提早回覆與 RAG 引擎經由替身完成分析"""
+    client = build_client(MockLLMProvider(latency="fixed:0.05", chars_per_second=2000, chunk_chars=16))
+    early = []
+    result = client.generate_json_stream(RAG_PROMPT.format("媽媽最近常忘記關瓦斯爐"), on_early=early.append)
+    assert early[0]["matched_warning_code"] == "M1-01"
+    assert result["early_fields_time"] < result["response_time"]
+    assert result["parsed"]["confidence_level"] == "medium"
+
+    engine = LightweightRAGEngine(index_dir=None)
+    engine.model = MockGenerativeModel(system_instruction=ANALYSIS_PROMPT.prefix, provider=fast_provider())
+    engine.gemini_available = True
+    first = engine.analyze_with_lightweight_rag("爸爸出門常迷路，不知道今天幾月幾號")
+    second = engine.analyze_with_lightweight_rag("爸爸出門常迷路，不知道今天幾月幾號")
+    assert first["analysis_method"] == "gemini_ai" and first["matched_warning_code"] == "M1-04"
+    assert second["prefix_tokens_saved"] > first["prefix_tokens_saved"]
+
+
+def post(url, body):
+    request = urllib.request.Request(url, json.dumps(body).encode(), {"Content-Type": "application/json"})
+    return urllib.request.urlopen(request, timeout=5)
+
+
+def test_http_openai_and_claude_compatible():
+    """測試 OpenAI（含 SSE 串流）與 Claude 相容端點、前綴快取命中，以及 429 回應"""
+    provider = fast_provider()
+    server = create_server(port=0, provider=provider)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    try:
+        messages = [{"role": "system", "content": "十大警訊… 回應 matched_warnings 與 overall_confidence"},
+                    {"role": "user", "content": '用戶描述："東西常找不到，懷疑被偷"'}]
+        for expected_cached in (0, True):
+            data = json.load(post(f"{base}/chat/completions", {"model": "gpt-4", "messages": messages}))
+            assert json.loads(data["choices"][0]["message"]["content"])["matched_warnings"][0]["warning_id"] == 7
+            assert bool(data["usage"]["prompt_tokens_details"]["cached_tokens"]) == bool(expected_cached)
+
+        lines = post(f"{base}/chat/completions", {"messages": messages, "stream": True}).read().decode().split("\n\n")
+        events = [line[len("data: "):] for line in lines if line]
+        assert events[-1] == "[DONE]"
+        content = "".join(json.loads(event)["choices"][0]["delta"]["content"] for event in events[:-1])
+        assert json.loads(content) == json.loads(data["choices"][0]["message"]["content"])
+
+        body = {"system": [{"type": "text", "text": "十大警訊… matched_warnings", "cache_control": {"type": "ephemeral"}}],
+                "messages": [{"role": "user", "content": '用戶描述："常常忘記吃藥"'}]}
+        post(f"{base}/messages", body)
+        data = json.load(post(f"{base}/messages", body))
+        assert data["usage"]["cache_read_input_tokens"] > 0 and data["content"][0]["type"] == "text"
+
+        provider.rate_limit_rate = 1.0
+        try:
+            post(f"{base}/chat/completions", {"messages": messages})
+            assert False, "應回應 429"
+        except urllib.error.HTTPError as e:
+            assert e.code == 429 and e.headers["Retry-After"] == "1.0"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_deterministic_m1_schema_output()
+    test_latency_distributions_and_streaming()
+    test_error_injection()
+    test_gemini_client_and_engine_use_mock()
+    test_http_openai_and_claude_compatible()
+    print("✅ 本地 LLM 替身測試通過")
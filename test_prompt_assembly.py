@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+提示詞組裝測試
+驗證前綴壓縮與 schema 緊湊化、每次呼叫節省的前綴 tokens、Gemini 前綴模型重用與 context caching，
+以及 RAG 引擎只送出動態後綴
+"""
+
+import os
+import sys
+import types
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import prompt_assembly
+from enhanced.lightweight_rag_for_replit import ANALYSIS_PROMPT, LightweightRAGEngine
+from prompt_assembly import GeminiPrefixCache, PromptAssembler, PromptTemplate
+from token_budget import HeuristicTokenizer, TokenBudgetManager
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"risk_level": {"type": "string", "description": "風險等級"}},
+    "required": ["risk_level"],
+}
+
+TEMPLATE = PromptTemplate(
+    "m1_test",
+    prefix="""
+        你是專業的失智症評估助手。
+
+
+        十大警訊：
+            1. 記憶力減退影響日常生活
+            2. 計劃事情或解決問題有困難
+    """,
+    suffix='用戶描述："{user_input}"',
+    schema=SCHEMA,
+)
+
+
+class FakeGenAI:
+    """記錄建立的模型與 context cache"""
+
+    def __init__(self):
+        self.models = []
+        self.caches = []
+        self.caching = types.SimpleNamespace(CachedContent=types.SimpleNamespace(create=self._create_cache))
+        self.GenerativeModel = self._model_factory()
+
+    def _create_cache(self, **kwargs):
+        self.caches.append(kwargs)
+        return kwargs
+
+    def _model_factory(self):
+        fake = self
+
+        class GenerativeModel:
+            def __init__(self, name, system_instruction=None):
+                self.name = name
+                self.system_instruction = system_instruction
+                fake.models.append(self)
+
+            @classmethod
+            def from_cached_content(cls, cached_content):
+                model = cls(cached_content["model"])
+                model.cached_content = cached_content
+                return model
+
+        return GenerativeModel
+
+
+class FakeModel:
+    """記錄送出的內容，回報命中 context cache 的 tokens"""
+
+    def __init__(self, cached_tokens=0):
+        self.contents = []
+        self.cached_tokens = cached_tokens
+
+    def generate_content(self, contents, stream=False):
+        self.contents.append(contents)
+        return types.SimpleNamespace(
+            text='{"matched_warning_code": "M1-01", "symptom_title": "記憶力減退"}',
+            usage_metadata=types.SimpleNamespace(cached_content_token_count=self.cached_tokens))
+
+
+def test_prefix_minimized_and_suffix_dynamic():
+    """測試前綴去除縮排與多餘空行、schema 不跳脫中文，後綴只含使用者輸入"""
+    assert TEMPLATE.prefix.startswith("你是專業的失智症評估助手。\n\n十大警訊：\n1. 記憶力減退")
+    assert "\n\n\n" not in TEMPLATE.prefix and "    " not in TEMPLATE.prefix
+    assert '"description":"風險等級"' in TEMPLATE.prefix and "\\u" not in TEMPLATE.prefix
+    assert "\\u" in TEMPLATE.original_prefix
+
+    prompt = TEMPLATE.render(user_input="媽媽忘記關瓦斯")
+    assert prompt.suffix == '用戶描述："媽媽忘記關瓦斯"' and prompt.prefix is TEMPLATE.prefix
+    assert prompt.text.startswith(TEMPLATE.prefix) and prompt.text.endswith(prompt.suffix)
+
+
+def test_saved_prefix_tokens_per_call():
+    """測試每次呼叫節省 = 壓縮節省 + 供應商快取命中（不超過前綴）"""
+    assembler = PromptAssembler(TokenBudgetManager(HeuristicTokenizer()))
+    prompt = TEMPLATE.render(user_input="爸爸開車迷路")
+    prefix_tokens = assembler.prefix_tokens(TEMPLATE)
+    minimized = assembler.budget.count(TEMPLATE.original_prefix) - prefix_tokens
+    assert minimized > 0
+
+    assert assembler.record(prompt, "openai") == minimized
+    assert assembler.record(prompt, "claude", cached_tokens=prefix_tokens * 10) == minimized + prefix_tokens
+
+    stats = assembler.get_stats()["m1_test"]
+    assert stats["calls"] == 2 and stats["provider_cached_tokens"] == prefix_tokens
+    assert stats["prefix_tokens_saved"] == 2 * minimized + prefix_tokens
+    assert stats["providers"] == {"openai": 1, "claude": 1}
+
+
+def test_gemini_prefix_model_reused_and_cached():
+    """測試短前綴以 system_instruction 建立一次模型重用；前綴夠長時建立 context cache，到期後重建"""
+    fake = FakeGenAI()
+    original = getattr(prompt_assembly, "genai", None)
+    prompt_assembly.genai = fake
+    try:
+        assembler = PromptAssembler(TokenBudgetManager(HeuristicTokenizer()))
+        cache = GeminiPrefixCache(assembler, min_tokens=10 ** 6)
+        model = cache.model_for(TEMPLATE)
+        assert cache.model_for(TEMPLATE) is model
+        assert model.system_instruction == TEMPLATE.prefix and fake.caches == []
+
+        cache = GeminiPrefixCache(assembler, min_tokens=1, ttl=0)
+        cached = cache.model_for(TEMPLATE, "gemini-1.5-flash")
+        assert cached.cached_content["system_instruction"] == TEMPLATE.prefix
+        assert fake.caches[0]["model"] == "models/gemini-1.5-flash-001"
+        cache.model_for(TEMPLATE, "gemini-1.5-flash")
+        assert len(fake.caches) == 2
+    finally:
+        if original is None:
+            del prompt_assembly.genai
+        else:
+            prompt_assembly.genai = original
+
+
+def test_engine_sends_only_suffix():
+    """測試 RAG 引擎只送出檢索片段與使用者描述，並回報節省的前綴 tokens"""
+    engine = LightweightRAGEngine(index_dir=None)
+    engine.model = FakeModel(cached_tokens=50)
+    engine.gemini_available = True
+
+    result = engine.analyze_with_lightweight_rag("媽媽最近常忘記關瓦斯爐")
+
+    sent, = engine.model.contents
+    assert sent.startswith("參考資料：") and sent.endswith('使用者描述："媽媽最近常忘記關瓦斯爐"')
+    assert "請以JSON格式回應" not in sent and "請以JSON格式回應" in ANALYSIS_PROMPT.prefix
+    assert result["analysis_method"] == "gemini_ai" and result["prefix_tokens_saved"] >= 50
+
+
+def test_engine_fetches_prefix_model_each_call():
+    """測試未注入模型時每次分析都向 gemini_prefix_cache 取得模型，context cache 到期重建後才會用到新模型"""
+    import enhanced.lightweight_rag_for_replit as rag
+
+    class RotatingCache:
+        def __init__(self):
+            self.models = []
+
+        def model_for(self, template, model_name):
+            assert template is ANALYSIS_PROMPT
+            self.models.append(FakeModel())
+            return self.models[-1]
+
+    original = rag.gemini_prefix_cache
+    rag.gemini_prefix_cache = RotatingCache()
+    try:
+        engine = LightweightRAGEngine(index_dir=None)
+        engine.gemini_available = True
+        engine.analyze_with_lightweight_rag("媽媽最近常忘記關瓦斯爐")
+        engine.analyze_with_lightweight_rag("爸爸出門常迷路")
+        first, second = rag.gemini_prefix_cache.models
+        assert len(first.contents) == 1 and len(second.contents) == 1
+    finally:
+        rag.gemini_prefix_cache = original
+
+
+def test_claude_breakpoint_only_above_minimum():
+    """測試前綴未達 Claude 最小可快取長度時不視為可快取"""
+    assembler = PromptAssembler(TokenBudgetManager(HeuristicTokenizer()))
+    assert not assembler.claude_cacheable(TEMPLATE)
+    assert not assembler.claude_cacheable(ANALYSIS_PROMPT)
+    long_template = PromptTemplate("long_prefix", prefix="十大警訊說明。" * 1000, suffix="{user_input}")
+    assert assembler.claude_cacheable(long_template)
+
+
+if __name__ == "__main__":
+    test_prefix_minimized_and_suffix_dynamic()
+    test_saved_prefix_tokens_per_call()
+    test_gemini_prefix_model_reused_and_cached()
+    test_engine_sends_only_suffix()
+    test_engine_fetches_prefix_model_each_call()
+    test_claude_breakpoint_only_above_minimum()
+    print("✅ 提示詞組裝測試通過")
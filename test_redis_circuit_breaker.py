@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Redis 斷路器測試
+驗證快取路徑只有一次往返、連線失敗時快速失敗，並由計時器探測恢復
+"""
+
+import time
+
+from circuit_breaker import CircuitBreaker
+from redis_cache_manager import RedisCacheManager
+
+
+class FlakyRedis:
+    """記錄指令的假 Redis 客戶端，down=True 時模擬連線失敗"""
+
+    def __init__(self):
+        self.down = False
+        self.commands = []
+        self.data = {}
+
+    def _call(self, name):
+        self.commands.append(name)
+        if self.down:
+            raise ConnectionError("connection refused")
+
+    def ping(self):
+        self._call("ping")
+        return True
+
+    def get(self, key):
+        self._call("get")
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+        return True
+
+    def publish(self, channel, message):
+        return 0
+
+    def pipeline(self, transaction=True):
+        return FlakyPipeline(self)
+
+
+class FlakyPipeline:
+    """一次往返送出多個指令"""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        self.client._call("pipeline")
+        return [getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+def build_manager(client):
+    manager = RedisCacheManager(redis_url="redis://127.0.0.1:1")
+    manager.close()
+    manager.redis_client = client
+    manager.l1 = None  # 只驗證 Redis 層
+    manager.breaker = CircuitBreaker("Redis", failure_threshold=2, reset_timeout=0.05, probe=manager._probe)
+    return manager
+
+
+def test_hot_path_is_one_round_trip():
+    """測試讀寫不再先 PING"""
+    client = FlakyRedis()
+    manager = build_manager(client)
+    assert manager.set("k", {"a": 1})
+    assert manager.get("k") == {"a": 1}
+    assert client.commands == ["pipeline", "get"]
+    assert manager.codec.decode(client.data["k"]) == {"a": 1}
+
+
+def test_breaker_fast_fails_and_recovers():
+    """測試連續失敗後快速失敗，恢復後由探測關閉斷路器"""
+    client = FlakyRedis()
+    manager = build_manager(client)
+    client.down = True
+    assert manager.get("k") is None
+    assert manager.get("k") is None
+    assert manager.breaker.state == CircuitBreaker.OPEN
+
+    client.commands.clear()
+    for _ in range(10):
+        assert manager.get("k") is None
+    assert client.commands == []  # 斷路器開啟時不碰 Redis
+    assert not manager.is_available()
+
+    time.sleep(0.08)  # 探測仍失敗，等待時間加倍
+    assert client.commands == ["ping"]
+    assert manager.breaker.state == CircuitBreaker.OPEN
+
+    client.down = False
+    time.sleep(0.15)
+    assert manager.breaker.state == CircuitBreaker.CLOSED
+    assert manager.set("k", [1, 2])
+    assert manager.get("k") == [1, 2]
+    stats = manager.breaker.get_stats()
+    assert stats["opened"] == 2 and stats["short_circuited"] >= 10
+
+
+def test_request_probe_without_timer():
+    """測試未設定探測函式時，逾時後放行一個請求"""
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=0.02)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.03)
+    assert breaker.allow()
+    assert not breaker.allow()  # 半開時只放行一個
+    breaker.record_success()
+    assert breaker.allow()
+
+
+if __name__ == "__main__":
+    test_hot_path_is_one_round_trip()
+    test_breaker_fast_fails_and_recovers()
+    test_request_probe_without_timer()
+    print("✅ Redis 斷路器測試通過")
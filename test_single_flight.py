@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Single-flight 測試
+驗證並行的相同輸入只計算一次，以及跨程序持鎖時等待快取結果
+"""
+
+import threading
+import time
+
+from single_flight import SingleFlight, flight_key
+
+
+def run_concurrently(count, target):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        results[index] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_callers_share_one_computation():
+    """測試並行呼叫者共用第一個呼叫者的結果"""
+    flights = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"summary": "記憶力減退"}
+
+    results = run_concurrently(8, lambda: flights.do(flight_key("analysis", "媽媽一直重複問同樣的問題"), compute))
+    assert len(calls) == 1
+    assert all(value is results[0][0] for value, _ in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert flights.get_stats() == {"leaders": 1, "shared": 7, "remote_waits": 0, "remote_hits": 0, "in_flight": 0}
+
+
+def test_key_normalizes_input():
+    """測試全半形與多餘空白不影響鍵值"""
+    assert flight_key("gemini", "  媽媽　忘記ＡＢＣ ") == flight_key("gemini", "媽媽 忘記ABC")
+    assert flight_key("gemini", "媽媽") != flight_key("flex", "媽媽")
+
+
+def test_errors_propagate_and_reset():
+    """測試計算失敗時等待者收到相同例外，之後可重新計算"""
+    flights = SingleFlight()
+
+    def fail():
+        time.sleep(0.02)
+        raise RuntimeError("gemini 429")
+
+    def call():
+        try:
+            flights.do("k", fail)
+        except RuntimeError as e:
+            return str(e)
+
+    assert run_concurrently(3, call) == ["gemini 429"] * 3
+    assert flights.do("k", lambda: "ok") == ("ok", False)
+
+
+class FakeLocks:
+    """模擬另一個程序持有鎖，稍後寫入快取並釋放"""
+
+    def __init__(self):
+        self.held = {"flight:analysis:x": "other"}
+        self.cache = None
+
+    def acquire_lock(self, name, token, ttl):
+        if name in self.held:
+            return False
+        self.held[name] = token
+        return True
+
+    def release_lock(self, name, token):
+        return self.held.pop(name, None) == token
+
+    def lock_held(self, name):
+        return name in self.held
+
+    def finish_remote(self):
+        time.sleep(0.05)
+        self.cache = "remote result"
+        self.held.clear()
+
+
+def test_waits_for_remote_holder():
+    """測試其他程序持鎖時輪詢快取，不重複計算"""
+    locks = FakeLocks()
+    flights = SingleFlight(lock_manager=locks, poll_interval=0.01)
+    threading.Thread(target=locks.finish_remote).start()
+    result = flights.do("analysis:x", lambda: "local", check=lambda: locks.cache)
+    assert result == ("remote result", True)
+    assert flights.stats["remote_waits"] == 1 and flights.stats["remote_hits"] == 1
+
+    # 取得鎖時本程序計算並釋放鎖
+    assert flights.do("analysis:y", lambda: "local") == ("local", False)
+    assert locks.held == {}
+
+
+if __name__ == "__main__":
+    test_concurrent_callers_share_one_computation()
+    test_key_normalizes_input()
+    test_errors_propagate_and_reset()
+    test_waits_for_remote_holder()
+    print("✅ Single-flight 測試通過")
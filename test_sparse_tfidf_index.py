@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+稀疏 TF-IDF 索引測試
+驗證 SparseTFIDFIndex 與原本逐文件餘弦相似度計算結果一致
+"""
+
+import math
+import os
+import sys
+import tempfile
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import enhanced.lightweight_rag_for_replit as rag
+from enhanced.lightweight_rag_for_replit import LightweightRAGEngine, SparseTFIDFIndex
+from retrieval_index_store import is_memory_mapped
+
+DOCUMENTS = [
+    "記憶力減退影響日常生活 忘記剛發生的事 反覆詢問同樣事情",
+    "計劃事情或解決問題有困難 處理金錢有困難",
+    "無法勝任原本熟悉的事務 迷路 無法管理預算",
+    "對時間地點感到混淆 忘記身在何處",
+    "",
+]
+
+QUERIES = ["媽媽最近常忘記關瓦斯爐", "爸爸開車時經常迷路", "奶奶重複問同樣的問題", "hello", ""]
+
+
+def reference_search(doc_tokens, query_tokens, k):
+    """原本的 dict-of-dicts 計算方式，作為比對基準"""
+    vocabulary = set(t for tokens in doc_tokens for t in tokens)
+    N = len(doc_tokens)
+    matrix = []
+    for tokens in doc_tokens:
+        vector = {}
+        counts = Counter(tokens)
+        for token in vocabulary:
+            if tokens:
+                df = sum(1 for dt in doc_tokens if token in dt)
+                score = counts[token] / len(tokens) * (math.log(N / df) if df else 0)
+                if score > 0:
+                    vector[token] = score
+        matrix.append(vector)
+
+    if not query_tokens:
+        return []
+    q_counts = Counter(query_tokens)
+    query = {t: q_counts[t] / len(query_tokens) for t in vocabulary if q_counts[t]}
+
+    results = []
+    for doc_idx, vector in enumerate(matrix):
+        common = set(query) & set(vector)
+        if not common:
+            continue
+        dot = sum(query[t] * vector[t] for t in common)
+        norm = math.sqrt(sum(v * v for v in query.values())) * math.sqrt(sum(v * v for v in vector.values()))
+        if norm and dot > 0:
+            results.append((doc_idx, dot / norm))
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results[:k]
+
+
+def check_index_matches_reference():
+    tokenizer = LightweightRAGEngine.tokenize_chinese
+    doc_tokens = [tokenizer(None, doc) for doc in DOCUMENTS]
+    index = SparseTFIDFIndex()
+    index.build(doc_tokens)
+
+    for query in QUERIES:
+        query_tokens = tokenizer(None, query)
+        for k in (1, 3, 10):
+            expected = reference_search(doc_tokens, query_tokens, k)
+            actual = index.search(query_tokens, k=k)
+            assert [d for d, _ in actual] == [d for d, _ in expected], (query, k)
+            for (_, a), (_, e) in zip(actual, expected):
+                assert abs(a - e) < 1e-9
+
+
+def test_sparse_index_matches_reference():
+    """測試 numpy/scipy 路徑"""
+    if not rag.SPARSE_AVAILABLE:
+        return
+    check_index_matches_reference()
+
+
+def test_postings_fallback_matches_reference():
+    """測試純 Python 倒排列表路徑"""
+    original = rag.SPARSE_AVAILABLE
+    rag.SPARSE_AVAILABLE = False
+    try:
+        check_index_matches_reference()
+    finally:
+        rag.SPARSE_AVAILABLE = original
+
+
+def check_incremental_matches_rebuild():
+    tokenizer = LightweightRAGEngine.tokenize_chinese
+    doc_tokens = [tokenizer(None, doc) for doc in DOCUMENTS]
+
+    # 先建立前兩份，再逐一加入其餘文件，並移除一份後重新加入
+    index = SparseTFIDFIndex()
+    index.build(doc_tokens[:2])
+    for tokens in doc_tokens[2:]:
+        index.add_document(tokens)
+    assert index.remove_document(0)
+    assert not index.remove_document(0)
+    index.add_document(doc_tokens[0])
+
+    reordered = doc_tokens[1:] + doc_tokens[:1]
+    rebuilt = SparseTFIDFIndex()
+    rebuilt.build(reordered)
+    assert index.vocabulary == rebuilt.vocabulary
+
+    # 增量索引的文件編號：1..n-1 不變，原 0 號重新加入後為 n
+    mapping = {i + 1: i for i in range(len(doc_tokens) - 1)}
+    mapping[len(doc_tokens)] = len(doc_tokens) - 1
+    for query in QUERIES:
+        query_tokens = tokenizer(None, query)
+        actual = {mapping[d]: s for d, s in index.search(query_tokens, k=10)}
+        expected = dict(rebuilt.search(query_tokens, k=10))
+        assert actual.keys() == expected.keys(), query
+        for doc_idx, score in expected.items():
+            assert abs(actual[doc_idx] - score) < 1e-9
+
+
+def test_incremental_updates_match_rebuild():
+    """測試增量新增/移除與完整重建結果相同"""
+    check_incremental_matches_rebuild()
+    original = rag.SPARSE_AVAILABLE
+    rag.SPARSE_AVAILABLE = False
+    try:
+        check_incremental_matches_rebuild()
+    finally:
+        rag.SPARSE_AVAILABLE = original
+
+
+def test_engine_add_and_remove_chunks():
+    """測試引擎熱新增、更新與移除知識片段"""
+    engine = LightweightRAGEngine()
+    base_count = len(engine.chunks)
+    engine.add_chunks([{
+        "chunk_id": "M3-01",
+        "title": "妄想症狀",
+        "content": "懷疑東西被偷、懷疑家人要害自己。",
+        "keywords": ["妄想", "被偷", "懷疑"],
+    }])
+    assert len(engine.chunks) == base_count + 1
+    assert engine.retrieve_relevant_chunks("爺爺懷疑東西被偷", k=1)[0]["chunk_id"] == "M3-01"
+
+    engine.add_chunks([{
+        "chunk_id": "M3-01",
+        "title": "遊走行為",
+        "content": "半夜外出、漫無目的走動。",
+        "keywords": ["遊走", "外出"],
+    }])
+    assert len(engine.chunks) == base_count + 1
+    assert "被偷" not in engine.vocabulary
+    assert engine.retrieve_relevant_chunks("半夜一直外出遊走", k=1)[0]["title"] == "遊走行為"
+
+    assert engine.remove_chunks(["M3-01", "not-exist"]) == 1
+    assert len(engine.chunks) == base_count
+    assert all(c["chunk_id"] != "M3-01" for c in engine.retrieve_relevant_chunks("外出遊走", k=10))
+
+
+def test_saved_index_roundtrip():
+    """測試磁碟索引以 mmap 開啟，且可在其上增量更新"""
+    if not rag.SPARSE_AVAILABLE:
+        return
+
+    built = LightweightRAGEngine(index_dir=None)
+    with tempfile.TemporaryDirectory() as index_dir:
+        built.save_index(index_dir)
+        loaded = LightweightRAGEngine(index_dir=index_dir)
+        assert is_memory_mapped(loaded.tfidf_index.tf_matrix.data)
+        for query in QUERIES:
+            assert loaded.retrieve_relevant_chunks(query, k=5) == built.retrieve_relevant_chunks(query, k=5)
+
+        chunk = {"chunk_id": "M2-02", "title": "中度失智症", "content": "需要協助穿衣", "keywords": ["協助"]}
+        for engine in (built, loaded):
+            engine.add_chunks([chunk])
+            engine.remove_chunks(["M1-01"])
+        for query in QUERIES + ["需要協助穿衣"]:
+            assert loaded.retrieve_relevant_chunks(query, k=5) == built.retrieve_relevant_chunks(query, k=5)
+
+        # 片段內容變更時指紋不符，改為重新建立索引
+        changed = LightweightRAGEngine.__new__(LightweightRAGEngine)
+        changed.chunks = [dict(c, content=c["content"] + "。") for c in built.indexed_chunks if c]
+        assert not changed.load_index(index_dir)
+
+
+def test_engine_retrieval():
+    """測試引擎檢索結果"""
+    engine = LightweightRAGEngine()
+    results = engine.retrieve_relevant_chunks("爸爸開車時經常迷路", k=3)
+    assert results
+    assert results[0]["chunk_id"] == "M1-03"
+    scores = [c["similarity_score"] for c in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+if __name__ == "__main__":
+    test_sparse_index_matches_reference()
+    test_postings_fallback_matches_reference()
+    test_incremental_updates_match_rebuild()
+    test_engine_add_and_remove_chunks()
+    test_saved_index_roundtrip()
+    test_engine_retrieval()
+    print("✅ 稀疏 TF-IDF 索引測試通過")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Token 預算管理測試
+驗證中文提示詞依 token 截斷、片段依相關度放入預算、輸入輸出分別計價，以及各端點直方圖
+"""
+
+from fake_redis import FakeRedis, build_manager
+from optimized_gemini_client import OptimizedGeminiClient
+from token_budget import HeuristicTokenizer, TokenBudgetManager
+
+CHUNKS = [
+    {"title": "迷路", "content": "在熟悉的地方迷路" * 20, "similarity_score": 0.2},
+    {"title": "記憶力減退", "content": "忘記剛發生的事情" * 20, "similarity_score": 0.9},
+    {"title": "判斷力變差", "content": "穿著不合時宜" * 20, "similarity_score": 0.5},
+]
+
+
+def render(i, chunk):
+    return f"【片段{i}】{chunk['title']}: {chunk['content']}\n"
+
+
+class WordTokenizer:
+    """以空白切詞的 tokenizer，確認 tokenizer 可替換"""
+
+    def count(self, text):
+        return len(text.split())
+
+    def truncate(self, text, max_tokens):
+        return " ".join(text.split()[:max_tokens])
+
+
+class FakeModel:
+    def generate_content(self, prompt, generation_config=None):
+        return type("Response", (), {"text": '{"matched_warning_code": "M1-01"}'})()
+
+
+def test_chinese_prompt_truncated_by_tokens():
+    """測試沒有空白的中文提示詞也能依 token 預算截斷"""
+    budget = TokenBudgetManager(HeuristicTokenizer())
+    prompt = "媽媽最近常常忘記關瓦斯爐，" * 100
+    fitted = budget.fit_prompt(prompt, 100)
+    assert budget.count(fitted) <= 100 < budget.count(prompt)
+    assert fitted.endswith("…") and prompt.startswith(fitted[:-1])
+    assert budget.fit_prompt("  媽媽 \n 忘記關瓦斯 ", 100) == "媽媽 忘記關瓦斯"
+
+
+def test_chunks_fitted_by_relevance_rank():
+    """測試預算不足時先捨棄排名最後的片段，部分放得下的片段截斷內容"""
+    budget = TokenBudgetManager(HeuristicTokenizer())
+    one_chunk = budget.count(render(1, CHUNKS[1]))
+
+    selected, context = budget.fit_chunks(CHUNKS, one_chunk + 40, render)
+    assert [chunk["title"] for chunk in selected] == ["記憶力減退", "判斷力變差"]
+    assert context.startswith("【片段1】記憶力減退") and context.endswith("…")
+    assert "迷路" not in context
+    assert budget.count(context) <= one_chunk + 40
+
+    selected, _ = budget.fit_chunks(CHUNKS, one_chunk + 10, render)
+    assert [chunk["title"] for chunk in selected] == ["記憶力減退"]
+
+
+def test_input_and_output_priced_separately():
+    """測試輸入與輸出分別計價，並可替換 tokenizer"""
+    budget = TokenBudgetManager(WordTokenizer())
+    assert abs(budget.cost(1000, 0) - 0.000075) < 1e-12
+    assert abs(budget.cost(0, 1000) - 0.0003) < 1e-12
+    assert abs(budget.cost(1000, 1000, "gemini-1.5-pro") - 0.00625) < 1e-12
+    assert budget.count("memory loss at home") == 4
+    assert budget.fit_prompt("a b c d e f", 3) == "a b…"
+    assert budget.get_stats()["tokenizer"] == "WordTokenizer"
+
+
+def test_client_records_endpoint_histograms():
+    """測試客戶端依端點記錄 token 與成本直方圖，build_prompt 依預算放入片段"""
+    client = OptimizedGeminiClient(api_key="test-key")
+    client.cache_manager = build_manager(FakeRedis())
+    client.model = FakeModel()
+    client._generation_config = lambda model_name, max_tokens: None
+
+    prompt, selected = client.build_prompt("參考資料：\n{context}\n請分析：媽媽忘記關瓦斯", CHUNKS,
+                                           render=render, max_input_tokens=200)
+    assert selected[0]["title"] == "記憶力減退" and client._estimate_tokens(prompt) <= 200
+
+    result = client.generate_response(prompt, endpoint="m1_analysis")
+    client.generate_response("請簡短說明失智症的早期症狀", endpoint="faq")
+    stats = client.get_usage_stats()["token_budget"]["endpoints"]
+
+    m1 = stats["m1_analysis"]
+    assert m1["calls"] == 1 and m1["input_tokens"] == result["input_tokens"]
+    assert m1["input_histogram"]["buckets"]["256"] == 1 and m1["input_histogram"]["buckets"]["128"] == 0
+    assert abs(m1["cost"] - result["cost"]) < 1e-12
+    assert stats["faq"]["output_histogram"]["count"] == 1
+    client.reset_stats()
+    assert client.get_usage_stats()["token_budget"]["endpoints"] == {}
+
+
+if __name__ == "__main__":
+    test_chinese_prompt_truncated_by_tokens()
+    test_chunks_fitted_by_relevance_rank()
+    test_input_and_output_priced_separately()
+    test_client_records_endpoint_histograms()
+    print("✅ Token 預算管理測試通過")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+XAI wrapper 訊息期限測試
+驗證上游 bot 呼叫與本地分詞並行、bot 呼叫在 deadline - local_reserve 截斷（含等待並行名額的時間）、
+降級結果不寫入快取，以及超過期限時 /api/v1/analyze 回應 504
+（需要 fastapi、pydantic 與 httpx；未安裝時標為 SKIPPED。jieba 以延遲固定時間的替身取代）
+"""
+
+import asyncio
+import importlib
+import importlib.util
+import os
+import sys
+import time
+import types
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "services", "xai-wrapper", "app")
+TOKENIZE_DELAY = 0.2
+_loaded = {}
+
+
+def fake_jieba():
+    """分詞固定耗時 TOKENIZE_DELAY 秒（在 to_thread 中執行）"""
+    module = types.ModuleType("jieba")
+
+    def lcut(text):
+        time.sleep(TOKENIZE_DELAY)
+        return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+    module.lcut = lcut
+    return module
+
+
+def load_main():
+    """以獨立套件名稱載入 services/xai-wrapper/app/main.py；缺少相依套件時略過測試"""
+    for name in ("fastapi", "httpx", "pydantic"):
+        pytest.importorskip(name)
+    if "main" in _loaded:
+        return _loaded["main"]
+
+    original = sys.modules.get("jieba")
+    sys.modules["jieba"] = fake_jieba()
+    try:
+        spec = importlib.util.spec_from_file_location(
+            "xai_wrapper_app", os.path.join(APP_DIR, "__init__.py"), submodule_search_locations=[APP_DIR])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules["xai_wrapper_app"] = package
+        spec.loader.exec_module(package)
+        _loaded["main"] = importlib.import_module("xai_wrapper_app.main")
+    finally:
+        if original is None:
+            del sys.modules["jieba"]
+        else:
+            sys.modules["jieba"] = original
+    return _loaded["main"]
+
+
+class FakeCache:
+    def __init__(self):
+        self.writes = {}
+
+    async def get(self, key):
+        return None
+
+    async def set(self, key, value, ttl=3600):
+        self.writes[key] = value
+        return True
+
+
+def build_service(main, bot_delay, deadline=2.0, local_reserve=0.2, concurrency=8):
+    """以 httpx.MockTransport 模擬 bot API（延遲 bot_delay 秒）"""
+    import httpx
+
+    async def bot(request):
+        await asyncio.sleep(bot_delay)
+        return httpx.Response(200, json={"text": "可能是記憶力減退", "confidence": 0.8})
+
+    service = main.XAIWrapperService()
+    service.cache = FakeCache()
+    service.http = httpx.AsyncClient(transport=httpx.MockTransport(bot))
+    service.deadline = deadline
+    service.local_reserve = local_reserve
+    service.concurrency = asyncio.Semaphore(concurrency)
+    return service
+
+
+def request(main, text="媽媽最近常常忘記吃藥"):
+    return main.AnalysisRequest(user_input=text, user_id="u1")
+
+
+def test_bot_call_overlaps_local_features():
+    """測試 bot 呼叫與分詞同時進行，成功結果寫入快取"""
+    main = load_main()
+
+    async def scenario():
+        service = build_service(main, bot_delay=TOKENIZE_DELAY)
+        start = time.perf_counter()
+        result = await service.process_message(request(main))
+        elapsed = time.perf_counter() - start
+        assert elapsed < TOKENIZE_DELAY * 1.75, elapsed
+        assert result["degraded"] is False and result["bot_response"]["text"] == "可能是記憶力減退"
+        assert len(service.cache.writes) == 1
+        await service.http.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_bot_call_cut_at_deadline_and_not_cached():
+    """測試 bot 呼叫在 deadline - local_reserve 截斷，降級結果不寫入快取"""
+    main = load_main()
+
+    async def scenario():
+        service = build_service(main, bot_delay=5, deadline=0.6, local_reserve=0.2)
+        start = time.perf_counter()
+        result = await service.process_message(request(main))
+        elapsed = time.perf_counter() - start
+        assert 0.35 < elapsed < 0.6, elapsed
+        assert result["degraded"] is True and result["bot_response"] == main.BOT_FALLBACK
+        assert service.cache.writes == {}
+        await service.http.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_queue_wait_counts_against_deadline():
+    """測試等待並行名額的時間也計入期限"""
+    main = load_main()
+
+    async def scenario():
+        service = build_service(main, bot_delay=0, deadline=0.5, local_reserve=0.2, concurrency=1)
+        await service.concurrency.acquire()  # 名額被占滿
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        data, degraded = await service._call_bot_api("忘記吃藥", loop.time() + service.deadline)
+        assert degraded and data == main.BOT_FALLBACK
+        assert time.perf_counter() - start < 0.45
+        await service.http.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_overrun_returns_504():
+    """測試本地步驟超過期限時端點回應 504"""
+    main = load_main()
+
+    async def scenario():
+        original = main.wrapper_service
+        service = build_service(main, bot_delay=0, deadline=0.1)
+
+        async def stuck(req):
+            await asyncio.sleep(5)
+
+        service.process_message = stuck
+        main.wrapper_service = service
+        try:
+            await main.analyze(request(main))
+            raise AssertionError("應回應 504")
+        except main.HTTPException as e:
+            assert e.status_code == 504
+        finally:
+            main.wrapper_service = original
+            await service.http.aclose()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_bot_call_overlaps_local_features()
+    test_bot_call_cut_at_deadline_and_not_cached()
+    test_queue_wait_counts_against_deadline()
+    test_overrun_returns_504()
+    print("✅ XAI wrapper 訊息期限測試通過")
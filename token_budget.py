@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Token 預算管理
+以可替換的本地 tokenizer 計算 token 數，取代「字元數 / 1.5」的粗估：
+    - 提示詞超出輸入預算時依 token 截斷（中文沒有空白，以空白切詞截斷無效）
+    - 檢索片段依相關度排名放入 context，預算不足時先捨棄排名最後的片段，而不是截掉提示詞結尾
+    - 輸入與輸出 token 分別計價
+    - 各端點的 token 數與成本直方圖
+tokenizer 預設為依字元類別估算；設定 GEMINI_TOKENIZER 為 SentencePiece 模型路徑
+（例如與 Gemini 同詞彙表的 Gemma tokenizer.model）且已安裝 sentencepiece 時改用實際分詞。
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import sentencepiece
+    SENTENCEPIECE_AVAILABLE = True
+except ImportError:
+    SENTENCEPIECE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 每 1K tokens 價格（美元），輸入與輸出分開
+MODEL_PRICING = {
+    'gemini-1.5-flash': {'input': 0.000075, 'output': 0.0003},
+    'gemini-1.5-pro': {'input': 0.00125, 'output': 0.005},
+}
+DEFAULT_MODEL = 'gemini-1.5-flash'
+
+# 直方圖級距
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+COST_BUCKETS = (0.00001, 0.00003, 0.0001, 0.0003, 0.001, 0.003, 0.01)
+
+# 片段剩餘預算少於此值時不再截斷放入
+MIN_CHUNK_TOKENS = 32
+
+_SEGMENT = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf]|[A-Za-z0-9]+|\s+|.', re.DOTALL)
+
+
+class HeuristicTokenizer:
+    """依字元類別估算：中文約 1.5 字元/token、英數約 4 字元/token、標點各 1 token、空白不計"""
+
+    name = 'heuristic'
+
+    @staticmethod
+    def _cost(segment: str) -> float:
+        if segment.isspace():
+            return 0.0
+        if len(segment) == 1 and ('\u4e00' <= segment <= '\u9fff' or '\u3400' <= segment <= '\u4dbf'):
+            return 1 / 1.5
+        if segment.isascii() and segment.isalnum():
+            return math.ceil(len(segment) / 4)
+        return 1.0
+
+    def count(self, text: str) -> int:
+        return math.ceil(sum(self._cost(segment) for segment in _SEGMENT.findall(text or '')))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        total = 0.0
+        for match in _SEGMENT.finditer(text or ''):
+            total += self._cost(match.group())
+            if total > max_tokens:
+                return text[:match.start()]
+        return text
+
+
+class SentencePieceTokenizer:
+    """以 SentencePiece 模型實際分詞"""
+
+    name = 'sentencepiece'
+
+    def __init__(self, model_path: str):
+        self.processor = sentencepiece.SentencePieceProcessor(model_file=model_path)
+
+    def count(self, text: str) -> int:
+        return len(self.processor.encode(text or ''))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        ids = self.processor.encode(text or '')
+        return text if len(ids) <= max_tokens else self.processor.decode(ids[:max_tokens])
+
+
+def load_tokenizer(spec: Optional[str] = None):
+    """依設定載入 tokenizer；無法載入時退回估算"""
+    spec = spec if spec is not None else os.getenv('GEMINI_TOKENIZER', 'heuristic')
+    if spec and spec != 'heuristic':
+        if not SENTENCEPIECE_AVAILABLE:
+            logger.warning("⚠️  sentencepiece 未安裝，改以估算計算 token")
+        else:
+            try:
+                return SentencePieceTokenizer(spec)
+            except Exception as e:
+                logger.warning(f"⚠️  載入 tokenizer 失敗（{spec}）: {e}，改以估算計算 token")
+    return HeuristicTokenizer()
+
+
+class Histogram:
+    """固定級距直方圖（各級距為累計次數，同 Prometheus 的 le）"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> Dict[str, Any]:
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'count': self.count, 'sum': round(self.sum, 8),
+                'avg': round(self.sum / self.count, 8) if self.count else 0.0, 'buckets': buckets}
+
+
+class TokenBudgetManager:
+    """token 計數、提示詞預算、計價與各端點直方圖"""
+
+    def __init__(self, tokenizer=None, pricing: Optional[Dict[str, Dict[str, float]]] = None):
+        self.tokenizer = tokenizer or load_tokenizer()
+        self.pricing = pricing or MODEL_PRICING
+        self.endpoints: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        return self.tokenizer.count(text)
+
+    def cost(self, input_tokens: int, output_tokens: int, model: str = DEFAULT_MODEL) -> float:
+        price = self.pricing.get(model, self.pricing[DEFAULT_MODEL])
+        return input_tokens / 1000 * price['input'] + output_tokens / 1000 * price['output']
+
+    def fit_prompt(self, prompt: str, max_tokens: int) -> str:
+        """正規化空白；超出預算時依 token 截斷結尾"""
+        prompt = ' '.join(prompt.split())
+        if self.count(prompt) <= max_tokens:
+            return prompt
+        return self.tokenizer.truncate(prompt, max(max_tokens - 1, 0)).rstrip() + '…'
+
+    def fit_chunks(self, chunks: List[Dict[str, Any]], budget: int,
+                   render: Callable[[int, Dict[str, Any]], str]) -> Tuple[List[Dict[str, Any]], str]:
+        """依相關度排名（similarity_score，沒有時依原順序）放入片段直到用完預算；
+        放不下的片段在剩餘預算足夠時截斷內容放入，其餘捨棄。回傳（放入的片段, context 文字）"""
+        ranked = sorted(enumerate(chunks), key=lambda item: (-item[1].get('similarity_score', 0), item[0]))
+        selected, parts, remaining = [], [], budget
+        for _, chunk in ranked:
+            text = render(len(selected) + 1, chunk)
+            tokens = self.count(text)
+            if tokens > remaining:
+                if remaining < MIN_CHUNK_TOKENS:
+                    break
+                text = self.tokenizer.truncate(text, remaining - 1).rstrip() + '…'
+                tokens = self.count(text)
+            selected.append(chunk)
+            parts.append(text)
+            remaining -= tokens
+        return selected, ''.join(parts)
+
+    def record(self, endpoint: str, input_tokens: int, output_tokens: int, model: str = DEFAULT_MODEL) -> float:
+        """記錄一次呼叫並回傳成本"""
+        cost = self.cost(input_tokens, output_tokens, model)
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cost': 0.0,
+                    'input_histogram': Histogram(TOKEN_BUCKETS),
+                    'output_histogram': Histogram(TOKEN_BUCKETS),
+                    'cost_histogram': Histogram(COST_BUCKETS),
+                }
+            stats['calls'] += 1
+            stats['input_tokens'] += input_tokens
+            stats['output_tokens'] += output_tokens
+            stats['cost'] += cost
+            stats['input_histogram'].observe(input_tokens)
+            stats['output_histogram'].observe(output_tokens)
+            stats['cost_histogram'].observe(cost)
+        return cost
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'tokenizer': getattr(self.tokenizer, 'name', type(self.tokenizer).__name__),
+                'endpoints': {
+                    endpoint: {key: value.to_dict() if isinstance(value, Histogram) else value
+                               for key, value in stats.items()}
+                    for endpoint, stats in self.endpoints.items()
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
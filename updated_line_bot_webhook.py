@@ -9,13 +9,17 @@ from fastapi.responses import JSONResponse
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import MessageEvent, TextMessage, FlexSendMessage, TextSendMessage, FollowEvent, PostbackEvent
-import requests
+import asyncio
+import httpx
+import json
 import os
 import logging
 import traceback
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
 
+from async_http_client import shared_http_client
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -39,6 +43,10 @@ FLEX_API_URL = os.getenv('FLEX_API_URL', 'http://localhost:8005/comprehensive-an
 RAG_HEALTH_URL = os.getenv('RAG_HEALTH_URL', 'http://localhost:8005/health')  # ← 新增健康檢查
 RAG_ANALYZE_URL = os.getenv('RAG_ANALYZE_URL', 'http://localhost:8005/comprehensive-analysis')  # ← 新增詳細分析
 
+# 🆕 Streaming M1 Flex API (NDJSON): reply on the early line, push the complete analysis afterwards
+M1_STREAM_URL = os.getenv('M1_STREAM_URL', 'http://localhost:8005/m1-flex/stream')
+USE_M1_STREAM = os.getenv('USE_M1_STREAM', 'false').lower() == 'true'
+
 # 🆕 失智小助手chatbot API Configuration
 CHATBOT_API_URL = os.getenv('CHATBOT_API_URL', '')  # Your chatbot API URL
 CHATBOT_API_KEY = os.getenv('CHATBOT_API_KEY', '')  # Your chatbot API key
@@ -50,6 +58,29 @@ THIRD_PARTY_API_KEY = os.getenv('THIRD_PARTY_API_KEY', '')  # 第三方 API Key
 USE_THIRD_PARTY_API = os.getenv('USE_THIRD_PARTY_API', 'true').lower() == 'true'  # 預設使用第三方 API
 THIRD_PARTY_API_NAME = os.getenv('THIRD_PARTY_API_NAME', '失智症小幫手1')  # API 名稱
 
+# 🆕 Shared pooled async HTTP client: keep-alive connections, per-upstream timeouts and concurrency limits
+http_client = shared_http_client
+http_client.register(
+    "third_party", THIRD_PARTY_API_URL,
+    timeout=float(os.getenv('THIRD_PARTY_API_TIMEOUT', '15')),
+    headers={"Authorization": f"Bearer {THIRD_PARTY_API_KEY}"} if THIRD_PARTY_API_KEY else None
+)
+http_client.register(
+    "chatbot", CHATBOT_API_URL,
+    timeout=float(os.getenv('CHATBOT_API_TIMEOUT', '15')),
+    headers={"Authorization": f"Bearer {CHATBOT_API_KEY}"} if CHATBOT_API_KEY else None
+)
+http_client.register("rag", timeout=float(os.getenv('RAG_API_TIMEOUT', '10')), max_concurrency=32)
+http_client.register("m1_stream", timeout=float(os.getenv('M1_STREAM_TIMEOUT', '20')), max_concurrency=32)
+
+@app.on_event("startup")
+async def startup():
+    await http_client.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await http_client.close()
+
 # Replit-specific configuration
 REPL_SLUG = os.getenv('REPL_SLUG', 'workspace')
 REPL_OWNER = os.getenv('REPL_OWNER', 'ke2211975')
@@ -104,7 +135,7 @@ async def rag_status():
     """RAG API specific status endpoint"""
     try:
         # 檢查 RAG API 健康狀態
-        response = requests.get(RAG_HEALTH_URL, timeout=5)
+        response = await http_client.get("rag", RAG_HEALTH_URL, timeout=5.0)
         rag_health = response.json() if response.status_code == 200 else None
 
         return {
@@ -141,7 +172,7 @@ async def health_check():
     # Check LINE Bot API
     try:
         if line_bot_api:
-            bot_info = line_bot_api.get_bot_info()
+            bot_info = await asyncio.to_thread(line_bot_api.get_bot_info)
             health_status["services"]["line_bot"] = {
                 "status": "ok",
                 "bot_id": bot_info.user_id,
@@ -154,7 +185,7 @@ async def health_check():
 
     # 🆕 Check Enhanced RAG API
     try:
-        response = requests.get(RAG_HEALTH_URL, timeout=5)
+        response = await http_client.get("rag", RAG_HEALTH_URL, timeout=5.0)
         if response.status_code == 200:
             rag_health = response.json()
             health_status["services"]["rag_api"] = {
@@ -209,8 +240,15 @@ async def webhook(request: Request):
             )
 
         try:
+            # Parse here and await the text handler, so upstream calls run on the event loop instead of blocking it
             body_str = body.decode('utf-8')
-            handler.handle(body_str, signature)
+            for event in handler.parser.parse(body_str, signature):
+                if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+                    await handle_text_message(event)
+                elif isinstance(event, FollowEvent):
+                    await handle_follow(event)
+                elif isinstance(event, PostbackEvent):
+                    await handle_postback(event)
             logger.info("✅ Webhook processed successfully")
 
         except InvalidSignatureError:
@@ -340,24 +378,17 @@ def create_error_flex_message(error_msg: str) -> Dict[str, Any]:
         }
     }
 
-def call_third_party_api(user_input: str) -> Optional[Dict[str, Any]]:
+async def call_third_party_api(user_input: str) -> Optional[Dict[str, Any]]:
     """
     🆕 Call 第三方 API 失智症小幫手1
     """
     try:
         logger.info(f"🔄 Calling {THIRD_PARTY_API_NAME}: {THIRD_PARTY_API_URL}")
 
-        # Prepare headers with API key if provided
-        headers = {"Content-Type": "application/json"}
-        if THIRD_PARTY_API_KEY:
-            headers["Authorization"] = f"Bearer {THIRD_PARTY_API_KEY}"
-
-        # Call third party API
-        response = requests.post(
-            THIRD_PARTY_API_URL,
-            json={"message": user_input, "user_id": "line_user"},
-            timeout=30,
-            headers=headers
+        # Call third party API (API key header is set on the upstream)
+        response = await http_client.post(
+            "third_party",
+            json={"message": user_input, "user_id": "line_user"}
         )
 
         logger.info(f"📊 {THIRD_PARTY_API_NAME} response: {response.status_code}")
@@ -370,34 +401,27 @@ def call_third_party_api(user_input: str) -> Optional[Dict[str, Any]]:
             logger.error(f"❌ {THIRD_PARTY_API_NAME} error: {response.status_code} - {response.text}")
             return None
 
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.error(f"⏰ {THIRD_PARTY_API_NAME} timeout")
         return None
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         logger.error(f"🔗 Cannot connect to {THIRD_PARTY_API_NAME}")
         return None
     except Exception as e:
         logger.error(f"❌ {THIRD_PARTY_API_NAME} error: {e}")
         return None
 
-def call_chatbot_api(user_input: str) -> Optional[Dict[str, Any]]:
+async def call_chatbot_api(user_input: str) -> Optional[Dict[str, Any]]:
     """
     🆕 Call 失智小助手chatbot API
     """
     try:
         logger.info(f"🔄 Calling chatbot API: {CHATBOT_API_URL}")
 
-        # Prepare headers with API key if provided
-        headers = {"Content-Type": "application/json"}
-        if CHATBOT_API_KEY:
-            headers["Authorization"] = f"Bearer {CHATBOT_API_KEY}"
-
-        # Call your chatbot API
-        response = requests.post(
-            CHATBOT_API_URL,
-            json={"message": user_input, "user_id": "line_user"},
-            timeout=30,
-            headers=headers
+        # Call your chatbot API (API key header is set on the upstream)
+        response = await http_client.post(
+            "chatbot",
+            json={"message": user_input, "user_id": "line_user"}
         )
 
         logger.info(f"📊 Chatbot API response: {response.status_code}")
@@ -410,17 +434,17 @@ def call_chatbot_api(user_input: str) -> Optional[Dict[str, Any]]:
             logger.error(f"❌ Chatbot API error: {response.status_code} - {response.text}")
             return None
 
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.error("⏰ Chatbot API timeout")
         return None
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         logger.error("🔗 Cannot connect to chatbot API")
         return None
     except Exception as e:
         logger.error(f"❌ Chatbot API error: {e}")
         return None
 
-def call_enhanced_rag_api(user_input: str) -> Optional[Dict[str, Any]]:
+async def call_enhanced_rag_api(user_input: str) -> Optional[Dict[str, Any]]:
     """
     🆕 Call enhanced RAG API with improved error handling
     """
@@ -428,11 +452,9 @@ def call_enhanced_rag_api(user_input: str) -> Optional[Dict[str, Any]]:
         logger.info(f"🔄 Calling enhanced RAG API: {FLEX_API_URL}")
 
         # 使用增強版 RAG API
-        response = requests.post(
-            FLEX_API_URL,
-            json={"text": user_input, "user_id": "line_user"},
-            timeout=30,
-            headers={"Content-Type": "application/json"}
+        response = await http_client.post(
+            "rag", FLEX_API_URL,
+            json={"text": user_input, "user_id": "line_user"}
         )
 
         logger.info(f"📊 RAG API response: {response.status_code}")
@@ -452,34 +474,66 @@ def call_enhanced_rag_api(user_input: str) -> Optional[Dict[str, Any]]:
             logger.error(f"❌ RAG API error: {response.status_code} - {response.text}")
             return None
 
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.error("⏰ RAG API timeout on Replit")
         return None
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         logger.error("🔗 Cannot connect to enhanced RAG API")
         return None
     except Exception as e:
         logger.error(f"❌ RAG API error: {e}")
         return None
 
-def call_analysis_api(user_input: str) -> Optional[Dict[str, Any]]:
+async def call_analysis_api(user_input: str) -> Optional[Dict[str, Any]]:
     """
     🆕 Unified API caller - 優先使用第三方 API，然後是 Chatbot API，最後是 RAG API
     """
     if USE_THIRD_PARTY_API and THIRD_PARTY_API_URL:
         logger.info(f"🤖 Using {THIRD_PARTY_API_NAME} API")
-        return call_third_party_api(user_input)
+        return await call_third_party_api(user_input)
     elif USE_CHATBOT_API and CHATBOT_API_URL:
         logger.info("🤖 Using 失智小助手chatbot API")
-        return call_chatbot_api(user_input)
+        return await call_chatbot_api(user_input)
     else:
         logger.info("🧠 Using Enhanced RAG API")
-        return call_enhanced_rag_api(user_input)
+        return await call_enhanced_rag_api(user_input)
+
+async def reply_message(reply_token: str, message) -> None:
+    """LineBotApi is synchronous; run it in a worker thread so a reply never stalls the event loop"""
+    await asyncio.to_thread(line_bot_api.reply_message, reply_token, message)
+
+async def push_message(user_id: str, message) -> None:
+    await asyncio.to_thread(line_bot_api.push_message, user_id, message)
+
+async def reply_with_m1_stream(user_id: str, reply_token: str, user_text: str) -> bool:
+    """
+    🆕 Consume /m1-flex/stream: reply with the early Flex as soon as its line arrives,
+    then push the complete analysis (a reply token can only be used once).
+    Returns False when nothing was sent, so the caller can fall back to the regular analysis API.
+    """
+    replied = False
+    try:
+        async for line in http_client.stream_lines("m1_stream", "POST", M1_STREAM_URL,
+                                                   json={"user_input": user_text}):
+            payload = json.loads(line)
+            flex = payload.get("flex_message")
+            if not flex:
+                continue
+            message = FlexSendMessage(alt_text=flex.get("altText", "失智症警訊分析結果"), contents=flex["contents"])
+            if not replied:
+                await reply_message(reply_token, message)
+                replied = True
+                logger.info(f"⚡ Sent {payload.get('stage')} Flex to {user_id} after {payload.get('elapsed', 'N/A')}s")
+            elif payload.get("stage") == "complete":
+                await push_message(user_id, message)
+                logger.info(f"✅ Pushed complete analysis to {user_id} after {payload.get('elapsed', 'N/A')}s")
+    except Exception as e:
+        logger.error(f"❌ M1 stream error: {e}")
+    return replied
 
 # Event handlers - Enhanced for RAG integration
 if handler and line_bot_api:
-    @handler.add(MessageEvent, message=TextMessage)
-    def handle_text_message(event):
+    async def handle_text_message(event):
         """🆕 Enhanced text message handler with RAG integration"""
         try:
             user_id = event.source.user_id
@@ -495,13 +549,13 @@ if handler and line_bot_api:
                     alt_text="AI 增強版使用說明",
                     contents=welcome_flex
                 )
-                line_bot_api.reply_message(reply_token, flex_message)
+                await reply_message(reply_token, flex_message)
                 logger.info("📤 Sent enhanced welcome message")
                 return
 
             # Input validation
             if len(user_text) < 5:
-                line_bot_api.reply_message(
+                await reply_message(
                     reply_token,
                     TextSendMessage(
                         text="請提供更詳細的描述（至少5個字）\n\n💡 AI 分析範例：\n• 媽媽最近常忘記關瓦斯\n• 爸爸重複問同樣問題\n• 奶奶在熟悉地方迷路"
@@ -510,14 +564,18 @@ if handler and line_bot_api:
                 return
 
             if len(user_text) > 1000:
-                line_bot_api.reply_message(
+                await reply_message(
                     reply_token,
                     TextSendMessage(text="描述過長，請簡化在1000字以內")
                 )
                 return
 
+            # 🆕 Streaming M1 Flex: early reply first, complete analysis pushed when ready
+            if USE_M1_STREAM and await reply_with_m1_stream(user_id, reply_token, user_text):
+                return
+
             # 🆕 Call unified analysis API (RAG or Chatbot)
-            analysis_response = call_analysis_api(user_text)
+            analysis_response = await call_analysis_api(user_text)
 
             if analysis_response and "type" in analysis_response and analysis_response["type"] == "flex":
                 # 🆕 Direct Flex Message response from backend
@@ -526,7 +584,7 @@ if handler and line_bot_api:
                     contents=analysis_response["contents"]
                 )
 
-                line_bot_api.reply_message(reply_token, flex_message)
+                await reply_message(reply_token, flex_message)
                 logger.info(f"✅ Sent Flex Message to {user_id}")
 
             elif analysis_response and "flex_message" in analysis_response:
@@ -537,7 +595,7 @@ if handler and line_bot_api:
                 # Always send text message first (guaranteed to work)
                 simple_message = f"🧠 AI 分析結果:\n\n{analysis_text}\n\n信心度: {confidence}"
                 text_message = TextSendMessage(text=simple_message)
-                line_bot_api.reply_message(reply_token, text_message)
+                await reply_message(reply_token, text_message)
                 
                 # Try to send a simplified Flex Message as a second message
                 try:
@@ -589,7 +647,7 @@ if handler and line_bot_api:
                     )
                     
                     # Send as a separate message
-                    line_bot_api.push_message(user_id, flex_message)
+                    await push_message(user_id, flex_message)
                     
                 except Exception as flex_error:
                     logger.warning(f"Flex Message failed, but text message sent: {flex_error}")
@@ -607,7 +665,7 @@ if handler and line_bot_api:
                     alt_text="系統錯誤",
                     contents=error_flex
                 )
-                line_bot_api.reply_message(reply_token, flex_message)
+                await reply_message(reply_token, flex_message)
                 logger.warning(f"⚠️ Sent error message to {user_id}")
 
         except LineBotApiError as e:
@@ -616,8 +674,7 @@ if handler and line_bot_api:
             logger.error(f"❌ Enhanced text handler error: {e}")
             logger.error(traceback.format_exc())
 
-    @handler.add(FollowEvent)
-    def handle_follow(event):
+    async def handle_follow(event):
         """Handle new followers with enhanced welcome"""
         try:
             user_id = event.source.user_id
@@ -629,7 +686,7 @@ if handler and line_bot_api:
                 alt_text="歡迎使用 AI 增強版失智症警訊分析",
                 contents=welcome_flex
             )
-            line_bot_api.reply_message(reply_token, flex_message)
+            await reply_message(reply_token, flex_message)
             logger.info("📤 Sent enhanced welcome message to new follower")
 
         except LineBotApiError as e:
@@ -637,8 +694,7 @@ if handler and line_bot_api:
         except Exception as e:
             logger.error(f"❌ Follow handler error: {e}")
 
-    @handler.add(PostbackEvent)
-    def handle_postback(event):
+    async def handle_postback(event):
         """Handle postback events from Flex Message buttons"""
         try:
             user_id = event.source.user_id
@@ -714,13 +770,13 @@ if handler and line_bot_api:
                     alt_text="額外建議與聯絡資訊",
                     contents=additional_suggestions
                 )
-                line_bot_api.reply_message(reply_token, flex_message)
+                await reply_message(reply_token, flex_message)
                 logger.info(f"📤 Sent additional suggestions to {user_id}")
 
             else:
                 # Default response for unknown postback
                 text_message = TextSendMessage(text="感謝您的使用！如有任何問題，請隨時詢問。")
-                line_bot_api.reply_message(reply_token, text_message)
+                await reply_message(reply_token, text_message)
                 logger.info(f"📤 Sent default postback response to {user_id}")
 
         except LineBotApiError as e:
@@ -736,7 +792,7 @@ async def bot_info():
         if not line_bot_api:
             raise HTTPException(status_code=500, detail="LINE Bot not configured")
 
-        bot_info = line_bot_api.get_bot_info()
+        bot_info = await asyncio.to_thread(line_bot_api.get_bot_info)
         return {
             "bot_id": bot_info.user_id,
             "display_name": bot_info.display_name,